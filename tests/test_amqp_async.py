@@ -0,0 +1,236 @@
+# encoding: UTF-8
+
+"""
+amqp异步发送：缓冲满时丢弃/等待，停止时发送完缓冲中的消息
+publisher批量发送tick：缓存超过max_delay时由定时线程发送
+使用本地的模拟连接/频道，不需要rabbitmq服务器
+"""
+
+import threading
+import time
+
+import pytest
+
+pytest.importorskip('pika')
+from vnpy.amqp.base import base_broker
+from vnpy.amqp.producer import publisher
+from vnpy.amqp.tick_codec import CONTENT_TYPE_JSON, decode_ticks
+
+
+class FakeChannel(object):
+    """记录发送的消息；gate未打开时，basic_publish等待（模拟网络阻塞）"""
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def confirm_delivery(self):
+        self.connection.confirm = True
+
+    def queue_declare(self, queue, **kwargs):
+        pass
+
+    def exchange_declare(self, exchange, **kwargs):
+        pass
+
+    def basic_publish(self, exchange, routing_key, body, properties=None):
+        self.connection.sending.set()
+        self.connection.gate.wait()
+        self.connection.published.append(body)
+        self.connection.threads.add(threading.current_thread().name)
+
+
+class FakeConnection(object):
+    def __init__(self):
+        self.gate = threading.Event()
+        self.gate.set()
+        self.sending = threading.Event()
+        self.published = []
+        self.threads = set()
+        self.confirm = False
+        self.closed = False
+
+    def channel(self, channel_number=None):
+        return FakeChannel(self)
+
+    def close(self):
+        self.closed = True
+
+
+class FakeBroker(base_broker):
+    """所有连接共用一个模拟连接，便于检查后台线程发送的消息"""
+
+    def __init__(self):
+        self.fake_connection = FakeConnection()
+        super(FakeBroker, self).__init__()
+
+    def create_connection(self):
+        return self.fake_connection
+
+
+class FakePublisher(publisher):
+    def __init__(self, **kwargs):
+        self.fake_connection = FakeConnection()
+        super(FakePublisher, self).__init__(**kwargs)
+
+    def create_connection(self):
+        return self.fake_connection
+
+
+def fill_buffer(broker, n):
+    """阻塞后台线程，使其停在第一条消息上，再放入n条消息填满缓冲"""
+    connection = broker.fake_connection
+    connection.gate.clear()
+    assert broker.publish('ex', 'key', 'm0', None)
+    assert connection.sending.wait(2)
+    for i in range(1, n + 1):
+        assert broker.publish('ex', 'key', 'm{}'.format(i), None)
+
+
+def test_drop_when_buffer_full():
+    broker = FakeBroker()
+    broker.start_async(max_buffer=2, batch_size=1, block=False)
+    fill_buffer(broker, 2)
+
+    assert broker.publish('ex', 'key', 'dropped', None) is False
+
+    broker.fake_connection.gate.set()
+    broker.stop_async()
+    stats = broker.get_async_stats()
+    assert broker.fake_connection.published == ['m0', 'm1', 'm2']
+    assert stats['dropped'] == 1
+    assert stats['published'] == 3
+    assert stats['max_buffered'] == 2
+
+
+def test_block_when_buffer_full():
+    broker = FakeBroker()
+    broker.start_async(max_buffer=2, batch_size=1, block=True, block_timeout=0.2)
+    fill_buffer(broker, 2)
+
+    # 等待block_timeout后仍满，丢弃
+    start = time.time()
+    assert broker.publish('ex', 'key', 'dropped', None) is False
+    assert time.time() - start >= 0.2
+
+    # 等待期间缓冲有空位，放入
+    broker.async_setting['block_timeout'] = 5
+    threading.Timer(0.1, broker.fake_connection.gate.set).start()
+    assert broker.publish('ex', 'key', 'm3', None) is True
+
+    broker.stop_async()
+    assert broker.fake_connection.published == ['m0', 'm1', 'm2', 'm3']
+    assert broker.get_async_stats()['dropped'] == 1
+
+
+def test_flush_on_stop():
+    broker = FakeBroker()
+    broker.start_async(max_buffer=1000, batch_size=7, confirm=True)
+    bodies = ['m{}'.format(i) for i in range(100)]
+    for body in bodies:
+        broker.publish('ex', 'key', body, None)
+    broker.stop_async()
+
+    stats = broker.get_async_stats()
+    assert broker.fake_connection.published == bodies
+    assert broker.fake_connection.confirm
+    assert stats['published'] == 100
+    assert stats['buffered'] == 0
+    assert broker.async_thread is None
+
+    # 停止后恢复同步发送
+    broker.publish('ex', 'key', 'sync', None)
+    assert broker.fake_connection.published[-1] == 'sync'
+
+
+def test_stop_async_timeout_abandons_buffer():
+    broker = FakeBroker()
+    broker.start_async(max_buffer=2, batch_size=1, block=False)
+    fill_buffer(broker, 2)
+
+    # 后台线程阻塞在网络上，缓冲已满：stop_async不会一直等待
+    start = time.time()
+    broker.stop_async(timeout=0.3)
+    assert time.time() - start < 2
+    assert broker.async_queue is None
+    assert broker.get_async_stats()['abandoned'] == 2
+
+    # 网络恢复后，后台线程发送完当前的消息即退出，不再发送放弃的消息
+    thread = threading.enumerate()
+    broker.fake_connection.gate.set()
+    time.sleep(0.2)
+    assert broker.fake_connection.published == ['m0']
+    assert not [t for t in thread if t.name == 'amqp_publish' and t.is_alive()]
+
+
+def test_publish_while_stopping():
+    broker = FakeBroker()
+    errors = []
+    done = threading.Event()
+
+    def publish():
+        while not done.is_set():
+            try:
+                broker.publish('ex', 'key', 'm', None)
+            except Exception as ex:
+                errors.append(ex)
+
+    thread = threading.Thread(target=publish)
+    thread.start()
+    for i in range(50):
+        broker.start_async(max_buffer=100, batch_size=10)
+        broker.stop_async()
+    done.set()
+    thread.join()
+    assert errors == []
+
+
+def published_ticks(connection):
+    return [[tick['i'] for tick in decode_ticks(body, CONTENT_TYPE_JSON)] for body in connection.published]
+
+
+def test_flush_ticks_after_max_delay_without_new_tick():
+    pub = FakePublisher(tick_content_type=CONTENT_TYPE_JSON, batch_size=100, max_delay=0.1)
+    for i in range(3):
+        pub.pub_tick({'i': i})
+    assert pub.fake_connection.published == []
+
+    # 没有新的tick到达，定时线程也会发送
+    deadline = time.time() + 2
+    while not pub.fake_connection.published and time.time() < deadline:
+        time.sleep(0.01)
+    assert published_ticks(pub.fake_connection) == [[0, 1, 2]]
+
+    pub.pub_tick({'i': 3})
+    pub.exit()
+    assert published_ticks(pub.fake_connection) == [[0, 1, 2], [3]]
+    assert pub.flush_thread is None
+    # 批量发送时启用异步发送，只有异步发送线程使用连接
+    assert pub.fake_connection.threads == {'amqp_publish'}
+
+
+def test_flush_ticks_keeps_order_and_routing_key():
+    pub = FakePublisher(tick_content_type=CONTENT_TYPE_JSON, batch_size=4, max_delay=0.01,
+                        async_setting={'max_buffer': 10000, 'batch_size': 50})
+    for i in range(200):
+        pub.pub_tick({'i': i}, routing_key='a' if i < 100 else 'b')
+        if i % 10 == 0:
+            time.sleep(0.02)
+    pub.exit()
+
+    batches = published_ticks(pub.fake_connection)
+    assert [i for batch in batches for i in batch] == list(range(200))
+    # 不同routing_key的tick不会打包在同一条消息中
+    assert all(batch[0] >= 100 or batch[-1] < 100 for batch in batches)
+
+
+def test_flush_thread_does_not_publish_without_async():
+    pub = FakePublisher(tick_content_type=CONTENT_TYPE_JSON, batch_size=100, max_delay=0.05)
+    pub.stop_async()
+    pub.pub_tick({'i': 0})
+    time.sleep(0.2)
+
+    # 定时发送线程不使用调用者线程创建的连接，由exit在调用者线程中发送
+    assert pub.fake_connection.published == []
+    pub.exit()
+    assert published_ticks(pub.fake_connection) == [[0]]
+    assert pub.fake_connection.threads == {threading.current_thread().name}
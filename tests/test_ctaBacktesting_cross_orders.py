@@ -0,0 +1,311 @@
+# encoding: UTF-8
+
+"""
+回测撮合：按价格索引撮合的crossLimitOrder/crossStopOrder与原遍历字典副本的实现结果一致
+包括在onTrade中发单、撤单，bar与tick两种模式
+"""
+
+import copy
+import random
+import traceback
+from datetime import datetime, timedelta
+
+import pytest
+
+backtesting = pytest.importorskip('vnpy.trader.app.ctaStrategy.ctaBacktesting')
+from vnpy.trader.app.ctaStrategy.ctaBase import (CtaBarData, CtaTickData, CTAORDER_BUY, CTAORDER_SELL,
+                                                 CTAORDER_SHORT, CTAORDER_COVER, STOPORDER_WAITING,
+                                                 STOPORDER_TRIGGERED, STOPORDER_CANCELLED)
+from vnpy.trader.vtConstant import DIRECTION_LONG, DIRECTION_SHORT, STATUS_ALLTRADED
+from vnpy.trader.vtGateway import VtOrderData, VtTradeData
+
+PositionBuffer = backtesting.PositionBuffer
+
+
+class ReferenceEngine(backtesting.BacktestingEngine):
+    """原实现：每次撮合深拷贝活动委托字典，逐个判断是否成交"""
+
+    def crossLimitOrder(self):
+        if self.mode == self.BAR_MODE:
+            buyCrossPrice = self.roundToPriceTick(self.bar.low) + self.priceTick
+            sellCrossPrice = self.roundToPriceTick(self.bar.high) - self.priceTick
+            buyBestCrossPrice = self.roundToPriceTick(self.bar.open) + self.priceTick
+            sellBestCrossPrice = self.roundToPriceTick(self.bar.open) - self.priceTick
+            vtSymbol = self.bar.vtSymbol
+            symbol = self.bar.symbol
+        else:
+            buyCrossPrice = self.tick.askPrice1
+            sellCrossPrice = self.tick.bidPrice1
+            buyBestCrossPrice = self.tick.askPrice1
+            sellBestCrossPrice = self.tick.bidPrice1
+            vtSymbol = self.tick.vtSymbol
+            symbol = self.tick.symbol
+
+        workingLimitOrderDictClone = copy.deepcopy(self.workingLimitOrderDict)
+        for orderID, order in list(workingLimitOrderDictClone.items()):
+            buyCross = order.direction == DIRECTION_LONG and order.price >= buyCrossPrice and (vtSymbol.lower() == order.vtSymbol.lower() or symbol.lower() == order.vtSymbol.lower())
+            sellCross = order.direction == DIRECTION_SHORT and order.price <= sellCrossPrice and (vtSymbol.lower() == order.vtSymbol.lower() or symbol.lower() == order.vtSymbol.lower())
+
+            if buyCross or sellCross:
+                self.tradeCount += 1
+
+                tradeID = str(self.tradeCount)
+                trade = VtTradeData()
+                trade.vtSymbol = order.vtSymbol
+                trade.tradeID = tradeID
+                trade.vtTradeID = tradeID
+                trade.orderID = order.orderID
+                trade.vtOrderID = order.orderID
+                trade.direction = order.direction
+                trade.offset = order.offset
+
+                if buyCross:
+                    if self.useBreakoutMode is False:
+                        trade.price = min(order.price, buyBestCrossPrice)
+                    else:
+                        trade.price = max(order.price, buyBestCrossPrice)
+                    self.strategy.pos += order.totalVolume
+                else:
+                    if self.useBreakoutMode is False:
+                        trade.price = max(order.price, sellBestCrossPrice)
+                    else:
+                        trade.price = min(order.price, sellBestCrossPrice)
+                    self.strategy.pos -= order.totalVolume
+
+                trade.volume = order.totalVolume
+                trade.tradeTime = str(self.dt)
+                trade.dt = self.dt
+                self.strategy.onTrade(trade)
+
+                self.tradeDict[tradeID] = trade
+
+                posBuffer = self.posBufferDict.get(trade.vtSymbol, None)
+                if not posBuffer:
+                    posBuffer = PositionBuffer()
+                    posBuffer.vtSymbol = trade.vtSymbol
+                    self.posBufferDict[trade.vtSymbol] = posBuffer
+                posBuffer.updateTradeData(trade)
+
+                order.tradedVolume = order.totalVolume
+                order.status = STATUS_ALLTRADED
+
+                self.strategy.onOrder(order)
+
+                try:
+                    del self.workingLimitOrderDict[orderID]
+                except Exception as ex:
+                    self.writeCtaError(u'crossLimitOrder exception:{},{}'.format(str(ex), traceback.format_exc()))
+
+    def crossStopOrder(self):
+        if self.mode == self.BAR_MODE:
+            buyCrossPrice = self.bar.high
+            sellCrossPrice = self.bar.low
+            bestCrossPrice = self.bar.open
+            vtSymbol = self.bar.vtSymbol
+            symbol = self.bar.symbol
+        else:
+            buyCrossPrice = self.tick.lastPrice
+            sellCrossPrice = self.tick.lastPrice
+            bestCrossPrice = self.tick.lastPrice
+            vtSymbol = self.tick.vtSymbol
+            symbol = self.tick.symbol
+
+        workingStopOrderDictClone = copy.deepcopy(self.workingStopOrderDict)
+        for stopOrderID, so in workingStopOrderDictClone.items():
+            # 原实现误用了未定义的order.vtSymbol，这里按so.vtSymbol比较
+            buyCross = so.direction == DIRECTION_LONG and so.price <= buyCrossPrice and (vtSymbol.lower() == so.vtSymbol.lower() or symbol.lower() == so.vtSymbol.lower())
+            sellCross = so.direction == DIRECTION_SHORT and so.price >= sellCrossPrice and (vtSymbol.lower() == so.vtSymbol.lower() or symbol.lower() == so.vtSymbol.lower())
+
+            # 已知的行为变化：本轮之前的成交回调中已撤销的停止单，不再成交
+            if stopOrderID not in self.workingStopOrderDict:
+                continue
+
+            if buyCross or sellCross:
+                self.tradeCount += 1
+                tradeID = str(self.tradeCount)
+                trade = VtTradeData()
+                trade.vtSymbol = so.vtSymbol
+                trade.tradeID = tradeID
+                trade.vtTradeID = tradeID
+
+                if buyCross:
+                    self.strategy.pos += so.volume
+                    trade.price = max(bestCrossPrice, so.price)
+                else:
+                    self.strategy.pos -= so.volume
+                    trade.price = min(bestCrossPrice, so.price)
+
+                self.limitOrderCount += 1
+                orderID = str(self.limitOrderCount)
+                trade.orderID = orderID
+                trade.vtOrderID = orderID
+
+                trade.direction = so.direction
+                trade.offset = so.offset
+                trade.volume = so.volume
+                trade.tradeTime = str(self.dt)
+                trade.dt = self.dt
+                self.strategy.onTrade(trade)
+
+                self.tradeDict[tradeID] = trade
+
+                posBuffer = self.posBufferDict.get(trade.vtSymbol, None)
+                if not posBuffer:
+                    posBuffer = PositionBuffer()
+                    posBuffer.vtSymbol = trade.vtSymbol
+                    self.posBufferDict[trade.vtSymbol] = posBuffer
+                posBuffer.updateTradeData(trade)
+
+                so.status = STOPORDER_TRIGGERED
+
+                order = VtOrderData()
+                order.vtSymbol = so.vtSymbol
+                order.symbol = so.vtSymbol
+                order.orderID = orderID
+                order.vtOrderID = orderID
+                order.direction = so.direction
+                order.offset = so.offset
+                order.price = so.price
+                order.totalVolume = so.volume
+                order.tradedVolume = so.volume
+                order.status = STATUS_ALLTRADED
+                order.orderTime = trade.tradeTime
+                order.gatewayName = so.gatewayName
+                self.strategy.onOrder(order)
+
+                self.limitOrderDict[orderID] = order
+
+                try:
+                    del self.workingStopOrderDict[stopOrderID]
+                except Exception as ex:
+                    self.writeCtaError(u'crossStopOrder exception:{},{}'.format(str(ex), traceback.format_exc()))
+
+
+SYMBOLS = ['rb1910', 'RB1910', 'j1909']
+ORDER_TYPES = [CTAORDER_BUY, CTAORDER_SELL, CTAORDER_SHORT, CTAORDER_COVER]
+
+
+class Strategy(object):
+    """在onTrade中随机发单、撤单；只保存回调的内容，不引用引擎（停止单深拷贝时会复制策略）"""
+
+    def __init__(self):
+        self.name = 'test'
+        self.pos = 0
+        self.limitOrders = []
+        self.stopOrders = []
+        self.onOrders = []
+
+    def onOrder(self, order):
+        self.onOrders.append((order.vtOrderID, order.status, order.tradedVolume))
+
+
+def run(engineClass, mode, seed, steps=400):
+    engine = engineClass()
+    engine.setPriceTick(1)
+    engine.writeCtaLog = lambda content, strategy_name=None: None
+    errors = []
+    engine.writeCtaError = lambda content, strategy_name=None: errors.append(content.split(',')[0])
+    engine.mode = engine.BAR_MODE if mode == 'bar' else engine.TICK_MODE
+    engine.calculateMode = None
+    rng = random.Random(seed)
+    strategy = Strategy()
+    engine.strategy = strategy
+
+    def sendRandomOrders(price, n):
+        for i in range(n):
+            orderType = rng.choice(ORDER_TYPES)
+            if rng.random() < 0.7:
+                strategy.limitOrders.append(engine.sendOrder(rng.choice(SYMBOLS), orderType,
+                                                             price + rng.randint(-8, 8), rng.randint(1, 3), strategy))
+            else:
+                strategy.stopOrders.append(engine.sendStopOrder(rng.choice(SYMBOLS), orderType,
+                                                                price + rng.randint(-8, 8), rng.randint(1, 3), strategy))
+
+    def cancelRandomOrders():
+        if strategy.limitOrders and rng.random() < 0.3:
+            engine.cancelOrder(rng.choice(strategy.limitOrders))
+        if strategy.stopOrders and rng.random() < 0.3:
+            engine.cancelStopOrder(rng.choice(strategy.stopOrders))
+
+    def onTrade(trade):
+        # 成交回调中发单、撤单
+        if rng.random() < 0.5:
+            sendRandomOrders(trade.price, 1)
+        cancelRandomOrders()
+    strategy.onTrade = onTrade
+
+    price = 3500
+    dt = datetime(2019, 1, 2, 9)
+    for i in range(steps):
+        sendRandomOrders(price, rng.randint(0, 3))
+        cancelRandomOrders()
+
+        lastPrice, price = price, price + rng.randint(-5, 5)
+        dt += timedelta(minutes=1)
+        if mode == 'bar':
+            bar = CtaBarData()
+            bar.vtSymbol = 'rb1910'
+            bar.symbol = 'RB1910'
+            bar.open = lastPrice
+            bar.close = price
+            bar.high = max(lastPrice, price) + rng.randint(0, 4)
+            bar.low = min(lastPrice, price) - rng.randint(0, 4)
+            bar.datetime = dt
+            engine.bar = bar
+        else:
+            tick = CtaTickData()
+            tick.vtSymbol = 'rb1910'
+            tick.symbol = 'rb1910'
+            tick.lastPrice = price
+            tick.askPrice1 = price + 1
+            tick.bidPrice1 = price - 1
+            tick.datetime = dt
+            engine.tick = tick
+        engine.dt = dt
+        engine.crossLimitOrder()
+        engine.crossStopOrder()
+
+    return engine, strategy, errors
+
+
+def trade_list(engine):
+    return [(k, t.vtSymbol, t.direction, t.offset, t.price, t.volume, t.orderID, t.tradeTime)
+            for k, t in engine.tradeDict.items()]
+
+
+@pytest.mark.parametrize('mode', ['bar', 'tick'])
+@pytest.mark.parametrize('seed', range(3))
+def test_cross_orders_same_as_reference(mode, seed):
+    ref, refStrategy, refErrors = run(ReferenceEngine, mode, seed)
+    new, newStrategy, newErrors = run(backtesting.BacktestingEngine, mode, seed)
+
+    assert len(ref.tradeDict) > 100
+    assert trade_list(new) == trade_list(ref)
+    assert newStrategy.pos == refStrategy.pos
+    assert newStrategy.onOrders == refStrategy.onOrders
+    assert newErrors == refErrors
+    assert list(new.workingLimitOrderDict.keys()) == list(ref.workingLimitOrderDict.keys())
+    assert sorted(new.workingStopOrderDict.keys()) == sorted(ref.workingStopOrderDict.keys())
+    assert len(new.limitOrderIndex) == len(new.workingLimitOrderDict)
+    assert len(new.stopOrderIndex) == len(new.workingStopOrderDict)
+    assert dict((k, v.__dict__) for k, v in new.posBufferDict.items()) == \
+        dict((k, v.__dict__) for k, v in ref.posBufferDict.items())
+
+    # 已知的行为变化：原实现只修改了委托副本的状态，现在成交的限价单、触发的停止单本身的状态也会更新
+    filled = set(t.orderID for t in new.tradeDict.values())
+    assert new.limitOrderDict.keys() == ref.limitOrderDict.keys()
+    for key, order in new.limitOrderDict.items():
+        if order.orderID in filled:
+            assert (order.status, order.tradedVolume) == (STATUS_ALLTRADED, order.totalVolume)
+        else:
+            assert order.status == ref.limitOrderDict[key].status
+    # 触发的停止单（包括在自身成交回调中被撤销的）状态为已触发，数量与停止单生成的委托一致
+    triggered = 0
+    for key, so in new.stopOrderDict.items():
+        refStatus = ref.stopOrderDict[key].status
+        if so.status == STOPORDER_TRIGGERED:
+            triggered += 1
+            assert refStatus in (STOPORDER_WAITING, STOPORDER_CANCELLED)
+        else:
+            assert so.status == refStatus
+    assert triggered == len([key for key in new.limitOrderDict if '.' not in key])
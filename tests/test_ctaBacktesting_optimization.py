@@ -0,0 +1,71 @@
+# encoding: UTF-8
+
+"""
+串行参数优化：每组参数回测前清空上一组参数的资金、每日结算等结果
+"""
+
+import logging
+from datetime import datetime, timedelta
+
+import pytest
+
+backtesting = pytest.importorskip('vnpy.trader.app.ctaStrategy.ctaBacktesting')
+from vnpy.trader.app.ctaStrategy.ctaBase import CtaBarData
+
+INIT_CAPITAL = 100000
+
+# 每组参数的每日平仓权益
+DAILY_CAPITAL = {
+    1: [100000, 80000],     # 回撤20%，触发提前终止
+    2: [100000, 101000, 100500],
+}
+
+
+def create_engine():
+    engine = backtesting.BacktestingEngine()
+    engine.logger = logging.getLogger('test_ctaBacktesting')
+    engine.setInitCapital(INIT_CAPITAL)
+    engine.last_bar = CtaBarData()
+    engine.last_bar.close = 3500
+
+    def initStrategy(strategyClass, setting=None):
+        engine.current_setting = setting
+
+    def runBacktesting():
+        # 模拟回放：每日结算，触发提前终止后不再继续
+        day = datetime(2019, 1, 2)
+        maxCapital = INIT_CAPITAL
+        for capital in DAILY_CAPITAL[engine.current_setting['x']]:
+            maxCapital = max(maxCapital, capital)
+            engine.capital = capital
+            engine.savingDailyData(day, capital, maxCapital, 0)
+            if engine.pruneReason:
+                break
+            day += timedelta(days=1)
+
+    engine.initStrategy = initStrategy
+    engine.runBacktesting = runBacktesting
+    return engine
+
+
+def test_serial_optimization_resets_result_between_settings(tmpdir):
+    engine = create_engine()
+
+    setting = backtesting.OptimizationSetting()
+    setting.addParameter('x', 1, 2, 1)
+    setting.setOptimizeTarget('capital')
+    setting.setResultFile(str(tmpdir.join('result.jsonl')))
+    setting.addPruneRule('max_drawdown_rate', 10)
+
+    resultList = engine.runOptimization(object, setting)
+    records = dict((r[2]['setting']['x'], r[2]) for r in resultList)
+
+    assert records[1]['pruned']
+    assert records[1]['maxDrawdownRate'] == 20
+
+    # 第二组参数未受第一组的回撤、净值影响
+    assert records[2]['pruned'] is None
+    assert records[2]['maxDrawdownRate'] == 0.495
+    assert records[2]['netCapital'] == 100500
+    assert [d['net'] for d in engine.dailyList] == DAILY_CAPITAL[2]
+    assert engine.maxNetCapital == 101000
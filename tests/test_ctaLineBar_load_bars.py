@@ -0,0 +1,129 @@
+# encoding: UTF-8
+
+"""
+CtaLineBar.load_bars 批量（向量化）计算与逐根addBar的一致性
+"""
+
+import copy
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+talib = pytest.importorskip('talib')
+lineBarModule = pytest.importorskip('vnpy.trader.app.ctaStrategy.ctaLineBar')
+from vnpy.trader.app.ctaStrategy.ctaBase import CtaBarData
+
+lineBarModule.DEBUGCTALOG = False
+
+SETTING = dict(name='M5', barTimeInterval=5, shortSymbol='rb', minDiff=1,
+               inputMa1Len=5, inputMa2Len=10, inputMa3Len=60,
+               inputEma1Len=12, inputEma2Len=26, inputEma3Len=8,
+               inputBollLen=20, inputBoll2Len=26, inputRsi1Len=14, inputRsi2Len=7,
+               inputMacdFastPeriodLen=12, inputMacdSlowPeriodLen=26, inputMacdSignalPeriodLen=9,
+               inputVolLen=10, inputKdjLen=9, inputKdjTBLen=9, inputDmiLen=14, inputAtr1Len=14, inputCmiLen=10)
+
+# 未取整的序列，允许浮点误差
+FLOAT_FIELDS = {'lineBollStd', 'lineBoll2Std'}
+
+
+class FakeStrategy(object):
+    def __init__(self):
+        self.logs = []
+
+    def writeCtaLog(self, content):
+        self.logs.append(content)
+
+
+def make_bars(n, seed=3):
+    rng = np.random.RandomState(seed)
+    close = 3500.0
+    dt = datetime(2019, 1, 2, 9, 0)
+    bars = []
+    for i in range(n):
+        bar = CtaBarData()
+        bar.open = close
+        close = round(close + rng.normal(0, 3))
+        bar.close = close
+        bar.high = max(bar.open, close) + abs(round(rng.normal(0, 2)))
+        bar.low = min(bar.open, close) - abs(round(rng.normal(0, 2)))
+        bar.volume = int(rng.randint(1, 500))
+        bar.datetime = dt
+        bar.date = dt.strftime('%Y-%m-%d')
+        bar.time = dt.strftime('%H:%M:%S')
+        bar.tradingDay = bar.date
+        bars.append(bar)
+        dt += timedelta(minutes=1)
+    return bars
+
+
+def create_line_bar(cls, mode, bars):
+    setting = dict(SETTING)
+    setting['mode'] = mode
+    lineBar = cls(FakeStrategy(), lambda bar: None, setting)
+    lineBar.curTick = bars[0]
+    return lineBar
+
+
+def assert_same_value(name, x, y):
+    if isinstance(x, float) and isinstance(y, float) and x != x and y != y:
+        return
+    if name in FLOAT_FIELDS:
+        assert abs(x - y) <= 1e-9, name
+    else:
+        assert x == y, name
+
+
+@pytest.mark.parametrize('mode', ['tick', 'bar'])
+@pytest.mark.parametrize('cls_name', ['CtaLineBar', 'CtaMinuteBar'])
+def test_load_bars_vectorized_same_as_add_bar(mode, cls_name):
+    cls = getattr(lineBarModule, cls_name)
+    bars = make_bars(1500)
+
+    expected = create_line_bar(cls, mode, bars)
+    for bar in bars:
+        expected.addBar(copy.copy(bar), bar_is_completed=True)
+
+    result = create_line_bar(cls, mode, bars)
+    assert result.load_bars([copy.copy(bar) for bar in bars]) == len(bars)
+
+    # 批量序列全程可用，未中途退回逐根计算
+    assert not [log for log in result.strategy.logs if u'不一致' in log]
+    assert result.bulk_cursor is None and result.inc_kernels == {}
+
+    for name, x in expected.__dict__.items():
+        if name in ('strategy', 'onBarFunc', 'lineBar', 'curTick', 'periods'):
+            continue
+        y = result.__dict__[name]
+        if isinstance(x, list) and all(isinstance(v, (int, float)) for v in x):
+            assert len(x) == len(y), name
+            for u, v in zip(x, y):
+                assert_same_value(name, u, v)
+        elif isinstance(x, (int, float, str, dict)):
+            assert_same_value(name, x, y)
+
+    assert [p.__dict__ for p in expected.periods] == [p.__dict__ for p in result.periods]
+
+
+def test_window_functions_same_as_talib():
+    from vnpy.trader.app.ctaStrategy import ctaIndicator
+
+    closes = np.array([bar.close for bar in make_bars(400, seed=5)], dtype=float)
+
+    mean = ctaIndicator.window_mean(closes, 20)
+    std = ctaIndicator.window_std(closes, 20, mean)
+    ema = ctaIndicator.window_ema(closes, 60, 20)
+    rsi = ctaIndicator.window_rsi(closes, 14)
+    dif, dea, macd = ctaIndicator.window_macd(closes, 12, 26, 9, 120)
+
+    assert np.isnan(mean[:19]).all() and np.isnan(ema[:59]).all()
+    for i in range(60, len(closes)):
+        upper, middle, lower = talib.BBANDS(closes[i - 19:i + 1], timeperiod=20, nbdevup=2, nbdevdn=2, matype=0)
+        assert mean[i] == pytest.approx(middle[-1], abs=1e-9)
+        assert mean[i] + 2 * std[i] == pytest.approx(upper[-1], abs=1e-9)
+        assert ema[i] == pytest.approx(talib.EMA(closes[i - 59:i + 1], 20)[-1], abs=1e-9)
+        assert rsi[i] == pytest.approx(talib.RSI(closes[i - 14:i + 1], 14)[-1], abs=1e-9)
+        ta_dif, ta_dea, ta_macd = talib.MACD(closes[max(0, i - 119):i + 1], 12, 26, 9)
+        assert dif[i] == pytest.approx(ta_dif[-1], abs=1e-9)
+        assert dea[i] == pytest.approx(ta_dea[-1], abs=1e-9)
+        assert macd[i] == pytest.approx(ta_macd[-1], abs=1e-9)
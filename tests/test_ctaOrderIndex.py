@@ -0,0 +1,115 @@
+# encoding: UTF-8
+
+"""
+停止单、限价单的价格索引：触发条件、同价按发出顺序、移除、合约大小写
+"""
+
+import pytest
+
+ctaOrderIndex = pytest.importorskip('vnpy.trader.app.ctaStrategy.ctaOrderIndex')
+from vnpy.trader.vtConstant import DIRECTION_LONG, DIRECTION_SHORT
+
+StopOrderIndex = ctaOrderIndex.StopOrderIndex
+LimitOrderIndex = ctaOrderIndex.LimitOrderIndex
+
+
+class Order(object):
+    def __init__(self, orderID, vtSymbol, direction, price):
+        self.stopOrderID = orderID
+        self.vtOrderID = orderID
+        self.vtSymbol = vtSymbol
+        self.direction = direction
+        self.price = price
+
+
+def ids(result):
+    return [orderID for orderID, order in result]
+
+
+def test_stop_order_trigger_condition():
+    index = StopOrderIndex()
+    index.add(Order('b1', 'rb1910', DIRECTION_LONG, 3510))
+    index.add(Order('b2', 'rb1910', DIRECTION_LONG, 3500))
+    index.add(Order('s1', 'rb1910', DIRECTION_SHORT, 3490))
+    index.add(Order('s2', 'rb1910', DIRECTION_SHORT, 3480))
+
+    # 多头 价格 >= 停止价，空头 价格 <= 停止价
+    assert ids(index.pop_triggered('rb1910', 3505, 3505)) == ['b2']
+    assert ids(index.pop_triggered('rb1910', 3490, 3490)) == ['s1']
+    assert ids(index.pop_triggered('rb1910', 3520, 3470)) == ['b1', 's2']
+    assert len(index) == 0
+
+
+def test_limit_order_cross_condition():
+    index = LimitOrderIndex()
+    index.add(Order('b1', 'rb1910', DIRECTION_LONG, 3490))
+    index.add(Order('b2', 'rb1910', DIRECTION_LONG, 3500))
+    index.add(Order('s1', 'rb1910', DIRECTION_SHORT, 3510))
+    index.add(Order('s2', 'rb1910', DIRECTION_SHORT, 3500))
+
+    # 买入 委托价 >= 买入撮合价，卖出 委托价 <= 卖出撮合价
+    assert ids(index.pop_triggered('rb1910', 3500, 3499)) == ['b2']
+    assert ids(index.pop_triggered('rb1910', 3501, 3500)) == ['s2']
+    assert ids(index.pop_triggered('rb1910', 3480, 3520)) == ['b1', 's1']
+
+
+def test_same_price_in_sent_order():
+    for indexClass in (StopOrderIndex, LimitOrderIndex):
+        index = indexClass()
+        for orderID in ['o3', 'o1', 'o2']:
+            index.add(Order(orderID, 'rb1910', DIRECTION_LONG, 3500))
+        index.add(Order('o4', 'rb1910', DIRECTION_SHORT, 3500))
+        index.add(Order('o5', 'rb1910', DIRECTION_LONG, 3500))
+
+        # 同价的委托按发出的先后顺序返回，不按编号排序
+        assert ids(index.pop_triggered('rb1910', 3500, 3500)) == ['o3', 'o1', 'o2', 'o4', 'o5']
+
+
+def test_remove_after_pop():
+    index = StopOrderIndex()
+    index.add(Order('b1', 'rb1910', DIRECTION_LONG, 3500))
+    index.add(Order('b2', 'rb1910', DIRECTION_LONG, 3500))
+    assert ids(index.pop_triggered('rb1910', 3500, None)) == ['b1', 'b2']
+
+    # 已取出的委托（如在成交回调中撤单）移除时返回False，不影响其他委托
+    index.add(Order('b3', 'rb1910', DIRECTION_LONG, 3500))
+    assert index.remove('b1') is False
+    assert 'b3' in index
+    assert index.remove('b3') is True
+    assert index.remove('b3') is False
+    assert len(index) == 0
+    assert index.pop_triggered('rb1910', 4000, 0) == []
+
+
+def test_remove_one_of_same_price():
+    index = LimitOrderIndex()
+    for orderID in ['o1', 'o2', 'o3']:
+        index.add(Order(orderID, 'rb1910', DIRECTION_SHORT, 3500))
+    assert index.remove('o2') is True
+    assert ids(index.pop_triggered('rb1910', None, 3500)) == ['o1', 'o3']
+
+
+def test_add_again_replaces():
+    index = StopOrderIndex()
+    order = Order('b1', 'rb1910', DIRECTION_LONG, 3500)
+    index.add(order)
+    order.price = 3600
+    index.add(order)
+    assert len(index) == 1
+    assert index.pop_triggered('rb1910', 3500, None) == []
+    assert ids(index.pop_triggered('rb1910', 3600, None)) == ['b1']
+
+
+def test_symbol_case():
+    index = LimitOrderIndex(ignore_case=True)
+    index.add(Order('o1', 'RB1910', DIRECTION_LONG, 3500))
+    index.add(Order('o2', 'rb1910', DIRECTION_LONG, 3500))
+    index.add(Order('o3', 'j1909', DIRECTION_LONG, 3500))
+    # 回测中按vtSymbol或symbol匹配，不区分大小写，同一委托只返回一次
+    assert ids(index.pop_triggered(('rb1910', 'RB1910'), 3500, 3500)) == ['o1', 'o2']
+    assert ids(index.pop_triggered('J1909', 3500, 3500)) == ['o3']
+
+    index = StopOrderIndex()
+    index.add(Order('o1', 'RB1910', DIRECTION_LONG, 3500))
+    assert index.pop_triggered('rb1910', 3500, 3500) == []
+    assert ids(index.pop_triggered('RB1910', 3500, 3500)) == ['o1']
@@ -0,0 +1,135 @@
+# encoding: UTF-8
+
+"""
+DrEngine批量写入：连接断开时重连重试，按实际写入的条数统计
+"""
+
+from queue import Queue
+from threading import Lock, Thread
+
+import pytest
+
+pytest.importorskip('pymongo')
+from pymongo.errors import AutoReconnect, BulkWriteError
+drEngine = pytest.importorskip('vnpy.trader.app.dataRecorder.drEngine')
+from vnpy.trader.app.dataRecorder.drStorage import DrMongoStorage
+
+
+class FakeCollection(object):
+    """依次执行actions：None为写入成功，异常则抛出"""
+
+    def __init__(self, actions):
+        self.actions = list(actions)
+        self.calls = 0
+
+    def insert_many(self, docs, ordered=True):
+        self.calls += 1
+        action = self.actions.pop(0) if self.actions else None
+        if action is not None:
+            raise action
+
+
+class FakeMainEngine(object):
+    def __init__(self, collection):
+        self.collection = collection
+        self.dbClient = {'db': {'col': collection}}
+        self.connects = 0
+
+    def dbConnect(self):
+        self.connects += 1
+
+
+def create_engine(actions, retryTimes=3):
+    collection = FakeCollection(actions)
+    mainEngine = FakeMainEngine(collection)
+    engine = drEngine.DrEngine.__new__(drEngine.DrEngine)
+    engine.storage = DrMongoStorage(mainEngine)
+    engine.retryTimes = retryTimes
+    engine.retryInterval = 0
+    engine.statsLock = Lock()
+    engine.stats = {'inserted': 0, 'failed': 0, 'batches': 0, 'retries': 0}
+    engine.logs = []
+    engine.writeDrLog = engine.logs.append
+    return engine, mainEngine
+
+
+def duplicate_key_error(nInserted, nDuplicated):
+    errors = [{'index': i, 'code': 11000, 'errmsg': 'E11000 duplicate key'} for i in range(nDuplicated)]
+    return BulkWriteError({'nInserted': nInserted, 'writeErrors': errors})
+
+
+def test_retry_after_reconnect():
+    engine, mainEngine = create_engine([AutoReconnect('reset'), AutoReconnect('reset'), None])
+    engine.flushBatch(('db', 'col'), [{'i': i} for i in range(10)])
+
+    assert mainEngine.collection.calls == 3
+    assert mainEngine.connects == 2
+    assert engine.stats == {'inserted': 10, 'failed': 0, 'batches': 1, 'retries': 2}
+
+
+def test_give_up_after_retry_times():
+    engine, mainEngine = create_engine([AutoReconnect('reset')] * 5, retryTimes=2)
+    engine.flushBatch(('db', 'col'), [{'i': i} for i in range(10)])
+
+    assert mainEngine.collection.calls == 3
+    assert engine.stats == {'inserted': 0, 'failed': 10, 'batches': 1, 'retries': 2}
+
+
+def test_count_inserted_from_bulk_write_error():
+    engine, mainEngine = create_engine([duplicate_key_error(7, 3)])
+    engine.flushBatch(('db', 'col'), [{'i': i} for i in range(10)])
+
+    assert mainEngine.collection.calls == 1
+    assert engine.stats == {'inserted': 7, 'failed': 3, 'batches': 1, 'retries': 0}
+
+
+def test_duplicates_on_retry_were_inserted_before():
+    # 第一次写入了4条后断开，重试时这4条报重复键错误
+    engine, mainEngine = create_engine([AutoReconnect('reset'), duplicate_key_error(6, 4)])
+    engine.flushBatch(('db', 'col'), [{'i': i} for i in range(10)])
+
+    assert engine.stats == {'inserted': 10, 'failed': 0, 'batches': 1, 'retries': 1}
+
+
+class FailingStorage(object):
+    """flush/close总是出错的存储"""
+
+    def __init__(self):
+        self.docs = []
+        self.flushes = 0
+
+    def insertMany(self, dbName, collectionName, docs, retry=False):
+        self.docs.extend(docs)
+        return len(docs)
+
+    def flush(self):
+        self.flushes += 1
+        raise OSError('disk full')
+
+    def close(self):
+        raise OSError('disk full')
+
+
+def test_run_survives_storage_flush_error():
+    engine, mainEngine = create_engine([])
+    engine.storage = FailingStorage()
+    engine.queue = Queue()
+    engine.batchSize = 1
+    engine.batchInterval = 0.01
+    engine.active = True
+    thread = Thread(target=engine.run)
+    thread.start()
+
+    engine.queue.put(('db', ('col',), {'i': 0}))
+    while engine.storage.flushes < 2 and thread.is_alive():
+        thread.join(0.01)
+    # 存储缓冲写入出错后，写入线程仍然继续处理队列
+    engine.queue.put(('db', ('col',), {'i': 1}))
+    engine.active = False
+    thread.join(5)
+
+    assert not thread.is_alive()
+    assert engine.storage.docs == [{'i': 0}, {'i': 1}]
+    assert engine.stats['inserted'] == 2
+    assert any(u'写入存储缓冲异常' in log for log in engine.logs)
+    assert any(u'关闭存储异常' in log for log in engine.logs)
@@ -0,0 +1,141 @@
+# encoding: UTF-8
+
+"""
+共享MongoClient与流式查询
+"""
+
+import pytest
+
+pytest.importorskip('pymongo')
+from pymongo.errors import AutoReconnect
+from vnpy.data.mongo import mongo_pool
+from vnpy.data.mongo.mongo_data import MongoData
+
+
+class FakeCursor(object):
+    """逐条返回数据，返回fail_after条后抛出异常"""
+
+    def __init__(self, rows, fail_after=None):
+        self.rows = rows
+        self.fail_after = fail_after
+        self.closed = False
+
+    def sort(self, key, direction):
+        return self
+
+    def limit(self, n):
+        return self
+
+    def __iter__(self):
+        for i, row in enumerate(self.rows):
+            if self.fail_after is not None and i >= self.fail_after:
+                raise AutoReconnect('connection reset')
+            yield row
+
+    def close(self):
+        self.closed = True
+
+
+class FakeCollection(object):
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    def find(self, flt, projection=None, batch_size=None):
+        if isinstance(self.cursor, Exception):
+            raise self.cursor
+        return self.cursor
+
+
+class FakeClient(object):
+    def __init__(self, collection):
+        self.collection = collection
+
+    def __getitem__(self, name):
+        return {'col': self.collection}
+
+
+def create_mongo_data(cursor, cls=MongoData):
+    mongo_data = cls.__new__(cls)
+    mongo_data.dbClient = FakeClient(FakeCollection(cursor))
+    mongo_data.db_has_connected = False
+    mongo_data.errors = []
+    mongo_data.writeError = mongo_data.errors.append
+    mongo_data.writeLog = lambda content: None
+    return mongo_data
+
+
+def test_get_client_shared_until_close_clients():
+    client = mongo_pool.get_client('localhost', 27017)
+    assert mongo_pool.get_client('localhost', 27017) is client
+
+    mongo_pool.close_clients()
+    new_client = mongo_pool.get_client('localhost', 27017)
+    assert new_client is not client
+    mongo_pool.close_clients()
+
+
+def test_iter_query_closes_cursor_when_stopped_early():
+    cursor = FakeCursor([{'i': i} for i in range(10)])
+    rows = mongo_pool.iter_query(FakeCollection(cursor))
+    assert next(rows) == {'i': 0}
+    rows.close()
+    assert cursor.closed
+
+
+def test_db_query_iter_raises_on_error_in_the_middle(monkeypatch):
+    monkeypatch.setattr('vnpy.data.mongo.mongo_pool.sleep', lambda seconds: None)
+    cursor = FakeCursor([{'i': i} for i in range(10)], fail_after=3)
+    mongo_data = create_mongo_data(cursor)
+
+    rows = []
+    with pytest.raises(AutoReconnect):
+        for row in mongo_data.dbQueryIter('db', 'col', {}):
+            rows.append(row)
+
+    # 调用者能得知数据不完整，而不是拿到前3条当作全部数据
+    assert len(rows) == 3
+    assert mongo_data.errors
+    assert cursor.closed
+
+
+def test_db_query_iter_returns_all_rows():
+    mongo_data = create_mongo_data(FakeCursor([{'i': i} for i in range(10)]))
+    assert [row['i'] for row in mongo_data.dbQueryIter('db', 'col', {})] == list(range(10))
+
+
+def main_engine_class():
+    vtEngine = pytest.importorskip('vnpy.trader.vtEngine')
+    return vtEngine.MainEngine
+
+
+@pytest.mark.parametrize('get_class', [lambda: MongoData, main_engine_class])
+def test_query_columns_returns_none_on_auto_reconnect(monkeypatch, get_class):
+    slept = []
+    monkeypatch.setattr('vnpy.data.mongo.mongo_pool.sleep', slept.append)
+    owner = create_mongo_data(AutoReconnect('connection reset'), get_class())
+
+    assert owner.dbQueryColumns('db', 'col', {}, ['i']) is None
+    assert slept == [1]
+    assert owner.errors and u'重连' in owner.errors[0]
+
+
+@pytest.mark.parametrize('get_class', [lambda: MongoData, main_engine_class])
+def test_query_iter_reraises_auto_reconnect(monkeypatch, get_class):
+    monkeypatch.setattr('vnpy.data.mongo.mongo_pool.sleep', lambda seconds: None)
+    owner = create_mongo_data(FakeCursor([{'i': i} for i in range(10)], fail_after=3), get_class())
+
+    with pytest.raises(AutoReconnect):
+        list(owner.dbQueryIter('db', 'col', {}))
+
+
+@pytest.mark.parametrize('get_class', [lambda: MongoData, main_engine_class])
+def test_query_columns_without_client_reconnects(get_class):
+    owner = create_mongo_data(FakeCursor([]), get_class())
+    owner.dbClient = None
+    owner.db_has_connected = True
+    connects = []
+    owner.dbConnect = lambda: connects.append(1)
+
+    assert owner.dbQueryColumns('db', 'col', {}, ['i']) is None
+    assert list(owner.dbQueryIter('db', 'col', {})) == []
+    assert connects == [1, 1]
@@ -0,0 +1,183 @@
+# encoding: UTF-8
+
+"""
+MultiWorkerEventEngine：同一分片键的事件按顺序处理，不同分片键并行；
+CtaEngine按策略名将tick/委托/成交/计时器回调转到各策略的线程
+"""
+
+import threading
+import time
+from threading import RLock
+
+import pytest
+
+pytest.importorskip('qtpy')
+from vnpy.event import MultiWorkerEventEngine, Event
+from vnpy.event.eventType import EVENT_TIMER
+
+EVENT_TEST = 'eTest'
+EVENT_ORDER = 'eOrder.'
+
+
+class Data(object):
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+@pytest.fixture
+def engine():
+    ee = MultiWorkerEventEngine(workers=4)
+    ee.start(timer=False)
+    yield ee
+    ee.stop()
+
+
+def test_per_key_ordering(engine):
+    received = {'A': [], 'B': []}
+    threads = {'A': set(), 'B': set()}
+
+    def make_handler(key):
+        def handler(event):
+            if key == 'A':
+                time.sleep(0.001)
+            received[key].append(event.dict_['data'])
+            threads[key].add(threading.current_thread().name)
+        return handler
+
+    engine.register(EVENT_TEST, make_handler('A'), shard='A')
+    engine.register(EVENT_TEST, make_handler('B'), shard='B')
+    for i in range(200):
+        engine.put(Event(EVENT_TEST, i))
+
+    assert wait_until(lambda: len(received['A']) == 200 and len(received['B']) == 200)
+    assert received['A'] == list(range(200))
+    assert received['B'] == list(range(200))
+    # 每个分片键固定在一个线程，不同分片键分在不同线程
+    assert len(threads['A']) == 1 and len(threads['B']) == 1
+    assert threads['A'] != threads['B']
+
+
+def test_by_symbol_keeps_symbol_order(engine):
+    received = []
+    lock = threading.Lock()
+
+    def handler(event):
+        with lock:
+            received.append(event.dict_['data'])
+
+    engine.register(EVENT_TEST, handler, bySymbol=True)
+    for i in range(300):
+        engine.put(Event(EVENT_TEST, Data(vtSymbol='s{}'.format(i % 3), i=i)))
+
+    assert wait_until(lambda: len(received) == 300)
+    for symbol in ['s0', 's1', 's2']:
+        seq = [d.i for d in received if d.vtSymbol == symbol]
+        assert seq == sorted(seq)
+
+
+def test_call_in_shard_runs_after_events_of_same_key(engine):
+    calls = []
+    names = set()
+
+    def handler(event):
+        calls.append(('event', event.dict_['data']))
+        names.add(threading.current_thread().name)
+        # 处理事件时转到同一分片键的后续调用，在其后的事件之前执行完
+        engine.callInShard('A', follow, event.dict_['data'])
+
+    def follow(i):
+        calls.append(('call', i))
+        names.add(threading.current_thread().name)
+
+    engine.register(EVENT_TEST, handler, shard='A')
+    for i in range(3):
+        engine.put(Event(EVENT_TEST, i))
+
+    assert wait_until(lambda: len(calls) == 6)
+    assert [c for c in calls if c[0] == 'call'] == [('call', 0), ('call', 1), ('call', 2)]
+    assert len(names) == 1
+
+
+#----------------------------------------------------------------------
+class FakeStrategy(object):
+    """记录回调顺序及执行线程，slow时每次回调等待"""
+
+    def __init__(self, name, slow=0):
+        self.name = name
+        self.slow = slow
+        self.calls = []
+        self.threads = set()
+
+    def record(self, item):
+        time.sleep(self.slow)
+        self.calls.append(item)
+        self.threads.add(threading.current_thread().name)
+
+    def onOrder(self, order):
+        self.record(('order', order.vtOrderID))
+
+    def onTimer(self):
+        self.record(('timer',))
+
+
+def create_cta_engine(eventEngine, strategies):
+    ctaEngine = pytest.importorskip('vnpy.trader.app.ctaStrategy.ctaEngine')
+    engine = ctaEngine.CtaEngine.__new__(ctaEngine.CtaEngine)
+    engine.eventEngine = eventEngine
+    engine.callInShard = eventEngine.callInShard
+    engine.orderLock = RLock()
+    engine.strategyDict = dict((s.name, s) for s in strategies)
+    engine.orderStrategyDict = {}
+    engine.writeCtaLog = lambda content, strategy_name=None: None
+    engine.onOrder_dispatch_close_pos = lambda order: None
+    eventEngine.register(EVENT_ORDER, engine.processOrderEvent)
+    eventEngine.register(EVENT_TIMER, engine.processTimerEvent)
+    return engine
+
+
+def order_event(vtOrderID):
+    order = Data(vtOrderID=vtOrderID, orderID=vtOrderID, vtSymbol='rb1910', totalVolume=1, tradedVolume=0,
+                 offset='', price=0, direction='', status='')
+    return Event(EVENT_ORDER, order)
+
+
+def test_cta_engine_routes_timer_and_order_events_by_strategy(engine):
+    slow = FakeStrategy('slow', slow=0.2)
+    fast = FakeStrategy('fast')
+    cta = create_cta_engine(engine, [slow, fast])
+    cta.orderStrategyDict = {'o1': slow, 'o2': fast, 'o3': slow}
+
+    engine.put(Event(EVENT_TIMER))
+    for vtOrderID in ['o1', 'o2', 'o3']:
+        engine.put(order_event(vtOrderID))
+
+    # 慢策略的onTimer不阻塞其他策略的委托回报
+    assert wait_until(lambda: len(fast.calls) == 2, timeout=0.15)
+    assert fast.calls == [('timer',), ('order', 'o2')]
+    assert len(slow.calls) < 3
+
+    # 同一策略的回调按事件顺序，在固定的线程中执行
+    assert wait_until(lambda: len(slow.calls) == 3)
+    assert slow.calls == [('timer',), ('order', 'o1'), ('order', 'o3')]
+    assert len(slow.threads) == 1
+    assert slow.threads != fast.threads
+
+
+def test_cta_engine_order_event_waits_for_order_mapping(engine):
+    strategy = FakeStrategy('s1')
+    cta = create_cta_engine(engine, [strategy])
+
+    # 策略线程发单：持锁期间委托回报已到达，引擎线程等待映射登记后再分发
+    with cta.orderLock:
+        engine.put(order_event('o1'))
+        time.sleep(0.1)
+        cta.orderStrategyDict['o1'] = strategy
+
+    assert wait_until(lambda: strategy.calls == [('order', 'o1')])
@@ -0,0 +1,125 @@
+# encoding: UTF-8
+
+"""
+本地tick日志：写入后读取、夜盘归入下一交易日、截掉末尾不完整的记录、索引
+"""
+
+import os
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip('numpy')
+from vnpy.data.journal import tick_journal
+from vnpy.data.journal.tick_journal import JournalWriter, KIND_TICK, KIND_BAR
+
+SYMBOL = 'rb1910'
+
+
+def make_tick(dt, i):
+    return {'vtSymbol': SYMBOL, 'symbol': SYMBOL, 'exchange': 'SHFE',
+            'datetime': dt,
+            'lastPrice': 3500 + i * 0.5,
+            'volume': 100 + i,
+            'openInterest': 20000.0 + i,
+            'upperLimit': 3700.0,
+            'lowerLimit': 3300.0,
+            'bidPrice1': 3499.5 + i * 0.5, 'bidVolume1': 10 + i,
+            'askPrice1': 3500.5 + i * 0.5, 'askVolume1': 20 + i}
+
+
+def make_ticks(start, n, step=timedelta(milliseconds=500)):
+    return [make_tick(start + step * i, i) for i in range(n)]
+
+
+def test_round_trip(tmpdir):
+    root = str(tmpdir)
+    ticks = make_ticks(datetime(2019, 6, 4, 9, 0, 0, 500000), 10)
+    writer = JournalWriter(root)
+    assert writer.append(KIND_TICK, SYMBOL, ticks) == 10
+    writer.close()
+
+    assert tick_journal.list_days(root, KIND_TICK, SYMBOL) == ['2019-06-04']
+    result = list(tick_journal.iter_objects(root, KIND_TICK, SYMBOL))
+    assert len(result) == 10
+    for t, r in zip(ticks, result):
+        assert r['datetime'] == t['datetime']
+        for name in ['lastPrice', 'volume', 'openInterest', 'bidPrice1', 'askPrice1', 'bidVolume1', 'askVolume1']:
+            assert r[name] == t[name]
+        # 未提供的字段写入0
+        assert r['bidPrice2'] == 0
+        assert r['symbol'] == SYMBOL and r['exchange'] == 'SHFE'
+        assert r['tradingDay'] == '2019-06-04'
+    assert result[0]['date'] == '2019-06-04'
+    assert result[0]['time'] == '09:00:00.500'
+
+
+def test_night_session_next_trading_day(tmpdir):
+    root = str(tmpdir)
+    writer = JournalWriter(root)
+    # 周五夜盘（含跨零点）归入下周一，与周一日盘同一文件
+    writer.append(KIND_TICK, SYMBOL, make_ticks(datetime(2019, 6, 7, 14, 59), 2))
+    writer.append(KIND_TICK, SYMBOL, make_ticks(datetime(2019, 6, 7, 23, 59, 59), 4))
+    writer.append(KIND_TICK, SYMBOL, make_ticks(datetime(2019, 6, 10, 9, 0), 3))
+    writer.close()
+
+    assert tick_journal.list_days(root, KIND_TICK, SYMBOL) == ['2019-06-07', '2019-06-10']
+    assert tick_journal.list_days(root, KIND_TICK, SYMBOL, start='2019-06-08') == ['2019-06-10']
+    path = tick_journal.get_journal_path(root, KIND_TICK, SYMBOL, '2019-06-10')
+    dts = [r['datetime'] for r in tick_journal.iter_file(path)]
+    assert len(dts) == 7
+    assert dts[0] == datetime(2019, 6, 7, 23, 59, 59)
+    assert dts[-1] == datetime(2019, 6, 10, 9, 0, 1)
+
+
+def test_truncate_torn_tail_on_reopen(tmpdir):
+    root = str(tmpdir)
+    start = datetime(2019, 6, 4, 9, 0)
+    writer = JournalWriter(root)
+    writer.append(KIND_TICK, SYMBOL, make_ticks(start, 5))
+    writer.close()
+
+    # 模拟写入中断：文件末尾只有半条记录
+    path = tick_journal.get_journal_path(root, KIND_TICK, SYMBOL, '2019-06-04')
+    size = os.path.getsize(path)
+    with open(path, 'ab') as f:
+        f.write(b'\x01' * 17)
+    # 读取时忽略不完整的记录
+    assert len(list(tick_journal.iter_file(path))) == 5
+
+    writer = JournalWriter(root)
+    writer.append(KIND_TICK, SYMBOL, [make_tick(start + timedelta(seconds=10), 5)])
+    writer.close()
+
+    itemsize = os.path.getsize(path) - size
+    assert itemsize == tick_journal.load_records(path)[1].dtype.itemsize
+    result = list(tick_journal.iter_file(path))
+    assert len(result) == 6
+    assert result[-1]['datetime'] == start + timedelta(seconds=10)
+    assert result[-1]['lastPrice'] == make_tick(start, 5)['lastPrice']
+    assert tick_journal.load_index(root, KIND_TICK, SYMBOL)['2019-06-04']['count'] == 6
+
+
+def test_index_counts(tmpdir):
+    root = str(tmpdir)
+    writer = JournalWriter(root)
+    writer.append(KIND_TICK, SYMBOL, make_ticks(datetime(2019, 6, 3, 21, 0), 3))
+    writer.append(KIND_TICK, SYMBOL, make_ticks(datetime(2019, 6, 4, 9, 0), 4))
+    writer.flush()
+    # flush后索引已写入文件
+    index = tick_journal.load_index(root, KIND_TICK, SYMBOL)
+    assert index == {'2019-06-04': {'count': 7,
+                                    'start': str(datetime(2019, 6, 3, 21, 0)),
+                                    'end': str(datetime(2019, 6, 4, 9, 0, 1, 500000))}}
+
+    writer.append(KIND_TICK, SYMBOL, make_ticks(datetime(2019, 6, 4, 21, 0), 2))
+    writer.close()
+    index = tick_journal.load_index(root, KIND_TICK, SYMBOL)
+    assert dict((day, info['count']) for day, info in index.items()) == {'2019-06-04': 7, '2019-06-05': 2}
+
+    # 重新打开后继续累加
+    writer = JournalWriter(root)
+    writer.append(KIND_TICK, SYMBOL, make_ticks(datetime(2019, 6, 5, 9, 0), 1))
+    writer.close()
+    assert tick_journal.load_index(root, KIND_TICK, SYMBOL)['2019-06-05']['count'] == 3
+    assert tick_journal.load_index(root, KIND_BAR, SYMBOL) == {}
@@ -0,0 +1,71 @@
+# encoding: UTF-8
+
+"""
+RpcServer：未标记concurrent的函数在服务器线程中依次执行，标记的函数在工作线程池中并发执行
+"""
+
+import threading
+import time
+
+import pytest
+
+pytest.importorskip('zmq')
+pytest.importorskip('msgpack')
+from vnpy.rpc import RpcServer, RpcClient
+
+
+class Recorder(object):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.running = 0
+        self.maxRunning = 0
+
+    def call(self):
+        with self.lock:
+            self.running += 1
+            self.maxRunning = max(self.maxRunning, self.running)
+        time.sleep(0.1)
+        with self.lock:
+            self.running -= 1
+        return threading.current_thread().name
+
+
+@pytest.fixture
+def rpc():
+    server = RpcServer('tcp://127.0.0.1:23401', 'tcp://127.0.0.1:23402', workers=4)
+    client = RpcClient('tcp://127.0.0.1:23401', 'tcp://127.0.0.1:23402', timeout=10)
+    server.start()
+    client.start()
+    yield server, client
+    client.stop()
+    server.stop()
+
+
+def test_trading_functions_run_one_by_one(rpc):
+    server, client = rpc
+    recorder = Recorder()
+
+    def sendOrder():
+        return recorder.call()
+    server.register(sendOrder)
+
+    futures = [client.rpcCallAsync('sendOrder') for i in range(4)]
+    names = set(f.result(timeout=10) for f in futures)
+
+    assert recorder.maxRunning == 1
+    assert len(names) == 1
+
+
+def test_concurrent_functions_run_in_pool(rpc):
+    server, client = rpc
+    recorder = Recorder()
+
+    def dbQuery():
+        return recorder.call()
+    server.register(dbQuery, concurrent=True)
+
+    futures = [client.rpcCallAsync('dbQuery') for i in range(4)]
+    for f in futures:
+        f.result(timeout=10)
+
+    assert recorder.maxRunning > 1
@@ -1,6 +1,11 @@
 # encoding: UTF-8
 
 import pika
+import traceback
+from pika.exceptions import NackError, UnroutableError
+from queue import Queue, Empty, Full
+from threading import Thread, Lock, Event
+from time import time
 
 class base_broker():
 
@@ -24,18 +29,28 @@ class base_broker():
         # 身份鉴权
         self.credentials = pika.PlainCredentials(self.user, self.password, erase_on_connect=True)
 
+        # 异步发送（start_async后启用）
+        self.async_queue = None
+        self.async_thread = None
+        self.async_stop = None
+        self.async_setting = {}
+        self.async_stats = {}
+        self.async_lock = Lock()
+
         # 创建连接
-        self.connection = pika.BlockingConnection(
-                pika.ConnectionParameters(host=self.host, port=self.port,
-                                          credentials=self.credentials,
-                                          heartbeat=0, socket_timeout=5,
-                )
-            )
+        self.connection = self.create_connection()
 
         # 创建一个频道，或者指定频段数字编号
         self.channel = self.connection.channel(
             channel_number=self.channel_number)
 
+    def create_connection(self):
+        """创建连接（测试时可重载为本地的模拟broker）"""
+        return pika.BlockingConnection(
+            pika.ConnectionParameters(host=self.host, port=self.port,
+                                      credentials=self.credentials,
+                                      heartbeat=0, socket_timeout=5,))
+
     def reconnect(self):
         """
         重新连接
@@ -46,15 +61,192 @@ class base_broker():
         except:
             pass
 
-        self.connection = pika.BlockingConnection(
-            pika.ConnectionParameters(host=self.host, port=self.port,
-                                      credentials=self.credentials,
-                                      heartbeat=0, socket_timeout=5,))
+        self.connection = self.create_connection()
 
         self.channel = self.connection.channel(
             channel_number=self.channel_number)
         return self
 
+    def publish(self, exchange, routing_key, body, properties):
+        """
+        发送消息
+        同步模式：当前线程basic_publish，失败时重连一次再发送
+        异步模式：放入发送缓冲，由后台线程批量发送，缓冲满时按start_async的block参数等待或丢弃
+        :return: 异步模式下是否放入缓冲，同步模式为True
+        """
+        # 只读取一次：stop_async可能在其他线程中同时将其置为None
+        q = self.async_queue
+        if q is not None:
+            return self._put_async(q, (exchange, routing_key, body, properties))
+
+        try:
+            self.channel.basic_publish(exchange=exchange,
+                                       routing_key=routing_key,
+                                       body=body,
+                                       properties=properties)
+        except Exception as e:
+            print(e)
+            # 重连一次，继续发送
+            self.reconnect().channel.basic_publish(exchange=exchange,
+                                                   routing_key=routing_key,
+                                                   body=body,
+                                                   properties=properties)
+        return True
+
+    # ----------------------------------------------------------------------
+    def start_async(self, max_buffer=10000, batch_size=200, confirm=False, block=False, block_timeout=1.0):
+        """
+        启用异步发送：publish只放入有界缓冲，由后台线程使用独立的连接批量发送，调用线程不再等待网络与重连
+        :param max_buffer: 缓冲的最大消息数
+        :param batch_size: 后台线程每批最多从缓冲中取出的消息数（减少取缓冲的开销，网络上仍逐条发送）
+        :param confirm: 是否开启publisher confirms，未确认的计入nacked。
+                        注意：pika的BlockingConnection不支持流水线确认，开启后每条basic_publish都等待broker的ack，
+                        吞吐受往返时延限制；只是等待发生在后台线程，不阻塞publish的调用线程
+        :param block: 缓冲满时，True：等待至多block_timeout秒；False：丢弃新消息，计入dropped
+        :param block_timeout: 等待的秒数
+        """
+        if self.async_thread is not None:
+            return
+        self.async_setting = {'max_buffer': max_buffer, 'batch_size': max(int(batch_size), 1),
+                              'confirm': confirm, 'block': block, 'block_timeout': block_timeout}
+        self.async_stats = {'published': 0,     # 已发送
+                            'dropped': 0,       # 缓冲满丢弃
+                            'failed': 0,        # 重连后仍发送失败
+                            'nacked': 0,        # 未被broker确认
+                            'batches': 0,       # 发送批次
+                            'reconnects': 0,    # 重连次数
+                            'abandoned': 0,     # 停止超时，未发送而放弃
+                            'max_buffered': 0}  # 缓冲中的最大消息数
+        self.async_queue = Queue(maxsize=max_buffer)
+        self.async_stop = Event()
+        self.async_thread = Thread(target=self._run_async, args=(self.async_queue, self.async_stop),
+                                   name='amqp_publish', daemon=True)
+        self.async_thread.start()
+
+    def stop_async(self, timeout=5):
+        """
+        发送完缓冲中的消息后，停止异步发送，恢复同步模式
+        :param timeout: 最多等待的秒数；超时（如网络阻塞、缓冲已满）时，放弃缓冲中未发送的消息，计入abandoned
+        """
+        thread = self.async_thread
+        if thread is None:
+            return
+        q = self.async_queue
+        deadline = time() + timeout
+        try:
+            q.put(None, timeout=timeout)
+        except Full:
+            pass
+        thread.join(max(deadline - time(), 0))
+
+        if thread.is_alive():
+            # 后台线程仍在等待网络，通知其发送完当前的消息后退出，不再发送缓冲中的消息
+            self.async_stop.set()
+            abandoned = len([x for x in list(q.queue) if x is not None])
+            with self.async_lock:
+                self.async_stats['abandoned'] += abandoned
+            print(u'amqp异步发送停止超时，放弃缓冲中的{}条消息'.format(abandoned))
+
+        self.async_thread = None
+        self.async_queue = None
+
+    def get_async_stats(self):
+        """异步发送的统计（背压指标）"""
+        with self.async_lock:
+            d = dict(self.async_stats)
+        q = self.async_queue
+        d['buffered'] = q.qsize() if q is not None else 0
+        return d
+
+    def _put_async(self, q, item):
+        """放入发送缓冲q"""
+        try:
+            if self.async_setting['block']:
+                q.put(item, timeout=self.async_setting['block_timeout'])
+            else:
+                q.put_nowait(item)
+        except Full:
+            with self.async_lock:
+                self.async_stats['dropped'] += 1
+            return False
+
+        n = q.qsize()
+        with self.async_lock:
+            if n > self.async_stats['max_buffered']:
+                self.async_stats['max_buffered'] = n
+        return True
+
+    def _open_async_channel(self):
+        """后台线程的连接与频道（pika的连接不能跨线程使用）"""
+        connection = self.create_connection()
+        channel = connection.channel()
+        if self.async_setting['confirm']:
+            channel.confirm_delivery()
+        return connection, channel
+
+    def _run_async(self, q, stop):
+        """后台发送线程，stop被设置时（停止超时）不再发送剩余的消息"""
+        batch_size = self.async_setting['batch_size']
+        connection, channel = None, None
+        running = True
+        while running and not stop.is_set():
+            # 阻塞取第一条，再取出缓冲中已有的消息，组成一批
+            batch = [q.get()]
+            while len(batch) < batch_size:
+                try:
+                    batch.append(q.get_nowait())
+                except Empty:
+                    break
+            if None in batch:
+                # 停止标志
+                running = False
+                batch = [x for x in batch if x is not None]
+
+            # 逐条发送：confirm模式下basic_publish等待该条消息的ack后才返回（不是流水线确认）
+            published, failed, nacked, reconnects = 0, 0, 0, 0
+            for exchange, routing_key, body, properties in batch:
+                if stop.is_set():
+                    break
+                for retry in range(2):
+                    try:
+                        if channel is None:
+                            connection, channel = self._open_async_channel()
+                        channel.basic_publish(exchange=exchange, routing_key=routing_key,
+                                              body=body, properties=properties)
+                        published += 1
+                        break
+                    except (NackError, UnroutableError):
+                        # confirm模式下，消息未被broker确认
+                        nacked += 1
+                        break
+                    except Exception as ex:
+                        print(u'amqp异步发送异常:{}'.format(str(ex)))
+                        try:
+                            connection.close()
+                        except Exception:
+                            pass
+                        connection, channel = None, None
+                        if retry == 0:
+                            reconnects += 1
+                        else:
+                            failed += 1
+                            traceback.print_exc()
+
+            with self.async_lock:
+                s = self.async_stats
+                s['published'] += published
+                s['failed'] += failed
+                s['nacked'] += nacked
+                s['reconnects'] += reconnects
+                s['batches'] += 1
+
+        try:
+            if connection:
+                connection.close()
+        except Exception:
+            pass
+
     def close(self):
+        self.stop_async()
         if self.connection:
             self.connection.close()
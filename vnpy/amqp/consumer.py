@@ -5,6 +5,7 @@ from vnpy.amqp.base import base_broker
 import random
 import traceback
 from threading import Thread
+from vnpy.amqp.tick_codec import decode_ticks
 
 #########  模式1：接收者 #########
 class receiver(base_broker):
@@ -116,6 +117,20 @@ class subscriber(base_broker):
     def set_callback(self,cb_func):
         self.cb_func = cb_func
 
+    def set_tick_callback(self, cb_func):
+        """
+        接收tick消息：按消息的content_type（json / msgpack）解码，
+        每条消息回调一次 cb_func([dict])，dict的datetime字段已转换为datetime
+        """
+        def on_message(chan, method_frame, header_frame, body, userdata=None):
+            try:
+                cb_func(decode_ticks(body, getattr(header_frame, 'content_type', None)))
+            except Exception as ex:
+                print(u'tick消息处理异常:{}'.format(str(ex)))
+                traceback.print_exc()
+
+        self.cb_func = on_message
+
     def callback(self, chan, method_frame, _header_frame, body, userdata=None):
         print(1)
         print(" [x] %r" % body)
@@ -5,8 +5,10 @@ import random
 import traceback
 from uuid import uuid1
 from vnpy.amqp.base import base_broker
-from threading import Thread
+from threading import Thread, Lock, Event
+from time import time
 import json
+from vnpy.amqp.tick_codec import CONTENT_TYPE_JSON, encode_ticks
 
 #########  模式1：发送者 #########
 class sender(base_broker):
@@ -42,22 +44,14 @@ class sender(base_broker):
         # routing_key 指定向哪个队列中发送消息
         # body是要插入的内容, 字符串格式
         content_type = 'application/json' if isinstance(text, dict) else 'text/plain'
-        try:
-            self.channel.basic_publish(exchange=self.exchange,
-                                       routing_key=self.routing_key,
-                                       body=text,
-                                       properties=pika.BasicProperties(content_type=content_type,
-                                                                       delivery_mode=1))
-        except Exception as e:
-            print(e)
-            # 重连一次，继续发送
-            self.reconnect().channel.basic_publish(exchange=self.exchange,
-                                                   routing_key=self.routing_key,
-                                                   body=text,
-                                                   properties=pika.BasicProperties(content_type=content_type,
-                                                                                   delivery_mode=1))
+        self.publish(exchange=self.exchange,
+                     routing_key=self.routing_key,
+                     body=text,
+                     properties=pika.BasicProperties(content_type=content_type,
+                                                     delivery_mode=1))
 
     def exit(self):
+        self.stop_async()
         self.connection.close()
 
 #########  模式2：工作队列,任务发布者 #########
@@ -91,22 +85,14 @@ class task_creator(base_broker):
         # routing_key 指定向哪个队列中发送消息
         # body是要插入的内容, 字符串格式
         content_type = 'application/json' if isinstance(text, dict) else 'text/plain'
-        try:
-            self.channel.basic_publish(exchange=self.exchange,
-                                       routing_key=self.routing_key,
-                                       body=text,
-                                       properties=pika.BasicProperties(content_type=content_type,
-                                                                       delivery_mode=2))
-        except Exception as e:
-            print(e)
-            # 重连一次，继续发送
-            self.reconnect().channel.basic_publish(exchange=self.exchange,
-                                                   routing_key=self.routing_key,
-                                                   body=text,
-                                                   properties=pika.BasicProperties(content_type=content_type,
-                                                                                   delivery_mode=2))
+        self.publish(exchange=self.exchange,
+                     routing_key=self.routing_key,
+                     body=text,
+                     properties=pika.BasicProperties(content_type=content_type,
+                                                     delivery_mode=2))
 
     def exit(self):
+        self.stop_async()
         self.connection.close()
 
 #########  3、发布 / 订阅（Pub/Sub）模式，发布者 #########
@@ -114,7 +100,15 @@ class publisher(base_broker):
 
     def __init__(self, host='localhost', port=5672, user='admin', password='admin',
                  channel_number=1, queue_name='', routing_key='default',
-                 exchange='x_fanout'):
+                 exchange='x_fanout', tick_content_type=CONTENT_TYPE_JSON,
+                 batch_size=1, max_delay=0.1, async_setting=None):
+        """
+        :param tick_content_type: pub_tick发送tick的格式，CONTENT_TYPE_JSON（兼容原json订阅者）
+                                  或 CONTENT_TYPE_MSGPACK（二进制，需订阅者按content_type解码）
+        :param batch_size: 每条消息最多包含的tick数量，json订阅者只能处理1
+        :param max_delay: 缓存中最早的tick超过该秒数时发送（由定时发送线程检查，不必等待下一个tick）
+        :param async_setting: batch_size > 1时启用异步发送，传给start_async的参数
+        """
 
         # 通过基类，创建connection & channel
         super().__init__(host, port, user, password, channel_number)
@@ -123,6 +117,17 @@ class publisher(base_broker):
         self.exchange = exchange
         self.routing_key = routing_key
 
+        self.tick_content_type = tick_content_type
+        self.batch_size = max(int(batch_size), 1)
+        self.max_delay = max_delay
+        self.tick_buffer = []           # 待发送的tick
+        self.tick_buffer_time = 0       # 缓存中第一个tick的时间
+        self.tick_routing_key = None    # 缓存中tick的routing_key
+        # pub_tick与定时发送线程共用tick缓存；持锁放入发送缓冲，保证tick的顺序
+        self.tick_lock = Lock()
+        self.flush_stop = Event()
+        self.flush_thread = None
+
         # 通过channel，创建/使用一个queue。
         # auto_delete： 当所有已绑定在queue的consumer不使用此queue时，自动删除此queue
         # exclusive： private queue,它是True时，auto_delete也是True
@@ -140,30 +145,88 @@ class publisher(base_broker):
                                       durable=False,
                                       auto_delete=False)
 
-    def pub(self, text, routing_key=None):
+        # 批量发送时，启用异步发送，并启动定时发送线程，避免行情稀疏时tick滞留在缓存中。
+        # pika的连接不能跨线程使用：定时发送线程只把消息放入异步发送的缓冲，由异步发送线程使用其自己的连接发送
+        if self.batch_size > 1:
+            self.start_async(**(async_setting or {}))
+            if self.max_delay > 0:
+                self.flush_thread = Thread(target=self._run_flush, name='amqp_tick_flush', daemon=True)
+                self.flush_thread.start()
+
+    def pub(self, text, routing_key=None, content_type=None):
         # channel.basic_publish向队列中发送信息
         # exchange -- 它使我们能够确切地指定消息应该到哪个队列去。
         # routing_key 指定向哪个队列中发送消息
         # body是要插入的内容, 字符串格式
-        content_type = 'application/json' if isinstance(text, dict) else 'text/plain'
+        if content_type is None:
+            content_type = 'application/json' if isinstance(text, dict) else 'text/plain'
         if routing_key is None:
             routing_key = self.routing_key
-        try:
-            self.channel.basic_publish(exchange=self.exchange,
-                                       routing_key=routing_key,
-                                       body=text,
-                                       properties=pika.BasicProperties(content_type=content_type,
-                                                                       delivery_mode=1))
-        except Exception as e:
-            print(e)
-            # 重连一次，继续发送
-            self.reconnect().channel.basic_publish(exchange=self.exchange,
-                                                   routing_key=routing_key,
-                                                   body=text,
-                                                   properties=pika.BasicProperties(content_type=content_type,
-                                                                                   delivery_mode=1))
+        self.publish(exchange=self.exchange,
+                     routing_key=routing_key,
+                     body=text,
+                     properties=pika.BasicProperties(content_type=content_type,
+                                                     delivery_mode=1))
+
+    def pub_tick(self, tick, routing_key=None):
+        """
+        发布tick（VtTickData或dict，发布后不应再修改）
+        累积batch_size个，或缓存超过max_delay秒时，打包成一条消息发送
+        """
+        with self.tick_lock:
+            # routing_key不同的tick不能打包在一起
+            if self.tick_buffer and routing_key != self.tick_routing_key:
+                self.publish(*self._pop_ticks())
+            if not self.tick_buffer:
+                self.tick_buffer_time = time()
+                self.tick_routing_key = routing_key
+            self.tick_buffer.append(tick)
+            if len(self.tick_buffer) >= self.batch_size or time() - self.tick_buffer_time >= self.max_delay:
+                self.publish(*self._pop_ticks())
+
+    def flush_ticks(self):
+        """发送缓存中的tick（在调用者的线程中）"""
+        with self.tick_lock:
+            if self.tick_buffer:
+                self.publish(*self._pop_ticks())
+
+    def _pop_ticks(self):
+        """取出缓存中的tick，打包为一条消息：(exchange, routing_key, body, properties)"""
+        ticks, self.tick_buffer = self.tick_buffer, []
+        routing_key = self.tick_routing_key if self.tick_routing_key is not None else self.routing_key
+        return (self.exchange, routing_key, encode_ticks(ticks, self.tick_content_type),
+                pika.BasicProperties(content_type=self.tick_content_type, delivery_mode=1))
+
+    def _run_flush(self):
+        """定时发送线程：缓存中最早的tick超过max_delay秒时，放入异步发送的缓冲"""
+        interval = self.max_delay
+        while not self.flush_stop.wait(interval):
+            interval = self.max_delay
+            try:
+                with self.tick_lock:
+                    if not self.tick_buffer:
+                        continue
+                    # 异步发送已停止时，不在本线程使用连接发送，留待下一个tick或exit时发送
+                    q = self.async_queue
+                    if q is None:
+                        continue
+                    delay = time() - self.tick_buffer_time
+                    if delay >= self.max_delay:
+                        self._put_async(q, self._pop_ticks())
+                    else:
+                        # 等到最早的tick满max_delay时再检查
+                        interval = self.max_delay - delay
+            except Exception as ex:
+                print(u'定时发送tick异常:{}'.format(str(ex)))
+                traceback.print_exc()
 
     def exit(self):
+        if self.flush_thread is not None:
+            self.flush_stop.set()
+            self.flush_thread.join()
+            self.flush_thread = None
+        self.flush_ticks()
+        self.stop_async()
         self.connection.close()
 
 #########  4、路由模式：发布者 #########
@@ -191,21 +254,14 @@ class publisher_routing(base_broker):
         # routing_key 指定向哪个队列中发送消息
         # body是要插入的内容, 字符串格式
         content_type = 'application/json' if isinstance(text, dict) else 'text/plain'
-        try:
-            self.channel.basic_publish(exchange=self.exchange,
-                                       routing_key=routing_key,
-                                       body=text,
-                                       properties=pika.BasicProperties(content_type=content_type,
-                                                                       delivery_mode=1))
-        except Exception as e:
-            print(e)
-            self.reconnect().channel.basic_publish(exchange=self.exchange,
-                                                   routing_key=routing_key,
-                                                   body=text,
-                                                   properties=pika.BasicProperties(content_type=content_type,
-                                                                                   delivery_mode=1))
+        self.publish(exchange=self.exchange,
+                     routing_key=routing_key,
+                     body=text,
+                     properties=pika.BasicProperties(content_type=content_type,
+                                                     delivery_mode=1))
 
     def exit(self):
+        self.stop_async()
         self.connection.close()
 
 #########  5、主题模式：发布者 #########
@@ -233,21 +289,14 @@ class publisher_topic(base_broker):
         # routing_key 指定向哪个队列中发送消息
         # body是要插入的内容, 字符串格式
         content_type = 'application/json' if isinstance(text, dict) else 'text/plain'
-        try:
-            self.channel.basic_publish(exchange=self.exchange,
-                                       routing_key=routing_key,
-                                       body=text,
-                                       properties=pika.BasicProperties(content_type=content_type,
-                                                                       delivery_mode=1))
-        except Exception as e:
-            print(e)
-            self.reconnect().channel.basic_publish(exchange=self.exchange,
-                                                   routing_key=routing_key,
-                                                   body=text,
-                                                   properties=pika.BasicProperties(content_type=content_type,
-                                                                                   delivery_mode=1))
+        self.publish(exchange=self.exchange,
+                     routing_key=routing_key,
+                     body=text,
+                     properties=pika.BasicProperties(content_type=content_type,
+                                                     delivery_mode=1))
 
     def exit(self):
+        self.stop_async()
         self.connection.close()
 
 
@@ -329,27 +378,15 @@ class rpc_client(base_broker):
         content_type = 'application/json' if isinstance(req_text, dict) else 'text/plain'
         if correlation_id is None:
             correlation_id = str(uuid1())
-        try:
-            self.channel.basic_publish(exchange=self.exchange,
-                                       routing_key=self.routing_key,
-                                       body=req_text,
-                                       properties=pika.BasicProperties(content_type=content_type,
-                                                                       reply_to=self.cb_queue_name,
-                                                                       correlation_id=correlation_id
-                                                                       ))
-        except Exception as e:
-            print(e)
-            # 重连一次，继续发送
-            self.reconnect().channel.basic_publish(exchange=self.exchange,
-                                                   routing_key=self.routing_key,
-                                                   body=req_text,
-                                                   properties=pika.BasicProperties(content_type=content_type,
-                                                                                   reply_to=self.cb_queue_name,
-                                                                                   correlation_id=correlation_id
-                                                                                   ))
-        # 登记参照id和回调函数
+        # 登记参照id和回调函数（异步发送时，先登记，避免结果先于登记返回）
         if cb_func:
             self.cb_dict.update({correlation_id: cb_func})
+        self.publish(exchange=self.exchange,
+                     routing_key=self.routing_key,
+                     body=req_text,
+                     properties=pika.BasicProperties(content_type=content_type,
+                                                     reply_to=self.cb_queue_name,
+                                                     correlation_id=correlation_id))
 
     def start(self):
         try:
@@ -361,6 +398,7 @@ class rpc_client(base_broker):
 
     def exit(self):
         try:
+            self.stop_async()
             self.channel.stop_consuming()
             self.channel.close()
             self.connection.close()
@@ -0,0 +1,117 @@
+# encoding: UTF-8
+
+"""
+行情tick的消息编码
+- application/json：兼容原格式，单个tick为dict，datetime为'%Y-%m-%d %H:%M:%S.%f'字符串；多个tick为dict的列表
+- application/x-msgpack：二进制格式，[版本, 字段名列表, [行, ...]]，
+  一条消息可包含多个tick，字段名只发送一次，datetime为整数（1970-01-01起的微秒数，本地时间）
+接收方根据消息属性中的content_type解码，未设置content_type的消息按json处理
+"""
+
+import json
+from datetime import datetime, timedelta
+
+import msgpack
+
+CONTENT_TYPE_JSON = 'application/json'
+CONTENT_TYPE_MSGPACK = 'application/x-msgpack'
+
+TICK_FORMAT_VERSION = 1
+
+# 不发送的字段
+EXCLUDE_FIELDS = ('rawData',)
+
+EPOCH = datetime(1970, 1, 1)
+ONE_MICROSECOND = timedelta(microseconds=1)
+
+
+def _to_dict(tick):
+    """tick对象/dict => dict"""
+    if isinstance(tick, dict):
+        return tick
+    return tick.__dict__
+
+
+def datetime_to_us(dt):
+    """datetime => 1970-01-01起的微秒数（不处理时区）"""
+    return (dt.replace(tzinfo=None) - EPOCH) // ONE_MICROSECOND
+
+
+def us_to_datetime(us):
+    """1970-01-01起的微秒数 => datetime"""
+    return EPOCH + timedelta(microseconds=us)
+
+
+def parse_datetime(s):
+    """'%Y-%m-%d %H:%M:%S.%f' 或 '%Y-%m-%d %H:%M:%S' => datetime"""
+    if '.' in s:
+        return datetime.strptime(s, '%Y-%m-%d %H:%M:%S.%f')
+    return datetime.strptime(s, '%Y-%m-%d %H:%M:%S')
+
+
+def encode_ticks(ticks, content_type=CONTENT_TYPE_MSGPACK):
+    """
+    tick列表 => 消息内容
+    :param ticks: [VtTickData] 或 [dict]，同一批tick的字段需一致
+    :param content_type: CONTENT_TYPE_MSGPACK / CONTENT_TYPE_JSON
+    :return: bytes / str
+    """
+    if content_type == CONTENT_TYPE_JSON:
+        rows = []
+        for tick in ticks:
+            d = {k: v for k, v in _to_dict(tick).items() if k not in EXCLUDE_FIELDS}
+            dt = d.get('datetime', None)
+            if isinstance(dt, datetime):
+                d['datetime'] = dt.strftime('%Y-%m-%d %H:%M:%S.%f')
+            rows.append(d)
+        return json.dumps(rows[0] if len(rows) == 1 else rows)
+
+    if content_type != CONTENT_TYPE_MSGPACK:
+        raise ValueError(u'不支持的content_type:{}'.format(content_type))
+
+    if len(ticks) == 0:
+        return msgpack.packb([TICK_FORMAT_VERSION, [], []], use_bin_type=True)
+
+    fields = [k for k in _to_dict(ticks[0]).keys() if k not in EXCLUDE_FIELDS]
+    dt_index = fields.index('datetime') if 'datetime' in fields else -1
+    rows = []
+    for tick in ticks:
+        d = _to_dict(tick)
+        row = [d.get(k, None) for k in fields]
+        if dt_index >= 0:
+            dt = row[dt_index]
+            if isinstance(dt, datetime):
+                row[dt_index] = datetime_to_us(dt)
+        rows.append(row)
+    return msgpack.packb([TICK_FORMAT_VERSION, fields, rows], use_bin_type=True)
+
+
+def decode_ticks(body, content_type=None):
+    """
+    消息内容 => tick的dict列表，datetime字段为datetime对象
+    :param body: bytes / str
+    :param content_type: 消息属性中的content_type，None按json处理
+    :return: [dict]
+    """
+    if content_type == CONTENT_TYPE_MSGPACK:
+        version, fields, rows = msgpack.unpackb(body, raw=False)
+        if version != TICK_FORMAT_VERSION:
+            raise ValueError(u'不支持的tick格式版本:{}'.format(version))
+        dt_index = fields.index('datetime') if 'datetime' in fields else -1
+        result = []
+        for row in rows:
+            if dt_index >= 0 and isinstance(row[dt_index], int):
+                row[dt_index] = us_to_datetime(row[dt_index])
+            result.append(dict(zip(fields, row)))
+        return result
+
+    if isinstance(body, bytes):
+        body = body.decode('utf-8')
+    data = json.loads(body)
+    if isinstance(data, dict):
+        data = [data]
+    for d in data:
+        dt = d.get('datetime', None)
+        if isinstance(dt, str):
+            d['datetime'] = parse_datetime(dt)
+    return data
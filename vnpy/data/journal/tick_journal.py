@@ -0,0 +1,310 @@
+# encoding: UTF-8
+
+"""
+本地tick/分钟bar日志文件（只追加写入）
+目录结构：
+    根目录/tick/合约/交易日.jnl
+    根目录/bar/合约/交易日.jnl
+    根目录/tick/合约/index.json     各交易日的记录数、首尾时间
+文件格式：
+    文件头：b'VNJ1' + 头部长度（uint32，小端）
+    头部：json（格式版本、类型、合约、交易所、交易日、字段列表），以空格补齐到64字节的整数倍
+    记录：定长（numpy结构化类型，小端、紧凑排列），datetime为datetime64[us]
+字符串字段（合约、交易所、交易日）只保存在头部，读取时由datetime生成date/time。
+读取时使用内存映射，文件末尾不完整的记录（写入中断）被忽略，再次写入前会截掉。
+"""
+
+import os
+import json
+import struct
+
+import numpy as np
+
+from vnpy.trader.vtSession import get_calendar
+
+JOURNAL_MAGIC = b'VNJ1'
+JOURNAL_VERSION = 1
+JOURNAL_SUFFIX = '.jnl'
+INDEX_FILE = 'index.json'
+HEADER_ALIGN = 64
+
+KIND_TICK = 'tick'
+KIND_BAR = 'bar'
+
+TICK_FIELDS = [('datetime', '<M8[us]'),
+               ('lastPrice', '<f8'),
+               ('volume', '<i8'),
+               ('openInterest', '<f8'),
+               ('upperLimit', '<f8'),
+               ('lowerLimit', '<f8')] + \
+              [('bidPrice{}'.format(i), '<f8') for i in range(1, 6)] + \
+              [('askPrice{}'.format(i), '<f8') for i in range(1, 6)] + \
+              [('bidVolume{}'.format(i), '<i8') for i in range(1, 6)] + \
+              [('askVolume{}'.format(i), '<i8') for i in range(1, 6)]
+
+BAR_FIELDS = [('datetime', '<M8[us]'),
+              ('open', '<f8'),
+              ('high', '<f8'),
+              ('low', '<f8'),
+              ('close', '<f8'),
+              ('volume', '<i8'),
+              ('openInterest', '<f8')]
+
+JOURNAL_FIELDS = {KIND_TICK: TICK_FIELDS, KIND_BAR: BAR_FIELDS}
+
+# 读取时time字段的长度：tick 'HH:MM:SS.mmm'，bar 'HH:MM:SS'
+TIME_LENGTH = {KIND_TICK: 12, KIND_BAR: 8}
+
+
+def get_journal_path(root, kind, vtSymbol, tradingDay=None):
+    """合约的日志目录，或某个交易日的日志文件"""
+    path = os.path.join(root, kind, vtSymbol)
+    if tradingDay is None:
+        return path
+    return os.path.join(path, tradingDay + JOURNAL_SUFFIX)
+
+
+def read_header(path):
+    """
+    读取日志文件的头部
+    :return: 头部信息(dict)，记录的起始位置
+    """
+    with open(path, 'rb') as f:
+        head = f.read(8)
+        if len(head) < 8 or head[0:4] != JOURNAL_MAGIC:
+            raise ValueError(u'{}不是日志文件'.format(path))
+        offset = struct.unpack('<I', head[4:8])[0]
+        header = json.loads(f.read(offset - 8).decode('utf-8'))
+    if header.get('version') != JOURNAL_VERSION:
+        raise ValueError(u'{}的版本不支持:{}'.format(path, header.get('version')))
+    return header, offset
+
+
+def _make_header(kind, vtSymbol, tradingDay, symbol='', exchange=''):
+    """生成文件头（含补齐）"""
+    header = {'version': JOURNAL_VERSION,
+              'kind': kind,
+              'vtSymbol': vtSymbol,
+              'symbol': symbol,
+              'exchange': exchange,
+              'tradingDay': tradingDay,
+              'fields': JOURNAL_FIELDS[kind]}
+    body = json.dumps(header, ensure_ascii=False).encode('utf-8')
+    size = 8 + len(body)
+    size += (-size) % HEADER_ALIGN
+    return JOURNAL_MAGIC + struct.pack('<I', size) + body.ljust(size - 8, b' ')
+
+
+def load_records(path):
+    """
+    读取日志文件的全部记录（内存映射，零拷贝）
+    :return: 头部信息，numpy结构化数组
+    """
+    header, offset = read_header(path)
+    dtype = np.dtype([tuple(f) for f in header['fields']])
+    count = (os.path.getsize(path) - offset) // dtype.itemsize
+    if count <= 0:
+        return header, np.zeros(0, dtype=dtype)
+    return header, np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=(count,))
+
+
+def list_days(root, kind, vtSymbol, start=None, end=None):
+    """
+    合约已有的交易日
+    :param start: 'YYYY-mm-dd'，包含
+    :param end: 'YYYY-mm-dd'，包含
+    :return: 排序后的交易日列表
+    """
+    path = get_journal_path(root, kind, vtSymbol)
+    if not os.path.isdir(path):
+        return []
+    days = sorted(name[:-len(JOURNAL_SUFFIX)] for name in os.listdir(path) if name.endswith(JOURNAL_SUFFIX))
+    return [d for d in days if (start is None or d >= start) and (end is None or d <= end)]
+
+
+def load_index(root, kind, vtSymbol):
+    """合约的索引：{交易日: {'count': 记录数, 'start': 首条时间, 'end': 末条时间}}"""
+    path = os.path.join(get_journal_path(root, kind, vtSymbol), INDEX_FILE)
+    if not os.path.isfile(path):
+        return {}
+    with open(path, 'r', encoding='utf8') as f:
+        return json.load(f)
+
+
+def iter_file(path, cls=None, defaults=None):
+    """
+    从日志文件中逐个生成对象
+    :param cls: 对象类型（如CtaTickData），None时生成dict
+    :param defaults: 对象的缺省字段，缺省为cls().__dict__
+    :return: generator
+    """
+    header, records = load_records(path)
+    if len(records) == 0:
+        return
+
+    names = list(records.dtype.names)
+    # datetime64[us].tolist() 直接得到datetime
+    columns = [records[name].tolist() for name in names]
+
+    # 由datetime生成date/time：'YYYY-mm-ddTHH:MM:SS.mmm'
+    texts = np.datetime_as_string(records['datetime'], unit='ms').tolist()
+    end = 11 + TIME_LENGTH.get(header['kind'], 12)
+    dates = [s[0:10] for s in texts]
+    times = [s[11:end] for s in texts]
+
+    const = {'vtSymbol': header['vtSymbol'],
+             'symbol': header.get('symbol') or header['vtSymbol'],
+             'exchange': header.get('exchange', ''),
+             'tradingDay': header['tradingDay']}
+    names = names + ['date', 'time']
+    columns = columns + [dates, times]
+
+    if cls is None:
+        for row in zip(*columns):
+            d = dict(const)
+            d.update(zip(names, row))
+            yield d
+        return
+
+    if defaults is None:
+        defaults = cls().__dict__
+    new = cls.__new__
+    for row in zip(*columns):
+        obj = new(cls)
+        d = obj.__dict__
+        d.update(defaults)
+        d.update(const)
+        d.update(zip(names, row))
+        yield obj
+
+
+def iter_objects(root, kind, vtSymbol, start=None, end=None, cls=None):
+    """按交易日顺序，从合约的日志文件中逐个生成对象"""
+    defaults = cls().__dict__ if cls is not None else None
+    for day in list_days(root, kind, vtSymbol, start, end):
+        for obj in iter_file(get_journal_path(root, kind, vtSymbol, day), cls=cls, defaults=defaults):
+            yield obj
+
+
+########################################################################
+class JournalWriter(object):
+    """
+    日志写入
+    每个(类型, 合约)同时只打开当前交易日的文件，交易日变化时关闭旧文件。
+    不是多线程安全的，应只在一个线程中使用（如DrEngine的写入线程）。
+    """
+
+    #----------------------------------------------------------------------
+    def __init__(self, root, calendar=None):
+        """
+        :param root: 日志根目录
+        :param calendar: 交易日历，数据中没有tradingDay时用于计算交易日
+        """
+        self.root = root
+        self.calendar = calendar or get_calendar(night_hour=20)
+        self.files = {}         # (类型, 合约): [交易日, 文件]
+        self.indexes = {}       # (类型, 合约): 索引
+        self.dirty = set()      # 索引有变化的(类型, 合约)
+
+    #----------------------------------------------------------------------
+    def append(self, kind, vtSymbol, records):
+        """
+        追加记录
+        :param kind: KIND_TICK / KIND_BAR
+        :param vtSymbol: 合约（目录名）
+        :param records: [dict] 或 [对象]（DrTickData、DrBarData、CtaTickData等），按时间顺序
+        :return: 写入的记录数
+        """
+        fields = JOURNAL_FIELDS[kind]
+        names = [f[0] for f in fields[1:]]
+
+        # 按交易日分组
+        groups = {}
+        first = None
+        for r in records:
+            d = r if isinstance(r, dict) else r.__dict__
+            if first is None:
+                first = d
+            dt = d['datetime']
+            day = d.get('tradingDay', None) or self.calendar.get_trading_date(dt)
+            rows = groups.get(day, None)
+            if rows is None:
+                rows = groups[day] = []
+            rows.append((dt,) + tuple(d.get(name, None) or 0 for name in names))
+
+        if first is None:
+            return 0
+
+        dtype = np.dtype(fields)
+        for day, rows in groups.items():
+            f = self.getFile(kind, vtSymbol, day, first.get('symbol', ''), first.get('exchange', ''))
+            f.write(np.array(rows, dtype=dtype).tobytes())
+
+            index = self.indexes[(kind, vtSymbol)]
+            info = index.get(day, None)
+            if info is None:
+                info = index[day] = {'count': 0, 'start': str(rows[0][0]), 'end': ''}
+            info['count'] += len(rows)
+            info['end'] = str(rows[-1][0])
+            self.dirty.add((kind, vtSymbol))
+
+        return len(records)
+
+    #----------------------------------------------------------------------
+    def getFile(self, kind, vtSymbol, tradingDay, symbol='', exchange=''):
+        """当前交易日的文件，交易日变化时关闭旧文件"""
+        key = (kind, vtSymbol)
+        current = self.files.get(key, None)
+        if current is not None:
+            if current[0] == tradingDay:
+                return current[1]
+            current[1].close()
+            del self.files[key]
+
+        if key not in self.indexes:
+            self.indexes[key] = load_index(self.root, kind, vtSymbol)
+
+        path = get_journal_path(self.root, kind, vtSymbol, tradingDay)
+        if os.path.isfile(path):
+            # 已有文件：检查字段，截掉末尾不完整的记录
+            header, offset = read_header(path)
+            if [list(f) for f in header['fields']] != [list(f) for f in JOURNAL_FIELDS[kind]]:
+                raise ValueError(u'{}的字段与当前版本不一致'.format(path))
+            itemsize = np.dtype(JOURNAL_FIELDS[kind]).itemsize
+            size = os.path.getsize(path)
+            count = (size - offset) // itemsize
+            if offset + count * itemsize != size:
+                with open(path, 'r+b') as f:
+                    f.truncate(offset + count * itemsize)
+            info = self.indexes[key].setdefault(tradingDay, {'count': 0, 'start': '', 'end': ''})
+            info['count'] = count
+            f = open(path, 'ab')
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            f = open(path, 'wb')
+            f.write(_make_header(kind, vtSymbol, tradingDay, symbol, exchange))
+
+        self.files[key] = [tradingDay, f]
+        return f
+
+    #----------------------------------------------------------------------
+    def flush(self):
+        """写入文件缓冲，更新索引"""
+        for tradingDay, f in self.files.values():
+            f.flush()
+
+        for kind, vtSymbol in self.dirty:
+            path = os.path.join(get_journal_path(self.root, kind, vtSymbol), INDEX_FILE)
+            tmp_path = path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf8') as f:
+                json.dump(self.indexes[(kind, vtSymbol)], f, sort_keys=True)
+            os.replace(tmp_path, path)
+        self.dirty.clear()
+
+    #----------------------------------------------------------------------
+    def close(self):
+        """写入并关闭所有文件"""
+        self.flush()
+        for tradingDay, f in self.files.values():
+            f.close()
+        self.files.clear()
@@ -12,6 +12,7 @@ from time import sleep
 
 from vnpy.trader.vtFunction import loadMongoSetting
 from vnpy.trader.setup_logger import setup_logger
+from vnpy.data.mongo.mongo_pool import get_client, iter_query, db_query_iter, db_query_columns, DEFAULT_BATCH_SIZE
 
 class MongoData(object):
     dbClient = None
@@ -25,8 +26,8 @@ class MongoData(object):
             host, port, logging = loadMongoSetting()
             print('connecting to Mongo:{}:{}'.format(host, port))
             try:
-                # 设置MongoDB操作的超时时间为0.5秒
-                self.dbClient = MongoClient(host, port, connectTimeoutMS=500)
+                # 使用进程内共享的MongoClient（与MainEngine、回测共用连接池）
+                self.dbClient = get_client(host, port)
                 # 调用server_info查询服务器状态，防止服务器异常并未连接成功
                 self.dbClient.server_info()
 
@@ -144,15 +145,7 @@ class MongoData(object):
                 db = self.dbClient[dbName]
                 collection = db[collectionName]
 
-                if sortKey:
-                    cursor = collection.find(d).sort(sortKey, sortDirection)  # 对查询出来的数据进行排序
-                else:
-                    cursor = collection.find(d)
-
-                if cursor:
-                    return list(cursor)
-                else:
-                        return []
+                return list(iter_query(collection, d, sortKey, sortDirection))
             else:
                 self.writeLog('db query fail')
                 if self.db_has_connected:
@@ -173,6 +166,18 @@ class MongoData(object):
 
         return []
 
+    def dbQueryIter(self, dbName, collectionName, d, sortKey='', sortDirection=ASCENDING, projection=None,
+                    batchSize=DEFAULT_BATCH_SIZE):
+        """从MongoDB中流式读取数据，按批读取游标，逐条返回（generator，异常时写日志后重新抛出）"""
+        return db_query_iter(self, dbName, collectionName, d, sortKey, sortDirection, projection, batchSize)
+
+    # ----------------------------------------------------------------------
+    def dbQueryColumns(self, dbName, collectionName, d, fields, sortKey='', sortDirection=ASCENDING,
+                       batchSize=DEFAULT_BATCH_SIZE, dtypes=None):
+        """从MongoDB中读取指定字段，返回{字段: np.ndarray}，失败时返回None"""
+        return db_query_columns(self, dbName, collectionName, d, fields, sortKey, sortDirection, batchSize,
+                                dtypes=dtypes)
+
     def dbQueryBySort(self, dbName, collectionName, d, sortName, sortType, limitNum=0):
         """从MongoDB中读取数据，d是查询要求，sortName是排序的字段,sortType是排序类型
           返回的是数据库查询的指针"""
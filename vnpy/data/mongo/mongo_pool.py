@@ -0,0 +1,199 @@
+# encoding: UTF-8
+
+"""
+MongoDB共享连接与流式查询
+- get_client：同一进程内，同一(host, port)共用一个MongoClient（自带线程安全的连接池），
+  不再每个引擎/回测各自创建；fork出的子进程（如参数优化的工作进程）各自重新创建。
+  共享的MongoClient由本模块管理，使用者不能自行close()（其他引擎仍在使用），进程退出时由close_clients关闭
+- iter_query：按批（batch_size）从游标读取，逐条生成，不再list(cursor)把结果全部放入内存
+- query_columns：只读取指定字段，按批转换为numpy数组后拼接，不生成每条记录的对象
+- db_query_iter / db_query_columns：MainEngine、MongoData共用的查询入口，未连接时重连，异常时写日志
+"""
+
+import atexit
+import os
+from threading import Lock
+from time import sleep
+
+import numpy as np
+from pymongo import MongoClient, ASCENDING
+from pymongo.errors import ConnectionFailure, AutoReconnect
+
+from vnpy.trader.vtFunction import loadMongoSetting
+
+# 游标每批读取的记录数
+DEFAULT_BATCH_SIZE = 5000
+
+# MongoClient的连接池设置
+POOL_SETTING = {'maxPoolSize': 50,                  # 每个服务器的最大连接数
+                'connectTimeoutMS': 500,            # 建立连接的超时
+                'serverSelectionTimeoutMS': 5000}   # 等待可用服务器的超时（缺省为30秒）
+
+_clients = {}       # (进程号, host, port): MongoClient
+_clients_lock = Lock()
+
+
+def get_client(host=None, port=None, **kwargs):
+    """
+    获取共享的MongoClient
+    :param host: 缺省为VT_setting.json中的mongoHost
+    :param port: 缺省为VT_setting.json中的mongoPort
+    :param kwargs: 覆盖POOL_SETTING，只在第一次创建时生效
+    :return: MongoClient，共享使用，不要调用其close()
+    """
+    if host is None or port is None:
+        setting_host, setting_port, logging = loadMongoSetting()
+        host = host or setting_host
+        port = port or setting_port
+
+    key = (os.getpid(), host, port)
+    client = _clients.get(key, None)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(key, None)
+            if client is None:
+                setting = dict(POOL_SETTING)
+                setting.update(kwargs)
+                client = MongoClient(host, port, **setting)
+                _clients[key] = client
+    return client
+
+
+def close_clients():
+    """关闭当前进程的所有共享连接，之后get_client重新创建"""
+    pid = os.getpid()
+    with _clients_lock:
+        for key in [k for k in _clients if k[0] == pid]:
+            _clients.pop(key).close()
+
+
+atexit.register(close_clients)
+
+
+def find_cursor(collection, flt=None, sort_key=None, sort_direction=ASCENDING, projection=None,
+                batch_size=DEFAULT_BATCH_SIZE, limit=0):
+    """生成查询游标"""
+    cursor = collection.find(flt or {}, projection=projection, batch_size=batch_size)
+    if sort_key:
+        cursor = cursor.sort(sort_key, sort_direction)
+    if limit > 0:
+        cursor = cursor.limit(limit)
+    return cursor
+
+
+def iter_query(collection, flt=None, sort_key=None, sort_direction=ASCENDING, projection=None,
+               batch_size=DEFAULT_BATCH_SIZE, limit=0):
+    """
+    流式查询，逐条生成记录(dict)
+    :param projection: 读取的字段，如{'_id': 0}、['datetime', 'close']
+    :param batch_size: 游标每批读取的记录数
+    :return: generator，提前结束时关闭游标；读取中途的异常原样抛出
+    """
+    cursor = find_cursor(collection, flt, sort_key, sort_direction, projection, batch_size, limit)
+    try:
+        for d in cursor:
+            yield d
+    finally:
+        cursor.close()
+
+
+def _to_array(values, dtype=None):
+    """一列数据 => numpy数组（datetime转为datetime64[us]）"""
+    if dtype is None and len(values) > 0 and hasattr(values[0], 'toordinal'):
+        dtype = 'datetime64[us]'
+    return np.array(values, dtype=dtype)
+
+
+def query_columns(collection, fields, flt=None, sort_key=None, sort_direction=ASCENDING,
+                  batch_size=DEFAULT_BATCH_SIZE, limit=0, dtypes=None):
+    """
+    查询指定字段，返回numpy数组
+    :param fields: 字段列表
+    :param dtypes: {字段: dtype}，缺省由数据推断（数值、字符串、datetime64[us]）
+    :return: {字段: np.ndarray}，缺少字段的记录为None（数组为object类型）
+    """
+    dtypes = dtypes or {}
+    projection = {name: 1 for name in fields}
+    projection['_id'] = 0
+
+    chunks = {name: [] for name in fields}
+    columns = {name: [] for name in fields}
+    count = 0
+    for d in iter_query(collection, flt, sort_key, sort_direction, projection, batch_size, limit):
+        for name in fields:
+            columns[name].append(d.get(name, None))
+        count += 1
+        if count >= batch_size:
+            for name in fields:
+                chunks[name].append(_to_array(columns[name], dtypes.get(name, None)))
+                columns[name] = []
+            count = 0
+
+    result = {}
+    for name in fields:
+        if count > 0 or not chunks[name]:
+            chunks[name].append(_to_array(columns[name], dtypes.get(name, None)))
+        parts = chunks[name]
+        result[name] = parts[0] if len(parts) == 1 else np.concatenate(parts)
+    return result
+
+
+def _reconnect(owner):
+    """曾经连接成功过的，重新连接"""
+    if owner.db_has_connected:
+        owner.writeLog(u'重新尝试连接数据库')
+        owner.dbConnect()
+
+
+def _on_db_error(owner, ex, func_name):
+    """查询异常时写日志：断线重连的等待1秒，连接失败的清除dbClient后重连"""
+    if isinstance(ex, AutoReconnect):
+        owner.writeError(u'数据库连接断开重连:{}'.format(str(ex)))
+        sleep(1)
+    elif isinstance(ex, ConnectionFailure):
+        owner.dbClient = None
+        owner.writeError(u'数据库连接断开')
+        _reconnect(owner)
+    else:
+        owner.writeError(u'{} exception:{}'.format(func_name, str(ex)))
+
+
+def db_query_iter(owner, db_name, collection_name, flt, sort_key='', sort_direction=ASCENDING, projection=None,
+                  batch_size=DEFAULT_BATCH_SIZE, fail_msg=u'db query fail'):
+    """
+    通过owner的连接流式查询（MainEngine.dbQueryIter、MongoData.dbQueryIter）
+    owner需有dbClient、db_has_connected属性及dbConnect、writeLog、writeError方法
+    :param fail_msg: 未连接时的日志
+    :return: generator，异常时写日志后重新抛出，避免调用者把读取到一半的数据当作完整数据使用
+    """
+    try:
+        client = owner.dbClient
+        if client:
+            collection = client[db_name][collection_name]
+            for row in iter_query(collection, flt, sort_key, sort_direction, projection, batch_size):
+                yield row
+        else:
+            owner.writeLog(fail_msg)
+            _reconnect(owner)
+    except Exception as ex:
+        _on_db_error(owner, ex, 'dbQueryIter')
+        raise
+
+
+def db_query_columns(owner, db_name, collection_name, flt, fields, sort_key='', sort_direction=ASCENDING,
+                     batch_size=DEFAULT_BATCH_SIZE, dtypes=None, fail_msg=u'db query fail'):
+    """
+    通过owner的连接查询指定字段（MainEngine.dbQueryColumns、MongoData.dbQueryColumns）
+    :return: {字段: np.ndarray}，未连接或异常时写日志后返回None
+    """
+    try:
+        client = owner.dbClient
+        if client:
+            collection = client[db_name][collection_name]
+            return query_columns(collection, fields, flt, sort_key, sort_direction, batch_size, dtypes=dtypes)
+        else:
+            owner.writeLog(fail_msg)
+            _reconnect(owner)
+    except Exception as ex:
+        _on_db_error(owner, ex, 'dbQueryColumns')
+    return None
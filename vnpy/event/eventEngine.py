@@ -1,16 +1,26 @@
 # encoding: UTF-8
 
 # 系统模块
-from queue import Queue, Empty
-from threading import Thread
-from time import sleep
+from queue import Empty
+try:
+    from queue import SimpleQueue as Queue
+except ImportError:
+    from queue import Queue
+from threading import Thread, Lock
+from time import sleep, perf_counter
 from collections import defaultdict
+import sys
+import traceback
 
 # 第三方模块
 from qtpy.QtCore import QTimer
 
 # 自己开发的模块
 from vnpy.event.eventType import *
+from vnpy.event.eventProfiler import EventProfiler, TimedItem, getHandlerName
+
+# 事件处理线程每次最多连续处理的事件数量
+EVENT_BATCH_SIZE = 1000
 
 ########################################################################
 class EventEngine(object):
@@ -36,6 +46,7 @@ class EventEngine(object):
     register：公共方法，向引擎中注册监听函数
     unregister：公共方法，向引擎中注销监听函数
     put：公共方法，向事件队列中存入新的事件
+    putData：公共方法，向事件队列中存入数据，按主题（通用+特定）分发
     
     事件监听函数必须定义为输入参数仅为一个event对象，即：
     
@@ -75,12 +86,27 @@ class EventEngine(object):
     #----------------------------------------------------------------------
     def __run(self):
         """引擎运行"""
+        queue = self.__queue
         while self.__active == True:
             try:
-                event = self.__queue.get(block = True, timeout = 1)  # 获取事件的阻塞时间设为1秒
-                self.__process(event)
+                event = queue.get(block = True, timeout = 1)  # 获取事件的阻塞时间设为1秒
             except Empty:
-                pass
+                continue
+
+            # 一次取出队列中已有的事件，批量处理
+            n = 0
+            while True:
+                if event.__class__ is tuple:
+                    self.__processData(event)
+                else:
+                    self.__process(event)
+                n += 1
+                if n >= EVENT_BATCH_SIZE:
+                    break
+                try:
+                    event = queue.get_nowait()
+                except Empty:
+                    break
             
     #----------------------------------------------------------------------
     def __process(self, event):
@@ -97,7 +123,21 @@ class EventEngine(object):
         # 调用通用处理函数进行处理
         if self.__generalHandlers:
             [handler(event) for handler in self.__generalHandlers]
-               
+
+    #----------------------------------------------------------------------
+    def __processData(self, item):
+        """处理putData存入的数据：先分发通用主题，再分发特定主题，只为有监听的主题创建事件"""
+        type_, key, data = item
+        handlers = self.__handlers.get(type_, None)
+        if handlers or self.__generalHandlers:
+            self.__process(Event(type_, data))
+
+        if key is not None:
+            type_ = type_ + key
+            handlers = self.__handlers.get(type_, None)
+            if handlers or self.__generalHandlers:
+                self.__process(Event(type_, data))
+
     #----------------------------------------------------------------------
     def __onTimer(self):
         """向事件队列中存入计时器事件"""
@@ -163,6 +203,17 @@ class EventEngine(object):
     def put(self, event):
         """向事件队列中存入事件"""
         self.__queue.put(event)
+
+    #----------------------------------------------------------------------
+    def putData(self, type_, data, key=None):
+        """
+        向事件队列中存入数据，只入队一次，处理时分发给type_及type_+key两个主题的监听函数
+        等同于依次put type_、type_+key两个dict_['data']为data的事件，但不为没有监听的主题创建事件
+        :param type_: 事件类型，如EVENT_TICK
+        :param data: 事件数据
+        :param key: 特定主题的后缀，如vtSymbol，None时只分发通用主题
+        """
+        self.__queue.put((type_, key, data))
         
     #----------------------------------------------------------------------
     def registerGeneralHandler(self, handler):
@@ -182,6 +233,8 @@ class EventEngine(object):
 class EventEngine2(object):
     """
     计时器使用python线程的事件驱动引擎        
+    可选合并模式（setConflateTypes）：指定类型的事件（如tick），同一合约只保留最新一个未处理的事件
+    可选延时统计（enableProfile）：各事件类型的排队数量、等待时间，各处理函数的执行时间
     """
 
     #----------------------------------------------------------------------
@@ -207,20 +260,61 @@ class EventEngine2(object):
         
         # __generalHandlers是一个列表，用来保存通用回调函数（所有事件均调用）
         self.__generalHandlers = []        
-        
+
+        # 合并模式
+        self.__conflateTypes = set()                    # 需合并的事件类型
+        self.__conflated = {}                           # (事件类型, 合约): 最新未处理的事件
+        self.__conflateLock = Lock()
+        self.conflateCount = defaultdict(int)           # 事件类型: 被合并（丢弃）的事件数量
+
+        # 延时统计
+        self.profiler = None                            # EventProfiler，None为不统计
+        self.__handlerNames = {}                        # 处理函数: 名称
+
     #----------------------------------------------------------------------
     def __run(self):
         """引擎运行"""
+        queue = self.__queue
         while self.__active == True:
             try:
-                event = self.__queue.get(block = True, timeout = 1)  # 获取事件的阻塞时间设为1秒
-                self.__process(event)
+                event = queue.get(block = True, timeout = 1)  # 获取事件的阻塞时间设为1秒
             except Empty:
-                pass
+                continue
+
+            # 一次取出队列中已有的事件，批量处理
+            n = 0
+            while True:
+                if event.__class__ is TimedItem:
+                    profiler = self.profiler
+                    if profiler is not None:
+                        profiler.onGet(event)
+                    event = event.item
+                if event.__class__ is tuple:
+                    if len(event) == 2:
+                        # 合并模式的占位，取出该合约最新的事件
+                        with self.__conflateLock:
+                            event = self.__conflated.pop(event)
+                    if event.__class__ is tuple:
+                        self.__processData(event)
+                    else:
+                        self.__process(event)
+                else:
+                    self.__process(event)
+                n += 1
+                if n >= EVENT_BATCH_SIZE:
+                    break
+                try:
+                    event = queue.get_nowait()
+                except Empty:
+                    break
             
     #----------------------------------------------------------------------
     def __process(self, event):
         """处理事件"""
+        if self.profiler is not None:
+            self.__processProfiled(event)
+            return
+
         # 检查是否存在对该事件进行监听的处理函数
         if event.type_ in self.__handlers:
             # 若存在，则按顺序将事件传递给处理函数执行
@@ -233,7 +327,42 @@ class EventEngine2(object):
         # 调用通用处理函数进行处理
         if self.__generalHandlers:
             [handler(event) for handler in self.__generalHandlers]        
-               
+
+    #----------------------------------------------------------------------
+    def __processProfiled(self, event):
+        """处理事件，并记录各处理函数的执行时间"""
+        profiler = self.profiler
+        handlers = list(self.__handlers.get(event.type_, []))
+        handlers.extend(self.__generalHandlers)
+        for handler in handlers:
+            start = perf_counter()
+            handler(event)
+            name = self.__handlerNames.get(handler, None)
+            if name is None:
+                name = getHandlerName(handler)
+                self.__handlerNames[handler] = name
+            profiler.record(name, perf_counter() - start)
+
+        # 定期汇总，并推送统计事件
+        if event.type_ == EVENT_TIMER:
+            d = profiler.checkReport()
+            if d is not None:
+                self.put(Event(EVENT_PROFILE, d))
+
+    #----------------------------------------------------------------------
+    def __processData(self, item):
+        """处理putData存入的数据：先分发通用主题，再分发特定主题，只为有监听的主题创建事件"""
+        type_, key, data = item
+        handlers = self.__handlers.get(type_, None)
+        if handlers or self.__generalHandlers:
+            self.__process(Event(type_, data))
+
+        if key is not None:
+            type_ = type_ + key
+            handlers = self.__handlers.get(type_, None)
+            if handlers or self.__generalHandlers:
+                self.__process(Event(type_, data))
+
     #----------------------------------------------------------------------
     def __runTimer(self):
         """运行在计时器线程中的循环函数"""
@@ -304,7 +433,91 @@ class EventEngine2(object):
     #----------------------------------------------------------------------
     def put(self, event):
         """向事件队列中存入事件"""
-        self.__queue.put(event)
+        if self.__conflateTypes and event.type_ in self.__conflateTypes:
+            symbol = getattr(event.dict_.get('data', None), 'vtSymbol', None)
+            if symbol is not None:
+                self.__putConflated((event.type_, symbol), event)
+                return
+        self.__putQueue(event, event.type_)
+
+    #----------------------------------------------------------------------
+    def __putQueue(self, item, type_):
+        """存入队列，开启统计时附带入队时间"""
+        profiler = self.profiler
+        if profiler is not None:
+            profiler.onPut(type_)
+            item = TimedItem(item, type_)
+        self.__queue.put(item)
+
+    #----------------------------------------------------------------------
+    def putData(self, type_, data, key=None):
+        """
+        向事件队列中存入数据，只入队一次，处理时分发给type_及type_+key两个主题的监听函数
+        等同于依次put type_、type_+key两个dict_['data']为data的事件，但不为没有监听的主题创建事件
+        :param type_: 事件类型，如EVENT_TICK
+        :param data: 事件数据
+        :param key: 特定主题的后缀，如vtSymbol，None时只分发通用主题
+        """
+        if type_ in self.__conflateTypes and key is not None:
+            self.__putConflated((type_, key), (type_, key, data))
+            return
+        self.__putQueue((type_, key, data), type_)
+
+    #----------------------------------------------------------------------
+    def __putConflated(self, key, item):
+        """
+        合并模式下存入事件：该合约已有未处理的事件时，直接替换为最新的事件，不再入队
+        队列中只保存(事件类型, 合约)占位，处理时取出最新的事件
+        """
+        with self.__conflateLock:
+            if key in self.__conflated:
+                self.__conflated[key] = item
+                self.conflateCount[key[0]] += 1
+                return
+            self.__conflated[key] = item
+        self.__putQueue(key, key[0])
+
+    #----------------------------------------------------------------------
+    def setConflateTypes(self, types):
+        """
+        设置合并模式的事件类型，如[EVENT_TICK]，处理不及时时同一合约只处理最新的事件
+        成交、委托等不可丢弃的事件类型不应加入
+        :param types: 事件类型列表，空列表为关闭合并模式
+        """
+        self.__conflateTypes = set(types)
+
+    #----------------------------------------------------------------------
+    def enableProfile(self, interval=60, logFunc=None):
+        """
+        开启延时统计
+        :param interval: 定期汇总的间隔（秒），汇总时输出日志并推送EVENT_PROFILE事件，0为不定期汇总
+        :param logFunc: 汇总日志的输出函数，如mainEngine.writeLog，缺省为print
+        """
+        self.profiler = EventProfiler(interval=interval, logFunc=logFunc)
+
+    #----------------------------------------------------------------------
+    def disableProfile(self):
+        """关闭延时统计"""
+        self.profiler = None
+
+    #----------------------------------------------------------------------
+    def getProfile(self, reset=False):
+        """
+        获取延时统计结果，见EventProfiler.summary
+        :param reset: 获取后清空统计
+        """
+        profiler = self.profiler
+        if profiler is None:
+            return {}
+        d = profiler.summary()
+        if reset:
+            profiler.reset()
+        return d
+
+    #----------------------------------------------------------------------
+    def getConflateCount(self):
+        """获取各事件类型被合并的事件数量"""
+        return dict(self.conflateCount)
 
     #----------------------------------------------------------------------
     def registerGeneralHandler(self, handler):
@@ -319,15 +532,238 @@ class EventEngine2(object):
             self.__generalHandlers.remove(handler)
 
 
+########################################################################
+class MultiWorkerEventEngine(object):
+    """
+    多线程分片的事件驱动引擎（接口与EventEngine2一致）
+    每个处理函数按分片键固定在一个工作线程上运行：
+    - 分片键缺省为处理函数所属的对象（如CtaEngine、DrEngine），同一对象的所有处理函数（tick、委托、成交、计时器）
+      在同一线程中按事件顺序执行，各应用引擎内部无需加锁，一个应用处理缓慢不会阻塞其他应用
+    - register时可指定分片键（如策略名），相同分片键的处理函数共用一个线程
+    - bySymbol=True的处理函数（须线程安全），按事件数据的vtSymbol分片，同一合约的事件保持顺序，
+      无vtSymbol的事件（如计时器）在该处理函数分片键对应的线程中执行
+    - 应用引擎可通过callInShard，将处理的后续部分转到其他分片键的线程执行，
+      如CtaEngine在自身线程中维护委托、停止单等状态后，按策略名将onTick/onOrder/onTrade/onTimer
+      转到各策略的线程，各策略并行，同一策略的回调保持事件顺序
+    事件在put时即按处理函数分发至各工作线程的队列，每个工作线程内保持事件的先后顺序。
+    """
+
+    #----------------------------------------------------------------------
+    def __init__(self, workers=4):
+        """
+        :param workers: 工作线程数量
+        """
+        self.__workerCount = max(int(workers), 1)
+        self.__queues = [Queue() for i in range(self.__workerCount)]
+        self.__threads = [Thread(target=self.__run, args=(queue,)) for queue in self.__queues]
+        self.__active = False
+
+        # 计时器
+        self.__timer = Thread(target = self.__runTimer)
+        self.__timerActive = False                      # 计时器工作状态
+        self.__timerSleep = 1                           # 计时器触发间隔（默认1秒）
+
+        # 事件类型: [(处理函数, 分片键, 是否按合约分片)]
+        self.__handlers = defaultdict(list)
+        # 通用处理函数: [(处理函数, 分片键)]
+        self.__generalHandlers = []
+
+        # 分片键: 工作线程序号
+        self.__shards = {}
+        self.__shardLoad = [0] * self.__workerCount
+
+        # 事件类型: [(工作线程序号, 处理函数)]，序号为None时按合约分片；注册变化时整体替换
+        self.__routes = {}
+        self.__generalRoutes = []
+        self.__lock = Lock()
+
+    #----------------------------------------------------------------------
+    def __run(self, queue):
+        """工作线程运行"""
+        while self.__active == True:
+            try:
+                handlers, args = queue.get(block = True, timeout = 1)  # 获取事件的阻塞时间设为1秒
+            except Empty:
+                continue
+            for handler in handlers:
+                try:
+                    handler(*args)
+                except Exception as ex:
+                    print(u'{}处理异常:{}'.format(getHandlerName(handler), str(ex)), file=sys.stderr)
+                    traceback.print_exc()
+
+    #----------------------------------------------------------------------
+    def __runTimer(self):
+        """运行在计时器线程中的循环函数"""
+        while self.__timerActive:
+            # 向队列中存入计时器事件
+            self.put(Event(type_=EVENT_TIMER))
+
+            # 等待
+            sleep(self.__timerSleep)
+
+    #----------------------------------------------------------------------
+    def __getShard(self, shard):
+        """分片键对应的工作线程序号，新的分片键分配至负载最少的线程"""
+        index = self.__shards.get(shard, None)
+        if index is None:
+            index = self.__shardLoad.index(min(self.__shardLoad))
+            self.__shards[shard] = index
+            self.__shardLoad[index] += 1
+        return index
+
+    #----------------------------------------------------------------------
+    def __updateRoutes(self):
+        """重新生成分发路由"""
+        routes = {}
+        for type_, handlerList in self.__handlers.items():
+            routes[type_] = [(None if bySymbol else self.__getShard(shard), handler, self.__getShard(shard))
+                             for handler, shard, bySymbol in handlerList]
+        self.__routes = routes
+        self.__generalRoutes = [(self.__getShard(shard), handler) for handler, shard in self.__generalHandlers]
+
+    #----------------------------------------------------------------------
+    def start(self, timer=True):
+        """
+        引擎启动
+        timer：是否要启动计时器
+        """
+        self.__active = True
+        for thread in self.__threads:
+            thread.start()
+
+        if timer:
+            self.__timerActive = True
+            self.__timer.start()
+
+    #----------------------------------------------------------------------
+    def stop(self):
+        """停止引擎"""
+        self.__active = False
+
+        if self.__timerActive:
+            self.__timerActive = False
+            self.__timer.join()
+
+        for thread in self.__threads:
+            thread.join()
+
+    #----------------------------------------------------------------------
+    def register(self, type_, handler, shard=None, bySymbol=False):
+        """
+        注册事件处理函数监听
+        :param type_: 事件类型
+        :param handler: 处理函数
+        :param shard: 分片键，缺省为处理函数所属的对象
+        :param bySymbol: 是否按事件数据的vtSymbol分片（处理函数须线程安全）
+        """
+        if shard is None:
+            shard = getattr(handler, '__self__', handler)
+        with self.__lock:
+            handlerList = self.__handlers[type_]
+            if handler not in [h for h, s, b in handlerList]:
+                handlerList.append((handler, shard, bySymbol))
+                self.__updateRoutes()
+
+    #----------------------------------------------------------------------
+    def unregister(self, type_, handler):
+        """注销事件处理函数监听"""
+        with self.__lock:
+            handlerList = self.__handlers.get(type_, [])
+            handlerList[:] = [item for item in handlerList if item[0] != handler]
+            if not handlerList:
+                self.__handlers.pop(type_, None)
+            self.__updateRoutes()
+
+    #----------------------------------------------------------------------
+    def registerGeneralHandler(self, handler, shard=None):
+        """注册通用事件处理函数监听"""
+        if shard is None:
+            shard = getattr(handler, '__self__', handler)
+        with self.__lock:
+            if handler not in [h for h, s in self.__generalHandlers]:
+                self.__generalHandlers.append((handler, shard))
+                self.__updateRoutes()
+
+    #----------------------------------------------------------------------
+    def unregisterGeneralHandler(self, handler):
+        """注销通用事件处理函数监听"""
+        with self.__lock:
+            self.__generalHandlers = [item for item in self.__generalHandlers if item[0] != handler]
+            self.__updateRoutes()
+
+    #----------------------------------------------------------------------
+    def put(self, event):
+        """按处理函数的分片，将事件存入各工作线程的队列"""
+        routes = self.__routes.get(event.type_, None)
+        generalRoutes = self.__generalRoutes
+        if not routes and not generalRoutes:
+            return
+
+        # 工作线程序号: [处理函数]，同一线程内保持注册顺序，通用处理函数在后
+        targets = {}
+        if routes:
+            symbol = None
+            for index, handler, defaultIndex in routes:
+                if index is None:
+                    if symbol is None:
+                        symbol = getattr(event.dict_.get('data', None), 'vtSymbol', None) or ''
+                    index = hash(symbol) % self.__workerCount if symbol else defaultIndex
+                targets.setdefault(index, []).append(handler)
+        for index, handler in generalRoutes:
+            targets.setdefault(index, []).append(handler)
+
+        queues = self.__queues
+        args = (event,)
+        for index, handlers in targets.items():
+            queues[index].put((handlers, args))
+
+    #----------------------------------------------------------------------
+    def callInShard(self, shard, func, *args):
+        """
+        在分片键对应的工作线程中执行func(*args)
+        同一线程中按调用的先后顺序执行，可与register(shard=...)的处理函数共用线程
+        :param shard: 分片键，如策略名
+        """
+        index = self.__shards.get(shard, None)
+        if index is None:
+            with self.__lock:
+                index = self.__getShard(shard)
+        self.__queues[index].put(((func,), args))
+
+    #----------------------------------------------------------------------
+    def putData(self, type_, data, key=None):
+        """
+        推送数据至type_及type_+key两个主题，只为有监听的主题创建事件
+        :param type_: 事件类型，如EVENT_TICK
+        :param data: 事件数据
+        :param key: 特定主题的后缀，如vtSymbol，None时只推送通用主题
+        """
+        generalRoutes = self.__generalRoutes
+        if generalRoutes or type_ in self.__routes:
+            self.put(Event(type_, data))
+        if key is not None:
+            type_ = type_ + key
+            if generalRoutes or type_ in self.__routes:
+                self.put(Event(type_, data))
+
+    #----------------------------------------------------------------------
+    def getShards(self):
+        """各分片键对应的工作线程序号"""
+        return dict(self.__shards)
+
+
 ########################################################################
 class Event:
     """事件对象"""
 
     #----------------------------------------------------------------------
-    def __init__(self, type_=None):
+    def __init__(self, type_=None, data=None):
         """Constructor"""
         self.type_ = type_      # 事件类型
         self.dict_ = {}         # 字典用于保存具体的事件数据
+        if data is not None:
+            self.dict_['data'] = data
 
 
 #----------------------------------------------------------------------
@@ -0,0 +1,184 @@
+# encoding: UTF-8
+
+"""
+事件引擎的延时统计
+- 各事件类型：队列中未处理的数量（当前/最大）、排队等待时间
+- 各处理函数：执行时间
+延时按微秒记录在以2的幂分桶的直方图中，记录一次只需几次整数运算，p50/p99为桶内插值的近似值，max为精确值。
+计数在多个线程中更新，未加锁，为近似值。
+"""
+
+from time import perf_counter, time
+from collections import defaultdict
+
+# 直方图的桶数，第i个桶为 [2^(i-1), 2^i) 微秒，最后一个桶包含更大的值
+HISTOGRAM_BUCKETS = 32
+
+
+########################################################################
+class LatencyHistogram(object):
+    """延时直方图（微秒）"""
+
+    __slots__ = ('counts', 'count', 'total', 'max')
+
+    #----------------------------------------------------------------------
+    def __init__(self):
+        self.counts = [0] * HISTOGRAM_BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    #----------------------------------------------------------------------
+    def add(self, us):
+        """记录一次延时（微秒）"""
+        i = int(us).bit_length()
+        if i >= HISTOGRAM_BUCKETS:
+            i = HISTOGRAM_BUCKETS - 1
+        self.counts[i] += 1
+        self.count += 1
+        self.total += us
+        if us > self.max:
+            self.max = us
+
+    #----------------------------------------------------------------------
+    def percentile(self, p):
+        """百分位数（在所在桶内按排名线性插值，微秒）"""
+        if self.count == 0:
+            return 0.0
+        target = self.count * p / 100.0
+        n = 0
+        for i, c in enumerate(self.counts):
+            if c and n + c >= target:
+                low = float(1 << (i - 1)) if i > 0 else 0.0
+                high = float(1 << i)
+                return min(low + (high - low) * (target - n) / c, self.max)
+            n += c
+        return self.max
+
+    #----------------------------------------------------------------------
+    def summary(self):
+        """统计结果，单位：微秒"""
+        return {'count': self.count,
+                'avg': self.total / self.count if self.count else 0.0,
+                'p50': self.percentile(50),
+                'p99': self.percentile(99),
+                'max': self.max}
+
+
+########################################################################
+class TimedItem(object):
+    """开启统计时，队列中保存的事件（附带入队时间）"""
+
+    __slots__ = ('item', 'type_', 'time')
+
+    #----------------------------------------------------------------------
+    def __init__(self, item, type_):
+        self.item = item
+        self.type_ = type_
+        self.time = perf_counter()
+
+
+########################################################################
+class EventProfiler(object):
+    """事件引擎的延时统计"""
+
+    #----------------------------------------------------------------------
+    def __init__(self, interval=60, logFunc=None, top=10):
+        """
+        :param interval: 定期汇总的间隔（秒），0为不定期汇总
+        :param logFunc: 汇总日志的输出函数，缺省为print
+        :param top: 汇总日志中输出执行时间p99最大的处理函数数量
+        """
+        self.interval = interval
+        self.logFunc = logFunc
+        self.top = top
+        self.lastReport = time()
+        self.reset()
+
+    #----------------------------------------------------------------------
+    def reset(self):
+        """清空统计"""
+        self.pending = defaultdict(int)                     # 事件类型: 队列中未处理的数量
+        self.maxPending = defaultdict(int)                  # 事件类型: 队列中未处理的最大数量
+        self.waitStats = defaultdict(LatencyHistogram)      # 事件类型: 排队等待时间
+        self.handlerStats = defaultdict(LatencyHistogram)   # 处理函数名称: 执行时间
+        self.startTime = time()
+
+    #----------------------------------------------------------------------
+    def onPut(self, type_):
+        """事件入队"""
+        n = self.pending[type_] + 1
+        self.pending[type_] = n
+        if n > self.maxPending[type_]:
+            self.maxPending[type_] = n
+
+    #----------------------------------------------------------------------
+    def onGet(self, timedItem):
+        """事件出队，记录排队等待时间"""
+        type_ = timedItem.type_
+        self.pending[type_] -= 1
+        self.waitStats[type_].add((perf_counter() - timedItem.time) * 1000000)
+
+    #----------------------------------------------------------------------
+    def record(self, name, seconds):
+        """记录处理函数（或策略函数）的执行时间"""
+        self.handlerStats[name].add(seconds * 1000000)
+
+    #----------------------------------------------------------------------
+    def summary(self):
+        """
+        统计结果
+        :return: {'seconds': 统计时长,
+                  'queue': {事件类型: {'pending', 'maxPending', 'count', 'avg', 'p50', 'p99', 'max'}},
+                  'handlers': {处理函数名称: {'count', 'avg', 'p50', 'p99', 'max'}}}，时间单位为微秒
+        """
+        queue = {}
+        for type_, hist in list(self.waitStats.items()):
+            d = hist.summary()
+            d['pending'] = self.pending.get(type_, 0)
+            d['maxPending'] = self.maxPending.get(type_, 0)
+            queue[type_] = d
+        handlers = {name: hist.summary() for name, hist in list(self.handlerStats.items())}
+        return {'seconds': time() - self.startTime, 'queue': queue, 'handlers': handlers}
+
+    #----------------------------------------------------------------------
+    def report(self):
+        """汇总文字"""
+        d = self.summary()
+        lines = [u'事件引擎统计（{0:.0f}秒，单位微秒）'.format(d['seconds'])]
+        for type_, s in sorted(d['queue'].items(), key=lambda x: -x[1]['p99']):
+            lines.append(u'队列 {0}: 数量={1} 未处理={2}/{3} 等待p50={4:.0f} p99={5:.0f} max={6:.0f}'.format(
+                type_, s['count'], s['pending'], s['maxPending'], s['p50'], s['p99'], s['max']))
+        for name, s in sorted(d['handlers'].items(), key=lambda x: -x[1]['p99'])[:self.top]:
+            lines.append(u'处理 {0}: 次数={1} 平均={2:.0f} p50={3:.0f} p99={4:.0f} max={5:.0f}'.format(
+                name, s['count'], s['avg'], s['p50'], s['p99'], s['max']))
+        return '\n'.join(lines)
+
+    #----------------------------------------------------------------------
+    def checkReport(self):
+        """
+        到达汇总间隔时，输出汇总日志
+        :return: 汇总结果，未到间隔时返回None
+        """
+        if not self.interval or time() - self.lastReport < self.interval:
+            return None
+        self.lastReport = time()
+        d = self.summary()
+        text = self.report()
+        if self.logFunc:
+            self.logFunc(text)
+        else:
+            print(text)
+        return d
+
+
+#----------------------------------------------------------------------
+def getHandlerName(handler):
+    """处理函数的名称：类名.方法名（绑定对象有name属性时附带，如策略名）"""
+    owner = getattr(handler, '__self__', None)
+    name = getattr(handler, '__qualname__', None) or getattr(handler, '__name__', None) or repr(handler)
+    if owner is not None:
+        ownerName = getattr(owner, 'name', None)
+        if isinstance(ownerName, str) and ownerName:
+            return u'{0}({1})'.format(name, ownerName)
+    return name
@@ -13,6 +13,7 @@
 
 
 EVENT_TIMER = 'eTimer'                  # 计时器事件，每隔1秒发送一次
+EVENT_PROFILE = 'eProfile'              # 事件引擎延时统计事件，开启统计后定期发送
 
 #----------------------------------------------------------------------
 def test():
@@ -1,3 +1,3 @@
 # encoding: UTF-8
 
-from .vnrpc import RpcServer, RpcClient, RemoteException
\ No newline at end of file
+from .vnrpc import RpcServer, RpcClient, RemoteException, RpcTimeoutException
\ No newline at end of file
@@ -3,6 +3,9 @@
 import threading
 import traceback
 import signal
+import itertools
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
 
 import zmq
 from msgpack import packb, unpackb
@@ -106,26 +109,49 @@ class RpcObject(object):
 
 ########################################################################
 class RpcServer(RpcObject):
-    """RPC服务器"""
+    """
+    RPC服务器
+
+    请求回应使用ROUTER socket，同时兼容REQ客户端（原有方式）和DEALER客户端（带请求编号，可并发调用）。
+    注册时标记为concurrent的函数（线程安全的查询类函数），交给工作线程池执行，慢调用不会阻塞其他请求；
+    工作线程的执行结果通过inproc socket交回服务器线程发送（zmq socket不能跨线程使用）。
+    其余函数（如下单、撤单等非线程安全的交易函数）仍在服务器线程中依次执行，与原REP方式一致。
+    workers=0时不启动工作线程池，所有函数都在服务器线程中依次执行。
+
+    数据广播使用XPUB socket，可收到客户端的订阅，publish只打包有客户端订阅的主题。
+    """
 
     #----------------------------------------------------------------------
-    def __init__(self, repAddress, pubAddress):
+    def __init__(self, repAddress, pubAddress, workers=4):
         """Constructor"""
         super(RpcServer, self).__init__()
         
         # 保存功能函数的字典，key是函数名，value是函数对象
         self.__functions = {}     
+        self.__concurrentFunctions = set()  # 可在工作线程池中并发执行的函数名
 
         # zmq端口相关
         self.__context = zmq.Context()
         
-        self.__socketREP = self.__context.socket(zmq.REP)   # 请求回应socket
+        self.__socketREP = self.__context.socket(zmq.ROUTER)    # 请求回应socket
         self.__socketREP.bind(repAddress)
         
-        self.__socketPUB = self.__context.socket(zmq.PUB)   # 数据广播socket
+        self.__socketPUB = self.__context.socket(zmq.XPUB)  # 数据广播socket（可收到客户端的订阅）
         self.__socketPUB.bind(pubAddress)
-        
+
+        # 客户端订阅的主题前缀（XPUB只在第一个客户端订阅、最后一个客户端退订时通知）
+        self.__subscriptions = set()
+        self.__topicCache = {}                              # 主题: 是否有客户端订阅
+
+        # 工作线程池执行结果的回传socket
+        self.__replyAddress = 'inproc://rpc_reply_{0}'.format(id(self))
+        self.__socketReply = self.__context.socket(zmq.PULL)
+        self.__socketReply.bind(self.__replyAddress)
+        self.__local = threading.local()                    # 各工作线程的回传socket
+
         # 工作线程相关
+        self.__workers = workers                            # 工作线程池的线程数
+        self.__executor = None                              # 工作线程池
         self.__active = False                             # 服务器的工作状态
         self.__thread = threading.Thread(target=self.run) # 服务器的工作线程
 
@@ -134,9 +160,13 @@ class RpcServer(RpcObject):
         """启动服务器"""
         # 将服务器设为启动
         self.__active = True
+
+        # 启动工作线程池
+        if self.__workers > 0 and self.__executor is None:
+            self.__executor = ThreadPoolExecutor(max_workers=self.__workers)
         
         # 启动工作线程
-        if not self.__thread.isAlive():
+        if not self.__thread.is_alive():
             self.__thread.start()
         
     #----------------------------------------------------------------------
@@ -146,47 +176,138 @@ class RpcServer(RpcObject):
         self.__active = False
         
         # 等待工作线程退出
-        if self.__thread.isAlive():
+        if self.__thread.is_alive():
             self.__thread.join()
+
+        # 等待正在执行的调用完成
+        if self.__executor is not None:
+            self.__executor.shutdown(wait=True)
+            self.__executor = None
+
+        # 关闭所有socket（包括各工作线程的回传socket），否则zmq context无法终止，进程退出时阻塞
+        self.__context.destroy(linger=0)
     
     #----------------------------------------------------------------------
     def run(self):
         """服务器运行函数"""
+        poller = zmq.Poller()
+        poller.register(self.__socketREP, zmq.POLLIN)
+        poller.register(self.__socketReply, zmq.POLLIN)
+
         while self.__active:
             # 使用poll来等待事件到达，等待1秒（1000毫秒）
-            if not self.__socketREP.poll(1000):
+            events = dict(poller.poll(1000))
+            if not events:
                 continue
-            
-            # 从请求响应socket收取请求数据
-            reqb = self.__socketREP.recv()
-            
-            # 序列化解包
-            req = self.unpack(reqb)
-            
-            # 获取函数名和参数
+
+            # 收取请求：[客户端标识, (请求编号,) b'', 请求数据]，最后一帧之前的都是回复时需原样带回的信封
+            if self.__socketREP in events:
+                while True:
+                    try:
+                        frames = self.__socketREP.recv_multipart(zmq.NOBLOCK)
+                    except zmq.Again:
+                        break
+                    envelope, reqb = frames[:-1], frames[-1]
+                    try:
+                        req = self.unpack(reqb)
+                        name = req[0]
+                    except Exception:
+                        req, name = None, None
+
+                    if self.__executor is not None and name in self.__concurrentFunctions:
+                        self.__executor.submit(self.__process, envelope, reqb, req)
+                    else:
+                        self.__socketREP.send_multipart(envelope + [self.__execute(reqb, req)])
+
+            # 发送工作线程的执行结果
+            if self.__socketReply in events:
+                while True:
+                    try:
+                        frames = self.__socketReply.recv_multipart(zmq.NOBLOCK)
+                    except zmq.Again:
+                        break
+                    self.__socketREP.send_multipart(frames)
+
+    #----------------------------------------------------------------------
+    def __execute(self, reqb, req=None):
+        """
+        执行一次调用，返回打包后的结果
+        :param req: 已解包的请求，None时由reqb解包
+        """
+        # 获取引擎中对应的函数对象，并执行调用，如果有异常则捕捉后返回
+        try:
+            # 序列化解包，获取函数名和参数
+            if req is None:
+                req = self.unpack(reqb)
             name, args, kwargs = req
-            
-            # 获取引擎中对应的函数对象，并执行调用，如果有异常则捕捉后返回
-            try:
-                func = self.__functions[name]
-                r = func(*args, **kwargs)
-                rep = [True, r]
-            except Exception as e:
-                rep = [False, traceback.format_exc()]
-            
-            # 序列化打包
-            repb = self.pack(rep)
-            
-            # 通过请求响应socket返回调用结果
-            self.__socketREP.send(repb)
-        
+            func = self.__functions[name]
+            r = func(*args, **kwargs)
+            rep = [True, r]
+        except Exception as e:
+            rep = [False, traceback.format_exc()]
+
+        # 序列化打包
+        try:
+            return self.pack(rep)
+        except Exception as e:
+            return self.pack([False, traceback.format_exc()])
+
+    #----------------------------------------------------------------------
+    def __process(self, envelope, reqb, req):
+        """工作线程中执行调用，结果交回服务器线程发送"""
+        repb = self.__execute(reqb, req)
+
+        socket = getattr(self.__local, 'socket', None)
+        if socket is None:
+            socket = self.__context.socket(zmq.PUSH)
+            socket.setsockopt(zmq.LINGER, 0)
+            socket.connect(self.__replyAddress)
+            self.__local.socket = socket
+        socket.send_multipart(envelope + [repb])
+
+    #----------------------------------------------------------------------
+    def __updateSubscriptions(self):
+        """收取客户端的订阅（首字节1）和退订（首字节0），其后为主题前缀"""
+        changed = False
+        while self.__socketPUB.getsockopt(zmq.EVENTS) & zmq.POLLIN:
+            msg = self.__socketPUB.recv()
+            if not msg:
+                continue
+            if msg[0] == 1:
+                self.__subscriptions.add(msg[1:])
+            elif msg[0] == 0:
+                self.__subscriptions.discard(msg[1:])
+            changed = True
+
+        if changed:
+            self.__topicCache.clear()
+
+    #----------------------------------------------------------------------
+    def hasSubscriber(self, topic):
+        """
+        是否有客户端订阅了该主题（按前缀匹配，与zmq的订阅规则一致）
+        与publish一样不是多线程安全的，需在调用publish的线程中使用
+        """
+        self.__updateSubscriptions()
+
+        result = self.__topicCache.get(topic, None)
+        if result is None:
+            topicb = topic.encode('utf-8') if isinstance(topic, str) else topic
+            result = any(topicb.startswith(prefix) for prefix in self.__subscriptions)
+            self.__topicCache[topic] = result
+        return result
+
     #----------------------------------------------------------------------
     def publish(self, topic, data):
         """
         广播推送数据
         topic：主题内容
         data：具体的数据
+        没有客户端订阅该主题时，不打包、不发送
         """
+        if not self.hasSubscriber(topic):
+            return
+
         # 序列化数据
         datab = self.pack(data)
         if len(topic) >0 :
@@ -195,56 +316,215 @@ class RpcServer(RpcObject):
         self.__socketPUB.send_multipart([topic, datab])
         
     #----------------------------------------------------------------------
-    def register(self, func):
-        """注册函数"""
+    def register(self, func, concurrent=False):
+        """
+        注册函数
+        :param concurrent: 函数是否线程安全，可在工作线程池中与其他调用并发执行；
+                           缺省为False，在服务器线程中依次执行（如下单函数中的请求编号递增不是线程安全的）
+        """
         self.__functions[func.__name__] = func
+        if concurrent:
+            self.__concurrentFunctions.add(func.__name__)
+        else:
+            self.__concurrentFunctions.discard(func.__name__)
 
 ########################################################################
 class RpcClient(RpcObject):
-    """RPC客户端"""
+    """
+    RPC客户端
+
+    useDealer=True（默认）：使用DEALER socket，每个请求带有编号，由请求线程统一收发，
+    多个线程可同时发出调用，rpcCallAsync可不等待结果连续发出多个调用；
+    useDealer=False：使用原有的REQ socket，调用依次进行。
+    timeout：每次调用等待结果的秒数，超时抛出RpcTimeoutException，None为一直等待。
+    """
     
     #----------------------------------------------------------------------
-    def __init__(self, reqAddress, subAddress):
+    def __init__(self, reqAddress, subAddress, timeout=30, useDealer=True):
         """Constructor"""
         super(RpcClient, self).__init__()
         
         # zmq端口相关
         self.__reqAddress = reqAddress
         self.__subAddress = subAddress
+        self.__useDealer = useDealer
+        self.timeout = timeout
         
         self.__context = zmq.Context()
-        self.__socketREQ = self.__context.socket(zmq.REQ)   # 请求发出socket
+        self.__socketREQ = self.__context.socket(zmq.DEALER if useDealer else zmq.REQ)   # 请求发出socket
+        self.__socketREQ.setsockopt(zmq.LINGER, 0)
         self.__socketSUB = self.__context.socket(zmq.SUB)   # 广播订阅socket        
 
+        # 远程调用相关
+        self.__reqLock = threading.Lock()                       # REQ方式下，调用依次进行
+        self.__reqId = itertools.count(1)                       # 请求编号
+        self.__pending = {}                                     # 等待结果的调用，key是请求编号，value是Future
+        self.__pendingLock = threading.Lock()
+        self.__sendAddress = 'inproc://rpc_send_{0}'.format(id(self))
+        self.__socketSend = self.__context.socket(zmq.PULL)     # 各线程的请求，交给请求线程发出
+        self.__socketSend.bind(self.__sendAddress)
+        self.__local = threading.local()                        # 各调用线程的请求socket
+
         # 工作线程相关，用于处理服务器推送的数据
         self.__active = False                                   # 客户端的工作状态
         self.__thread = threading.Thread(target=self.run)       # 客户端的工作线程
+        self.__reqThread = threading.Thread(target=self.__runReq)   # DEALER方式的请求线程
         
     #----------------------------------------------------------------------
     def __getattr__(self, name):
         """实现远程调用功能"""
         # 执行远程调用任务
         def dorpc(*args, **kwargs):
-            # 生成请求
-            req = [name, args, kwargs]
-            
-            # 序列化打包请求
-            reqb = self.pack(req)
-            
-            # 发送请求并等待回应
-            self.__socketREQ.send(reqb)
-            repb = self.__socketREQ.recv()
-            
-            # 序列化解包回应
-            rep = self.unpack(repb)
-            
-            # 若正常则返回结果，调用失败则触发异常
-            if rep[0]:
-                return rep[1]
-            else:
-                raise RemoteException(rep[1])
+            return self.rpcCall(name, args, kwargs)
         
         return dorpc
+
+    #----------------------------------------------------------------------
+    def rpcCall(self, name, args=(), kwargs=None, timeout=None):
+        """
+        远程调用，等待结果
+        :param name: 函数名
+        :param args: 位置参数
+        :param kwargs: 关键字参数
+        :param timeout: 超时秒数，None时使用self.timeout
+        :return: 调用结果，调用失败抛出RemoteException，超时抛出RpcTimeoutException
+        """
+        if timeout is None:
+            timeout = self.timeout
+
+        if not self.__useDealer:
+            return self.__reqCall(name, args, kwargs or {}, timeout)
+
+        reqId, future = self.__send(name, args, kwargs or {})
+        try:
+            return future.result(timeout)
+        except FutureTimeoutError:
+            self.__removePending(reqId)
+            raise RpcTimeoutException(u'{0} 调用超时({1}秒)'.format(name, timeout))
+
+    #----------------------------------------------------------------------
+    def rpcCallAsync(self, name, *args, **kwargs):
+        """
+        远程调用，不等待结果
+        :return: concurrent.futures.Future，result()返回调用结果或抛出RemoteException；
+                 超时由调用方在result(timeout)中控制，超时后可调用rpcCancel放弃该调用
+        """
+        if not self.__useDealer:
+            future = Future()
+            try:
+                future.set_result(self.__reqCall(name, args, kwargs, self.timeout))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+
+        reqId, future = self.__send(name, args, kwargs)
+        future.reqId = reqId
+        return future
+
+    #----------------------------------------------------------------------
+    def rpcCancel(self, future):
+        """放弃一个rpcCallAsync发出的调用，之后到达的结果将被丢弃"""
+        reqId = getattr(future, 'reqId', None)
+        if reqId is not None:
+            self.__removePending(reqId)
+        future.cancel()
+
+    #----------------------------------------------------------------------
+    def __send(self, name, args, kwargs):
+        """DEALER方式：登记请求，交给请求线程发出"""
+        # 序列化打包请求
+        reqb = self.pack([name, args, kwargs])
+
+        reqId = next(self.__reqId)
+        future = Future()
+        with self.__pendingLock:
+            self.__pending[reqId] = future
+
+        socket = getattr(self.__local, 'socket', None)
+        if socket is None:
+            socket = self.__context.socket(zmq.PUSH)
+            socket.setsockopt(zmq.LINGER, 0)
+            socket.connect(self.__sendAddress)
+            self.__local.socket = socket
+        socket.send_multipart([b'', str(reqId).encode('ascii'), reqb])
+
+        return reqId, future
+
+    #----------------------------------------------------------------------
+    def __removePending(self, reqId):
+        """移除等待结果的调用"""
+        with self.__pendingLock:
+            return self.__pending.pop(reqId, None)
+
+    #----------------------------------------------------------------------
+    def __reqCall(self, name, args, kwargs, timeout):
+        """REQ方式：发送请求并等待回应"""
+        # 序列化打包请求
+        reqb = self.pack([name, args, kwargs])
+
+        with self.__reqLock:
+            self.__socketREQ.send(reqb)
+            if timeout is not None and not self.__socketREQ.poll(int(timeout * 1000)):
+                # REQ socket在收到回应之前不能再发送，超时后重建socket
+                self.__socketREQ.close()
+                self.__socketREQ = self.__context.socket(zmq.REQ)
+                self.__socketREQ.setsockopt(zmq.LINGER, 0)
+                self.__socketREQ.connect(self.__reqAddress)
+                raise RpcTimeoutException(u'{0} 调用超时({1}秒)'.format(name, timeout))
+            repb = self.__socketREQ.recv()
+
+        # 序列化解包回应
+        rep = self.unpack(repb)
+
+        # 若正常则返回结果，调用失败则触发异常
+        if rep[0]:
+            return rep[1]
+        else:
+            raise RemoteException(rep[1])
+
+    #----------------------------------------------------------------------
+    def __runReq(self):
+        """DEALER方式的请求线程：发出各线程的请求，收取回应并交给对应的Future"""
+        poller = zmq.Poller()
+        poller.register(self.__socketREQ, zmq.POLLIN)
+        poller.register(self.__socketSend, zmq.POLLIN)
+
+        while self.__active:
+            events = dict(poller.poll(1000))
+            if not events:
+                continue
+
+            if self.__socketSend in events:
+                while True:
+                    try:
+                        frames = self.__socketSend.recv_multipart(zmq.NOBLOCK)
+                    except zmq.Again:
+                        break
+                    self.__socketREQ.send_multipart(frames)
+
+            # 回应：[b'', 请求编号, 回应数据]
+            if self.__socketREQ in events:
+                while True:
+                    try:
+                        frames = self.__socketREQ.recv_multipart(zmq.NOBLOCK)
+                    except zmq.Again:
+                        break
+                    if len(frames) != 3:
+                        continue
+                    future = self.__removePending(int(frames[1]))
+                    if future is None:
+                        # 已超时或已放弃的调用
+                        continue
+                    try:
+                        rep = self.unpack(frames[2])
+                    except Exception as e:
+                        future.set_exception(e)
+                        continue
+                    # 若正常则返回结果，调用失败则触发异常
+                    if rep[0]:
+                        future.set_result(rep[1])
+                    else:
+                        future.set_exception(RemoteException(rep[1]))
     
     #----------------------------------------------------------------------
     def start(self):
@@ -259,8 +539,10 @@ class RpcClient(RpcObject):
         self.__active = True
         
         # 启动工作线程
-        if not self.__thread.isAlive():
+        if not self.__thread.is_alive():
             self.__thread.start()
+        if self.__useDealer and not self.__reqThread.is_alive():
+            self.__reqThread.start()
     
     #----------------------------------------------------------------------
     def stop(self):
@@ -269,8 +551,13 @@ class RpcClient(RpcObject):
         self.__active = False
         
         # 等待工作线程退出
-        if self.__thread.isAlive():
+        if self.__thread.is_alive():
             self.__thread.join()
+        if self.__reqThread.is_alive():
+            self.__reqThread.join()
+
+        # 关闭所有socket（包括各调用线程的请求socket），否则zmq context无法终止，进程退出时阻塞
+        self.__context.destroy(linger=0)
         
     #----------------------------------------------------------------------
     def run(self):
@@ -301,13 +588,14 @@ class RpcClient(RpcObject):
         """
         订阅特定主题的广播数据
         
-        可以使用topic=''来订阅所有的主题
+        可以使用topic=''来订阅所有的主题，topic为列表时订阅其中的每个主题
         """
-        if len(topic)==0:
-            topic = ''
-        else:
-            topic = topic.encode('utf-8')
-        self.__socketSUB.setsockopt_string(zmq.SUBSCRIBE, topic)
+        if isinstance(topic, (list, tuple)):
+            for t in topic:
+                self.subscribeTopic(t)
+            return
+
+        self.__socketSUB.setsockopt(zmq.SUBSCRIBE, topic.encode('utf-8'))
 
 
 ########################################################################
@@ -324,4 +612,8 @@ class RemoteException(Exception):
         """输出错误信息"""
         return self.__value
 
-    
\ No newline at end of file
+
+########################################################################
+class RpcTimeoutException(RemoteException):
+    """RPC调用超时"""
+    pass
@@ -701,7 +701,8 @@ class AlgoRpcServer(RpcServer):
         repAddress = 'tcp://*:%s' %repPort
         pubAddress = 'tcp://*:%s' %pubPort
 
-        super(AlgoRpcServer, self).__init__(repAddress, pubAddress)
+        # 算法的启停都涉及交易，在服务器线程中依次执行，不使用工作线程池
+        super(AlgoRpcServer, self).__init__(repAddress, pubAddress, workers=0)
 
         self.register(self.engine.addAlgo)
         self.register(self.engine.stopAlgo)
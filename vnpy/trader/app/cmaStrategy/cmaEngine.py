@@ -21,6 +21,7 @@ from vnpy.trader.vtEvent import *
 from vnpy.trader.vtConstant import *
 from vnpy.trader.vtGateway import VtSubscribeReq, VtOrderReq, VtCancelOrderReq, VtLogData, VtSignalData
 from vnpy.trader.app.ctaStrategy.ctaBase import *
+from vnpy.trader.app.ctaStrategy.ctaOrderIndex import StopOrderIndex
 from vnpy.trader.setup_logger import setup_logger
 from vnpy.trader.vtFunction import todayDate, getJsonPath
 from vnpy.trader.util_mail import sendmail
@@ -74,6 +75,7 @@ class CmaEngine(object):
         # key为stopOrderID，value为stopOrder对象
         self.stopOrderDict = {}  # 停止单撤销后不会从本字典中删除
         self.workingStopOrderDict = {}  # 停止单撤销后会从本字典中删除
+        self.stopOrderIndex = StopOrderIndex()  # 等待中的停止单，按合约、方向、价格索引
 
         # 持仓缓存字典
         # key为vtSymbol，value为PositionBuffer对象
@@ -281,6 +283,7 @@ class CmaEngine(object):
             # 保存stopOrder对象到字典中
         self.stopOrderDict[stopOrderID] = so  # 字典中不会删除
         self.workingStopOrderDict[stopOrderID] = so  # 字典中会删除
+        self.stopOrderIndex.add(so)
 
         self.writeCtaLog(u'发停止单成功，'
                          u'Id:{0},Symbol:{1},Type:{2},Price:{3},Volume:{4}'
@@ -299,6 +302,7 @@ class CmaEngine(object):
             so = self.workingStopOrderDict[stopOrderID]
             so.status = STOPORDER_CANCELLED  # STOPORDER_WAITING =》STOPORDER_CANCELLED
             del self.workingStopOrderDict[stopOrderID]  # 删除
+            self.stopOrderIndex.remove(stopOrderID)
             self.writeCtaLog(u'撤销停止单:{0}成功.'.format(stopOrderID))
             return True
         else:
@@ -312,30 +316,23 @@ class CmaEngine(object):
 
         # 1.首先检查是否有策略交易该合约
         if vtSymbol in self.tickStrategyDict:
-            # 2.遍历等待中的停止单，检查是否会被触发
-            for so in (self.workingStopOrderDict.values()):
-                if so.vtSymbol == vtSymbol:
-                    # 3. 触发标识判断
-                    longTriggered = so.direction == DIRECTION_LONG and tick.lastPrice >= so.price  # 多头停止单被触发
-                    shortTriggered = so.direction == DIRECTION_SHORT and tick.lastPrice <= so.price  # 空头停止单被触发
-
-                    # 4.触发处理
-                    if longTriggered or shortTriggered:
-
-                        # 5.设定价格，买入和卖出分别以涨停跌停价发单（模拟市价单）
-                        if so.direction == DIRECTION_LONG:
-                            price = tick.upperLimit
-                        else:
-                            price = tick.lowerLimit
+            # 2.从索引中取出已触发的停止单：多头停止价 <= 最新价，空头停止价 >= 最新价
+            for stopOrderID, so in self.stopOrderIndex.pop_triggered(vtSymbol, tick.lastPrice, tick.lastPrice):
+                # 已不在等待中（如已撤单）
+                if self.workingStopOrderDict.pop(stopOrderID, None) is None:
+                    continue
 
-                        # 6.更新停止单状态，触发
-                        so.status = STOPORDER_TRIGGERED
+                # 3.设定价格，买入和卖出分别以涨停跌停价发单（模拟市价单）
+                if so.direction == DIRECTION_LONG:
+                    price = tick.upperLimit
+                else:
+                    price = tick.lowerLimit
 
-                        # 7.发单
-                        self.sendOrder(so.vtSymbol, so.orderType, price, so.volume, so.strategy)
+                # 4.更新停止单状态，触发
+                so.status = STOPORDER_TRIGGERED
 
-                        # 8.删除停止单
-                        del self.workingStopOrderDict[so.stopOrderID]
+                # 5.发单
+                self.sendOrder(so.vtSymbol, so.orderType, price, so.volume, so.strategy)
 
     # ----------------------------------------------------------------------
     def procecssTickEvent(self, event):
@@ -359,10 +356,7 @@ class CmaEngine(object):
         if tick.vtSymbol in self.tickStrategyDict:
 
             # 4.将vtTickData数据转化为ctaTickData
-            ctaTick = CtaTickData()
-            d = ctaTick.__dict__
-            for key in d.keys():
-                d[key] = tick.__getattribute__(key)
+            ctaTick = CtaTickData.fromVtTick(tick)
 
             if not ctaTick.datetime:
                 # 添加datetime字段
@@ -533,11 +527,10 @@ class CmaEngine(object):
         startDate = self.today - timedelta(days)
 
         d = {'datetime': {'$gte': startDate}}
-        barData = self.mainEngine.dbQuery(dbName, collectionName, d)
 
         l = []
-        for d in barData:
-            bar = CtaBarData()
+        for d in self.queryRows(dbName, collectionName, d):
+            bar = CtaBarData.__new__(CtaBarData)
             bar.__dict__ = d
             l.append(bar)
 
@@ -550,16 +543,27 @@ class CmaEngine(object):
         startDate = self.today - timedelta(days)
 
         d = {'datetime': {'$gte': startDate}}
-        tickData = self.mainEngine.dbQuery(dbName, collectionName, d)
 
         l = []
-        for d in tickData:
-            tick = CtaTickData()
+        for d in self.queryRows(dbName, collectionName, d):
+            tick = CtaTickData.__new__(CtaTickData)
             tick.__dict__ = d
             l.append(tick)
 
         return l
 
+    # ----------------------------------------------------------------------
+    def queryRows(self, dbName, collectionName, flt):
+        """
+        逐条读取数据库记录（不读取_id）
+        主引擎支持流式查询时按批读取游标，不再先生成全部记录的列表；
+        否则（如远程的ClientEngine）使用dbQuery
+        读取中途的数据库异常会抛出（loadBar/loadTick不返回不完整的历史数据），由callStrategyFunc记录并停止策略
+        """
+        if hasattr(self.mainEngine, 'dbQueryIter'):
+            return self.mainEngine.dbQueryIter(dbName, collectionName, flt, projection={'_id': 0})
+        return self.mainEngine.dbQuery(dbName, collectionName, flt)
+
         # ----------------------------------------------------------------------
 
     # 日志相关
@@ -903,7 +907,7 @@ class CmaEngine(object):
                         self.cancelOrder(vtOrderID)
 
                 # 7.对该策略发出的所有本地停止单撤单
-                for stopOrderID, so in self.workingStopOrderDict.items():
+                for stopOrderID, so in list(self.workingStopOrderDict.items()):
                     if so.strategy is strategy:
                         self.cancelStopOrder(stopOrderID)
         else:
@@ -1777,6 +1781,7 @@ class CmaEngine(object):
         self.tickDict = {}
         self.orderStrategyDict = {}
         self.workingStopOrderDict = {}
+        self.stopOrderIndex.clear()
         self.posBufferDict = {}
         self.stopOrderDict = {}
 
@@ -25,16 +25,23 @@ import pandas as pd
 import re
 import traceback
 import decimal
+import hashlib
+import random
 import numpy as np
 
 from vnpy.trader.app.ctaStrategy.ctaBase import *
 from vnpy.trader.vtConstant import *
 from vnpy.trader.vtGateway import VtOrderData, VtTradeData
 from vnpy.trader.vtFunction import loadMongoSetting
+from vnpy.trader.vtSession import get_calendar
 from vnpy.trader.vtEvent import *
 from vnpy.trader.setup_logger import setup_logger
 from vnpy.trader.data_source import DataSource
 from vnpy.trader.app.ctaStrategy.ctaEngine import PositionBuffer
+from vnpy.trader.app.ctaStrategy import ctaHistoryCache
+from vnpy.trader.app.ctaStrategy.ctaOrderIndex import StopOrderIndex, LimitOrderIndex
+from vnpy.data.journal import tick_journal
+from vnpy.data.mongo.mongo_pool import get_client, iter_query
 from vnpy.trader.app.ctaStrategy.fundKline import FundKline
 
 ########################################################################
@@ -71,6 +78,7 @@ class BacktestingEngine(object):
         # key为stopOrderID，value为stopOrder对象
         self.stopOrderDict = {}             # 停止单撤销后不会从本字典中删除
         self.workingStopOrderDict = {}      # 停止单撤销后会从本字典中删除
+        self.stopOrderIndex = StopOrderIndex(ignore_case=True)     # 等待中的停止单，按合约、方向、价格索引
 
         # 引擎类型为回测
         self.engineType = ENGINETYPE_BACKTESTING
@@ -107,6 +115,7 @@ class BacktestingEngine(object):
 
         self.limitOrderDict = OrderedDict()         # 限价单字典
         self.workingLimitOrderDict = OrderedDict()  # 活动限价单字典，用于进行撮合用
+        self.limitOrderIndex = LimitOrderIndex(ignore_case=True)    # 活动限价单，按合约、方向、价格索引
         self.limitOrderCount = 0                    # 限价单编号
 
         # 持仓缓存字典
@@ -133,6 +142,10 @@ class BacktestingEngine(object):
 
         # csvFile相关
         self.barTimeInterval = 60          # csv文件，属于K线类型，K线的周期（秒数）,缺省是1分钟
+        self.use_column_cache = True        # csv文件/tick缓存，使用列式缓存（ctaHistoryCache）
+        self.sharedData = None              # 并行优化时，父进程预先加载的回测数据 (meta, arrays)
+        self.pruneRules = {}                # 提前终止规则，见OptimizationSetting.addPruneRule
+        self.pruneReason = None             # 触发提前终止的原因
 
         # 费用情况
 
@@ -314,6 +327,11 @@ class BacktestingEngine(object):
         self.priceTick = priceTick
         self.minDiff = priceTick
 
+    def setColumnCache(self, use_column_cache):
+        """设置是否使用列式缓存"""
+        self.use_column_cache = use_column_cache
+
+    # ----------------------------------------------------------------------
     def setStrategyName(self, strategy_name):
         """
         设置策略的运行实例名称
@@ -477,7 +495,7 @@ class BacktestingEngine(object):
 
         host, port, log = loadMongoSetting()
 
-        self.dbClient = pymongo.MongoClient(host, port)
+        self.dbClient = get_client(host, port)
         symbol = self.strategy.shortSymbol + self.symbol[-2:]
         self.strategy.vtSymbol = symbol
         collection = self.dbClient[self.dbName][symbol]
@@ -514,7 +532,7 @@ class BacktestingEngine(object):
                 # 载入初始化需要用的数据
                 flt = {'tradingDay': testday.strftime('%Y-%m-%d')} # WJ: using TradingDay instead of calandar day
                 # flt = {'datetime': {'$gte': testday_monrning, '$lt': testday_midnight}}
-                initCursor = collection.find(flt).sort('datetime', pymongo.ASCENDING)
+                initCursor = iter_query(collection, flt, sort_key='datetime')
 
                 process_time = datetime.now()
                 # 将数据从查询指针中读取出，并生成列表
@@ -551,6 +569,74 @@ class BacktestingEngine(object):
             if len(rawTicks) > 1:
                 self.savingDailyData(testday, self.capital, self.maxCapital, self.totalCommission)
 
+    def runBackTestingWithJournal(self, journalPath, symbol=None):
+        """
+        运行Tick回测（使用DrEngine记录的本地日志文件）
+        :param journalPath: 日志根目录（DR_setting.json中的journal_path）
+        :param symbol: 合约（日志的目录名，如rb1901、rb99），缺省为self.symbol
+        按交易日读取日志文件（内存映射），逐个推送tick
+        """
+        self.capital = self.initCapital  # 更新设置期初资金
+
+        symbol = symbol or self.symbol
+        if len(symbol) < 1:
+            self.writeCtaLog(u'回测对象未设置。')
+            return
+
+        if not self.dataStartDate:
+            self.writeCtaLog(u'回测开始日期未设置。')
+            return
+
+        if not self.dataEndDate:
+            self.dataEndDate = datetime.today()
+
+        # 首先根据回测模式，确认要使用的数据类
+        if self.mode == self.BAR_MODE:
+            self.writeCtaLog(u'本回测仅支持tick模式')
+            return
+
+        testdays = tick_journal.list_days(journalPath, tick_journal.KIND_TICK, symbol,
+                                          start=self.dataStartDate.strftime('%Y-%m-%d'),
+                                          end=self.dataEndDate.strftime('%Y-%m-%d'))
+        if len(testdays) < 1:
+            self.writeCtaLog(u'{0}在{1}中没有回测时间内的tick日志'.format(symbol, journalPath))
+            return
+
+        self.output(u'开始回测')
+
+        self.strategy.onInit()
+        self.output(u'策略初始化完成')
+
+        self.strategy.trading = True
+        self.strategy.onStart()
+        self.output(u'策略启动完成')
+
+        defaults = CtaTickData().__dict__
+        for testday in testdays:
+            dt1 = datetime.now()
+            filename = tick_journal.get_journal_path(journalPath, tick_journal.KIND_TICK, symbol, testday)
+            count_ticks = 0
+            for t in tick_journal.iter_file(filename, cls=CtaTickData, defaults=defaults):
+                # 排除涨停/跌停的数据
+                if ((t.askPrice1 == float('1.79769E308') or t.askPrice1 == 0) and t.askVolume1 == 0) \
+                        or ((t.bidPrice1 == float('1.79769E308') or t.bidPrice1 == 0) and t.bidVolume1 == 0):
+                    continue
+
+                # 推送到策略中
+                self.newTick(t)
+                self.last_leg1_tick = t
+                count_ticks += 1
+
+            self.writeCtaLog(u'回测交易日{0}，tick数量：{1}，耗时:{2}'.format(testday, count_ticks, str(datetime.now() - dt1)))
+
+            # 撤销所有之前的orders
+            if self.symbol:
+                self.cancelOrders(self.symbol)
+            # 更新持仓缓存
+            self.update_pos_buffer()
+            self.savingDailyData(datetime.strptime(testday, '%Y-%m-%d'), self.capital, self.maxCapital, self.totalCommission)
+
+    # ----------------------------------------------------------------------
     def runBackTestingWithArbTickFile(self,mainPath, arbSymbol):
         """运行套利回测（使用本地tick TXT csv数据)
         参数：套利代码 SP rb1610&rb1701
@@ -904,7 +990,7 @@ class BacktestingEngine(object):
 
         # 连接数据库
         host, port, log = loadMongoSetting()
-        self.dbClient = pymongo.MongoClient(host, port)
+        self.dbClient = get_client(host, port)
 
         self.capital = self.initCapital  # 更新设置期初资金
 
@@ -1038,12 +1124,105 @@ class BacktestingEngine(object):
 
         self.output(u'开始回放数据')
 
-        import csv
-        csvfile = open(filename, 'r', encoding='utf8')
-        reader = csv.DictReader((line.replace('\0', '') for line in csvfile), delimiter=",")
+        try:
+            bars = self.__loadBarsFromBarFile(filename)
+        except Exception as ex:
+            self.writeCtaError(u'回测异常导致停止')
+            self.writeCtaError(u'{},{}'.format(str(ex), traceback.format_exc()))
+            return
+
         last_tradingDay = None
-        for row in reader:
+        for bar in bars:
+            try:
+                if self.strategyStartDate <= bar.datetime <= self.dataEndDate:
+                    if last_tradingDay != bar.tradingDay:
+                        if last_tradingDay is not None:
+                            self.savingDailyData(datetime.strptime(last_tradingDay, '%Y-%m-%d'), self.capital,
+                                                 self.maxCapital, self.totalCommission, benchmark=bar.close)
+                            if self.pruneReason:
+                                return
+                        last_tradingDay = bar.tradingDay
+
+                        # 第二个交易日,撤单
+                        self.cancelOrders(self.symbol)
+                        # 更新持仓缓存
+                        self.update_pos_buffer()
+
+                if self.dataStartDate >= bar.datetime:
+                    continue
+
+                if bar.datetime > self.dataEndDate:
+                    continue
+
+                # Check the order triggers and deliver the bar to the Strategy
+                if self.useBreakoutMode is False:
+                    self.newBar(bar)
+                else:
+                    self.newBarForBreakout(bar)
+
+                if not self.strategy.trading and self.strategyStartDate < bar.datetime:
+                    self.strategy.trading = True
+                    self.strategy.onStart()
+                    self.output(u'策略启动交易')
+
+                if self.netCapital < 0:
+                    self.writeCtaError(u'净值低于0，回测停止')
+                    return
+
+            except Exception as ex:
+                self.writeCtaError(u'回测异常导致停止')
+                self.writeCtaError(u'{},{}'.format(str(ex), traceback.format_exc()))
+                return
+
+    def __getBarFileCacheName(self, filename):
+        """csv bar文件对应的列式缓存文件（文件变化或解析参数变化时，缓存名称随之变化）"""
+        stat = os.stat(filename)
+        key = u'{}|{}|{}|{}|{}|{}|{}'.format(os.path.abspath(filename), stat.st_size, int(stat.st_mtime),
+                                            self.symbol, self.barTimeInterval, self.priceTick, self.is_7x24)
+        name = os.path.splitext(os.path.basename(filename))[0]
+        return u'{0}/cache/{1}_{2}'.format(self.get_logs_path(), name,
+                                          hashlib.md5(key.encode('utf8')).hexdigest()[0:12])
+
+    def __loadBarsFromBarFile(self, filename):
+        """
+        加载csv bar文件
+        首次加载时解析csv并写入列式缓存，此后直接从缓存读取，不再逐行解析
+        :param filename:
+        :return: [CtaBarData]
+        """
+        cacheFile = None
+        if self.use_column_cache:
+            cacheFile = self.__getBarFileCacheName(filename)
+            if ctaHistoryCache.is_cached(cacheFile):
+                try:
+                    bars = ctaHistoryCache.load_objects(cacheFile)
+                    self.writeCtaLog(u'从缓存{}加载{}根bar'.format(ctaHistoryCache.get_cache_path(cacheFile), len(bars)))
+                    return bars
+                except Exception as ex:
+                    self.writeCtaError(u'读取缓存{}失败:{}'.format(cacheFile, str(ex)))
+
+        bars = self.__loadBarsFromCsvFile(filename)
+
+        if cacheFile is not None and len(bars) > 0:
             try:
+                if not os.path.isdir(os.path.dirname(cacheFile)):
+                    os.makedirs(os.path.dirname(cacheFile))
+                ctaHistoryCache.save_objects(cacheFile, bars)
+            except Exception as ex:
+                self.writeCtaError(u'保存缓存{}失败:{}'.format(cacheFile, str(ex)))
+        return bars
+
+    def __loadBarsFromCsvFile(self, filename):
+        """
+        解析csv bar文件（ricequant导出格式）
+        :param filename:
+        :return: [CtaBarData]
+        """
+        bars = []
+        calendar = get_calendar()
+        with open(filename, 'r', encoding='utf8') as csvfile:
+            reader = csv.DictReader((line.replace('\0', '') for line in csvfile), delimiter=",")
+            for row in reader:
                 bar = CtaBarData()
                 bar.symbol = self.symbol
                 bar.vtSymbol = self.symbol
@@ -1091,57 +1270,24 @@ class BacktestingEngine(object):
                                          + row['trading_date'][6:]
                     else:
                         bar.tradingDay = row['trading_date']
+                elif self.is_7x24:
+                    bar.tradingDay = bar.date
                 else:
-                    if bar.datetime.hour >= 21 and not self.is_7x24:
-                        if bar.datetime.isoweekday() == 5:
-                            # 星期五=》星期一
-                            bar.tradingDay = (barEndTime + timedelta(days=3)).strftime('%Y-%m-%d')
-                        else:
-                            # 第二天
-                            bar.tradingDay = (barEndTime + timedelta(days=1)).strftime('%Y-%m-%d')
-                    elif bar.datetime.hour < 8 and bar.datetime.isoweekday() == 6 and not self.is_7x24:
-                        # 星期六=>星期一
-                        bar.tradingDay = (barEndTime + timedelta(days=2)).strftime('%Y-%m-%d')
-                    else:
-                        bar.tradingDay = bar.date
+                    bar.tradingDay = calendar.get_trading_date(bar.datetime)
 
-                if self.strategyStartDate <= bar.datetime <= self.dataEndDate:
-                    if last_tradingDay != bar.tradingDay:
-                        if last_tradingDay is not None:
-                            self.savingDailyData(datetime.strptime(last_tradingDay, '%Y-%m-%d'), self.capital,
-                                                 self.maxCapital, self.totalCommission, benchmark=bar.close)
-                        last_tradingDay = bar.tradingDay
+                bars.append(bar)
 
-                        # 第二个交易日,撤单
-                        self.cancelOrders(self.symbol)
-                        # 更新持仓缓存
-                        self.update_pos_buffer()
-
-                if self.dataStartDate >= bar.datetime:
-                    continue
-
-                if bar.datetime > self.dataEndDate:
-                    continue
-
-                # Check the order triggers and deliver the bar to the Strategy
-                if self.useBreakoutMode is False:
-                    self.newBar(bar)
-                else:
-                    self.newBarForBreakout(bar)
-
-                if not self.strategy.trading and self.strategyStartDate < bar.datetime:
-                    self.strategy.trading = True
-                    self.strategy.onStart()
-                    self.output(u'策略启动交易')
-
-                if self.netCapital < 0:
-                    self.writeCtaError(u'净值低于0，回测停止')
-                    return
+        return bars
 
-            except Exception as ex:
-                self.writeCtaError(u'回测异常导致停止')
-                self.writeCtaError(u'{},{}'.format(str(ex), traceback.format_exc()))
-                return
+    def convertBarFileToCache(self, filename):
+        """将csv bar文件转换为列式缓存（回测时自动使用）"""
+        bars = self.__loadBarsFromCsvFile(filename)
+        if len(bars) == 0:
+            return None
+        cacheFile = self.__getBarFileCacheName(filename)
+        if not os.path.isdir(os.path.dirname(cacheFile)):
+            os.makedirs(os.path.dirname(cacheFile))
+        return ctaHistoryCache.save_objects(cacheFile, bars)
 
     # ----------------------------------------------------------------------
     def runBackTestingWithDataSource(self, data_source_url=None):
@@ -1378,7 +1524,10 @@ class BacktestingEngine(object):
         self.output(u'开始回放数据')
 
         # 循环加载回放数据
-        self.runHistoryDataFromMongo()
+        if self.sharedData is not None:
+            self.runHistoryDataFromShared()
+        else:
+            self.runHistoryDataFromMongo()
 
         self.output(u'数据回放结束')
 
@@ -1781,43 +1930,13 @@ class BacktestingEngine(object):
         """从本地缓存中，加载数据"""
         # 运行路径下cache子目录
         cacheFolder = os.getcwd() + '/cache'
-
-        # cache文件
-        cacheFile = u'{0}/{1}.pickle'. \
-            format(cacheFolder, filename)
-
-        if not os.path.isfile(cacheFile):
-            return []
-        else:
-            # 从cache文件加载
-            cache = open(cacheFile, mode='r')
-            l = cPickle.load(cache)
-            cache.close()
-            return l
+        return self.__loadObjectsFromCache(cacheFolder, filename)
 
     def __saveArbTicksToLocalCache(self, filename, arbticks):
         """保存价差tick到本地缓存目录"""
         # 运行路径下cache子目录
         cacheFolder = os.getcwd() + '/cache'
-
-        # 创建cache子目录
-        if not os.path.isdir(cacheFolder):
-            os.mkdir(cacheFolder)
-
-        # cache 文件名
-        cacheFile = u'{0}/{1}.pickle'. \
-            format(cacheFolder, filename)
-
-        # 重复存在 返回
-        if os.path.isfile(cacheFile):
-            return False
-
-        else:
-            # 写入cache文件
-            cache = open(cacheFile, mode='w')
-            cPickle.dump(arbticks, cache)
-            cache.close()
-            return True
+        return self.__saveObjectsToCache(cacheFolder, filename, arbticks)
 
     def __loadTxtTicks(self, mainPath, testday, symbol):
 
@@ -1913,47 +2032,76 @@ class BacktestingEngine(object):
         """从本地缓存中，加载数据"""
         # 运行路径下cache子目录
         cacheFolder = self.get_logs_path() + '/cache'
-        # cacheFolder = '/home/wenjiand/Workspaces/huafu-vnpy/vnpy/trader/app/ctaStrategy/strategy/cache'
+        return self.__loadObjectsFromCache(cacheFolder, filename)
 
-        # cache文件
-        cacheFile = u'{0}/{1}.pickle'. \
-            format(cacheFolder, filename)
+    def __saveTicksToLocalCache(self, filename, arbticks):
+        """保存价差tick到本地缓存目录"""
+        # 运行路径下cache子目录
+        cacheFolder = self.get_logs_path() + '/cache'
+        return self.__saveObjectsToCache(cacheFolder, filename, arbticks)
+
+    def __loadObjectsFromCache(self, cacheFolder, filename):
+        """
+        从缓存目录中加载tick/bar列表
+        优先读取列式缓存；只有pickle缓存时，读取后自动转换为列式缓存
+        :param cacheFolder: 缓存目录
+        :param filename: 缓存文件名（不含后缀）
+        :return: [] 没有缓存
+        """
+        cacheFile = u'{0}/{1}.pickle'.format(cacheFolder, filename)
+
+        if self.use_column_cache and ctaHistoryCache.is_cached(cacheFile):
+            try:
+                return ctaHistoryCache.load_objects(cacheFile)
+            except Exception as ex:
+                self.writeCtaError(u'读取缓存{}失败:{}'.format(ctaHistoryCache.get_cache_path(cacheFile), str(ex)))
 
         if not os.path.isfile(cacheFile):
             return []
-        else:
-            # 从cache文件加载
-            cache = open(cacheFile, mode='rb')
+
+        # 从pickle文件加载
+        with open(cacheFile, mode='rb') as cache:
             l = cPickle.load(cache)
-            cache.close()
-            return l
 
-    def __saveTicksToLocalCache(self, filename, arbticks):
-        """保存价差tick到本地缓存目录"""
-        # 运行路径下cache子目录
-        cacheFolder = self.get_logs_path() + '/cache'
-        # cacheFolder = '/home/wenjiand/Workspaces/huafu-vnpy/vnpy/trader/app/ctaStrategy/strategy/cache'
+        if self.use_column_cache and isinstance(l, list) and len(l) > 0:
+            try:
+                ctaHistoryCache.save_objects(cacheFile, l)
+            except ValueError:
+                # 字段类型不支持列式保存，继续使用pickle
+                pass
+        return l
 
+    def __saveObjectsToCache(self, cacheFolder, filename, objects):
+        """
+        保存tick/bar列表到缓存目录
+        缺省保存为列式缓存，字段不支持时保存为pickle
+        :param cacheFolder: 缓存目录
+        :param filename: 缓存文件名（不含后缀）
+        :param objects:
+        :return: False 已存在
+        """
         # 创建cache子目录
         if not os.path.isdir(cacheFolder):
-            os.mkdir(cacheFolder)
+            os.makedirs(cacheFolder)
 
         # cache 文件名
-        cacheFile = u'{0}/{1}.pickle'. \
-            format(cacheFolder, filename)
+        cacheFile = u'{0}/{1}.pickle'.format(cacheFolder, filename)
 
         # 重复存在 返回
-        if os.path.isfile(cacheFile):
+        if os.path.isfile(cacheFile) or ctaHistoryCache.is_cached(cacheFile):
             return False
 
-        else:
-            # 写入cache文件
-            cache = open(cacheFile, mode='wb')
-            cPickle.dump(arbticks, cache)
-            cache.close()
-            return True
-
+        if self.use_column_cache:
+            try:
+                ctaHistoryCache.save_objects(cacheFile, objects)
+                return True
+            except ValueError as ex:
+                self.writeCtaLog(u'{}不能保存为列式缓存:{}，使用pickle'.format(filename, str(ex)))
 
+        # 写入cache文件
+        with open(cacheFile, mode='wb') as cache:
+            cPickle.dump(objects, cache)
+        return True
 
     def __loadArbTicks2(self, leg1MainPath, leg2MainPath, testday, leg1Symbol, leg2Symbol):
         """加载taobao csv格式tick产生的价差合约"""
@@ -2453,7 +2601,7 @@ class BacktestingEngine(object):
                             '$lt': testday_midnight}}
         db = self.dbClient[self.dbName]
         collection = db[shortSymbol]
-        initCursor = collection.find(flt).sort('datetime', pymongo.ASCENDING)
+        initCursor = iter_query(collection, flt, sort_key='datetime')
 
         # 将数据从查询指针中读取出，并生成列表
         count_ticks = 0
@@ -2572,7 +2720,7 @@ class BacktestingEngine(object):
 
         host, port, log = loadMongoSetting()
 
-        self.dbClient = pymongo.MongoClient(host, port)
+        self.dbClient = get_client(host, port)
         collection = self.dbClient[self.dbName][self.symbol]
 
         self.output(u'开始载入数据')
@@ -2607,7 +2755,7 @@ class BacktestingEngine(object):
             flt = {'datetime': {'$gte': testday_monrning,
                                 '$lt': testday_midnight}}
 
-            initCursor = collection.find(flt).sort('datetime', pymongo.ASCENDING)
+            initCursor = iter_query(collection, flt, sort_key='datetime')
 
             process_time = datetime.now()
             # 将数据从查询指针中读取出，并生成列表
@@ -2624,6 +2772,100 @@ class BacktestingEngine(object):
                                 str(datetime.now() - process_time)))
             # 记录每日净值
             self.savingDailyData(testday, self.capital, self.maxCapital, self.totalCommission)
+            if self.pruneReason:
+                break
+
+    def saveHistoryDataFromMongo(self, cacheFile):
+        """
+        从MongoDB载入全部回测数据（按runHistoryDataFromMongo的方式逐日查询），保存为列式缓存
+        用于并行优化：父进程只加载一次，各工作进程通过内存映射共享读取
+        :param cacheFile: 缓存文件
+        :return: 列式缓存目录，失败返回None
+        """
+        host, port, log = loadMongoSetting()
+
+        self.dbClient = get_client(host, port)
+        collection = self.dbClient[self.dbName][self.symbol]
+
+        if self.mode == self.BAR_MODE:
+            dataClass = CtaBarData
+        else:
+            dataClass = CtaTickData
+
+        if not self.dataEndDate:
+            self.dataEndDate = datetime.now()
+
+        testdays = (self.dataEndDate - self.dataStartDate).days
+        if testdays < 1:
+            self.writeCtaLog(u'回测时间不足')
+            return None
+
+        rawData = []
+        test_days = []      # [第几天, 起始位置, 结束位置]
+        for i in range(0, testdays):
+            testday = self.dataStartDate + timedelta(days=i)
+            flt = {'datetime': {'$gte': testday,
+                                '$lt': testday + timedelta(days=1)}}
+            start = len(rawData)
+            for d in iter_query(collection, flt, sort_key='datetime'):
+                # mongo的_id不参与回测
+                d.pop('_id', None)
+                data = dataClass()
+                data.__dict__ = d
+                rawData.append(data)
+            test_days.append([i, start, len(rawData)])
+
+        self.output(u'共载入{0}条数据'.format(len(rawData)))
+        if len(rawData) == 0:
+            return None
+
+        folder = os.path.dirname(cacheFile)
+        if folder and not os.path.isdir(folder):
+            os.makedirs(folder)
+        try:
+            return ctaHistoryCache.save_objects(cacheFile, rawData,
+                                                extra={'data_start': self.dataStartDate.strftime('%Y%m%d'),
+                                                       'test_days': test_days})
+        except ValueError as ex:
+            self.writeCtaError(u'回测数据不能保存为列式缓存:{}'.format(str(ex)))
+            return None
+
+    def runHistoryDataFromShared(self):
+        """
+        从预先加载的回测数据（sharedData）中，按测试的每一天推送Tick/Bar至回测函数
+        与runHistoryDataFromMongo的回放顺序、每日净值记录一致
+        :return:
+        """
+        meta, arrays = self.sharedData
+
+        if self.mode == self.BAR_MODE:
+            dataClass = CtaBarData
+            func = self.newBar
+        else:
+            dataClass = CtaTickData
+            func = self.newTick
+
+        if not self.dataEndDate:
+            self.dataEndDate = datetime.now()
+
+        # 共享数据的日期范围可能大于本次回测（如逐步淘汰搜索中的较短区间），只回放本次回测的日期
+        testdays = (self.dataEndDate - self.dataStartDate).days
+        data_start = datetime.strptime(meta['extra']['data_start'], '%Y%m%d')
+
+        for i, start, end in meta['extra']['test_days']:
+            testday = data_start + timedelta(days=i)
+            if not 0 <= (testday - self.dataStartDate).days < testdays:
+                continue
+            process_time = datetime.now()
+            for data in ctaHistoryCache.iter_rows(meta, arrays, [(start, end)], cls=dataClass):
+                func(data)
+
+            self.output(u'回测日期{0}，数据量：{1}，回测耗时:{2}'
+                        .format(testday.strftime('%Y-%m-%d'), end - start, str(datetime.now() - process_time)))
+            # 记录每日净值
+            self.savingDailyData(testday, self.capital, self.maxCapital, self.totalCommission)
+            if self.pruneReason:
+                break
 
     def __sendOnBarEvent(self, bar):
         """发送Bar的事件"""
@@ -2746,6 +2988,7 @@ class BacktestingEngine(object):
         key = u'{0}.{1}'.format(order.gatewayName, orderID)
         # 保存到限价单字典中
         self.workingLimitOrderDict[key] = order
+        self.limitOrderIndex.add(order, key)
         self.limitOrderDict[key] = order
 
         self.writeCtaLog(u'{},{},p:{},v:{},ref:{}'.format(vtSymbol, orderType, price, volume,key))
@@ -2759,6 +3002,7 @@ class BacktestingEngine(object):
             order.status = STATUS_CANCELLED
             order.cancelTime = str(self.dt)
             del self.workingLimitOrderDict[vtOrderID]
+            self.limitOrderIndex.remove(vtOrderID)
 
     def cancelOrders(self, symbol, offset=EMPTY_STRING):
         """撤销所有单"""
@@ -2767,7 +3011,7 @@ class BacktestingEngine(object):
         if len(self.workingLimitOrderDict) > 0:
             self.writeCtaLog(u'从所有订单中撤销{0}\{1}'.format(offset, symbol))
 
-        for vtOrderID in self.workingLimitOrderDict.keys():
+        for vtOrderID in list(self.workingLimitOrderDict.keys()):
             order = self.workingLimitOrderDict[vtOrderID]
 
             if offset == EMPTY_STRING:
@@ -2780,6 +3024,7 @@ class BacktestingEngine(object):
                 order.status = STATUS_CANCELLED
                 order.cancelTime = str(self.dt)
                 del self.workingLimitOrderDict[vtOrderID]
+                self.limitOrderIndex.remove(vtOrderID)
 
     #----------------------------------------------------------------------
     def sendStopOrder(self, vtSymbol, orderType, price, volume, strategy):
@@ -2816,6 +3061,7 @@ class BacktestingEngine(object):
         # 保存stopOrder对象到字典中
         self.stopOrderDict[stopOrderID] = so
         self.workingStopOrderDict[stopOrderID] = so
+        self.stopOrderIndex.add(so)
 
         return stopOrderID
 
@@ -2827,6 +3073,7 @@ class BacktestingEngine(object):
             so = self.workingStopOrderDict[stopOrderID]
             so.status = STOPORDER_CANCELLED
             del self.workingStopOrderDict[stopOrderID]
+            self.stopOrderIndex.remove(stopOrderID)
 
     #----------------------------------------------------------------------
     def crossLimitOrder(self):
@@ -2847,12 +3094,14 @@ class BacktestingEngine(object):
             vtSymbol = self.tick.vtSymbol
             symbol = self.tick.symbol
 
-        # 遍历限价单字典中的所有限价单
-        workingLimitOrderDictClone = copy.deepcopy(self.workingLimitOrderDict)
-        for orderID, order in list(workingLimitOrderDictClone.items()):
-            # 判断是否会成交
-            buyCross = order.direction == DIRECTION_LONG and order.price >= buyCrossPrice and (vtSymbol.lower() == order.vtSymbol.lower() or symbol.lower() == order.vtSymbol.lower())
-            sellCross = order.direction == DIRECTION_SHORT and order.price <= sellCrossPrice and (vtSymbol.lower() == order.vtSymbol.lower() or symbol.lower() == order.vtSymbol.lower())
+        # 从索引中取出会成交的限价单（合约代码不区分大小写，与vtSymbol或symbol相同）
+        # 买入：委托价 >= buyCrossPrice，卖出：委托价 <= sellCrossPrice
+        # 与原遍历字典副本的方式一致：本轮成交的限价单在撮合开始时确定，按发出的先后顺序成交
+        # 与原方式不同：不再复制委托，onOrder收到的是limitOrderDict中的委托对象本身，成交后其状态为全部成交
+        # （原方式只修改副本，limitOrderDict中的委托保持未成交状态）
+        for orderID, order in self.limitOrderIndex.pop_triggered((vtSymbol, symbol), buyCrossPrice, sellCrossPrice):
+            buyCross = order.direction == DIRECTION_LONG
+            sellCross = not buyCross
 
             # 如果发生了成交
             if buyCross or sellCross:
@@ -2936,12 +3185,14 @@ class BacktestingEngine(object):
             vtSymbol = self.tick.vtSymbol
             symbol = self.tick.symbol
 
-        # 遍历停止单字典中的所有停止单
-        workingStopOrderDictClone = copy.deepcopy(self.workingStopOrderDict)
-        for stopOrderID, so in workingStopOrderDictClone.items():
-            # 判断是否会成交
-            buyCross = so.direction == DIRECTION_LONG and so.price <= buyCrossPrice and (vtSymbol.lower() == so.vtSymbol.lower() or symbol.lower() == order.vtSymbol.lower())
-            sellCross = so.direction == DIRECTION_SHORT and so.price >= sellCrossPrice and (vtSymbol.lower() == so.vtSymbol.lower() or symbol.lower() == order.vtSymbol.lower())
+        # 从索引中取出会成交的停止单（合约代码不区分大小写，与vtSymbol或symbol相同）
+        # 买入：停止价 <= buyCrossPrice，卖出：停止价 >= sellCrossPrice
+        for stopOrderID, so in self.stopOrderIndex.pop_triggered((vtSymbol, symbol), buyCrossPrice, sellCrossPrice):
+            # 已被撤销（如在本轮之前的成交回调中撤单）
+            if stopOrderID not in self.workingStopOrderDict:
+                continue
+            buyCross = so.direction == DIRECTION_LONG
+            sellCross = not buyCross
 
             # 如果发生了成交
             if buyCross or sellCross:
@@ -3655,6 +3906,27 @@ class BacktestingEngine(object):
         self.writeCtaLog(u'DEBUG---: savingDailyData, {}: lastPrice={}, net={}, capital={} max={} margin={} commission={} longPos={} shortPos={}, {}'.format(
             dict['date'], dict['lastPrice'], dict['net'], c, m, today_margin, commission, len(long_list), len(short_list), positionMsg))
         print(u'{} : {}'.format(dict['date'],dict['net']))
+
+        if self.pruneRules and self.pruneReason is None:
+            self.checkPruneRules(dict['date'])
+
+    # ----------------------------------------------------------------------
+    def checkPruneRules(self, date):
+        """
+        每日结算时检查提前终止规则，触发时设置pruneReason，回放循环随即停止
+        :param date: 结算日期
+        :return:
+        """
+        max_drawdown_rate = self.pruneRules.get('max_drawdown_rate', None)
+        if max_drawdown_rate is not None and self.daily_max_drawdown_rate > max_drawdown_rate:
+            self.pruneReason = u'{} 最大回撤率{}%超过{}%'.format(date, self.daily_max_drawdown_rate, max_drawdown_rate)
+
+        min_net_capital = self.pruneRules.get('min_net_capital', None)
+        if min_net_capital is not None and self.netCapital < min_net_capital:
+            self.pruneReason = u'{} 净值{}低于{}'.format(date, self.netCapital, min_net_capital)
+
+        if self.pruneReason:
+            self.writeCtaLog(u'提前终止回测:{}'.format(self.pruneReason))
     # ----------------------------------------------------------------------
     def writeWenHuaSignal(self, filehandle, count, bardatetime, price, text, mask=52):
         """
@@ -4337,6 +4609,10 @@ class BacktestingEngine(object):
     #----------------------------------------------------------------------
     def runOptimization(self, strategyClass, optimizationSetting):
         """优化参数"""
+        # 逐步淘汰、遗传算法需多轮调度，使用并行优化
+        if optimizationSetting.searchMode not in (SEARCH_GRID, SEARCH_RANDOM):
+            return self.runParallelOptimization(strategyClass, optimizationSetting)
+
         # 获取优化设置
         settingList = optimizationSetting.generateSetting()
         targetName = optimizationSetting.optimizeTarget
@@ -4345,23 +4621,27 @@ class BacktestingEngine(object):
         if not settingList or not targetName:
             self.output(u'优化设置有问题，请检查')
 
+        # 结果文件中已完成的参数组合，不再重复回测
+        finished = loadOptimizationResults(optimizationSetting.resultFile)
+        resultList = [(str(r['setting']), r['target'], r) for r in finished.values()]
+        self.setPruneRules(optimizationSetting.pruneRules)
+
         # 遍历优化
-        resultList = []
         for setting in settingList:
+            key = getSettingKey(setting)
+            if key in finished:
+                continue
             self.clearBacktestingResult()
             self.output('-' * 30)
             self.output('setting: %s' %str(setting))
-            self.initStrategy(strategyClass, setting)
+            self.initStrategy(strategyClass, copy.copy(setting))
             self.runBacktesting()
-            d = self.calculateBacktestingResult()
-            try:
-                targetValue = d[targetName]
-            except KeyError:
-                targetValue = 0
-            resultList.append(([str(setting)], targetValue))
+            result = self.getOptimizeResult(setting, targetName)
+            saveOptimizationResult(optimizationSetting.resultFile, result[2])
+            resultList.append(result)
 
         # 显示结果
-        resultList.sort(reverse=True, key=lambda result:result[1])
+        sortOptimizationResults(resultList)
         self.output('-' * 30)
         self.output(u'优化结果：')
         for result in resultList:
@@ -4369,6 +4649,39 @@ class BacktestingEngine(object):
 
         return resultList
 
+    # ----------------------------------------------------------------------
+    def setPruneRules(self, pruneRules):
+        """设置提前终止规则"""
+        self.pruneRules = dict(pruneRules or {})
+        self.pruneReason = None
+
+    # ----------------------------------------------------------------------
+    def getOptimizeResult(self, setting, targetName):
+        """
+        计算回测结果，生成优化结果记录
+        :param setting: 参数组合
+        :param targetName: 优化目标字段
+        :return: (str(setting), 目标值, 结果记录)
+        """
+        d = self.calculateBacktestingResult() or {}
+        if targetName not in d:
+            try:
+                d = self.getResult()[0] or d
+            except Exception:
+                pass
+        try:
+            targetValue = d[targetName]
+        except KeyError:
+            targetValue = 0
+
+        record = {'setting': setting,
+                  'target': targetValue,
+                  'pruned': self.pruneReason,
+                  'netCapital': self.netCapital,
+                  'maxDrawdownRate': self.daily_max_drawdown_rate,
+                  'result': {k: v for k, v in d.items() if isinstance(v, (int, float, str, bool))}}
+        return (str(setting), targetValue, record)
+
     #----------------------------------------------------------------------
     def clearBacktestingResult(self):
         """清空之前回测的结果"""
@@ -4376,48 +4689,224 @@ class BacktestingEngine(object):
         self.limitOrderCount = 0
         self.limitOrderDict.clear()
         self.workingLimitOrderDict.clear()
+        self.limitOrderIndex.clear()
 
         # 清空停止单相关
         self.stopOrderCount = 0
         self.stopOrderDict.clear()
         self.workingStopOrderDict.clear()
+        self.stopOrderIndex.clear()
 
         # 清空成交相关
         self.tradeCount = 0
         self.tradeDict.clear()
+        self.longPosition = []
+        self.shortPosition = []
+        self.posBufferDict = {}
+        self.exportTradeList = []
+
+        # 资金、净值恢复为期初资金
+        self.capital = self.initCapital
+        self.netCapital = self.initCapital
+        self.maxCapital = self.initCapital
+        self.maxNetCapital = self.initCapital
+        self.avaliable = self.initCapital
+        self.percent = EMPTY_FLOAT
+
+        # 清空成交统计
+        self.maxPnl = 0
+        self.minPnl = 0
+        self.maxVolume = 1
+        self.winningResult = 0
+        self.losingResult = 0
+        self.totalResult = 0
+        self.totalWinning = 0
+        self.totalLosing = 0
+        self.totalTurnover = 0
+        self.totalCommission = 0
+        self.totalSlippage = 0
+        self.timeList = []
+        self.pnlList = []
+        self.capitalList = []
+        self.drawdownList = []
+        self.drawdownRateList = []
+
+        # 清空每日结算相关（提前终止规则、优化结果记录均依赖于此）
+        self.maxNetCapital_time = ''
+        self.max_drowdown_rate_time = ''
+        self.daily_max_drawdown_rate = 0
+        self.dailyList = []
+        self.daily_first_benchmark = None
+        self.price_dict = {}
+
+        self.pruneReason = None
 
     #----------------------------------------------------------------------
     def runParallelOptimization(self, strategyClass, optimizationSetting):
-        """并行优化参数"""
-        # 获取优化设置
-        settingList = optimizationSetting.generateSetting()
+        """
+        并行优化参数
+        按optimizationSetting.searchMode进行网格、随机、逐步淘汰或遗传算法搜索
+        """
         targetName = optimizationSetting.optimizeTarget
+        searchMode = optimizationSetting.searchMode
 
         # 检查参数设置问题
-        if not settingList or not targetName:
+        if not optimizationSetting.paramDict or not targetName:
             self.output(u'优化设置有问题，请检查')
 
-        # 多进程优化，启动一个对应CPU核心数量的进程池
-        pool = multiprocessing.Pool(multiprocessing.cpu_count())
-        l = []
+        # 结果文件中已完成的参数组合，不再重复回测
+        finished = loadOptimizationResults(optimizationSetting.resultFile)
+        if finished:
+            self.output(u'结果文件中已完成{0}组参数'.format(len(finished)))
+        evaluated = OrderedDict((key, (str(r['setting']), r['target'], r)) for key, r in finished.items())
 
-        for setting in settingList:
-            l.append(pool.apply_async(optimize, (strategyClass, setting,
-                                                 targetName, self.mode,
-                                                 self.startDate, self.initDays, self.endDate,
-                                                 self.slippage, self.rate, self.size,
-                                                 self.dbName, self.symbol)))
-        pool.close()
-        pool.join()
+        settingList = []
+        if searchMode in (SEARCH_GRID, SEARCH_RANDOM):
+            settingList = [setting for setting in optimizationSetting.generateSetting()
+                           if getSettingKey(setting) not in evaluated]
+            self.output(u'待优化{0}组参数'.format(len(settingList)))
+
+        if settingList or searchMode not in (SEARCH_GRID, SEARCH_RANDOM):
+            # 父进程预先加载一次回测数据，保存为列式缓存，各工作进程内存映射共享读取，避免每个参数组合都重新查询数据库
+            cacheFile = u'{0}/cache/optimize_{1}_{2}_{3}'.format(self.get_logs_path(), self.symbol, self.mode, os.getpid())
+            cachePath = None
+            try:
+                cachePath = self.saveHistoryDataFromMongo(cacheFile)
+            except Exception as ex:
+                self.writeCtaError(u'预先加载回测数据失败:{},{}'.format(str(ex), traceback.format_exc()))
+            if cachePath is None:
+                self.output(u'各进程自行加载回测数据')
+
+            # 多进程优化，启动一个对应CPU核心数量的进程池，进程在各参数组合间复用
+            pool = multiprocessing.Pool(multiprocessing.cpu_count(),
+                                        initializer=initOptimizeWorker, initargs=(cachePath,))
+            try:
+                if searchMode == SEARCH_HALVING:
+                    self.__runHalvingSearch(pool, strategyClass, optimizationSetting, evaluated)
+                elif searchMode == SEARCH_GENETIC:
+                    self.__runGeneticSearch(pool, strategyClass, optimizationSetting, evaluated)
+                else:
+                    self.__runOptimizeTasks(pool, strategyClass, optimizationSetting, settingList, evaluated)
+            finally:
+                pool.close()
+                pool.join()
+                if cachePath is not None:
+                    ctaHistoryCache.remove_cache(cachePath)
 
         # 显示结果
-        resultList = [res.get() for res in l]
-        resultList.sort(reverse=True, key=lambda result:result[1])
+        resultList = list(evaluated.values())
+        sortOptimizationResults(resultList)
         self.output('-' * 30)
         self.output(u'优化结果：')
         for result in resultList:
             self.output(u'%s: %s' %(result[0], result[1]))
 
+        return resultList
+
+    # ----------------------------------------------------------------------
+    def __runOptimizeTasks(self, pool, strategyClass, optimizationSetting, settingList, evaluated=None, endDate=None):
+        """
+        在进程池中回测一批参数组合（optimize函数）
+        :param settingList: 参数组合列表
+        :param evaluated: 完整区间的结果 {getSettingKey(setting): result}，结果同时写入结果文件
+        :param endDate: 结束日期（'%Y%m%d'），缺省为回测的结束日期；指定时为缩短的区间，结果不写入结果文件
+        :return: [(str(setting), 目标值, 结果记录)]
+        """
+        argsList = [(strategyClass, setting,
+                     optimizationSetting.optimizeTarget, self.mode,
+                     self.startDate, self.initDays, endDate or self.endDate,
+                     self.slippage, self.rate, self.size,
+                     self.dbName, self.symbol, optimizationSetting.pruneRules) for setting in settingList]
+
+        results = []
+        # 每完成一组，立即写入结果文件
+        for result in pool.imap_unordered(optimizeStar, argsList):
+            if endDate is None:
+                saveOptimizationResult(optimizationSetting.resultFile, result[2])
+                if evaluated is not None:
+                    evaluated[getSettingKey(result[2]['setting'])] = result
+            results.append(result)
+        return results
+
+    # ----------------------------------------------------------------------
+    def __runHalvingSearch(self, pool, strategyClass, optimizationSetting, evaluated):
+        """
+        逐步淘汰（successive halving）搜索
+        随机抽取n组参数，先在较短的区间上回测，每轮保留1/eta的较优参数，区间扩大eta倍，最后一轮为完整区间
+        """
+        searchSetting = optimizationSetting.searchSetting
+        n = searchSetting.get('n', 81)
+        eta = searchSetting.get('eta', 3)
+        rungs = searchSetting.get('rungs', 3)
+
+        endDate = self.dataEndDate or datetime.now()
+        totalDays = (endDate - self.strategyStartDate).days
+
+        candidates = optimizationSetting.generateRandomSetting(n)
+        for rung in range(rungs):
+            if rung == rungs - 1:
+                # 最后一轮，完整区间
+                todo = [setting for setting in candidates if getSettingKey(setting) not in evaluated]
+                self.__runOptimizeTasks(pool, strategyClass, optimizationSetting, todo, evaluated)
+                return
+
+            days = max(int(totalDays / eta ** (rungs - 1 - rung)), 1)
+            rungEndDate = (self.strategyStartDate + timedelta(days=days)).strftime('%Y%m%d')
+            results = self.__runOptimizeTasks(pool, strategyClass, optimizationSetting, candidates, endDate=rungEndDate)
+            sortOptimizationResults(results)
+            candidates = [result[2]['setting'] for result in results[:max(len(results) // eta, 1)]]
+            self.output(u'逐步淘汰第{0}轮（至{1}）回测{2}组，保留{3}组'.format(
+                rung + 1, rungEndDate, len(results), len(candidates)))
+
+    # ----------------------------------------------------------------------
+    def __runGeneticSearch(self, pool, strategyClass, optimizationSetting, evaluated):
+        """
+        遗传算法搜索
+        每代保留较优的一半参数，交叉、变异产生新的参数组合，已回测过的参数组合不再重复回测
+        """
+        searchSetting = optimizationSetting.searchSetting
+        population = searchSetting.get('population', 20)
+        generations = searchSetting.get('generations', 10)
+        mutationRate = searchSetting.get('mutation_rate', 0.2)
+        rng = random.Random(searchSetting.get('seed', None))
+
+        # 参数空间内不重复的组合数量
+        total = 1
+        for values in optimizationSetting.paramDict.values():
+            total *= len(values)
+        population = min(population, total)
+
+        parents = optimizationSetting.generateRandomSetting(population, rng=rng)
+        for generation in range(generations):
+            todo = [setting for setting in parents if getSettingKey(setting) not in evaluated]
+            self.__runOptimizeTasks(pool, strategyClass, optimizationSetting, todo, evaluated)
+
+            ranked = [evaluated[getSettingKey(setting)] for setting in parents]
+            sortOptimizationResults(ranked)
+            self.output(u'遗传算法第{0}代，最优:{1}: {2}'.format(generation + 1, ranked[0][0], ranked[0][1]))
+            if len(evaluated) >= total:
+                return
+
+            # 较优的一半作为下一代的父代，并产生子代
+            elite = [result[2]['setting'] for result in ranked[:max(len(ranked) // 2, 1)]]
+            children = []
+            keys = set(getSettingKey(setting) for setting in elite)
+            tries = 0
+            while len(elite) + len(children) < population and tries < population * 20:
+                tries += 1
+                a = rng.choice(elite)
+                b = rng.choice(elite)
+                child = optimizationSetting.mutateSetting(optimizationSetting.crossoverSetting(a, b, rng),
+                                                          mutationRate, rng)
+                key = getSettingKey(child)
+                if key in keys or key in evaluated:
+                    continue
+                keys.add(key)
+                children.append(child)
+            if not children:
+                return
+            parents = elite + children
+
     #----------------------------------------------------------------------
     def roundToPriceTick(self, price, priceTick=None):
         """取整价格到合约最小价格变动"""
@@ -4449,22 +4938,7 @@ class BacktestingEngine(object):
         :param dt:
         :return:
         """
-        tradingDay = ''
-        if dt is None:
-            dt = datetime.now()
-
-        if dt.hour >= 21:
-            if dt.isoweekday() == 5:
-                # 星期五=》星期一
-                return (dt + timedelta(days=3)).strftime('%Y-%m-%d')
-            else:
-                # 第二天
-                return (dt + timedelta(days=1)).strftime('%Y-%m-%d')
-        elif dt.hour < 8 and dt.isoweekday() == 6:
-            # 星期六=>星期一
-            return (dt + timedelta(days=2)).strftime('%Y-%m-%d')
-        else:
-            return dt.strftime('%Y-%m-%d')
+        return get_calendar().get_trading_date(dt)
 
 ########################################################################
 class TradingResult(object):
@@ -4492,6 +4966,13 @@ class TradingResult(object):
                     - self.commission - self.slippage)  # 净盈亏
 
 
+# 参数搜索方式
+SEARCH_GRID = 'grid'            # 网格，全部参数组合
+SEARCH_RANDOM = 'random'        # 随机抽样
+SEARCH_HALVING = 'halving'      # 逐步淘汰，较短区间上淘汰较差参数
+SEARCH_GENETIC = 'genetic'      # 遗传算法
+
+
 ########################################################################
 class OptimizationSetting(object):
     """优化设置"""
@@ -4502,6 +4983,10 @@ class OptimizationSetting(object):
         self.paramDict = OrderedDict()
 
         self.optimizeTarget = ''        # 优化目标字段
+        self.resultFile = None          # 结果文件（jsonl），每完成一组参数写入一行，重新运行时跳过已完成的参数
+        self.pruneRules = {}            # 提前终止规则
+        self.searchMode = SEARCH_GRID   # 参数搜索方式
+        self.searchSetting = {}         # 搜索方式的设置，见setSearchMode
 
     #----------------------------------------------------------------------
     def addParameter(self, name, start, end=None, step=None):
@@ -4527,9 +5012,29 @@ class OptimizationSetting(object):
 
         self.paramDict[name] = l
 
+    #----------------------------------------------------------------------
+    def setSearchMode(self, mode, **kwargs):
+        """
+        设置参数搜索方式
+        :param mode: SEARCH_GRID，全部参数组合；
+                     SEARCH_RANDOM，随机抽取n组（n, seed）；
+                     SEARCH_HALVING，随机抽取n组，在1/eta^k的较短区间上逐轮淘汰，每轮保留1/eta（n, eta, rungs, seed）；
+                     SEARCH_GENETIC，遗传算法（population, generations, mutation_rate, seed）
+        :param kwargs: 搜索方式的设置
+        :return:
+        """
+        if mode not in (SEARCH_GRID, SEARCH_RANDOM, SEARCH_HALVING, SEARCH_GENETIC):
+            print(u'不支持的搜索方式:{}'.format(mode))
+            return
+        self.searchMode = mode
+        self.searchSetting = kwargs
+
     #----------------------------------------------------------------------
     def generateSetting(self):
         """生成优化参数组合"""
+        if self.searchMode == SEARCH_RANDOM:
+            return self.generateRandomSetting(self.searchSetting.get('n', 100))
+
         # 参数名的列表
         nameList = list(self.paramDict.keys())
         paramList = list(self.paramDict.values())
@@ -4545,11 +5050,83 @@ class OptimizationSetting(object):
 
         return settingList
 
+    #----------------------------------------------------------------------
+    def generateRandomSetting(self, n, rng=None):
+        """
+        随机抽取n组不重复的参数组合（不生成全部组合）
+        :param n: 数量，超过全部组合数量时，返回全部组合
+        :param rng: random.Random，缺省按searchSetting['seed']创建
+        :return:
+        """
+        if rng is None:
+            rng = random.Random(self.searchSetting.get('seed', None))
+
+        total = 1
+        for values in self.paramDict.values():
+            total *= len(values)
+        if n >= total:
+            settingList = [dict(zip(self.paramDict.keys(), p)) for p in product(*self.paramDict.values())]
+            rng.shuffle(settingList)
+            return settingList
+
+        settingList = []
+        keys = set()
+        while len(settingList) < n:
+            setting = {name: rng.choice(values) for name, values in self.paramDict.items()}
+            key = getSettingKey(setting)
+            if key not in keys:
+                keys.add(key)
+                settingList.append(setting)
+        return settingList
+
+    #----------------------------------------------------------------------
+    def crossoverSetting(self, a, b, rng):
+        """交叉：每个参数随机取自a或b"""
+        return {name: (a[name] if rng.random() < 0.5 else b[name]) for name in self.paramDict.keys()}
+
+    #----------------------------------------------------------------------
+    def mutateSetting(self, setting, rate, rng):
+        """变异：每个参数以rate的概率，移动到相邻的取值（或随机取值）"""
+        setting = dict(setting)
+        for name, values in self.paramDict.items():
+            if len(values) < 2 or rng.random() >= rate:
+                continue
+            try:
+                i = values.index(setting[name])
+            except ValueError:
+                setting[name] = rng.choice(values)
+                continue
+            if rng.random() < 0.8:
+                i = min(max(i + rng.choice((-1, 1)), 0), len(values) - 1)
+            else:
+                i = rng.randrange(len(values))
+            setting[name] = values[i]
+        return setting
+
     #----------------------------------------------------------------------
     def setOptimizeTarget(self, target):
         """设置优化目标字段"""
         self.optimizeTarget = target
 
+    #----------------------------------------------------------------------
+    def setResultFile(self, filename):
+        """设置结果文件，中断后使用同一文件重新运行，可继续未完成的优化"""
+        self.resultFile = filename
+
+    #----------------------------------------------------------------------
+    def addPruneRule(self, name, threshold):
+        """
+        增加提前终止规则，每日结算时检查，触发后该组参数停止回测
+        :param name: 'max_drawdown_rate'，最大回撤率（%）超过threshold；
+                     'min_net_capital'，净值低于threshold
+        :param threshold:
+        :return:
+        """
+        if name not in ('max_drawdown_rate', 'min_net_capital'):
+            print(u'不支持的终止规则:{}'.format(name))
+            return
+        self.pruneRules[name] = threshold
+
 #----------------------------------------------------------------------
 def formatNumber(n):
     """格式化数字到字符串"""
@@ -4558,10 +5135,78 @@ def formatNumber(n):
 
 
 #----------------------------------------------------------------------
+# 工作进程中共享的回测数据 (meta, arrays)，由initOptimizeWorker加载
+_sharedData = None
+
+
+def initOptimizeWorker(cachePath):
+    """多进程优化时，每个工作进程启动时运行一次：内存映射父进程预先加载的回测数据"""
+    global _sharedData
+    _sharedData = None
+    if cachePath:
+        try:
+            _sharedData = ctaHistoryCache.load_columns(cachePath, mmap=True)
+        except Exception as ex:
+            print(u'加载共享回测数据失败:{}'.format(str(ex)), file=sys.stderr)
+            _sharedData = None
+
+
+def getSettingKey(setting):
+    """参数组合的唯一标识"""
+    return json.dumps(setting, sort_keys=True, default=str)
+
+
+def loadOptimizationResults(filename):
+    """
+    读取结果文件中已完成的参数组合
+    :param filename: 结果文件（jsonl）
+    :return: {getSettingKey(setting): 结果记录}
+    """
+    results = OrderedDict()
+    if not filename or not os.path.isfile(filename):
+        return results
+    valid_size = 0
+    with open(filename, 'rb') as f:
+        for line in f:
+            try:
+                record = json.loads(line.decode('utf8'))
+            except ValueError:
+                record = None
+            if record is None or not line.endswith(b'\n'):
+                # 中断时未写完的一行
+                break
+            valid_size += len(line)
+            results[getSettingKey(record['setting'])] = record
+
+    # 截掉未写完的部分，后续结果从新行开始追加
+    if valid_size < os.path.getsize(filename):
+        with open(filename, 'rb+') as f:
+            f.truncate(valid_size)
+    return results
+
+
+def saveOptimizationResult(filename, record):
+    """追加一组参数的结果至结果文件（jsonl）"""
+    if not filename:
+        return
+    with open(filename, 'a', encoding='utf8') as f:
+        f.write(json.dumps(record, ensure_ascii=False, default=str) + '\n')
+
+
+def sortOptimizationResults(resultList):
+    """按目标值从大到小排序，提前终止的参数组合排在最后"""
+    resultList.sort(reverse=True, key=lambda result: (not result[2].get('pruned'), result[1]))
+
+
+def optimizeStar(args):
+    """imap使用的单参数版本"""
+    return optimize(*args)
+
+
 def optimize(strategyClass, setting, targetName,
              mode, startDate, initDays, endDate,
              slippage, rate, size,
-             dbName, symbol):
+             dbName, symbol, pruneRules=None):
     """多进程优化时跑在每个进程中运行的函数"""
     engine = BacktestingEngine()
     engine.setBacktestingMode(mode)
@@ -4571,15 +5216,12 @@ def optimize(strategyClass, setting, targetName,
     engine.setRate(rate)
     engine.setSize(size)
     engine.setDatabase(dbName, symbol)
+    engine.sharedData = _sharedData
+    engine.setPruneRules(pruneRules)
 
-    engine.initStrategy(strategyClass, setting)
+    engine.initStrategy(strategyClass, copy.copy(setting))
     engine.runBacktesting()
-    d = engine.calculateBacktestingResult()
-    try:
-        targetValue = d[targetName]
-    except KeyError:
-        targetValue = 0
-    return (str(setting), targetValue)
+    return engine.getOptimizeResult(setting, targetName)
 
 
 
@@ -0,0 +1,374 @@
+# encoding: UTF-8
+
+"""
+列式K线存储
+用于CtaLineBar.lineBar，替代 list + copy.deepcopy(CtaBarData) 的保存方式：
+- 数值字段（OHLC、成交量、持仓量、mid3/4/5等）按列保存在float64数组中，可零拷贝读取
+- 其他字段（日期、时间、交易日等）按列保存在list中，只保存引用
+- lineBar[i] 返回CtaBarView视图对象，属性读写直接作用于列数据，兼容原CtaBarData的用法
+注意：视图只在对应bar仍保留在lineBar中时有效，需长期保存的，请使用 view.to_bar() 生成CtaBarData
+"""
+
+from operator import attrgetter
+from sys import intern
+
+import numpy as np
+
+from vnpy.trader.app.ctaStrategy.ctaBase import CtaBarData
+
+# 按float64列保存的数值字段
+BAR_FLOAT_FIELDS = ('open', 'high', 'low', 'close', 'volume', 'dayVolume', 'openInterest', 'mid3', 'mid4', 'mid5',
+                    'height', 'upBand', 'downBand')
+
+# 按引用保存的其他字段
+BAR_OBJECT_FIELDS = ('vtSymbol', 'symbol', 'exchange', 'tradingDay', 'date', 'time', 'datetime',
+                     'color', 'traded', 'tradeStatus', 'seconds', 'highSeconds', 'lowSeconds',
+                     'lowTime', 'highTime')
+
+BAR_FIELD_SET = frozenset(BAR_FLOAT_FIELDS + BAR_OBJECT_FIELDS)
+
+
+class CtaBarStore(object):
+    """K线列式存储（环形缓冲，容量不足时自动扩容）"""
+
+    def __init__(self, capacity=256):
+        capacity = max(int(capacity), 1)
+        self._capacity = capacity
+        self._start = 0         # 第一根bar所在的位置，[0, capacity)
+        self._len = 0
+        self._first_seq = 0     # 第一根bar的序号，bar的序号单调递增，视图通过序号定位
+        self._extras = {}       # 序号: {非标准字段: 值}
+        self._alloc(capacity)
+
+    def _alloc(self, capacity):
+        """分配列数据，数值列每个数据写两份(i与i+capacity)，保证最近n个数据为连续内存"""
+        self._floats = {}
+        self._mvs = {}
+        for field in BAR_FLOAT_FIELDS:
+            arr = np.zeros(capacity * 2, dtype=np.float64)
+            self._floats[field] = arr
+            self._mvs[field] = memoryview(arr)
+        self._objects = {}
+        for field in BAR_OBJECT_FIELDS:
+            self._objects[field] = [None] * capacity
+
+    def _grow(self):
+        """扩容一倍"""
+        n = self._len
+        floats = {f: self.column(f).copy() for f in BAR_FLOAT_FIELDS}
+        objects = {f: self.values(f) for f in BAR_OBJECT_FIELDS}
+        capacity = self._capacity * 2
+        self._alloc(capacity)
+        for f in BAR_FLOAT_FIELDS:
+            arr = self._floats[f]
+            arr[:n] = floats[f]
+            arr[capacity:capacity + n] = floats[f]
+        for f in BAR_OBJECT_FIELDS:
+            self._objects[f][:n] = objects[f]
+        self._capacity = capacity
+        self._start = 0
+
+    # ----------------------------------------------------------------------
+    def _pos(self, seq):
+        """序号 => 数组中的位置"""
+        i = seq - self._first_seq
+        if i < 0 or i >= self._len:
+            raise IndexError(u'bar已移出lineBar')
+        i += self._start
+        if i >= self._capacity:
+            i -= self._capacity
+        return i
+
+    def append(self, bar):
+        """
+        添加bar，复制bar的字段数值至各列
+        :param bar: CtaBarData或CtaBarView
+        :return: 新bar的视图
+        """
+        if self._len == self._capacity:
+            self._grow()
+        cap = self._capacity
+        pos = self._start + self._len
+        if pos >= cap:
+            pos -= cap
+
+        for field in BAR_FLOAT_FIELDS:
+            value = getattr(bar, field, None)
+            value = float(value) if value is not None else 0.0
+            mv = self._mvs[field]
+            mv[pos] = value
+            mv[pos + cap] = value
+        for field in BAR_OBJECT_FIELDS:
+            value = getattr(bar, field, None)
+            if value.__class__ is str:
+                # 日期、时间、合约等字符串大量重复，驻留后各bar共用同一对象
+                value = intern(value)
+            self._objects[field][pos] = value
+
+        seq = self._first_seq + self._len
+        self._len += 1
+
+        # 保存bar对象上的非标准字段
+        if isinstance(bar, CtaBarView):
+            extra = bar._store._extras.get(bar._seq, None)
+            if extra:
+                self._extras[seq] = dict(extra)
+        else:
+            d = getattr(bar, '__dict__', None)
+            if d and len(d) > len(BAR_FIELD_SET):
+                extra = {k: v for k, v in d.items() if k not in BAR_FIELD_SET}
+                if extra:
+                    self._extras[seq] = extra
+
+        return CtaBarView(self, seq)
+
+    def popleft(self):
+        """移除最早的bar"""
+        if self._len == 0:
+            raise IndexError('pop from empty CtaBarStore')
+        pos = self._start
+        for field in BAR_OBJECT_FIELDS:
+            self._objects[field][pos] = None
+        self._extras.pop(self._first_seq, None)
+        self._start = pos + 1 if pos + 1 < self._capacity else 0
+        self._first_seq += 1
+        self._len -= 1
+
+    def pop(self):
+        """移除最后一根bar"""
+        if self._len == 0:
+            raise IndexError('pop from empty CtaBarStore')
+        seq = self._first_seq + self._len - 1
+        pos = self._pos(seq)
+        for field in BAR_OBJECT_FIELDS:
+            self._objects[field][pos] = None
+        self._extras.pop(seq, None)
+        self._len -= 1
+
+    # ----------------------------------------------------------------------
+    def column(self, field, n=None):
+        """
+        数值字段最近n根bar的只读连续视图（零拷贝）
+        :param field: BAR_FLOAT_FIELDS中的字段
+        :param n: None，全部bar
+        :return: np.ndarray
+        """
+        end = self._start + self._len
+        if n is None or n >= self._len:
+            begin = self._start
+        else:
+            begin = end - max(int(n), 0)
+        v = self._floats[field][begin:end]
+        v.flags.writeable = False
+        return v
+
+    def values(self, field, start=None, end=None):
+        """
+        lineBar[start:end] 某个字段的数值列表，与 [getattr(x, field) for x in lineBar[start:end]] 一致
+        """
+        if field in self._floats:
+            return self.column(field)[start:end].tolist()
+        if field in self._objects:
+            objs = self._objects[field]
+            cap = self._capacity
+            return [objs[(self._start + i) % cap] for i in range(self._len)[start:end]]
+        return [getattr(x, field) for x in self[start:end]]
+
+    # ----------------------------------------------------------------------
+    def __len__(self):
+        return self._len
+
+    def __getitem__(self, item):
+        if item.__class__ is slice:
+            first = self._first_seq
+            return [CtaBarView(self, first + i) for i in range(self._len)[item]]
+        n = self._len
+        if item < 0:
+            item += n
+        if item < 0 or item >= n:
+            raise IndexError('CtaBarStore index out of range')
+        return CtaBarView(self, self._first_seq + item)
+
+    def __delitem__(self, item):
+        if item == 0 or item == -self._len:
+            self.popleft()
+        elif item == -1 or item == self._len - 1:
+            self.pop()
+        else:
+            raise IndexError(u'CtaBarStore只支持删除第一根或最后一根bar')
+
+    def __iter__(self):
+        first = self._first_seq
+        for i in range(self._len):
+            yield CtaBarView(self, first + i)
+
+    def __reversed__(self):
+        first = self._first_seq
+        for i in range(self._len - 1, -1, -1):
+            yield CtaBarView(self, first + i)
+
+    def __repr__(self):
+        return 'CtaBarStore(len={})'.format(self._len)
+
+    # ----------------------------------------------------------------------
+    def __getstate__(self):
+        """Pickle时只保存有效数据"""
+        return {'capacity': self._capacity,
+                'first_seq': self._first_seq,
+                'floats': {f: self.column(f).tolist() for f in BAR_FLOAT_FIELDS},
+                'objects': {f: self.values(f) for f in BAR_OBJECT_FIELDS},
+                'extras': dict(self._extras)}
+
+    def __setstate__(self, state):
+        capacity = state['capacity']
+        floats = state['floats']
+        n = len(floats['close'])
+        self.__init__(capacity=max(capacity, n))
+        for f in BAR_FLOAT_FIELDS:
+            arr = self._floats[f]
+            arr[:n] = floats[f]
+            arr[self._capacity:self._capacity + n] = floats[f]
+        for f in BAR_OBJECT_FIELDS:
+            self._objects[f][:n] = state['objects'][f]
+        self._len = n
+        self._first_seq = state['first_seq']
+        self._extras = state['extras']
+
+
+def _float_property(field):
+    # 属性读写较频繁，直接内联 _pos 的计算
+    def fget(self):
+        store = self._store
+        i = self._seq - store._first_seq
+        if i < 0 or i >= store._len:
+            raise IndexError(u'bar已移出lineBar')
+        i += store._start
+        if i >= store._capacity:
+            i -= store._capacity
+        return store._mvs[field][i]
+
+    def fset(self, value):
+        store = self._store
+        cap = store._capacity
+        i = self._seq - store._first_seq
+        if i < 0 or i >= store._len:
+            raise IndexError(u'bar已移出lineBar')
+        i += store._start
+        if i >= cap:
+            i -= cap
+        mv = store._mvs[field]
+        value = float(value)
+        mv[i] = value
+        mv[i + cap] = value
+
+    return property(fget, fset)
+
+
+def _object_property(field):
+    def fget(self):
+        store = self._store
+        i = self._seq - store._first_seq
+        if i < 0 or i >= store._len:
+            raise IndexError(u'bar已移出lineBar')
+        i += store._start
+        if i >= store._capacity:
+            i -= store._capacity
+        return store._objects[field][i]
+
+    def fset(self, value):
+        store = self._store
+        store._objects[field][store._pos(self._seq)] = value
+
+    return property(fget, fset)
+
+
+class CtaBarView(object):
+    """CtaBarStore中一根bar的视图，属性与CtaBarData一致"""
+
+    __slots__ = ('_store', '_seq')
+
+    def __init__(self, store, seq):
+        object.__setattr__(self, '_store', store)
+        object.__setattr__(self, '_seq', seq)
+
+    def __getattr__(self, name):
+        # 非标准字段
+        extra = self._store._extras.get(self._seq, None)
+        if extra is not None and name in extra:
+            return extra[name]
+        raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        setter = _FIELD_SETTERS.get(name, None)
+        if setter is not None:
+            setter(self, value)
+        else:
+            store = self._store
+            store._pos(self._seq)
+            store._extras.setdefault(self._seq, {})[name] = value
+
+    def to_bar(self):
+        """生成独立的CtaBarData对象"""
+        bar = CtaBarData()
+        d = bar.__dict__
+        for field in BAR_FLOAT_FIELDS:
+            d[field] = getattr(self, field)
+        for field in BAR_OBJECT_FIELDS:
+            d[field] = getattr(self, field)
+        extra = self._store._extras.get(self._seq, None)
+        if extra:
+            d.update(extra)
+        return bar
+
+    def __copy__(self):
+        return self.to_bar()
+
+    def __deepcopy__(self, memo):
+        return self.to_bar()
+
+    def __eq__(self, other):
+        if isinstance(other, CtaBarView):
+            return self._store is other._store and self._seq == other._seq
+        return NotImplemented
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+    def __hash__(self):
+        return hash((id(self._store), self._seq))
+
+    def __reduce__(self):
+        # pickle时保存为独立的CtaBarData
+        return (_restore_bar, (self.to_bar().__dict__,))
+
+    def __repr__(self):
+        return 'CtaBarView(datetime={}, open={}, high={}, low={}, close={}, volume={})'.format(
+            self.datetime, self.open, self.high, self.low, self.close, self.volume)
+
+
+def _restore_bar(d):
+    bar = CtaBarData()
+    bar.__dict__.update(d)
+    return bar
+
+
+_FIELD_SETTERS = {}     # 字段名: 属性的写方法
+for _field in BAR_FLOAT_FIELDS:
+    setattr(CtaBarView, _field, _float_property(_field))
+for _field in BAR_OBJECT_FIELDS:
+    setattr(CtaBarView, _field, _object_property(_field))
+for _field in BAR_FIELD_SET:
+    _FIELD_SETTERS[_field] = getattr(CtaBarView, _field).fset
+
+
+def get_bar_values(line_bar, field, start=None, end=None):
+    """
+    获取 line_bar[start:end] 中某个字段的列表
+    :param line_bar: list(CtaBarData) 或 CtaBarStore
+    """
+    if isinstance(line_bar, CtaBarStore):
+        return line_bar.values(field, start, end)
+    return list(map(attrgetter(field), line_bar[start:end]))
@@ -131,6 +131,18 @@ class CtaBarData(object):
         self.lowTime = None                 # 最后一次进入低位区域的时间
         self.highTime = None                # 最后一次进入高位区域的时间
 
+    #----------------------------------------------------------------------
+    @staticmethod
+    def fromVtBar(bar):
+        """
+        VtBarData => CtaBarData
+        按预先生成的字段表一次性复制：同名字段取bar的值，其余为缺省值
+        """
+        src = bar.__dict__
+        ctaBar = CtaBarData.__new__(CtaBarData)
+        ctaBar.__dict__ = {k: src.get(k, v) for k, v in CTA_BAR_DEFAULTS}
+        return ctaBar
+
 
 ########################################################################
 class CtaTickData(object):
@@ -181,4 +193,23 @@ class CtaTickData(object):
         self.askVolume2 = EMPTY_INT
         self.askVolume3 = EMPTY_INT
         self.askVolume4 = EMPTY_INT
-        self.askVolume5 = EMPTY_INT    
\ No newline at end of file
+        self.askVolume5 = EMPTY_INT
+
+    #----------------------------------------------------------------------
+    @staticmethod
+    def fromVtTick(tick):
+        """
+        VtTickData => CtaTickData
+        按预先生成的字段表一次性复制：同名字段取tick的值，其余为缺省值，
+        替代逐个字段判断 key in tick.__dict__ 和 tick.__getattribute__(key)
+        """
+        src = tick.__dict__
+        ctaTick = CtaTickData.__new__(CtaTickData)
+        ctaTick.__dict__ = {k: src.get(k, v) for k, v in CTA_TICK_DEFAULTS}
+        return ctaTick
+
+
+# 各字段及缺省值，(字段, 缺省值)，用于Vt/Cta数据之间的转换
+# 字段的缺省值均为不可变对象（数值、字符串、None），可直接共用
+CTA_BAR_DEFAULTS = tuple(CtaBarData().__dict__.items())
+CTA_TICK_DEFAULTS = tuple(CtaTickData().__dict__.items())
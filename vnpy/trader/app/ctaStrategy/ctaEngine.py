@@ -30,13 +30,15 @@ import re
 import csv
 import copy
 import decimal
-from threading import Thread
+from threading import Thread, RLock
+from time import perf_counter
 from concurrent.futures import ThreadPoolExecutor
 
 from vnpy.trader.vtEvent import *
 from vnpy.trader.vtConstant import *
 from vnpy.trader.vtGateway import VtSubscribeReq, VtOrderReq, VtCancelOrderReq, VtLogData, VtSignalData
 from vnpy.trader.app.ctaStrategy.ctaBase import *
+from vnpy.trader.app.ctaStrategy.ctaOrderIndex import StopOrderIndex
 from vnpy.trader.setup_logger import setup_logger
 from vnpy.trader.vtFunction import todayDate, getJsonPath
 from vnpy.trader.vtObject import VtPositionData,PositionBuffer
@@ -88,6 +90,11 @@ class CtaEngine(object):
         # key为vtOrderID，value为strategy对象
         self.orderStrategyDict = {}
 
+        # 事件引擎支持分片（MultiWorkerEventEngine）时，策略的回调在以策略名为分片键的线程中执行，
+        # 策略在各自线程中发单/撤单，委托映射和停止单的字典由orderLock保护
+        self.callInShard = getattr(eventEngine, 'callInShard', None)
+        self.orderLock = RLock()
+
         # 本地停止单编号计数
         self.stopOrderCount = 0
         # stopOrderID = STOPORDERPREFIX + str(stopOrderCount)
@@ -96,6 +103,7 @@ class CtaEngine(object):
         # key为stopOrderID，value为stopOrder对象
         self.stopOrderDict = {}  # 停止单撤销后不会从本字典中删除
         self.workingStopOrderDict = {}  # 停止单撤销后会从本字典中删除
+        self.stopOrderIndex = StopOrderIndex()  # 等待中的停止单，按合约、方向、价格索引
 
         # 持仓缓存字典
         # key为vtSymbol，value为PositionBuffer对象
@@ -309,14 +317,18 @@ class CtaEngine(object):
                 # else:
                 #    req.offset = OFFSET_CLOSE
         strategy_name = getattr(strategy,'name') if strategy is not None else None
-        vtOrderID = self.mainEngine.sendOrder(req, contract.gatewayName, strategyName=strategy_name)  # 发单
+        # 持锁发单并登记映射，避免委托回报先于映射到达引擎线程
+        with self.orderLock:
+            vtOrderID = self.mainEngine.sendOrder(req, contract.gatewayName, strategyName=strategy_name)  # 发单
 
-        if vtOrderID is None or len(vtOrderID) == 0:
-            self.writeCtaError(u'{} 发送委托失败. {} {} {} {}'.format(getattr(strategy,'name','') if strategy else 'CtaEngine', vtSymbol, req.offset, req.direction, volume, price))
-            return ''
+            if vtOrderID is None or len(vtOrderID) == 0:
+                self.writeCtaError(u'{} 发送委托失败. {} {} {} {}'.format(getattr(strategy,'name','') if strategy else 'CtaEngine', vtSymbol, req.offset, req.direction, volume, price))
+                return ''
+
+            if strategy:
+                self.orderStrategyDict[vtOrderID] = strategy  # 保存vtOrderID和策略的映射关系
 
         if strategy:
-            self.orderStrategyDict[vtOrderID] = strategy  # 保存vtOrderID和策略的映射关系
             msg = u'策略%s发送委托，%s, %s，%s，%s@%s' % (getattr(strategy,'name',''), vtSymbol, req.offset, req.direction, volume, price)
             self.writeCtaLog(msg)
         else:
@@ -412,8 +424,9 @@ class CtaEngine(object):
         """发停止单（本地实现）"""
 
         # 1.生成本地停止单ID
-        self.stopOrderCount += 1
-        stopOrderID = STOPORDERPREFIX + str(self.stopOrderCount)
+        with self.orderLock:
+            self.stopOrderCount += 1
+            stopOrderID = STOPORDERPREFIX + str(self.stopOrderCount)
 
         # 2.创建停止单对象
         so = StopOrder()
@@ -439,8 +452,10 @@ class CtaEngine(object):
             so.offset = OFFSET_CLOSE
 
             # 保存stopOrder对象到字典中
-        self.stopOrderDict[stopOrderID] = so  # 字典中不会删除
-        self.workingStopOrderDict[stopOrderID] = so  # 字典中会删除
+        with self.orderLock:
+            self.stopOrderDict[stopOrderID] = so  # 字典中不会删除
+            self.workingStopOrderDict[stopOrderID] = so  # 字典中会删除
+            self.stopOrderIndex.add(so)
 
         msg = u'发停止单成功，Id:{},Symbol:{},Type:{},Price:{},Volume:{}'.format(stopOrderID, vtSymbol, orderType, price, volume)
         self.writeCtaLog(msg)
@@ -459,10 +474,12 @@ class CtaEngine(object):
         增加返回True 和 False
         """
         # 1.检查停止单是否存在
-        if stopOrderID in self.workingStopOrderDict:
-            so = self.workingStopOrderDict[stopOrderID]
-            so.status = STOPORDER_CANCELLED  # STOPORDER_WAITING =》STOPORDER_CANCELLED
-            del self.workingStopOrderDict[stopOrderID]  # 删除
+        with self.orderLock:
+            so = self.workingStopOrderDict.pop(stopOrderID, None)  # 删除
+            if so is not None:
+                so.status = STOPORDER_CANCELLED  # STOPORDER_WAITING =》STOPORDER_CANCELLED
+                self.stopOrderIndex.remove(stopOrderID)
+        if so is not None:
             self.writeCtaLog(u'撤销停止单:{0}成功.'.format(stopOrderID))
 
             # 发送微信
@@ -488,38 +505,32 @@ class CtaEngine(object):
 
         # 1.首先检查是否有策略交易该合约
         if vtSymbol in self.tickStrategyDict:
-            # 2.遍历等待中的停止单，检查是否会被触发
-            for so in (self.workingStopOrderDict.values()):
-                if so.vtSymbol == vtSymbol:
-                    # 3. 触发标识判断
-                    longTriggered = so.direction == DIRECTION_LONG and tick.lastPrice >= so.price  # 多头停止单被触发
-                    shortTriggered = so.direction == DIRECTION_SHORT and tick.lastPrice <= so.price  # 空头停止单被触发
-
-                    # 4.触发处理
-                    if longTriggered or shortTriggered:
-
-                        # 5.设定价格，买入和卖出分别以涨停跌停价发单（模拟市价单）
-                        if so.direction == DIRECTION_LONG:
-                            price = tick.upperLimit
-                        else:
-                            price = tick.lowerLimit
-
-                        # 6.更新停止单状态，触发
-                        so.status = STOPORDER_TRIGGERED
+            # 2.从索引中取出已触发的停止单：多头停止价 <= 最新价，空头停止价 >= 最新价
+            with self.orderLock:
+                triggered = [(stopOrderID, so) for stopOrderID, so
+                             in self.stopOrderIndex.pop_triggered(vtSymbol, tick.lastPrice, tick.lastPrice)
+                             if self.workingStopOrderDict.pop(stopOrderID, None) is not None]  # 已撤单的跳过
+
+            for stopOrderID, so in triggered:
+                # 3.设定价格，买入和卖出分别以涨停跌停价发单（模拟市价单）
+                if so.direction == DIRECTION_LONG:
+                    price = tick.upperLimit
+                else:
+                    price = tick.lowerLimit
 
-                        # 7.发单
-                        self.sendOrder(so.vtSymbol, so.orderType, price, so.volume, so.strategy)
+                # 4.更新停止单状态，触发
+                so.status = STOPORDER_TRIGGERED
 
-                        # 8.删除停止单
-                        del self.workingStopOrderDict[so.stopOrderID]
+                # 5.发单
+                self.sendOrder(so.vtSymbol, so.orderType, price, so.volume, so.strategy)
 
     # ----------------------------------------------------------------------
     def processTickEvent(self, event):
         """处理行情推送事件"""
 
         # 1. 获取事件的Tick数据
+        # gateway推送的tick已是独立的对象，各处理函数只读共享，不再复制
         tick = event.dict_['data']
-        tick = copy.copy(tick)
 
         # 移除待订阅的合约清单
         if '.' in tick.vtSymbol:
@@ -545,21 +556,17 @@ class CtaEngine(object):
         if tick.vtSymbol in self.tickStrategyDict:
 
             # 4.将vtTickData数据转化为ctaTickData
-            ctaTick = CtaTickData()
-            d = ctaTick.__dict__
-            for key in d.keys():
-                if key in tick.__dict__:
-                    d[key] = tick.__getattribute__(key)
+            ctaTick = CtaTickData.fromVtTick(tick)
 
             if not ctaTick.datetime:
                 # 添加datetime字段
                 tickDate = tick.date.replace('-', '')
                 ctaTick.datetime = datetime.strptime(' '.join([tickDate, tick.time]), '%Y%m%d %H:%M:%S.%f')
 
-            # 逐个推送到策略实例中
+            # 逐个推送到策略实例中（各策略共享同一个ctaTick，策略不应修改其属性）
             l = self.tickStrategyDict[tick.vtSymbol]
             for strategy in l:
-                self.callStrategyFunc(strategy, strategy.onTick, ctaTick)
+                self.dispatchStrategyFunc(strategy, self.callStrategyFunc, strategy, strategy.onTick, ctaTick)
 
     def processBarEvent(self,event):
         # 1. 获取事件的Tick数据
@@ -568,10 +575,12 @@ class CtaEngine(object):
         # 3.推送tick到对应的策略对象进行处理
         if bar.vtSymbol in self.barStrategyDict:
             # 逐个推送到策略实例中
+            # 只复制一次，各策略共享（gateway仍会继续更新原bar）
+            bar = copy.copy(bar)
             l = self.barStrategyDict[bar.vtSymbol]
             for strategy in l:
                 self.writeCtaLog(u'推送{}bar到策略:{}'.format(bar.vtSymbol,strategy.name))
-                self.callStrategyFunc(strategy, strategy.onBar, copy.copy(bar))
+                self.dispatchStrategyFunc(strategy, self.callStrategyFunc, strategy, strategy.onBar, bar)
 
     # ----------------------------------------------------------------------
     def processOrderEvent(self, event):
@@ -585,12 +594,12 @@ class CtaEngine(object):
                 .format( order.vtSymbol, order.totalVolume, order.tradedVolume,
                         order.offset, order.price, order.direction, order.status))
 
-        # 2.判断order是否在策略的映射字典中
-        if order.vtOrderID in self.orderStrategyDict:
-            # 3.提取对应的策略
-            strategy = self.orderStrategyDict[order.vtOrderID]
-            # 4.触发策略的委托推送事件方法
-            strategy.onOrder(order)
+        # 2.判断order是否在策略的映射字典中（策略线程发单时，等待其登记完映射）
+        with self.orderLock:
+            strategy = self.orderStrategyDict.get(order.vtOrderID, None)
+        if strategy is not None:
+            # 3.触发策略的委托推送事件方法
+            self.dispatchStrategyFunc(strategy, strategy.onOrder, order)
         else:
             # 检查调度的平仓
             self.onOrder_dispatch_close_pos(order)
@@ -608,9 +617,9 @@ class CtaEngine(object):
         self.tradeSet.add(trade.vtTradeID)
 
         # 将成交推送到策略对象中
-        if trade.vtOrderID in self.orderStrategyDict:
-            # 3.提取对应的策略
-            strategy = self.orderStrategyDict[trade.vtOrderID]
+        with self.orderLock:
+            strategy = self.orderStrategyDict.get(trade.vtOrderID, None)
+        if strategy is not None:
 
             # 计算策略持仓 ( canceled by IncenseLee )
             # if trade.direction == DIRECTION_LONG:
@@ -638,7 +647,7 @@ class CtaEngine(object):
                 self.writeCtaError(u'写入交易记录csv出错：{},{}'.format(str(ex),traceback.format_exc()))
 
             # 推送到策略onTrade事件
-            self.callStrategyFunc(strategy, strategy.onTrade, trade)
+            self.dispatchStrategyFunc(strategy, self.callStrategyFunc, strategy, strategy.onTrade, trade)
 
             if globalSetting.get('activate_strategy_fund_kline',False):
                 kline = self.get_fund_kline(strategy_name)
@@ -925,7 +934,19 @@ class CtaEngine(object):
 
         # 触发每个策略的定时接口
         for strategy in list(self.strategyDict.values()):
-            strategy.onTimer()
+            self.dispatchStrategyFunc(strategy, strategy.onTimer)
+
+    # ----------------------------------------------------------------------
+    def dispatchStrategyFunc(self, strategy, func, *args):
+        """
+        执行策略的回调func(*args)
+        事件引擎支持分片时，转到以策略名为分片键的线程执行：各策略并行，同一策略的回调按事件顺序执行；
+        否则在当前线程直接执行
+        """
+        if self.callInShard is None:
+            func(*args)
+        else:
+            self.callInShard(strategy.name, func, *args)
 
     # ----------------------------------------------------------------------
     def insertData(self, dbName, collectionName, data):
@@ -938,11 +959,10 @@ class CtaEngine(object):
         startDate = self.today - timedelta(days)
 
         d = {'datetime': {'$gte': startDate}}
-        barData = self.mainEngine.dbQuery(dbName, collectionName, d)
 
         l = []
-        for d in barData:
-            bar = CtaBarData()
+        for d in self.queryRows(dbName, collectionName, d):
+            bar = CtaBarData.__new__(CtaBarData)
             bar.__dict__ = d
             l.append(bar)
 
@@ -955,16 +975,27 @@ class CtaEngine(object):
         startDate = self.today - timedelta(days)
 
         d = {'datetime': {'$gte': startDate}}
-        tickData = self.mainEngine.dbQuery(dbName, collectionName, d)
 
         l = []
-        for d in tickData:
-            tick = CtaTickData()
+        for d in self.queryRows(dbName, collectionName, d):
+            tick = CtaTickData.__new__(CtaTickData)
             tick.__dict__ = d
             l.append(tick)
 
         return l
 
+    # ----------------------------------------------------------------------
+    def queryRows(self, dbName, collectionName, flt):
+        """
+        逐条读取数据库记录（不读取_id）
+        主引擎支持流式查询时按批读取游标，不再先生成全部记录的列表；
+        否则（如远程的ClientEngine）使用dbQuery
+        读取中途的数据库异常会抛出（loadBar/loadTick不返回不完整的历史数据），由callStrategyFunc记录并停止策略
+        """
+        if hasattr(self.mainEngine, 'dbQueryIter'):
+            return self.mainEngine.dbQueryIter(dbName, collectionName, flt, projection={'_id': 0})
+        return self.mainEngine.dbQuery(dbName, collectionName, flt)
+
     # ----------------------------------------------------------------------
     #  保存记录相关
     def append_data(self, file_name, dict_data, field_names=None):
@@ -1455,14 +1486,17 @@ class CtaEngine(object):
                 self.callStrategyFunc(strategy, strategy.onStop)
 
                 # 6.对该策略发出的所有限价单进行撤单
-                for vtOrderID, s in self.orderStrategyDict.items():
-                    if s is strategy:
-                        self.cancelOrder(vtOrderID)
+                with self.orderLock:
+                    vtOrderIDs = [vtOrderID for vtOrderID, s in self.orderStrategyDict.items() if s is strategy]
+                for vtOrderID in vtOrderIDs:
+                    self.cancelOrder(vtOrderID)
 
                 # 7.对该策略发出的所有本地停止单撤单
-                for stopOrderID, so in self.workingStopOrderDict.items():
-                    if so.strategy is strategy:
-                        self.cancelStopOrder(stopOrderID)
+                with self.orderLock:
+                    stopOrderIDs = [stopOrderID for stopOrderID, so in self.workingStopOrderDict.items()
+                                    if so.strategy is strategy]
+                for stopOrderID in stopOrderIDs:
+                    self.cancelStopOrder(stopOrderID)
 
             return True
         else:
@@ -2418,11 +2452,18 @@ class CtaEngine(object):
     # ----------------------------------------------------------------------
     def callStrategyFunc(self, strategy, func, params=None):
         """调用策略的函数，若触发异常则捕捉"""
+        # 事件引擎开启延时统计时，记录各策略函数的执行时间
+        profiler = getattr(self.eventEngine, 'profiler', None)
+        if profiler is not None:
+            start = perf_counter()
         try:
             if params:
                 func(params)
             else:
                 func()
+            if profiler is not None:
+                profiler.record(u'{0}.{1}'.format(strategy.name, getattr(func, '__name__', '')),
+                                perf_counter() - start)
         except Exception as ex:
             # 停止策略，修改状态为未初始化
             strategy.trading = False
@@ -2579,10 +2620,12 @@ class CtaEngine(object):
         """清空运行数据"""
         self.writeCtaLog(u'ctaEngine.clearData()清空运行数据')
         self.tickDict = {}
-        self.orderStrategyDict = {}
-        self.workingStopOrderDict = {}
+        with self.orderLock:
+            self.orderStrategyDict = {}
+            self.workingStopOrderDict = {}
+            self.stopOrderIndex.clear()
+            self.stopOrderDict = {}
         self.posBufferDict = {}
-        self.stopOrderDict = {}
 
     def qryStatus(self):
         """查询cta Engined的运行状态"""
@@ -0,0 +1,285 @@
+# encoding: UTF-8
+
+"""
+回测用的本地列式缓存
+将bar/tick对象列表按字段拆成列，每列保存为一个.npy文件（目录名以.npc结尾），
+读取时使用内存映射（np.load(mmap_mode='r')），不再逐行解析csv、也不再反序列化整个pickle。
+- 数值字段：float64 / int64 / bool
+- 字符串字段：定长unicode数组
+- datetime字段：datetime64[us]
+- 全部相同的字段：只在meta.json中保存一个值
+- 含None的字段：另存一个mask列
+按tradingDay（如有）保存每个交易日的起止位置，可只读取部分交易日。
+不支持的字段类型（list、dict、带时区的datetime等），save_objects会抛出ValueError，调用方可改用pickle。
+
+命令行转换已有的pickle缓存：
+    python ctaHistoryCache.py xxx.pickle [yyy.pickle ...]
+"""
+
+import os
+import sys
+import json
+import shutil
+import importlib
+import pickle
+from datetime import datetime
+
+import numpy as np
+
+CACHE_SUFFIX = '.npc'
+CACHE_VERSION = 1
+META_FILE = 'meta.json'
+
+
+def get_cache_path(path):
+    """缓存文件名（无论是否带.pickle后缀） => 列式缓存目录"""
+    if path.endswith(CACHE_SUFFIX):
+        return path
+    if path.endswith('.pickle'):
+        path = path[:-len('.pickle')]
+    return path + CACHE_SUFFIX
+
+
+def is_cached(path):
+    """列式缓存是否存在"""
+    return os.path.isfile(os.path.join(get_cache_path(path), META_FILE))
+
+
+def _encode_column(values):
+    """
+    一列数据 => (列信息, 数组, mask数组)
+    :param values: list
+    :return:
+    """
+    first = values[0]
+    # 全部相同，只保存一个值
+    if isinstance(first, (str, int, float, bool)) or first is None:
+        t = type(first)
+        if all(v == first and type(v) is t for v in values):
+            return {'kind': 'const', 'value': first}, None, None
+
+    mask = None
+    present = [v for v in values if v is not None]
+    if len(present) < len(values):
+        mask = np.array([v is None for v in values], dtype=bool)
+    if len(present) == 0:
+        return {'kind': 'const', 'value': None}, None, None
+
+    types = set(type(v) for v in present)
+    if types == {bool}:
+        kind, fill = '?', False
+    elif types <= {int, bool} and bool not in types:
+        kind, fill = 'i8', 0
+    elif types <= {int, float} and float in types:
+        kind, fill = 'f8', 0.0
+    elif types == {str}:
+        kind, fill = 'U', ''
+    elif types == {datetime} and all(v.tzinfo is None for v in present):
+        kind, fill = 'M', datetime(1970, 1, 1)
+    else:
+        raise ValueError(u'不支持的字段类型:{}'.format(types))
+
+    if mask is not None:
+        values = [fill if v is None else v for v in values]
+
+    if kind == 'M':
+        arr = np.array(values, dtype='datetime64[us]')
+    elif kind == 'U':
+        arr = np.array(values, dtype=str)
+    else:
+        arr = np.array(values, dtype=kind)
+
+    # 检查整数是否溢出
+    if kind == 'i8' and arr.tolist() != values:
+        raise ValueError(u'整数超出int64范围')
+
+    return {'kind': kind, 'mask': mask is not None}, arr, mask
+
+
+def save_objects(path, objects, extra=None):
+    """
+    将对象列表保存为列式缓存
+    :param path: 缓存路径（自动加.npc后缀）
+    :param objects: [CtaBarData] / [CtaTickData]，各对象的字段需一致
+    :param extra: 附加信息（可json序列化），保存在meta.json中
+    :return: 缓存目录
+    """
+    if len(objects) == 0:
+        raise ValueError(u'没有数据')
+
+    first = objects[0]
+    cls = first.__class__
+    names = list(first.__dict__.keys())
+    name_set = set(names)
+    for obj in objects:
+        if obj.__class__ is not cls or obj.__dict__.keys() != name_set:
+            raise ValueError(u'对象的类型或字段不一致')
+
+    cache_path = get_cache_path(path)
+    tmp_path = cache_path + '.tmp{}'.format(os.getpid())
+    if os.path.isdir(tmp_path):
+        shutil.rmtree(tmp_path)
+    os.makedirs(tmp_path)
+
+    try:
+        columns = {}
+        for name in names:
+            values = [obj.__dict__[name] for obj in objects]
+            info, arr, mask = _encode_column(values)
+            if arr is not None:
+                np.save(os.path.join(tmp_path, name + '.npy'), arr)
+            if mask is not None:
+                np.save(os.path.join(tmp_path, name + '.mask.npy'), mask)
+            columns[name] = info
+
+        # 每个交易日的起止位置
+        days = []
+        if 'tradingDay' in name_set:
+            last_day = None
+            for i, obj in enumerate(objects):
+                day = obj.tradingDay
+                if day != last_day:
+                    if days:
+                        days[-1][2] = i
+                    days.append([day, i, None])
+                    last_day = day
+            days[-1][2] = len(objects)
+
+        meta = {'version': CACHE_VERSION,
+                'cls': '{}:{}'.format(cls.__module__, cls.__name__),
+                'length': len(objects),
+                'names': names,
+                'columns': columns,
+                'days': days,
+                'extra': extra or {}}
+        with open(os.path.join(tmp_path, META_FILE), 'w', encoding='utf8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+
+        if os.path.isdir(cache_path):
+            shutil.rmtree(cache_path)
+        os.rename(tmp_path, cache_path)
+    except Exception:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+
+    return cache_path
+
+
+def load_meta(path):
+    """读取缓存的meta信息"""
+    with open(os.path.join(get_cache_path(path), META_FILE), 'r', encoding='utf8') as f:
+        return json.load(f)
+
+
+def load_columns(path, mmap=True):
+    """
+    读取列式缓存的各列（内存映射，零拷贝）
+    :param path:
+    :param mmap: 是否使用内存映射
+    :return: meta, {字段: np.ndarray}，常量字段不在其中
+    """
+    cache_path = get_cache_path(path)
+    meta = load_meta(cache_path)
+    mode = 'r' if mmap else None
+    arrays = {}
+    for name, info in meta['columns'].items():
+        if info['kind'] == 'const':
+            continue
+        arrays[name] = np.load(os.path.join(cache_path, name + '.npy'), mmap_mode=mode)
+        if info.get('mask'):
+            arrays[name + '.mask'] = np.load(os.path.join(cache_path, name + '.mask.npy'), mmap_mode=mode)
+    return meta, arrays
+
+
+def _import_class(cls_path):
+    module_name, cls_name = cls_path.split(':')
+    return getattr(importlib.import_module(module_name), cls_name)
+
+
+def iter_objects(path, trading_days=None, cls=None):
+    """
+    从列式缓存中逐个生成对象
+    :param path:
+    :param trading_days: 只读取这些交易日，None为全部
+    :param cls: 对象类型，缺省为保存时的类型
+    :return: generator
+    """
+    meta, arrays = load_columns(path)
+
+    ranges = [(0, meta['length'])]
+    if trading_days is not None:
+        trading_days = set(trading_days)
+        ranges = [(start, end) for day, start, end in meta['days'] if day in trading_days]
+
+    return iter_rows(meta, arrays, ranges, cls=cls)
+
+
+def iter_rows(meta, arrays, ranges, cls=None):
+    """
+    从已读取的列（load_columns的返回值）中逐个生成对象
+    多次读取同一缓存时（如参数优化的工作进程），只需load_columns一次
+    :param meta:
+    :param arrays:
+    :param ranges: [(start, end)]，读取的位置区间
+    :param cls: 对象类型，缺省为保存时的类型
+    :return: generator
+    """
+    cls = cls or _import_class(meta['cls'])
+    names = meta['names']
+    columns = meta['columns']
+    new = cls.__new__
+    for start, end in ranges:
+        col_values = []
+        for name in names:
+            info = columns[name]
+            if info['kind'] == 'const':
+                col_values.append([info['value']] * (end - start))
+                continue
+            # datetime64[us].tolist() 直接得到datetime
+            values = arrays[name][start:end].tolist()
+            if info.get('mask'):
+                mask = arrays[name + '.mask'][start:end].tolist()
+                values = [None if m else v for v, m in zip(values, mask)]
+            col_values.append(values)
+
+        for row in zip(*col_values):
+            obj = new(cls)
+            obj.__dict__.update(zip(names, row))
+            yield obj
+
+
+def load_objects(path, trading_days=None, cls=None):
+    """从列式缓存中读取对象列表"""
+    return list(iter_objects(path, trading_days=trading_days, cls=cls))
+
+
+def remove_cache(path):
+    """删除列式缓存"""
+    cache_path = get_cache_path(path)
+    if os.path.isdir(cache_path):
+        shutil.rmtree(cache_path)
+
+
+def convert_pickle_file(pickle_file):
+    """
+    将已有的pickle缓存（对象列表）转换为列式缓存
+    :param pickle_file:
+    :return: 列式缓存目录，不能转换时返回None
+    """
+    with open(pickle_file, 'rb') as f:
+        objects = pickle.load(f)
+    if not isinstance(objects, list) or len(objects) == 0:
+        print(u'{}不是对象列表，不能转换'.format(pickle_file), file=sys.stderr)
+        return None
+    try:
+        return save_objects(pickle_file, objects)
+    except ValueError as ex:
+        print(u'{}不能转换:{}'.format(pickle_file, str(ex)), file=sys.stderr)
+        return None
+
+
+if __name__ == '__main__':
+    for file_name in sys.argv[1:]:
+        result = convert_pickle_file(file_name)
+        if result:
+            print(u'{} => {}'.format(file_name, result))
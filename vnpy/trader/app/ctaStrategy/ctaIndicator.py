@@ -0,0 +1,593 @@
+# encoding: UTF-8
+
+"""
+增量（流式）指标计算内核
+每根新bar只做O(1)的状态更新，不再每次把整个窗口转换成np.array再调用TA-Lib。
+计算口径与CtaLineBar中原有的TA-Lib调用方式保持一致：
+- RollingSum：  滑动窗口求和，对应 ta.MA / ta.SUM / ta.BBANDS(matype=0) / np.std
+- RollingExtreme：滑动窗口最高/最低（单调队列），对应 KDJ的HHV/LLV
+- WindowEma：   对应 ta.EMA(最近data_len个数据, period)[-1]，即以窗口内前period个数据的SMA作为种子，再递推窗口其余数据
+- WindowRsi：   对应 ta.RSI(最近data_len个数据, period)[-1]
+- StreamMacd：  对应 ta.MACD(全部数据, fast, slow, signal)
+浮点累加误差通过定期按窗口重新求和来消除，结果与TA-Lib在round_n精度内一致。
+
+批量（向量化）计算，用于CtaLineBar.load_bars一次算出整段历史每个位置的窗口值：
+- window_sum / window_mean / window_std / window_ema / window_rsi / window_max / window_min / window_macd
+  与逐窗口调用TA-Lib的算法一致（窗口内逐项累加），结果与TA-Lib在浮点误差内一致，窗口不完整的位置为nan
+- SeriesKernel：按当前位置从批量计算结果中取值，接口与上述增量计算内核一致
+"""
+
+import math
+from collections import deque
+
+import numpy as np
+import talib as ta
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+class RollingSum(object):
+    """
+    滑动窗口求和（O(1)更新）
+    同时维护平方和，可计算均值、总体/样本标准差
+    """
+
+    def __init__(self, period):
+        self.period = int(period)
+        self.window = deque(maxlen=self.period)
+        self.total = 0.0        # 窗口内数据之和
+        self.total_sq = 0.0     # 窗口内数据平方和
+        self.count = 0          # 累计输入的数据数量
+        self._updates = 0       # 距离上次重新求和的更新次数
+
+    def update(self, value):
+        """输入一个新数据"""
+        value = float(value)
+        if len(self.window) == self.period:
+            old = self.window[0]
+            self.total -= old
+            self.total_sq -= old * old
+        self.window.append(value)
+        self.total += value
+        self.total_sq += value * value
+        self.count += 1
+
+        # 定期按窗口顺序重新求和，消除浮点累计误差
+        self._updates += 1
+        if self._updates >= self.period:
+            self.resync()
+
+    def resync(self):
+        """按窗口重新计算累加值"""
+        total = 0.0
+        total_sq = 0.0
+        for v in self.window:
+            total += v
+            total_sq += v * v
+        self.total = total
+        self.total_sq = total_sq
+        self._updates = 0
+
+    @property
+    def ready(self):
+        """窗口是否已满"""
+        return len(self.window) == self.period
+
+    def sum(self):
+        return self.total
+
+    def mean(self):
+        return self.total / self.period
+
+    def std(self, ddof=0):
+        """
+        标准差
+        :param ddof: 0，总体标准差（与ta.BBANDS/ta.STDDEV一致）；1，样本标准差（与np.std(ddof=1)一致）
+        :return:
+        """
+        n = self.period
+        if ddof == 0:
+            # 与TA-Lib的 INT_stddev_using_precalc_ma 一致：E(x^2) - E(x)^2，过小则视为0
+            mean = self.total / n
+            var = self.total_sq / n - mean * mean
+            if var < 0.00000001:
+                return 0.0
+            return math.sqrt(var)
+
+        if n <= ddof:
+            return 0.0
+        var = (self.total_sq - self.total * self.total / n) / (n - ddof)
+        if var <= 0:
+            return 0.0
+        return math.sqrt(var)
+
+
+class RollingExtreme(object):
+    """
+    滑动窗口最高/最低值
+    单调队列实现，均摊O(1)
+    """
+
+    def __init__(self, period):
+        self.period = int(period)
+        self.count = 0
+        self._max_q = deque()   # (序号, 数值)，数值单调递减
+        self._min_q = deque()   # (序号, 数值)，数值单调递增
+
+    def update(self, high, low=None):
+        """
+        输入一个新数据
+        :param high: 参与最高值计算的数据
+        :param low:  参与最低值计算的数据，缺省与high相同
+        :return:
+        """
+        if low is None:
+            low = high
+        idx = self.count
+        self.count += 1
+
+        while self._max_q and self._max_q[-1][1] <= high:
+            self._max_q.pop()
+        self._max_q.append((idx, high))
+
+        while self._min_q and self._min_q[-1][1] >= low:
+            self._min_q.pop()
+        self._min_q.append((idx, low))
+
+        # 移除窗口外的数据
+        start = self.count - self.period
+        while self._max_q[0][0] < start:
+            self._max_q.popleft()
+        while self._min_q[0][0] < start:
+            self._min_q.popleft()
+
+    @property
+    def ready(self):
+        return self.count >= self.period
+
+    def max(self):
+        return self._max_q[0][1]
+
+    def min(self):
+        return self._min_q[0][1]
+
+
+class WindowEma(object):
+    """
+    窗口EMA，与 ta.EMA(最近data_len个数据, period)[-1] 结果一致
+    TA-Lib的EMA以前period个数据的SMA作为种子，再对剩余 m = data_len - period 个数据递推，
+    因此窗口结果可以拆成: EMA = (1-k)^m * SMA(种子区) + Σ k*(1-k)^(data_len-1-j) * x[j] (递推区)
+    窗口滑动时，种子区与递推区都可以O(1)更新。
+    """
+
+    def __init__(self, period, data_len=None, k=None):
+        """
+        :param period: EMA周期
+        :param data_len: 窗口长度，缺省等于period（即退化为SMA）
+        :param k: 平滑系数，缺省为 2/(period+1)；Wilder平滑（RSI）使用 1/period
+        """
+        self.period = int(period)
+        self.data_len = int(data_len) if data_len else self.period
+        if self.data_len < self.period:
+            self.data_len = self.period
+        self.k = float(k) if k else 2.0 / (self.period + 1)
+        self.m = self.data_len - self.period            # 窗口内递推的数量
+        self.decay = (1 - self.k) ** self.m              # 种子的衰减系数
+        self.tail_decay = (1 - self.k) ** (self.m - 1) if self.m > 0 else 0.0
+
+        self.window = deque(maxlen=self.data_len)
+        self.count = 0
+        self.seed = 0.0         # 种子区的SMA
+        self.tail = 0.0         # 递推区的加权和
+        self._updates = 0
+
+    def update(self, value):
+        """输入一个新数据"""
+        value = float(value)
+        self.count += 1
+        if len(self.window) < self.data_len:
+            self.window.append(value)
+            if len(self.window) == self.data_len:
+                self.resync()
+            return
+
+        w = self.window
+        x_out = w[0]
+        if self.m == 0:
+            self.seed += (value - x_out) / self.period
+        else:
+            # 原递推区的第一个数据，滑入种子区
+            x_mid = w[self.period]
+            self.seed += (x_mid - x_out) / self.period
+            self.tail = (1 - self.k) * (self.tail - self.k * self.tail_decay * x_mid) + self.k * value
+        w.append(value)
+
+        self._updates += 1
+        if self._updates >= self.data_len:
+            self.resync()
+
+    def resync(self):
+        """按TA-Lib的计算顺序，重新计算种子与递推值"""
+        values = list(self.window)
+        seed = 0.0
+        for v in values[:self.period]:
+            seed += v
+        self.seed = seed / self.period
+        tail = 0.0
+        for v in values[self.period:]:
+            tail = (1 - self.k) * tail + self.k * v
+        self.tail = tail
+        self._updates = 0
+
+    @property
+    def ready(self):
+        return len(self.window) == self.data_len
+
+    def value(self):
+        return self.decay * self.seed + self.tail
+
+
+class WindowRsi(object):
+    """
+    窗口RSI，与 ta.RSI(最近data_len个收盘价, period)[-1] 结果一致
+    data_len个收盘价产生data_len-1个涨跌值，涨、跌分别做Wilder平滑（k=1/period）
+    """
+
+    def __init__(self, period, data_len=None):
+        self.period = int(period)
+        self.data_len = int(data_len) if data_len else self.period + 1
+        diff_len = max(self.data_len - 1, self.period)
+        self.gain = WindowEma(self.period, diff_len, k=1.0 / self.period)
+        self.loss = WindowEma(self.period, diff_len, k=1.0 / self.period)
+        self.last_value = None
+
+    def update(self, value):
+        value = float(value)
+        if self.last_value is not None:
+            diff = value - self.last_value
+            if diff > 0:
+                self.gain.update(diff)
+                self.loss.update(0.0)
+            else:
+                self.gain.update(0.0)
+                self.loss.update(-diff)
+        self.last_value = value
+
+    @property
+    def ready(self):
+        return self.gain.ready
+
+    def value(self):
+        gain = self.gain.value()
+        loss = self.loss.value()
+        if gain + loss == 0:
+            return 0.0
+        return 100 * (gain / (gain + loss))
+
+
+class StreamMacd(object):
+    """
+    流式MACD，与 ta.MACD(全部收盘价, fast, slow, signal) 最后一个值一致
+    TA-Lib中快、慢EMA都在第slow个数据处用SMA作为种子（快线种子取最近fast个数据），
+    DEA以最初signal个DIF的均值作为种子。
+    """
+
+    def __init__(self, fast, slow, signal):
+        fast = int(fast)
+        slow = int(slow)
+        # 与TA-Lib一致，慢线周期小于快线周期时，自动交换
+        if slow < fast:
+            fast, slow = slow, fast
+        self.fast = fast
+        self.slow = slow
+        self.signal = int(signal)
+        self.k_fast = 2.0 / (fast + 1)
+        self.k_slow = 2.0 / (slow + 1)
+        self.k_signal = 2.0 / (self.signal + 1)
+
+        self.count = 0
+        self._seed_values = []      # 种子阶段的数据
+        self._dif_values = []       # DEA种子阶段的DIF
+        self.ema_fast = None
+        self.ema_slow = None
+        self.dif = None
+        self.dea = None
+
+    def update(self, value):
+        value = float(value)
+        self.count += 1
+
+        if self.ema_slow is None:
+            self._seed_values.append(value)
+            if len(self._seed_values) < self.slow:
+                return
+            s = 0.0
+            for v in self._seed_values:
+                s += v
+            self.ema_slow = s / self.slow
+            s = 0.0
+            for v in self._seed_values[-self.fast:]:
+                s += v
+            self.ema_fast = s / self.fast
+            self._seed_values = []
+        else:
+            self.ema_fast = (value - self.ema_fast) * self.k_fast + self.ema_fast
+            self.ema_slow = (value - self.ema_slow) * self.k_slow + self.ema_slow
+
+        self.dif = self.ema_fast - self.ema_slow
+
+        if self.dea is None:
+            self._dif_values.append(self.dif)
+            if len(self._dif_values) < self.signal:
+                return
+            s = 0.0
+            for v in self._dif_values:
+                s += v
+            self.dea = s / self.signal
+            self._dif_values = []
+        else:
+            self.dea = (self.dif - self.dea) * self.k_signal + self.dea
+
+    @property
+    def ready(self):
+        return self.dea is not None
+
+    def value(self):
+        """
+        :return: dif, dea, macd(dif-dea，与talib一致，未乘2)
+        """
+        return self.dif, self.dea, self.dif - self.dea
+
+
+# ----------------------------------------------------------------------
+# 批量（向量化）计算
+# result[i]为以第i个数据结尾的窗口值。窗口内仍按TA-Lib的顺序逐项累加，只是对所有窗口同时计算。
+# TA-Lib编译时可能使用乘加融合指令(FMA)，EMA/MACD/RSI等递推结果与其可能相差一个末位，取整后一致。
+
+def window_sum(values, window, reverse=False):
+    """
+    滑动窗口求和，与 ta.SUM / ta.MA 的累加顺序一致（窗口内从前往后累加）
+    :param reverse: 窗口内从后往前累加（与DMI逐根bar累加的顺序一致）
+    :return: np.ndarray，与values等长
+    """
+    values = np.asarray(values, dtype=float)
+    n = len(values)
+    result = np.full(n, np.nan)
+    if window <= 0 or n < window:
+        return result
+    m = n - window + 1
+    total = np.zeros(m)
+    for j in (range(window - 1, -1, -1) if reverse else range(window)):
+        total += values[j:j + m]
+    result[window - 1:] = total
+    return result
+
+
+def window_mean(values, window):
+    """滑动窗口均值，与 ta.MA(窗口, window)[-1] 一致"""
+    return window_sum(values, window) / window
+
+
+def window_std(values, window, mean=None):
+    """
+    滑动窗口总体标准差，与 ta.BBANDS(matype=0) 的计算一致：sum((x - mean)^2) / window，过小视为0
+    :param mean: 已计算的window_mean，可省去重复计算
+    """
+    values = np.asarray(values, dtype=float)
+    n = len(values)
+    if mean is None:
+        mean = window_mean(values, window)
+    result = np.full(n, np.nan)
+    if window <= 0 or n < window:
+        return result
+    m = n - window + 1
+    cur_mean = mean[window - 1:]
+    var = np.zeros(m)
+    for j in range(window):
+        d = values[j:j + m] - cur_mean
+        var += d * d
+    var /= window
+    result[window - 1:] = np.sqrt(np.where(var < 0.00000001, 0.0, var))
+    return result
+
+
+def window_ema(values, window, period):
+    """
+    滑动窗口EMA，与 ta.EMA(最近window个数据, period)[-1] 一致
+    以窗口内前period个数据的SMA作为种子，再递推窗口其余数据
+    """
+    values = np.asarray(values, dtype=float)
+    n = len(values)
+    result = np.full(n, np.nan)
+    if period <= 0 or window < period or n < window:
+        return result
+    m = n - window + 1
+    k = 2.0 / (period + 1)
+    seed = np.zeros(m)
+    for j in range(period):
+        seed += values[j:j + m]
+    ema = seed / period
+    for j in range(period, window):
+        ema = ((values[j:j + m] - ema) * k) + ema
+    result[window - 1:] = ema
+    return result
+
+
+def window_rsi(values, period):
+    """滑动窗口RSI，与 ta.RSI(最近period+1个数据, period)[-1] 一致"""
+    values = np.asarray(values, dtype=float)
+    n = len(values)
+    result = np.full(n, np.nan)
+    if period <= 1 or n < period + 1:
+        return result
+    m = n - period
+    diff = values[1:] - values[:-1]
+    gain = np.zeros(m)
+    loss = np.zeros(m)
+    for j in range(period):
+        d = diff[j:j + m]
+        gain += np.where(d < 0, 0.0, d)
+        loss -= np.where(d < 0, d, 0.0)
+    gain /= period
+    loss /= period
+    total = gain + loss
+    is_zero = (total > -0.00000001) & (total < 0.00000001)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        result[period:] = np.where(is_zero, 0.0, 100.0 * (gain / np.where(is_zero, 1.0, total)))
+    return result
+
+
+def window_max(values, window):
+    """滑动窗口最高值"""
+    values = np.asarray(values, dtype=float)
+    result = np.full(len(values), np.nan)
+    if 0 < window <= len(values):
+        result[window - 1:] = sliding_window_view(values, window).max(axis=1)
+    return result
+
+
+def window_min(values, window):
+    """滑动窗口最低值"""
+    values = np.asarray(values, dtype=float)
+    result = np.full(len(values), np.nan)
+    if 0 < window <= len(values):
+        result[window - 1:] = sliding_window_view(values, window).min(axis=1)
+    return result
+
+
+def window_macd(values, fast, slow, signal, max_len):
+    """
+    MACD，与 ta.MACD(最近max_len个数据, fast, slow, signal) 的最后一个值一致
+    （数据不足max_len个时，为ta.MACD(全部数据)的最后一个值）
+    快慢线在窗口内第slow个数据处以SMA作为种子（快线种子取最近fast个数据），DEA以最初signal个DIF的均值作为种子
+    :return: dif, dea, macd(dif-dea，未乘2)，均与values等长
+    """
+    values = np.asarray(values, dtype=float)
+    n = len(values)
+    dif = np.full(n, np.nan)
+    dea = np.full(n, np.nan)
+    if slow < fast:
+        fast, slow = slow, fast
+    if fast <= 0 or signal <= 0 or n == 0:
+        return dif, dea, dif - dea
+
+    # 数据未超过max_len时，窗口即全部数据，TA-Lib各位置的结果与截取到该位置的计算一致
+    head = min(n, max_len)
+    head_dif, head_dea, head_macd = ta.MACD(values[:head], fastperiod=fast, slowperiod=slow, signalperiod=signal)
+    dif[:head] = head_dif
+    dea[:head] = head_dea
+
+    # 之后每个位置的窗口为最近max_len个数据，在各窗口内按TA-Lib的方式重新播种、递推
+    if n > max_len and max_len >= slow + signal - 1:
+        m = n - max_len
+        k_fast = 2.0 / (fast + 1)
+        k_slow = 2.0 / (slow + 1)
+        k_signal = 2.0 / (signal + 1)
+
+        def column(j):
+            # 所有窗口中第j个数据（窗口起点为1..m）
+            return values[1 + j:1 + j + m]
+
+        seed = np.zeros(m)
+        for j in range(slow):
+            seed += column(j)
+        ema_slow = seed / slow
+        seed = np.zeros(m)
+        for j in range(slow - fast, slow):
+            seed += column(j)
+        ema_fast = seed / fast
+
+        cur_dif = ema_fast - ema_slow
+        dif_total = np.zeros(m) + cur_dif
+        cur_dea = dif_total / signal if signal == 1 else None
+        for j in range(slow, max_len):
+            x = column(j)
+            ema_fast = ((x - ema_fast) * k_fast) + ema_fast
+            ema_slow = ((x - ema_slow) * k_slow) + ema_slow
+            cur_dif = ema_fast - ema_slow
+            if cur_dea is None:
+                dif_total += cur_dif
+                if j == slow + signal - 2:
+                    cur_dea = dif_total / signal
+            else:
+                cur_dea = ((cur_dif - cur_dea) * k_signal) + cur_dea
+        dif[max_len:] = cur_dif
+        dea[max_len:] = cur_dea
+
+    return dif, dea, dif - dea
+
+
+class SeriesCursor(object):
+    """批量加载时的当前位置，由CtaLineBar逐根bar更新"""
+
+    def __init__(self, bar_offset=0, closes=None, line_close=None):
+        """
+        :param bar_offset: 窗口最后一根bar与lineBar[-1]的距离，tick模式为1（不包含当前bar）
+        :param closes: 批量数据的收盘价序列，用于校验lineBar[-1]
+        :param line_close: lineClose对应的数据序列，用于校验lineClose[-1]
+        """
+        self.bar_pos = -1       # lineBar[-1]在批量数据中的下标
+        self.bar_offset = bar_offset
+        self.close_pos = -1     # lineClose[-1]在lineClose数据序列中的下标
+        self.closes = closes
+        self.line_close = line_close
+
+    def index(self, axis):
+        if axis == 'close':
+            return self.close_pos
+        return self.bar_pos - self.bar_offset
+
+
+class SeriesKernel(object):
+    """
+    批量计算好的指标序列，按SeriesCursor的当前位置取值
+    接口与增量计算内核一致（mean/std/sum/value/max/min），返回numpy.float64，与TA-Lib的返回值类型相同
+    """
+
+    def __init__(self, cursor, window, axis='bar', **series):
+        """
+        :param window: 每个值对应的窗口长度（与CtaLineBar取窗口数据的长度一致）
+        :param axis: 'bar'，与lineBar对应；'close'，与lineClose对应
+        :param series: 名称: 序列，如mean=..., std=...；value可以是多个序列的tuple
+        """
+        self.cursor = cursor
+        self.window = window
+        self.axis = axis
+        self.series = series
+        first = series.get('value', None)
+        if isinstance(first, tuple):
+            first = first[0]
+        if first is None:
+            first = next(iter(series.values()))
+        self._check = first
+
+    @property
+    def ready(self):
+        """当前位置是否有完整窗口的值"""
+        i = self.cursor.index(self.axis)
+        return 0 <= i < len(self._check) and not math.isnan(self._check[i])
+
+    def _get(self, name):
+        return self.series[name][self.cursor.index(self.axis)]
+
+    def sum(self):
+        return self._get('sum')
+
+    def mean(self):
+        return self._get('mean')
+
+    def std(self, ddof=0):
+        """只有总体标准差（ddof=0）"""
+        return self._get('std')
+
+    def max(self):
+        return self._get('max')
+
+    def min(self):
+        return self._get('min')
+
+    def value(self):
+        v = self.series['value']
+        i = self.cursor.index(self.axis)
+        if isinstance(v, tuple):
+            return tuple(a[i] for a in v)
+        return v[i]
@@ -17,7 +17,13 @@ import traceback
 from vnpy.trader.app.ctaStrategy.ctaBase import *
 from vnpy.trader.vtConstant import *
 from vnpy.trader.vtConstant import DIRECTION_LONG, DIRECTION_SHORT
+from vnpy.trader.vtSession import get_calendar, get_minutes_of_day, get_bar_index
 from vnpy.trader.app.ctaStrategy.ctaPeriod import *
+from vnpy.trader.app.ctaStrategy.ctaIndicator import RollingSum, RollingExtreme, WindowEma, WindowRsi, StreamMacd
+from vnpy.trader.app.ctaStrategy.ctaIndicator import window_sum, window_mean, window_std, window_ema, window_rsi, \
+    window_max, window_min, window_macd, SeriesCursor, SeriesKernel
+from vnpy.trader.app.ctaStrategy.ctaRingBuffer import RingBuffer
+from vnpy.trader.app.ctaStrategy.ctaBarStore import CtaBarStore, get_bar_values
 
 DEBUGCTALOG = True
 
@@ -39,6 +45,113 @@ AREA_SHORT_C = 'SHORT_C'
 AREA_SHORT_D = 'SHORT_D'
 AREA_SHORT_E = 'SHORT_E'
 
+# 启用环形缓冲区时，使用RingBuffer保存的数值序列
+RING_BUFFER_SERIES = ['lineOpen', 'lineHigh', 'lineLow', 'lineClose', 'preHigh', 'preLow',
+                      'lineMa1', 'lineMa2', 'lineMa3', 'lineMa1Atan', 'lineMa2Atan', 'lineMa3Atan',
+                      'lineEma1', 'lineEma2', 'lineEma3',
+                      'linePdi', 'lineMdi', 'lineDx', 'lineAdx', 'lineAdxr',
+                      'lineAtr1', 'lineAtr2', 'lineAtr3', 'lineAvgVol', 'lineRsi1', 'lineRsi2', 'lineCmi',
+                      'lineUpperBand', 'lineMiddleBand', 'lineLowerBand', 'lineBollStd',
+                      'lineUpperBandAtan', 'lineMiddleBandAtan', 'lineLowerBandAtan',
+                      'lineUpperBand2', 'lineMiddleBand2', 'lineLowerBand2', 'lineBoll2Std',
+                      'lineUpperBand2Atan', 'lineMiddleBand2Atan', 'lineLowerBand2Atan',
+                      'lineK', 'lineD', 'lineJ', 'lineKdjRSV', 'lineDif', 'lineDea', 'lineMacd', 'lineCci',
+                      'lineSkdRSI', 'lineSkdSTO', 'lineSK', 'lineSD', 'lineYb', 'lineBias', 'lineBias2', 'lineBias3']
+
+# 批量加载K线时，数据列名 => CtaBarData字段名
+BAR_COLUMN_ALIASES = {
+    'open_interest': 'openInterest',
+    'trading_date': 'tradingDay',
+    'trading_day': 'tradingDay',
+    'day_volume': 'dayVolume',
+    'vt_symbol': 'vtSymbol',
+}
+
+
+def _to_list(values):
+    """数组/Series/list => list，datetime64转为datetime"""
+    dt_values = getattr(values, 'dt', None)
+    if dt_values is not None:
+        return list(dt_values.to_pydatetime())
+    if hasattr(values, 'to_pydatetime'):
+        return list(values.to_pydatetime())
+    values = np.asarray(values) if not isinstance(values, (list, tuple)) else values
+    if isinstance(values, np.ndarray):
+        if values.dtype.kind == 'M':
+            values = values.astype('datetime64[us]')
+        return values.tolist()
+    return list(values)
+
+
+def bars_from_data(data, symbol=None):
+    """
+    将批量K线数据转换为CtaBarData列表
+    :param data: [CtaBarData]；
+                 或pandas.DataFrame / {字段: 数组}，需包含open,high,low,close,volume列，
+                 可选openInterest(open_interest)、tradingDay(trading_date)、date、time、symbol等列，
+                 datetime取自datetime列（datetime类型），否则取自DatetimeIndex
+    :param symbol: 数据中没有symbol列时，使用的合约
+    :return: [CtaBarData]
+    """
+    if isinstance(data, (list, tuple)):
+        return list(data)
+
+    if hasattr(data, 'columns'):
+        names = list(data.columns)
+    else:
+        names = list(data.keys())
+
+    columns = {}
+    for name in names:
+        field = BAR_COLUMN_ALIASES.get(name, name)
+        if field in ('datetime', 'open', 'high', 'low', 'close', 'volume', 'openInterest', 'dayVolume',
+                     'tradingDay', 'date', 'time', 'symbol', 'vtSymbol', 'exchange'):
+            columns[field] = _to_list(data[name])
+
+    n = len(columns['close'])
+
+    # datetime列不是时间类型时（如tdx数据的float时间），使用DatetimeIndex
+    dt_list = columns.get('datetime', None)
+    if dt_list is None or (n > 0 and not isinstance(dt_list[0], datetime)):
+        index = getattr(data, 'index', None)
+        if index is not None and hasattr(index, 'to_pydatetime'):
+            columns['datetime'] = list(index.to_pydatetime())
+        elif dt_list is not None:
+            columns.pop('datetime')
+
+    dt_list = columns.get('datetime', None)
+    if dt_list is not None:
+        if 'date' not in columns:
+            columns['date'] = [dt.strftime('%Y-%m-%d') for dt in dt_list]
+        if 'time' not in columns:
+            columns['time'] = [dt.strftime('%H:%M:%S') for dt in dt_list]
+    if 'tradingDay' not in columns and 'date' in columns:
+        columns['tradingDay'] = columns['date']
+    if 'symbol' not in columns and symbol is not None:
+        columns['symbol'] = [symbol] * n
+    if 'vtSymbol' not in columns and 'symbol' in columns:
+        columns['vtSymbol'] = columns['symbol']
+
+    for field in ('open', 'high', 'low', 'close', 'volume', 'openInterest', 'dayVolume'):
+        if field in columns:
+            columns[field] = [float(x) for x in columns[field]]
+
+    items = list(columns.items())
+    bars = []
+    for i in range(n):
+        bar = CtaBarData()
+        d = bar.__dict__
+        for field, values in items:
+            d[field] = values[i]
+        bars.append(bar)
+    return bars
+
+# 实时计算函数的依赖关系：执行key之前，先执行（同一tick/bar内只执行一次）其依赖的实时计算函数
+RT_FUNC_DEPENDS = {
+    'rt_countMa': ('rt_countMa1', 'rt_countMa2', 'rt_countMa3'),
+    'rt_countSkd': ('rt_count_SK_SD',),
+}
+
 def getCtaBarClass(bar_type):
     assert  isinstance(bar_type,str)
     if bar_type == PERIOD_SECOND:
@@ -163,6 +276,7 @@ class CtaLineBar(object):
 
         # 启动实时得函数
         self.rt_funcs = set()
+        self.rt_done = set()    # 本次tick/bar已执行的实时计算函数名称
 
         if setting:
             self.setParam(setting)
@@ -195,6 +309,14 @@ class CtaLineBar(object):
                     self.writeCtaLog(u'导入卡尔曼过滤器失败,需先安装 pip install pykalman')
                     self.inputKF = False
 
+            # 使用环形缓冲区保存数值序列
+            if self.activate_ring_buffer:
+                self.init_ring_buffers()
+
+            # 使用列式存储保存K线
+            if self.activate_bar_store:
+                self.lineBar = CtaBarStore(capacity=self.max_hold_bars + 2)
+
     def init_properties(self):
         """
         初始化内部变量
@@ -243,6 +365,10 @@ class CtaLineBar(object):
         self.paramList.append('inputSarAfLimit')
         self.paramList.append('inputGoldenN')
         self.paramList.append('activate_boll_ma_area')
+        self.paramList.append('activate_incremental')
+        self.paramList.append('activate_ring_buffer')
+        self.paramList.append('activate_bar_store')
+        self.paramList.append('activate_lazy_rt')
         self.paramList.append('inputBiasLen')
         self.paramList.append('inputBias2Len')
         self.paramList.append('inputBias3Len')
@@ -562,6 +688,22 @@ class CtaLineBar(object):
         self._rt_Bias2 = None
         self._rt_Bias3 = None
 
+        # 增量计算内核（activate_incremental=True时启用），每根bar只做O(1)更新，替代TA-Lib的整窗口计算
+        self.activate_incremental = False
+        self.inc_kernels = {}       # 指标名称: 增量计算内核
+        self.inc_last_hlc = None    # 上一根推送至内核的bar (high,low,close)，用于DMI
+        self.bulk_cursor = None     # load_bars批量加载时，当前bar在批量计算序列中的位置（见__initSeriesKernels）
+
+        # 数值序列使用NumPy环形缓冲区（activate_ring_buffer=True时启用），替代list + del [0]
+        self.activate_ring_buffer = False
+
+        # K线使用列式存储（activate_bar_store=True时启用），替代 list + copy.deepcopy(bar)
+        self.activate_bar_store = False
+
+        # 实时指标按需计算（activate_lazy_rt=True时启用）：tick/bar更新时不再执行全部实时计算函数，
+        # 而是在策略首次读取rt_*指标时才计算，并缓存至下一个tick/bar
+        self.activate_lazy_rt = False
+
         # 存为Bar文件，For TradeBlazer   WJ
         # filename = u'../TestLogs/rb1801_{}_Min.csv'.format(datetime.now().strftime('%m%d_%H%M'))
         # self.min1File = open(filename, mode='w')
@@ -569,6 +711,38 @@ class CtaLineBar(object):
         # barMsg = u"datetime,close,date,high,instrument_id,limit_down,limit_up,low,open,open_interest,time,trading_date,total_turnover,volume,symbol\n"
         # self.min1File.write(barMsg)
 
+    def init_ring_buffers(self):
+        """将数值序列替换为NumPy环形缓冲区（保留已有数据）"""
+        for name in RING_BUFFER_SERIES:
+            values = getattr(self, name, None)
+            if values is None or isinstance(values, RingBuffer):
+                continue
+            if name in ['lineOpen', 'lineHigh', 'lineLow', 'lineClose']:
+                buf = RingBuffer(capacity=self.max_hold_bars + 1)
+            elif name in ['lineAvgVol', 'lineKdjRSV']:
+                # 原列表没有裁剪，限制其最大长度
+                buf = RingBuffer(maxlen=self.max_hold_bars + 1)
+            else:
+                buf = RingBuffer()
+            buf.extend(values)
+            setattr(self, name, buf)
+
+    def append_bar(self, bar, copy_bar=True):
+        """
+        添加bar至lineBar
+        :param bar: 
+        :param copy_bar: 普通列表时，是否先复制bar（列式存储本身就是复制字段数值）
+        :return: lineBar中的bar（列式存储时为CtaBarView）
+        """
+        if isinstance(self.lineBar, CtaBarStore):
+            return self.lineBar.append(bar)
+
+        if copy_bar:
+            # CtaBarData的字段均为不可变对象（数值、字符串、datetime），浅拷贝即可，比deepcopy快一个数量级
+            bar = copy.copy(bar)
+        self.lineBar.append(bar)
+        return bar
+
     def setParam(self, setting):
         """设置参数"""
         d = self.__dict__
@@ -593,11 +767,13 @@ class CtaLineBar(object):
             self.writeCtaLog(u'竞价排名tick时间:{0}'.format(tick.datetime))
             return
 
-        self.curTick = copy.copy(tick)
+        # tick由引擎推送、各K线共享，只读引用；需要补充lastPrice时才复制
+        self.curTick = tick
         if self.curTick.lastPrice is None or self.curTick.lastPrice == 0:
             if self.curTick.askPrice1 ==0 and  self.curTick.bidPrice1 == 0:
                 return
 
+            self.curTick = copy.copy(tick)
             self.curTick.lastPrice = (self.curTick.askPrice1 + self.curTick.bidPrice1) / 2
             self.cur_price = (self.curTick.askPrice1 + self.curTick.bidPrice1) / 2
         else:
@@ -629,8 +805,7 @@ class CtaLineBar(object):
         self.cur_price = bar.close
 
         if l1 == 0:
-            new_bar = copy.deepcopy(bar)
-            self.lineBar.append(new_bar)
+            self.append_bar(bar)
             self.curTradingDay = bar.date
             self.onBar(bar)
             return
@@ -646,8 +821,8 @@ class CtaLineBar(object):
         if self.period == PERIOD_SECOND and (bar.datetime - lastBar.datetime).seconds >= self.barTimeInterval:
             is_new_bar = True
 
-        elif self.period == PERIOD_MINUTE and (int((bar.datetime - datetime.strptime(bar.datetime.strftime('%Y-%m-%d'), '%Y-%m-%d')).total_seconds() / 60 / self.barTimeInterval) !=
-                 int((lastBar.datetime - datetime.strptime(lastBar.datetime.strftime('%Y-%m-%d'), '%Y-%m-%d')).total_seconds() / 60 / self.barTimeInterval)):            # (bar.datetime - lastBar.datetime).seconds >= self.barTimeInterval*60:
+        elif self.period == PERIOD_MINUTE and (get_bar_index(bar.datetime, self.barTimeInterval) !=
+                 get_bar_index(lastBar.datetime, self.barTimeInterval)):            # (bar.datetime - lastBar.datetime).seconds >= self.barTimeInterval*60:
             is_new_bar = True
 
         elif self.period == PERIOD_HOUR:
@@ -671,8 +846,7 @@ class CtaLineBar(object):
 
         if is_new_bar:
             # 添加新的bar
-            new_bar = copy.deepcopy(bar)
-            self.lineBar.append(new_bar)
+            self.append_bar(bar)
             # 将上一个Bar推送至OnBar事件
             self.onBar(lastBar)
 
@@ -693,6 +867,152 @@ class CtaLineBar(object):
             # 实时计算
             self.runtime_recount()
 
+    def load_bars(self, data, bar_is_completed=True, bar_freq=1, symbol=None, callback=True, incremental=False,
+                  vectorized=True):
+        """
+        批量加载历史K线，用于策略初始化时预热指标
+        与逐根调用addBar的结果一致，只是省去了逐行转换DataFrame(iterrows)的开销；
+        vectorized=True时，在lineBar为空、数据周期与K线周期一致时，先对整段数据一次性计算MA/EMA/BOLL/RSI/MACD/
+        DMI/KDJ/均量等指标序列，逐根bar只执行交叉计数、背离、段等逻辑，速度更快，
+        但未取整的序列（如lineBollStd）与逐根计算存在浮点误差；
+        incremental=True时（不使用vectorized），在tick模式、lineBar为空时，临时使用增量计算内核计算指标
+        :param data: pandas.DataFrame / {字段: 数组} / [CtaBarData]，见bars_from_data()
+        :param bar_is_completed: 数据周期与K线周期一致，设为True
+        :param bar_freq: 每根数据包含的1分钟bar数量
+        :param symbol: 数据中没有symbol列时，使用的合约
+        :param callback: 是否回调onBarFunc
+        :param incremental: 是否临时使用增量计算内核（见上）
+        :param vectorized: 是否先批量计算指标序列（见上）
+        :return: 加载的bar数量
+        """
+        bars = bars_from_data(data, symbol=symbol)
+        if len(bars) == 0:
+            return 0
+
+        on_bar_func = self.onBarFunc
+        if not callback:
+            self.onBarFunc = lambda bar: None
+
+        # 批量计算的序列需要与lineBar、lineClose从第一根bar开始一一对应
+        use_vectorized = vectorized and bar_is_completed and not self.activate_incremental \
+            and len(self.lineBar) == 0 and len(self.lineClose) == 0
+        if use_vectorized:
+            self.__initSeriesKernels(bars)
+
+        # 增量计算内核需要从第一根bar开始推送
+        tmp_incremental = incremental and not use_vectorized and not self.activate_incremental \
+            and self.mode == self.TICK_MODE and len(self.lineBar) == 0
+        if tmp_incremental:
+            self.activate_incremental = True
+
+        try:
+            for i, bar in enumerate(bars):
+                if self.bulk_cursor is not None:
+                    self.bulk_cursor.bar_pos = i
+                self.addBar(bar, bar_is_completed=bar_is_completed, bar_freq=bar_freq)
+        finally:
+            self.onBarFunc = on_bar_func
+            if use_vectorized:
+                self.bulk_cursor = None
+                self.inc_kernels = {}
+            if tmp_incremental:
+                self.activate_incremental = False
+                self.inc_kernels = {}
+                self.inc_last_hlc = None
+
+        self.writeCtaLog(u'{}批量加载{}根bar，当前{}根'.format(self.name, len(bars), len(self.lineBar)))
+        return len(bars)
+
+    def __initSeriesKernels(self, bars):
+        """
+        批量计算指标序列，作为load_bars期间的计算内核（替代增量计算内核，接口一致）
+        tick模式下，窗口为lineBar[-N-1:-1]，即截至上一根bar；bar模式下，窗口为lineBar[-N:]，即截至当前bar
+        MACD使用lineClose：addBar首根bar即推送onBar，之后推送上一根bar，因此lineClose序列为[c0, c0, c1, ...]
+        ADX（基于lineDx）、ATR等依赖逐根状态的指标，仍逐根计算
+        :param bars: [CtaBarData]
+        :return:
+        """
+        closes = np.array([bar.close for bar in bars], dtype=float)
+        line_close = np.concatenate((closes[:1], closes[:-1]))
+        cursor = SeriesCursor(bar_offset=1 if self.mode == self.TICK_MODE else 0, closes=closes, line_close=line_close)
+        k = {}
+
+        for name, length in (('ma1', self.inputMa1Len), ('ma2', self.inputMa2Len), ('ma3', self.inputMa3Len)):
+            if length > 0:
+                k[name] = SeriesKernel(cursor, length, mean=window_mean(closes, length))
+
+        # 与__recountEma的数据窗口一致，EMA3的周期参数使用了数据长度
+        for name, length, is_data_len in (('ema1', self.inputEma1Len, False), ('ema2', self.inputEma2Len, False),
+                                          ('ema3', self.inputEma3Len, True)):
+            if length > 0:
+                data_len = min(length * 4, length + 40)
+                k[name] = SeriesKernel(cursor, data_len,
+                                       value=window_ema(closes, data_len, data_len if is_data_len else length))
+
+        for name, length in (('boll', self.inputBollLen), ('boll2', self.inputBoll2Len)):
+            if length > 0:
+                mean = window_mean(closes, length)
+                k[name] = SeriesKernel(cursor, length, mean=mean, std=window_std(closes, length, mean))
+
+        for name, length in (('rsi1', self.inputRsi1Len), ('rsi2', self.inputRsi2Len)):
+            if length > 0:
+                k[name] = SeriesKernel(cursor, length + 1, value=window_rsi(closes, length))
+
+        if self.inputVolLen > 0:
+            volumes = np.array([bar.volume for bar in bars], dtype=float)
+            k['vol'] = SeriesKernel(cursor, self.inputVolLen, sum=window_sum(volumes, self.inputVolLen))
+
+        if self.inputKdjLen > 0 or self.inputKdjTBLen > 0 or self.inputDmiLen > 0:
+            highs = np.array([bar.high for bar in bars], dtype=float)
+            lows = np.array([bar.low for bar in bars], dtype=float)
+
+            # KDJ的内核只用于tick模式（见__recountKdj）
+            if self.mode == self.TICK_MODE:
+                for name, length in (('kdj', self.inputKdjLen), ('kdjTB', self.inputKdjTBLen)):
+                    if length > 0:
+                        k[name] = SeriesKernel(cursor, length, max=window_max(highs, length),
+                                               min=window_min(lows, length))
+
+            if self.inputDmiLen > 0 and len(bars) > 1:
+                # 每根bar与上一根bar的价差，与__recountDmi一致，周期内从最近的bar往前累加
+                pre_close = np.concatenate(([np.nan], closes[:-1]))
+                tr = np.maximum(np.maximum(highs - lows, np.abs(highs - pre_close)), np.abs(lows - pre_close))
+                high_prehigh_spread = np.concatenate(([np.nan], highs[1:] - highs[:-1]))
+                low_prelow_spread = np.concatenate(([np.nan], lows[:-1] - lows[1:]))
+                with np.errstate(invalid='ignore'):
+                    pdm = np.where((high_prehigh_spread > 0) & (high_prehigh_spread > low_prelow_spread),
+                                   high_prehigh_spread, 0.0)
+                    mdm = np.where((low_prelow_spread > 0) & (low_prelow_spread > high_prehigh_spread),
+                                   low_prelow_spread, 0.0)
+                pdm[0] = mdm[0] = np.nan
+                data_len = self.inputDmiLen + 1
+                k['dmi_tr'] = SeriesKernel(cursor, data_len, sum=window_sum(tr, self.inputDmiLen, reverse=True))
+                k['dmi_pdm'] = SeriesKernel(cursor, data_len, sum=window_sum(pdm, self.inputDmiLen, reverse=True))
+                k['dmi_mdm'] = SeriesKernel(cursor, data_len, sum=window_sum(mdm, self.inputDmiLen, reverse=True))
+
+        if self.inputMacdFastPeriodLen > 0 and self.inputMacdSlowPeriodLen > 0 and self.inputMacdSignalPeriodLen > 0:
+            k['macd'] = SeriesKernel(cursor, self.max_hold_bars + 1, axis='close',
+                                     value=window_macd(line_close, self.inputMacdFastPeriodLen,
+                                                       self.inputMacdSlowPeriodLen, self.inputMacdSignalPeriodLen,
+                                                       self.max_hold_bars + 1))
+
+        self.inc_kernels = k
+        self.bulk_cursor = cursor
+
+    def __updateBulkCursor(self):
+        """
+        onBar时更新批量计算序列的位置
+        lineBar、lineClose与批量数据不再对应时（如子类合并了bar），停止使用批量计算的序列，改为逐根计算
+        :return:
+        """
+        cursor = self.bulk_cursor
+        cursor.close_pos += 1
+        if self.lineBar[-1].close != cursor.closes[cursor.bar_pos] or \
+                self.lineClose[-1] != cursor.line_close[cursor.close_pos]:
+            self.writeCtaLog(u'{}批量计算的指标序列与K线不一致，改为逐根计算'.format(self.name))
+            self.bulk_cursor = None
+            self.inc_kernels = {}
+
     def onBar(self, bar):
         """OnBar事件"""
         # 计算相关数据
@@ -718,6 +1038,12 @@ class CtaLineBar(object):
 
         self.lineClose.append(bar.close)
 
+        # 推送至增量计算内核
+        if self.activate_incremental:
+            self.__updateIncKernels(bar)
+        elif self.bulk_cursor is not None:
+            self.__updateBulkCursor()
+
         self.__recountPreHighLow()
         self.__recountMa()
         self.__recountEma()
@@ -750,13 +1076,155 @@ class CtaLineBar(object):
     def runtime_recount(self):
         """
         根据实时计算得要求，执行实时指标计算
+        activate_lazy_rt=True时，只清除已计算标记，实时指标在读取时才计算
         :return:
         """
+        self.rt_done.clear()
+        if self.activate_lazy_rt:
+            return
+
         for func in list(self.rt_funcs):
-            try:
-                func()
-            except Exception as ex:
-                print(u'{}调用实时计算,异常:{},{}'.format(self.name, str(ex),traceback.format_exc()), file=sys.stderr)
+            self.run_rt_func(func)
+
+    def run_rt_func(self, func):
+        """
+        执行实时计算函数，同一tick/bar内只执行一次
+        执行前，先执行RT_FUNC_DEPENDS中其依赖的实时计算函数
+        :param func:
+        :return:
+        """
+        name = func.__name__
+        if name in self.rt_done:
+            return
+        self.rt_done.add(name)
+
+        for dep_name in RT_FUNC_DEPENDS.get(name, []):
+            self.run_rt_func(getattr(self, dep_name))
+
+        try:
+            func()
+        except Exception as ex:
+            print(u'{}调用实时计算,异常:{},{}'.format(self.name, str(ex),traceback.format_exc()), file=sys.stderr)
+
+    def __initIncKernels(self):
+        """根据指标参数，创建增量计算内核"""
+        k = self.inc_kernels
+        if self.inputMa1Len > 0:
+            k['ma1'] = RollingSum(self.inputMa1Len)
+        if self.inputMa2Len > 0:
+            k['ma2'] = RollingSum(self.inputMa2Len)
+        if self.inputMa3Len > 0:
+            k['ma3'] = RollingSum(self.inputMa3Len)
+
+        # 与__recountEma的数据窗口一致
+        if self.inputEma1Len > 0:
+            k['ema1'] = WindowEma(self.inputEma1Len, min(self.inputEma1Len * 4, self.inputEma1Len + 40))
+        if self.inputEma2Len > 0:
+            k['ema2'] = WindowEma(self.inputEma2Len, min(self.inputEma2Len * 4, self.inputEma2Len + 40))
+        if self.inputEma3Len > 0:
+            # 原计算中EMA3的周期参数使用了数据长度，保持一致
+            ema3_data_len = min(self.inputEma3Len * 4, self.inputEma3Len + 40)
+            k['ema3'] = WindowEma(ema3_data_len, ema3_data_len)
+
+        if self.inputBollLen > 0:
+            k['boll'] = RollingSum(self.inputBollLen)
+        if self.inputBoll2Len > 0:
+            k['boll2'] = RollingSum(self.inputBoll2Len)
+        if self.inputBollTBLen > 0:
+            k['bollTB'] = RollingSum(self.inputBollTBLen)
+        if self.inputBoll2TBLen > 0:
+            k['boll2TB'] = RollingSum(self.inputBoll2TBLen)
+
+        if self.inputRsi1Len > 0:
+            k['rsi1'] = WindowRsi(self.inputRsi1Len)
+        if self.inputRsi2Len > 0:
+            k['rsi2'] = WindowRsi(self.inputRsi2Len)
+
+        if self.inputMacdFastPeriodLen > 0 and self.inputMacdSlowPeriodLen > 0 and self.inputMacdSignalPeriodLen > 0:
+            k['macd'] = StreamMacd(self.inputMacdFastPeriodLen, self.inputMacdSlowPeriodLen,
+                                   self.inputMacdSignalPeriodLen)
+
+        if self.inputVolLen > 0:
+            k['vol'] = RollingSum(self.inputVolLen)
+
+        if self.inputKdjLen > 0:
+            k['kdj'] = RollingExtreme(self.inputKdjLen)
+        if self.inputKdjTBLen > 0:
+            k['kdjTB'] = RollingExtreme(self.inputKdjTBLen)
+
+        if self.inputDmiLen > 0:
+            k['dmi_tr'] = RollingSum(self.inputDmiLen)
+            k['dmi_pdm'] = RollingSum(self.inputDmiLen)
+            k['dmi_mdm'] = RollingSum(self.inputDmiLen)
+            # 与ta.EMA(lineDx, inputDmiLen)一致，lineDx最多保留inputDmiLen+2个
+            k['adx'] = WindowEma(self.inputDmiLen, self.inputDmiLen + 2)
+
+    def __updateIncKernels(self, bar):
+        """
+        推送onBar的bar至增量计算内核
+        tick模式下，依次推送的bar与lineBar[:-1]一一对应，因此内核窗口与lineBar[-N-1:-1]一致
+        :param bar:
+        :return:
+        """
+        if len(self.inc_kernels) == 0:
+            self.__initIncKernels()
+        k = self.inc_kernels
+
+        for name in ['ma1', 'ma2', 'ma3', 'ema1', 'ema2', 'ema3', 'boll', 'boll2', 'bollTB', 'boll2TB',
+                     'rsi1', 'rsi2', 'macd']:
+            kernel = k.get(name, None)
+            if kernel is not None:
+                kernel.update(bar.close)
+
+        if 'vol' in k:
+            k['vol'].update(bar.volume)
+        if 'kdj' in k:
+            k['kdj'].update(bar.high, bar.low)
+        if 'kdjTB' in k:
+            k['kdjTB'].update(bar.high, bar.low)
+
+        # DMI：当前bar与上一bar的价差
+        if 'dmi_tr' in k and self.inc_last_hlc is not None:
+            pre_high, pre_low, pre_close = self.inc_last_hlc
+            max_spread = max(bar.high - bar.low, abs(bar.high - pre_close), abs(bar.low - pre_close))
+            k['dmi_tr'].update(max_spread)
+            high_prehigh_spread = bar.high - pre_high
+            low_prelow_spread = pre_low - bar.low
+            if high_prehigh_spread > 0 and high_prehigh_spread > low_prelow_spread:
+                k['dmi_pdm'].update(high_prehigh_spread)
+            else:
+                k['dmi_pdm'].update(0)
+            if low_prelow_spread > 0 and low_prelow_spread > high_prehigh_spread:
+                k['dmi_mdm'].update(low_prelow_spread)
+            else:
+                k['dmi_mdm'].update(0)
+        self.inc_last_hlc = (bar.high, bar.low, bar.close)
+
+    def __getIncKernel(self, name, data_len):
+        """
+        获取可用的增量计算内核
+        仅在tick模式、内核窗口已满、且lineBar[-data_len-1:-1]为完整窗口时可用，否则返回None，使用TA-Lib计算
+        load_bars批量加载时，返回窗口长度一致的批量计算序列（tick/bar模式均可）
+        :param name: 内核名称
+        :param data_len: 计算所需的bar数量（不包含当前未完成的bar）
+        :return:
+        """
+        if self.bulk_cursor is not None:
+            kernel = self.inc_kernels.get(name, None)
+            if kernel is None or kernel.window != data_len or not kernel.ready:
+                return None
+            if len(self.lineBar) < data_len + self.bulk_cursor.bar_offset:
+                return None
+            return kernel
+
+        if not self.activate_incremental or self.mode != self.TICK_MODE:
+            return None
+        kernel = self.inc_kernels.get(name, None)
+        if kernel is None or not kernel.ready:
+            return None
+        if len(self.lineBar) <= data_len:
+            return None
+        return kernel
 
     def export_to_csv(self, bar):
         if self.export_filename is None or len(self.export_fields) == 0:
@@ -1003,7 +1471,7 @@ class CtaLineBar(object):
 
         self.barFirstTick = True  # 标识该Tick属于该Bar的第一个tick数据
 
-        self.lineBar.append(self.bar)  # 推入到lineBar队列
+        self.bar = self.append_bar(self.bar, copy_bar=False)  # 推入到lineBar队列
 
     # ----------------------------------------------------------------------
     def drawLineBar(self, tick):
@@ -1063,10 +1531,8 @@ class CtaLineBar(object):
 
             elif self.period == PERIOD_MINUTE:
                 # 时间到达整点分钟数，例如5分钟的 0,5,15,20,,.与上一个tick的分钟数不是同一分钟
-                cur_bars_in_day = int(((tick.datetime - datetime.strptime(tick.datetime.strftime('%Y-%m-%d'),
-                                                                          '%Y-%m-%d')).total_seconds() / 60 / self.barTimeInterval))
-                last_bars_in_day = int(((lastBar.datetime - datetime.strptime(lastBar.datetime.strftime('%Y-%m-%d'),
-                                                                              '%Y-%m-%d')).total_seconds() / 60 / self.barTimeInterval))
+                cur_bars_in_day = get_bar_index(tick.datetime, self.barTimeInterval)
+                last_bars_in_day = get_bar_index(lastBar.datetime, self.barTimeInterval)
 
                 if cur_bars_in_day != last_bars_in_day:
                     is_new_bar = True
@@ -1209,11 +1675,11 @@ class CtaLineBar(object):
 
         # 3、获取前InputN周期(不包含当前周期）的K线
         if self.mode == self.TICK_MODE:
-            listHigh = [x.high for x in self.lineBar[0:-1]]
-            listLow = [x.low for x in self.lineBar[0:-1]]
+            listHigh = get_bar_values(self.lineBar, 'high', 0, -1)
+            listLow = get_bar_values(self.lineBar, 'low', 0, -1)
         else:
-            listHigh = [x.high for x in self.lineBar]
-            listLow = [x.low for x in self.lineBar]
+            listHigh = get_bar_values(self.lineBar, 'high')
+            listLow = get_bar_values(self.lineBar, 'low')
 
         if len(self.lineSarSrUp) == 0 and len(self.lineSarSrDown) == 0:
             if self.lineBar[-2].close > self.lineBar[-5].close:
@@ -1348,13 +1814,17 @@ class CtaLineBar(object):
             else:
                 ma1Len = self.inputMa1Len
 
-            # 3、获取前InputN周期(不包含当前周期）的K线
-            if self.mode == self.TICK_MODE:
-                listClose = [x.close for x in self.lineBar[-ma1Len - 1:-1]]
+            kernel = self.__getIncKernel('ma1', ma1Len)
+            if kernel is not None:
+                barMa1 = kernel.mean()
             else:
-                listClose = [x.close for x in self.lineBar[-ma1Len:]]
+                # 3、获取前InputN周期(不包含当前周期）的K线
+                if self.mode == self.TICK_MODE:
+                    listClose = get_bar_values(self.lineBar, 'close', -ma1Len - 1, -1)
+                else:
+                    listClose = get_bar_values(self.lineBar, 'close', -ma1Len)
 
-            barMa1 = ta.MA(np.array(listClose, dtype=float), ma1Len)[-1]
+                barMa1 = ta.MA(np.array(listClose, dtype=float), ma1Len)[-1]
             barMa1 = round(float(barMa1), self.round_n)
 
             if len(self.lineMa1) > self.inputMa1Len * 8:
@@ -1376,13 +1846,17 @@ class CtaLineBar(object):
             else:
                 ma2Len = self.inputMa2Len
 
-            # 3、获取前InputN周期(不包含当前周期）的K线
-            if self.mode == self.TICK_MODE:
-                listClose = [x.close for x in self.lineBar[-ma2Len - 1:-1]]
+            kernel = self.__getIncKernel('ma2', ma2Len)
+            if kernel is not None:
+                barMa2 = kernel.mean()
             else:
-                listClose = [x.close for x in self.lineBar[-ma2Len:]]
+                # 3、获取前InputN周期(不包含当前周期）的K线
+                if self.mode == self.TICK_MODE:
+                    listClose = get_bar_values(self.lineBar, 'close', -ma2Len - 1, -1)
+                else:
+                    listClose = get_bar_values(self.lineBar, 'close', -ma2Len)
 
-            barMa2 = ta.MA(np.array(listClose, dtype=float), ma2Len)[-1]
+                barMa2 = ta.MA(np.array(listClose, dtype=float), ma2Len)[-1]
             barMa2 = round(float(barMa2), self.round_n)
 
             if len(self.lineMa2) > self.inputMa2Len * 8:
@@ -1404,13 +1878,17 @@ class CtaLineBar(object):
             else:
                 ma3Len = self.inputMa3Len
 
-            # 3、获取前InputN周期(不包含当前周期）的K线
-            if self.mode == self.TICK_MODE:
-                listClose = [x.close for x in self.lineBar[-ma3Len - 1:-1]]
+            kernel = self.__getIncKernel('ma3', ma3Len)
+            if kernel is not None:
+                barMa3 = kernel.mean()
             else:
-                listClose = [x.close for x in self.lineBar[-ma3Len:]]
+                # 3、获取前InputN周期(不包含当前周期）的K线
+                if self.mode == self.TICK_MODE:
+                    listClose = get_bar_values(self.lineBar, 'close', -ma3Len - 1, -1)
+                else:
+                    listClose = get_bar_values(self.lineBar, 'close', -ma3Len)
 
-            barMa3 = ta.MA(np.array(listClose, dtype=float), ma3Len)[-1]
+                barMa3 = ta.MA(np.array(listClose, dtype=float), ma3Len)[-1]
             barMa3 = round(float(barMa3), self.round_n)
 
             if len(self.lineMa3) > self.inputMa3Len * 8:
@@ -1482,42 +1960,43 @@ class CtaLineBar(object):
     def rt_countMa(self):
         """
         实时计算MA得值
-        :param ma_num:第几条均线, 1，对应inputMa1Len,,,,
+        由rt_countMa1、rt_countMa2、rt_countMa3分别计算（见RT_FUNC_DEPENDS），同一tick/bar内已计算的不再重复计算
         :return:
         """
-        if self.inputMa1Len > 0:
-            ma_len = min(len(self.lineClose), self.inputMa1Len)
-            if ma_len > 0:
-                listClose = self.lineClose[-ma_len - 2:] + [self.lineBar[-1].close]
-                barMa = ta.MA(np.array(listClose, dtype=float), ma_len)
-                self._rt_Ma1 = round(float(barMa[-1]), self.round_n)
+        self.run_rt_func(self.rt_countMa1)
+        self.run_rt_func(self.rt_countMa2)
+        self.run_rt_func(self.rt_countMa3)
 
-                # 计算斜率
-                if len(barMa) > 2 and barMa[-2] != 0:
-                    self._rt_Ma1Atan = round(math.atan((barMa[-1] / barMa[-2] - 1) * 100) * 180 / math.pi,3)
-
-        if self.inputMa2Len > 0:
-            ma_len = min(len(self.lineClose), self.inputMa2Len)
-            if ma_len > 0:
-                listClose = self.lineClose[-ma_len - 2:] + [self.lineBar[-1].close]
-                barMa = ta.MA(np.array(listClose, dtype=float), ma_len)
-                self._rt_Ma2 = round(float(barMa[-1]), self.round_n)
+    def rt_countMa1(self):
+        """实时计算MA1的值及斜率"""
+        self.__rtCountMa(1)
 
-                # 计算斜率
-                if len(barMa) > 2 and barMa[-2] != 0:
-                    self._rt_Ma2Atan = round(math.atan((barMa[-1] / barMa[-2] - 1) * 100) * 180 / math.pi, 3)
+    def rt_countMa2(self):
+        """实时计算MA2的值及斜率"""
+        self.__rtCountMa(2)
 
+    def rt_countMa3(self):
+        """实时计算MA3的值及斜率"""
+        self.__rtCountMa(3)
 
-        if self.inputMa3Len > 0:
-            ma_len = min(len(self.lineClose), self.inputMa3Len)
+    def __rtCountMa(self, ma_num):
+        """
+        实时计算MA得值
+        :param ma_num:第几条均线, 1，对应inputMa1Len,,,,
+        :return:
+        """
+        input_ma_len = getattr(self, 'inputMa{}Len'.format(ma_num))
+        if input_ma_len > 0:
+            ma_len = min(len(self.lineClose), input_ma_len)
             if ma_len > 0:
                 listClose = self.lineClose[-ma_len - 2:] + [self.lineBar[-1].close]
                 barMa = ta.MA(np.array(listClose, dtype=float), ma_len)
-                self._rt_Ma3 = round(float(barMa[-1]), self.round_n)
+                setattr(self, '_rt_Ma{}'.format(ma_num), round(float(barMa[-1]), self.round_n))
 
                 # 计算斜率
                 if len(barMa) > 2 and barMa[-2] != 0:
-                    self._rt_Ma3Atan = round(math.atan((barMa[-1] / barMa[-2] - 1) * 100) * 180 / math.pi, 3)
+                    setattr(self, '_rt_Ma{}Atan'.format(ma_num),
+                            round(math.atan((barMa[-1] / barMa[-2] - 1) * 100) * 180 / math.pi, 3))
 
     def getRuntimeMa(self, ma_num):
         """
@@ -1525,45 +2004,46 @@ class CtaLineBar(object):
         :param ma_num:
         :return:
         """
-        self.check_rt_funcs(self.rt_countMa)
-
         if ma_num == 1:
+            self.check_rt_funcs(self.rt_countMa1)
             return self._rt_Ma1
         elif ma_num == 2:
+            self.check_rt_funcs(self.rt_countMa2)
             return self._rt_Ma2
         elif ma_num == 3:
+            self.check_rt_funcs(self.rt_countMa3)
             return self._rt_Ma3
         else:
             return None
 
     @property
     def rt_Ma1(self):
-        self.check_rt_funcs(self.rt_countMa)
+        self.check_rt_funcs(self.rt_countMa1)
         return self._rt_Ma1
 
     @property
     def rt_Ma2(self):
-        self.check_rt_funcs(self.rt_countMa)
+        self.check_rt_funcs(self.rt_countMa2)
         return self._rt_Ma2
 
     @property
     def rt_Ma3(self):
-        self.check_rt_funcs(self.rt_countMa)
+        self.check_rt_funcs(self.rt_countMa3)
         return self._rt_Ma3
 
     @property
     def rt_Ma1Atan(self):
-        self.check_rt_funcs(self.rt_countMa)
+        self.check_rt_funcs(self.rt_countMa1)
         return self._rt_Ma1Atan
 
     @property
     def rt_Ma2Atan(self):
-        self.check_rt_funcs(self.rt_countMa)
+        self.check_rt_funcs(self.rt_countMa2)
         return self._rt_Ma2Atan
 
     @property
     def rt_Ma3Atan(self):
-        self.check_rt_funcs(self.rt_countMa)
+        self.check_rt_funcs(self.rt_countMa3)
         return self._rt_Ma3Atan
     # ----------------------------------------------------------------------
     def __recountEma(self):
@@ -1590,13 +2070,17 @@ class CtaLineBar(object):
             else:
                 ema1Len = self.inputEma1Len
 
-            # 3、获取前InputN周期(不包含当前周期）的K线
-            if self.mode == self.TICK_MODE:
-                listClose = [x.close for x in self.lineBar[-ema1_data_len - 1:-1]]
+            kernel = self.__getIncKernel('ema1', ema1_data_len)
+            if kernel is not None:
+                barEma1 = kernel.value()
             else:
-                listClose = [x.close for x in self.lineBar[-ema1_data_len:]]
+                # 3、获取前InputN周期(不包含当前周期）的K线
+                if self.mode == self.TICK_MODE:
+                    listClose = get_bar_values(self.lineBar, 'close', -ema1_data_len - 1, -1)
+                else:
+                    listClose = get_bar_values(self.lineBar, 'close', -ema1_data_len)
 
-            barEma1 = ta.EMA(np.array(listClose, dtype=float), ema1Len)[-1]
+                barEma1 = ta.EMA(np.array(listClose, dtype=float), ema1Len)[-1]
 
             barEma1 = round(float(barEma1), self.round_n)
 
@@ -1611,13 +2095,17 @@ class CtaLineBar(object):
             else:
                 ema2Len = self.inputEma2Len
 
-            # 3、获取前InputN周期(不包含当前周期）的自适应均线
-            if self.mode == self.TICK_MODE:
-                listClose = [x.close for x in self.lineBar[-ema2_data_len - 1:-1]]
+            kernel = self.__getIncKernel('ema2', ema2_data_len)
+            if kernel is not None:
+                barEma2 = kernel.value()
             else:
-                listClose = [x.close for x in self.lineBar[-ema2_data_len:]]
+                # 3、获取前InputN周期(不包含当前周期）的自适应均线
+                if self.mode == self.TICK_MODE:
+                    listClose = get_bar_values(self.lineBar, 'close', -ema2_data_len - 1, -1)
+                else:
+                    listClose = get_bar_values(self.lineBar, 'close', -ema2_data_len)
 
-            barEma2 = ta.EMA(np.array(listClose, dtype=float), ema2Len)[-1]
+                barEma2 = ta.EMA(np.array(listClose, dtype=float), ema2Len)[-1]
 
             barEma2 = round(float(barEma2), self.round_n)
 
@@ -1632,13 +2120,17 @@ class CtaLineBar(object):
             else:
                 ema3Len = self.inputEma3Len
 
-            # 3、获取前InputN周期(不包含当前周期）的自适应均线
-            if self.mode == self.TICK_MODE:
-                listClose = [x.close for x in self.lineBar[-ema3_data_len - 1:-1]]
+            kernel = self.__getIncKernel('ema3', ema3_data_len)
+            if kernel is not None:
+                barEma3 = kernel.value()
             else:
-                listClose = [x.close for x in self.lineBar[-ema3_data_len:]]
+                # 3、获取前InputN周期(不包含当前周期）的自适应均线
+                if self.mode == self.TICK_MODE:
+                    listClose = get_bar_values(self.lineBar, 'close', -ema3_data_len - 1, -1)
+                else:
+                    listClose = get_bar_values(self.lineBar, 'close', -ema3_data_len)
 
-            barEma3 = ta.EMA(np.array(listClose, dtype=float), ema3_data_len)[-1]
+                barEma3 = ta.EMA(np.array(listClose, dtype=float), ema3_data_len)[-1]
 
             barEma3 = round(float(barEma3), self.round_n)
 
@@ -1672,7 +2164,7 @@ class CtaLineBar(object):
                              format(len(self.lineBar), ema_data_len))
             return
 
-        listClose = [x.close for x in self.lineBar[-ema_data_len - 1:]]
+        listClose = get_bar_values(self.lineBar, 'close', -ema_data_len - 1)
         rtEma = ta.EMA(np.array(listClose, dtype=float), ema_len)[-1]
         rtEma = round(float(rtEma), self.round_n)
         return rtEma
@@ -1693,37 +2185,56 @@ class CtaLineBar(object):
         barPdm = EMPTY_FLOAT  # InputP周期内的做多价差之和
         barMdm = EMPTY_FLOAT  # InputP周期内的做空价差之和
 
-        if self.mode == self.TICK_MODE:
-            idx = 2
+        kernel = self.__getIncKernel('dmi_tr', self.inputDmiLen + 1)
+        if kernel is not None:
+            barTr1 = kernel.sum()
+            barPdm = self.inc_kernels['dmi_pdm'].sum()
+            barMdm = self.inc_kernels['dmi_mdm'].sum()
         else:
-            idx = 1
+            if self.mode == self.TICK_MODE:
+                idx = 2
+            else:
+                idx = 1
 
-        for i in range(len(self.lineBar) - idx, len(self.lineBar) - idx - self.inputDmiLen, -1):  # 周期 inputDmiLen
-            # 3.1、计算TR1
+            # 一次取出周期内（含前一根bar）的最高、最低、收盘价列，避免逐根bar访问属性
+            end = len(self.lineBar) - idx + 1
+            start = end - self.inputDmiLen - 1
+            if start < 0:
+                # 数据刚满足长度时，与原逐根下标访问一致（下标-1为最后一根bar）
+                highs = get_bar_values(self.lineBar, 'high', start) + get_bar_values(self.lineBar, 'high', None, end)
+                lows = get_bar_values(self.lineBar, 'low', start) + get_bar_values(self.lineBar, 'low', None, end)
+                closes = get_bar_values(self.lineBar, 'close', start) + get_bar_values(self.lineBar, 'close', None, end)
+            else:
+                highs = get_bar_values(self.lineBar, 'high', start, end)
+                lows = get_bar_values(self.lineBar, 'low', start, end)
+                closes = get_bar_values(self.lineBar, 'close', start, end)
 
-            # 当前周期最高与最低的价差
-            high_low_spread = self.lineBar[i].high - self.lineBar[i].low
-            # 当前周期最高与昨收价的价差
-            high_preclose_spread = abs(self.lineBar[i].high - self.lineBar[i - 1].close)
-            # 当前周期最低与昨收价的价差
-            low_preclose_spread = abs(self.lineBar[i].low - self.lineBar[i - 1].close)
+            for i in range(self.inputDmiLen, 0, -1):  # 周期 inputDmiLen
+                # 3.1、计算TR1
 
-            # 最大价差
-            max_spread = max(high_low_spread, high_preclose_spread, low_preclose_spread)
-            barTr1 = barTr1 + float(max_spread)
+                # 当前周期最高与最低的价差
+                high_low_spread = highs[i] - lows[i]
+                # 当前周期最高与昨收价的价差
+                high_preclose_spread = abs(highs[i] - closes[i - 1])
+                # 当前周期最低与昨收价的价差
+                low_preclose_spread = abs(lows[i] - closes[i - 1])
+
+                # 最大价差
+                max_spread = max(high_low_spread, high_preclose_spread, low_preclose_spread)
+                barTr1 = barTr1 + float(max_spread)
 
-            # 今高与昨高的价差
-            high_prehigh_spread = self.lineBar[i].high - self.lineBar[i - 1].high
-            # 昨低与今低的价差
-            low_prelow_spread = self.lineBar[i - 1].low - self.lineBar[i].low
+                # 今高与昨高的价差
+                high_prehigh_spread = highs[i] - highs[i - 1]
+                # 昨低与今低的价差
+                low_prelow_spread = lows[i - 1] - lows[i]
 
-            # 3.2、计算周期内的做多价差之和
-            if high_prehigh_spread > 0 and high_prehigh_spread > low_prelow_spread:
-                barPdm = barPdm + high_prehigh_spread
+                # 3.2、计算周期内的做多价差之和
+                if high_prehigh_spread > 0 and high_prehigh_spread > low_prelow_spread:
+                    barPdm = barPdm + high_prehigh_spread
 
-            # 3.3、计算周期内的做空价差之和
-            if low_prelow_spread > 0 and low_prelow_spread > high_prehigh_spread:
-                barMdm = barMdm + low_prelow_spread
+                # 3.3、计算周期内的做空价差之和
+                if low_prelow_spread > 0 and low_prelow_spread > high_prehigh_spread:
+                    barMdm = barMdm + low_prelow_spread
 
         # 6、计算上升动向指标，即做多的比率
         if barTr1 == 0:
@@ -1759,10 +2270,16 @@ class CtaLineBar(object):
         self.lineDx.append(dx)
 
         # 平均趋向指标，MA计算
+        adx_kernel = self.inc_kernels.get('adx', None) if self.activate_incremental else None
+        if adx_kernel is not None:
+            adx_kernel.update(dx)
+
         if len(self.lineDx) < self.inputDmiLen + 1:
             self.barAdx = dx
+        elif adx_kernel is not None and adx_kernel.ready and len(self.lineDx) == adx_kernel.data_len:
+            self.barAdx = adx_kernel.value()
         else:
-            self.barAdx = ta.EMA(np.array(self.lineDx, dtype=float), self.inputDmiLen)[-1]
+            self.barAdx = ta.EMA(np.asarray(self.lineDx, dtype=float), self.inputDmiLen)[-1]
 
         # 保存Adx值
         if len(self.lineAdx) > self.inputDmiLen + 1:
@@ -1937,12 +2454,16 @@ class CtaLineBar(object):
                              format(len(self.lineBar), self.inputVolLen + 1))
             return
 
-        if self.mode == self.TICK_MODE:
-            listVol = [x.volume for x in self.lineBar[-self.inputVolLen - 1: -1]]
+        kernel = self.__getIncKernel('vol', self.inputVolLen)
+        if kernel is not None:
+            sumVol = kernel.sum()
         else:
-            listVol = [x.volume for x in self.lineBar[-self.inputVolLen:]]
+            if self.mode == self.TICK_MODE:
+                listVol = get_bar_values(self.lineBar, 'volume', -self.inputVolLen - 1, -1)
+            else:
+                listVol = get_bar_values(self.lineBar, 'volume', -self.inputVolLen)
 
-        sumVol = ta.SUM(np.array(listVol, dtype=float), timeperiod=self.inputVolLen)[-1]
+            sumVol = ta.SUM(np.array(listVol, dtype=float), timeperiod=self.inputVolLen)[-1]
 
         avgVol = round(sumVol / self.inputVolLen, 0)
 
@@ -1964,13 +2485,20 @@ class CtaLineBar(object):
         # 计算第1根RSI曲线
         # 3、inputRsi1Len(包含当前周期）的相对强弱
         if self.mode == self.TICK_MODE:
-            listClose = [x.close for x in self.lineBar[-self.inputRsi1Len - 2:-1]]
             idx = 2
         else:
-            listClose = [x.close for x in self.lineBar[-self.inputRsi1Len - 1:]]
             idx = 1
 
-        barRsi = ta.RSI(np.array(listClose, dtype=float), self.inputRsi1Len)[-1]
+        kernel = self.__getIncKernel('rsi1', self.inputRsi1Len + 1)
+        if kernel is not None:
+            barRsi = kernel.value()
+        else:
+            if self.mode == self.TICK_MODE:
+                listClose = get_bar_values(self.lineBar, 'close', -self.inputRsi1Len - 2, -1)
+            else:
+                listClose = get_bar_values(self.lineBar, 'close', -self.inputRsi1Len - 1)
+
+            barRsi = ta.RSI(np.array(listClose, dtype=float), self.inputRsi1Len)[-1]
         barRsi = round(float(barRsi), self.round_n)
 
         l = len(self.lineRsi1)
@@ -2010,12 +2538,16 @@ class CtaLineBar(object):
             if len(self.lineBar) < self.inputRsi2Len + 2:
                 return
 
-            if self.mode == self.TICK_MODE:
-                listClose = [x.close for x in self.lineBar[-self.inputRsi2Len - 2:-1]]
+            kernel = self.__getIncKernel('rsi2', self.inputRsi2Len + 1)
+            if kernel is not None:
+                barRsi = kernel.value()
             else:
-                listClose = [x.close for x in self.lineBar[-self.inputRsi2Len - 1:]]
+                if self.mode == self.TICK_MODE:
+                    listClose = get_bar_values(self.lineBar, 'close', -self.inputRsi2Len - 2, -1)
+                else:
+                    listClose = get_bar_values(self.lineBar, 'close', -self.inputRsi2Len - 1)
 
-            barRsi = ta.RSI(np.array(listClose, dtype=float), self.inputRsi2Len)[-1]
+                barRsi = ta.RSI(np.array(listClose, dtype=float), self.inputRsi2Len)[-1]
             barRsi = round(float(barRsi), self.round_n)
 
             l = len(self.lineRsi2)
@@ -2045,10 +2577,10 @@ class CtaLineBar(object):
             return
 
         if self.mode == self.TICK_MODE:
-            listClose = [x.close for x in self.lineBar[-self.inputCmiLen - 1:-1]]
+            listClose = get_bar_values(self.lineBar, 'close', -self.inputCmiLen - 1, -1)
             idx = 2
         else:
-            listClose = [x.close for x in self.lineBar[-self.inputCmiLen:]]
+            listClose = get_bar_values(self.lineBar, 'close', -self.inputCmiLen)
             idx = 1
 
         hhv = max(listClose)
@@ -2084,15 +2616,23 @@ class CtaLineBar(object):
                 else:
                     bollLen = self.inputBollLen
 
-                # 不包含当前最新的Bar
-                if self.mode == self.TICK_MODE:
-                    listClose = [x.close for x in self.lineBar[-bollLen - 1:-1]]
+                kernel = self.__getIncKernel('boll', bollLen)
+                if kernel is not None:
+                    mean = kernel.mean()
+                    std = kernel.std()
+                    upper = [mean + self.inputBollStdRate * std]
+                    middle = [mean]
+                    lower = [mean - self.inputBollStdRate * std]
                 else:
-                    listClose = [x.close for x in self.lineBar[-bollLen:]]
+                    # 不包含当前最新的Bar
+                    if self.mode == self.TICK_MODE:
+                        listClose = get_bar_values(self.lineBar, 'close', -bollLen - 1, -1)
+                    else:
+                        listClose = get_bar_values(self.lineBar, 'close', -bollLen)
 
-                upper, middle, lower = ta.BBANDS(np.array(listClose, dtype=float),
-                                                 timeperiod=bollLen, nbdevup=self.inputBollStdRate,
-                                                 nbdevdn=self.inputBollStdRate, matype=0)
+                    upper, middle, lower = ta.BBANDS(np.array(listClose, dtype=float),
+                                                     timeperiod=bollLen, nbdevup=self.inputBollStdRate,
+                                                     nbdevdn=self.inputBollStdRate, matype=0)
                 if len(self.lineUpperBand) > self.inputBollLen * 8:
                     del self.lineUpperBand[0]
                 if len(self.lineMiddleBand) > self.inputBollLen * 8:
@@ -2149,15 +2689,23 @@ class CtaLineBar(object):
                 else:
                     boll2Len = self.inputBoll2Len
 
-                # 不包含当前最新的Bar
-                if self.mode == self.TICK_MODE:
-                    listClose = [x.close for x in self.lineBar[-boll2Len - 1:-1]]
+                kernel = self.__getIncKernel('boll2', boll2Len)
+                if kernel is not None:
+                    mean = kernel.mean()
+                    std = kernel.std()
+                    upper = [mean + self.inputBoll2StdRate * std]
+                    middle = [mean]
+                    lower = [mean - self.inputBoll2StdRate * std]
                 else:
-                    listClose = [x.close for x in self.lineBar[-boll2Len:]]
+                    # 不包含当前最新的Bar
+                    if self.mode == self.TICK_MODE:
+                        listClose = get_bar_values(self.lineBar, 'close', -boll2Len - 1, -1)
+                    else:
+                        listClose = get_bar_values(self.lineBar, 'close', -boll2Len)
 
-                upper, middle, lower = ta.BBANDS(np.array(listClose, dtype=float),
-                                                 timeperiod=boll2Len, nbdevup=self.inputBoll2StdRate,
-                                                 nbdevdn=self.inputBoll2StdRate, matype=0)
+                    upper, middle, lower = ta.BBANDS(np.array(listClose, dtype=float),
+                                                     timeperiod=boll2Len, nbdevup=self.inputBoll2StdRate,
+                                                     nbdevdn=self.inputBoll2StdRate, matype=0)
                 if len(self.lineUpperBand2) > self.inputBoll2Len * 8:
                     del self.lineUpperBand2[0]
                 if len(self.lineMiddleBand2) > self.inputBoll2Len * 8:
@@ -2214,11 +2762,13 @@ class CtaLineBar(object):
                 else:
                     bollLen = self.inputBollTBLen
 
-                # 不包含当前最新的Bar
-                if self.mode == self.TICK_MODE:
-                    listClose = [x.close for x in self.lineBar[-bollLen - 1:-1]]
-                else:
-                    listClose = [x.close for x in self.lineBar[-bollLen:]]
+                kernel = self.__getIncKernel('bollTB', bollLen)
+                if kernel is None:
+                    # 不包含当前最新的Bar
+                    if self.mode == self.TICK_MODE:
+                        listClose = get_bar_values(self.lineBar, 'close', -bollLen - 1, -1)
+                    else:
+                        listClose = get_bar_values(self.lineBar, 'close', -bollLen)
 
                 if len(self.lineUpperBand) > self.inputBollTBLen * 8:
                     del self.lineUpperBand[0]
@@ -2230,10 +2780,14 @@ class CtaLineBar(object):
                     del self.lineBollStd[0]
 
                 # 1标准差
-                std = np.std(listClose, ddof=1)
+                if kernel is not None:
+                    std = kernel.std(ddof=1)
+                    m = kernel.mean()
+                else:
+                    std = np.std(listClose, ddof=1)
+                    m = np.mean(listClose)
                 self.lineBollStd.append(std)
 
-                m = np.mean(listClose)
                 self.lineMiddleBand.append(m)  # 中轨
                 self.lastBollMiddle = m - m % self.minDiff  # 中轨取整
 
@@ -2276,11 +2830,13 @@ class CtaLineBar(object):
                 else:
                     boll2Len = self.inputBoll2TBLen
 
-                # 不包含当前最新的Bar
-                if self.mode == self.TICK_MODE:
-                    listClose = [x.close for x in self.lineBar[-boll2Len - 1:-1]]
-                else:
-                    listClose = [x.close for x in self.lineBar[-boll2Len:]]
+                kernel = self.__getIncKernel('boll2TB', boll2Len)
+                if kernel is None:
+                    # 不包含当前最新的Bar
+                    if self.mode == self.TICK_MODE:
+                        listClose = get_bar_values(self.lineBar, 'close', -boll2Len - 1, -1)
+                    else:
+                        listClose = get_bar_values(self.lineBar, 'close', -boll2Len)
 
                 if len(self.lineUpperBand2) > self.inputBoll2TBLen * 8:
                     del self.lineUpperBand2[0]
@@ -2292,10 +2848,14 @@ class CtaLineBar(object):
                     del self.lineBoll2Std[0]
 
                 # 1标准差
-                std = np.std(listClose, ddof=1)
+                if kernel is not None:
+                    std = kernel.std(ddof=1)
+                    m = kernel.mean()
+                else:
+                    std = np.std(listClose, ddof=1)
+                    m = np.mean(listClose)
                 self.lineBoll2Std.append(std)
 
-                m = np.mean(listClose)
                 self.lineMiddleBand2.append(m)  # 中轨
                 self.lastBoll2Middle = m - m % self.minDiff  # 中轨取整
 
@@ -2346,7 +2906,7 @@ class CtaLineBar(object):
                 else:
                     bollLen = boll_01_len
 
-            listClose = [x.close for x in self.lineBar[-bollLen:]]
+            listClose = get_bar_values(self.lineBar, 'close', -bollLen)
             if self.inputBollTBLen == EMPTY_INT:
                 upper, middle, lower = ta.BBANDS(np.array(listClose, dtype=float),
                                                  timeperiod=bollLen, nbdevup=self.inputBollStdRate,
@@ -2389,7 +2949,7 @@ class CtaLineBar(object):
                 else:
                     bollLen = boll_02_len
 
-            listClose = [x.close for x in self.lineBar[-bollLen:]]
+            listClose = get_bar_values(self.lineBar, 'close', -bollLen)
             if self.inputBoll2TBLen == EMPTY_INT:
                 upper, middle, lower = ta.BBANDS(np.array(listClose, dtype=float),
                                                  timeperiod=bollLen, nbdevup=self.inputBollStdRate,
@@ -2424,11 +2984,16 @@ class CtaLineBar(object):
                 self._rt_LowerBand2Atan = round(low_atan, 3)
 
     def check_rt_funcs(self,func):
-        """检查调用函数名是否在实时计算函数清单中，如果没有，则添加并运行"""
+        """
+        检查调用函数名是否在实时计算函数清单中，如果没有，则添加并运行
+        按需计算时，本tick/bar尚未计算的，执行计算
+        """
         if func not in self.rt_funcs:
             self.writeCtaLog(u'{}添加{}到实时函数中'.format(self.name,str(func.__name__)))
             self.rt_funcs.add(func)
-            func()
+            self.run_rt_func(func)
+        elif self.activate_lazy_rt:
+            self.run_rt_func(func)
 
     @property
     def rt_Upper(self):
@@ -2521,20 +3086,27 @@ class CtaLineBar(object):
             self.inputKdjSmoothLen = 3
 
         inputKdjLen = min(self.inputKdjLen, len(self.lineBar))
-        # 数据是Tick模式，非bar内计算
-        if self.mode == self.TICK_MODE and not countInBar:
-            listClose = [x.close for x in self.lineBar[-self.inputKdjLen - 1:-1]]
-            listHigh = [x.high for x in self.lineBar[-self.inputKdjLen - 1:-1]]
-            listLow = [x.low for x in self.lineBar[-self.inputKdjLen - 1:-1]]
+        kernel = None if countInBar else self.__getIncKernel('kdj', self.inputKdjLen)
+        if kernel is not None:
+            listClose = [self.lineBar[-2].close]
+            hhv = kernel.max()
+            llv = kernel.min()
             idx = 2
         else:
-            listClose = [x.close for x in self.lineBar[-self.inputKdjLen:]]
-            listHigh = [x.high for x in self.lineBar[-self.inputKdjLen:]]
-            listLow = [x.low for x in self.lineBar[-self.inputKdjLen:]]
-            idx = 1
+            # 数据是Tick模式，非bar内计算
+            if self.mode == self.TICK_MODE and not countInBar:
+                listClose = get_bar_values(self.lineBar, 'close', -self.inputKdjLen - 1, -1)
+                listHigh = get_bar_values(self.lineBar, 'high', -self.inputKdjLen - 1, -1)
+                listLow = get_bar_values(self.lineBar, 'low', -self.inputKdjLen - 1, -1)
+                idx = 2
+            else:
+                listClose = get_bar_values(self.lineBar, 'close', -self.inputKdjLen)
+                listHigh = get_bar_values(self.lineBar, 'high', -self.inputKdjLen)
+                listLow = get_bar_values(self.lineBar, 'low', -self.inputKdjLen)
+                idx = 1
 
-        hhv = max(listHigh)
-        llv = min(listLow)
+            hhv = max(listHigh)
+            llv = min(listLow)
 
         if len(self.lineK) > 0:
             lastK = self.lineK[-1]
@@ -2654,30 +3226,40 @@ class CtaLineBar(object):
             inputKdjTBLen = len(self.lineBar)
             # 数据是Tick模式，非bar内计算
             if self.mode == self.TICK_MODE and not countInBar:
-                listClose = [x.close for x in self.lineBar[0:-1]]
-                listHigh = [x.high for x in self.lineBar[0:-1]]
-                listLow = [x.low for x in self.lineBar[0:-1]]
+                listClose = get_bar_values(self.lineBar, 'close', 0, -1)
+                listHigh = get_bar_values(self.lineBar, 'high', 0, -1)
+                listLow = get_bar_values(self.lineBar, 'low', 0, -1)
                 idx = 2
             else:
-                listClose = [x.close for x in self.lineBar]
-                listHigh = [x.high for x in self.lineBar]
-                listLow = [x.low for x in self.lineBar]
+                listClose = get_bar_values(self.lineBar, 'close')
+                listHigh = get_bar_values(self.lineBar, 'high')
+                listLow = get_bar_values(self.lineBar, 'low')
                 idx = 1
+
+            hhv = max(listHigh)
+            llv = min(listLow)
         else:
+            kernel = None if countInBar else self.__getIncKernel('kdjTB', self.inputKdjTBLen)
+            if kernel is not None:
+                listClose = [self.lineBar[-2].close]
+                hhv = kernel.max()
+                llv = kernel.min()
+                idx = 2
             # 数据是Tick模式，非bar内计算
-            if self.mode == self.TICK_MODE and not countInBar:
-                listClose = [x.close for x in self.lineBar[-self.inputKdjTBLen - 1:-1]]
-                listHigh = [x.high for x in self.lineBar[-self.inputKdjTBLen - 1:-1]]
-                listLow = [x.low for x in self.lineBar[-self.inputKdjTBLen - 1:-1]]
+            elif self.mode == self.TICK_MODE and not countInBar:
+                listClose = get_bar_values(self.lineBar, 'close', -self.inputKdjTBLen - 1, -1)
+                listHigh = get_bar_values(self.lineBar, 'high', -self.inputKdjTBLen - 1, -1)
+                listLow = get_bar_values(self.lineBar, 'low', -self.inputKdjTBLen - 1, -1)
                 idx = 2
             else:
-                listClose = [x.close for x in self.lineBar[-self.inputKdjTBLen:]]
-                listHigh = [x.high for x in self.lineBar[-self.inputKdjTBLen:]]
-                listLow = [x.low for x in self.lineBar[-self.inputKdjTBLen:]]
+                listClose = get_bar_values(self.lineBar, 'close', -self.inputKdjTBLen)
+                listHigh = get_bar_values(self.lineBar, 'high', -self.inputKdjTBLen)
+                listLow = get_bar_values(self.lineBar, 'low', -self.inputKdjTBLen)
                 idx = 1
 
-        hhv = max(listHigh)
-        llv = min(listLow)
+            if kernel is None:
+                hhv = max(listHigh)
+                llv = min(listLow)
 
         if len(self.lineK) > 0:
             lastK = self.lineK[-1]
@@ -2808,8 +3390,14 @@ class CtaLineBar(object):
             self.debugCtaLog(u'数据未充分,当前Bar数据数量：{0}，计算MACD需要：{1}'.format(len(self.lineBar), maxLen))
             return
 
-        dif, dea, macd = ta.MACD(np.array(self.lineClose, dtype=float), fastperiod=self.inputMacdFastPeriodLen,
-                                 slowperiod=self.inputMacdSlowPeriodLen, signalperiod=self.inputMacdSignalPeriodLen)
+        kernel = self.inc_kernels.get('macd', None) \
+            if self.activate_incremental or self.bulk_cursor is not None else None
+        if kernel is not None and kernel.ready:
+            # 流式MACD与lineClose一一对应，bar/tick模式均可使用
+            dif, dea, macd = [[x] for x in kernel.value()]
+        else:
+            dif, dea, macd = ta.MACD(np.asarray(self.lineClose, dtype=float), fastperiod=self.inputMacdFastPeriodLen,
+                                     slowperiod=self.inputMacdSlowPeriodLen, signalperiod=self.inputMacdSignalPeriodLen)
 
         # dif, dea, macd = ta.MACDEXT(np.array(listClose, dtype=float),
         #                            fastperiod=self.inputMacdFastPeriodLen, fastmatype=1,
@@ -2929,7 +3517,7 @@ class CtaLineBar(object):
         if len(self.lineBar) < maxLen:
             return
 
-        listClose = [x.close for x in self.lineBar[-maxLen:]]
+        listClose = get_bar_values(self.lineBar, 'close', -maxLen)
         dif, dea, macd = ta.MACD(np.array(listClose, dtype=float), fastperiod=self.inputMacdFastPeriodLen,
                                  slowperiod=self.inputMacdSlowPeriodLen, signalperiod=self.inputMacdSignalPeriodLen)
 
@@ -2953,13 +3541,8 @@ class CtaLineBar(object):
 
     def getRuntimeMACD(self):
         """获取实时MACD计算值"""
-        if self.rt_countMacd in self.rt_funcs:
-            return self._rt_Dif, self._rt_Dea, self._rt_Macd
-        else:
-            self.writeCtaLog(u'getRuntimeMACD(),添加rt_countMacd到实时函数中')
-            self.rt_funcs.add(self.rt_countMacd)
-            self.rt_countMacd()
-            return self._rt_Dif, self._rt_Dea, self._rt_Macd
+        self.check_rt_funcs(self.rt_countMacd)
+        return self._rt_Dif, self._rt_Dea, self._rt_Macd
     @property
     def rt_Dif(self):
         self.check_rt_funcs(self.rt_countMacd)
@@ -3119,14 +3702,14 @@ class CtaLineBar(object):
 
         # 3、inputCc1Len(包含当前周期）
         if self.mode == self.TICK_MODE:
-            listClose = [x.close for x in self.lineBar[-self.inputCciLen - 2:-1]]
-            listHigh = [x.high for x in self.lineBar[-self.inputCciLen - 2:-1]]
-            listLow = [x.low for x in self.lineBar[-self.inputCciLen - 2:-1]]
+            listClose = get_bar_values(self.lineBar, 'close', -self.inputCciLen - 2, -1)
+            listHigh = get_bar_values(self.lineBar, 'high', -self.inputCciLen - 2, -1)
+            listLow = get_bar_values(self.lineBar, 'low', -self.inputCciLen - 2, -1)
             idx = 2
         else:
-            listClose = [x.close for x in self.lineBar[-self.inputCciLen - 1:]]
-            listHigh = [x.high for x in self.lineBar[-self.inputCciLen - 1:]]
-            listLow = [x.low for x in self.lineBar[-self.inputCciLen - 1:]]
+            listClose = get_bar_values(self.lineBar, 'close', -self.inputCciLen - 1)
+            listHigh = get_bar_values(self.lineBar, 'high', -self.inputCciLen - 1)
+            listLow = get_bar_values(self.lineBar, 'low', -self.inputCciLen - 1)
             idx = 1
 
         barCci = ta.CCI(high=np.array(listHigh, dtype=float), low=np.array(listLow, dtype=float),
@@ -3452,9 +4035,9 @@ class CtaLineBar(object):
 
         # 取得Len1*2 长度的Close
         if self.mode == self.TICK_MODE:
-            close_list = [x.close for x in self.lineBar[-data_len:-1]]
+            close_list = get_bar_values(self.lineBar, 'close', -data_len, -1)
         else:
-            close_list = [x.close for x in self.lineBar[-data_len:]]
+            close_list = get_bar_values(self.lineBar, 'close', -data_len)
 
         # 计算最后一根Bar的RSI指标
         last_rsi = ta.RSI(np.array(close_list, dtype=float), self.inputSkdLen1)[-1]
@@ -3483,7 +4066,7 @@ class CtaLineBar(object):
         # 根据STO，计算SK = EMA(STO,5)
         if sto_len < 5:
             return
-        sk = ta.EMA(np.array(self.lineSkdSTO, dtype=float), 5)[-1]
+        sk = ta.EMA(np.asarray(self.lineSkdSTO, dtype=float), 5)[-1]
         if len(self.lineSK) > data_len * 2:
             del self.lineSK[0]
         self.lineSK.append(sk)
@@ -3491,7 +4074,7 @@ class CtaLineBar(object):
         if len(self.lineSK) < 3:
             return
 
-        sd = ta.EMA(np.array(self.lineSK, dtype=float), 3)[-1]
+        sd = ta.EMA(np.asarray(self.lineSK, dtype=float), 3)[-1]
         if len(self.lineSD) > data_len * 2:
             del self.lineSD[0]
         self.lineSD.append(sd)
@@ -3678,13 +4261,11 @@ class CtaLineBar(object):
         return False
 
     def getRuntimeSKD(self):
-        if self.rt_countSkd in self.rt_funcs or self.rt_count_SK_SD in self.rt_funcs:
-            return self._rt_SK, self._rt_SD
+        if self.rt_count_SK_SD in self.rt_funcs:
+            self.check_rt_funcs(self.rt_count_SK_SD)
         else:
-            self.writeCtaLog(u'getRuntimeSKD(),添加rt_countSkd到实时函数中')
-            self.rt_funcs.add(self.rt_countSkd)
-            self.rt_count_SK_SD()
-            return self._rt_SK, self._rt_SD
+            self.check_rt_funcs(self.rt_countSkd)
+        return self._rt_SK, self._rt_SD
 
     def rt_count_SK_SD(self):
         """
@@ -3702,7 +4283,7 @@ class CtaLineBar(object):
         # 收盘价 = 结算bar + 最后一个未结束得close
         close_list = self.lineClose[-data_len:]
         close_list.append(self.lineBar[-1].close)
-        # close_list = [x.close for x in self.lineBar[-data_len:]]
+        # close_list = get_bar_values(self.lineBar, 'close', -data_len)
 
         # 计算最后得动态RSI值
         last_rsi = ta.RSI(np.array(close_list, dtype=float), self.inputSkdLen1)[-1]
@@ -3780,7 +4361,7 @@ class CtaLineBar(object):
             if self.rt_countSkd not in self.rt_funcs:
                 self.writeCtaLog(u'skd_is_high_dead_cross(),添加rt_countSkd到实时函数中')
                 self.rt_funcs.add(self.rt_countSkd)
-                self.rt_count_SK_SD()
+            self.run_rt_func(self.rt_count_SK_SD)
             if self._rt_SK is None or self._rt_SD is None:
                 return False
 
@@ -3822,7 +4403,7 @@ class CtaLineBar(object):
             if self.rt_countSkd not in self.rt_funcs:
                 self.writeCtaLog(u'skd_is_low_golden_cross添加rt_countSkd到实时函数中')
                 self.rt_funcs.add(self.rt_countSkd)
-                self.rt_count_SK_SD()
+            self.run_rt_func(self.rt_count_SK_SD)
 
             if self._rt_SK is None or self._rt_SD is None:
                 return False
@@ -3855,8 +4436,8 @@ class CtaLineBar(object):
         :return:
         """
         if self.inputSkd:
-            # 计算实时指标 rt_SK, rt_SD
-            self.rt_count_SK_SD()
+            # 实时指标 rt_SK, rt_SD，由依赖的rt_count_SK_SD计算（见RT_FUNC_DEPENDS）
+            self.run_rt_func(self.rt_count_SK_SD)
 
             # 计算 实时金叉/死叉
             self.skd_is_high_dead_cross(runtime=True, high_skd=0)
@@ -3898,9 +4479,9 @@ class CtaLineBar(object):
             return
         # 3、获取前InputN周期(不包含当前周期）的K线
         if self.mode == self.TICK_MODE:
-            list_mid3 = [x.mid3 for x in self.lineBar[-emaLen * 4 - 1:-1]]
+            list_mid3 = get_bar_values(self.lineBar, 'mid3', -emaLen * 4 - 1, -1)
         else:
-            list_mid3 = [x.mid3 for x in self.lineBar[-emaLen * 4:]]
+            list_mid3 = get_bar_values(self.lineBar, 'mid3', -emaLen * 4)
         bar_mid3_ema10 = ta.EMA(np.array(list_mid3, dtype=float), emaLen)[-1]
         bar_mid3_ema10 = round(float(bar_mid3_ema10), self.round_n)
 
@@ -3942,7 +4523,7 @@ class CtaLineBar(object):
                                                  format(len(self.lineBar)))
             return
         # 3、获取前InputN周期(包含当前周期）的K线
-        list_mid3 = [x.mid3 for x in self.lineBar[-emaLen * 4:-1]]
+        list_mid3 = get_bar_values(self.lineBar, 'mid3', -emaLen * 4, -1)
         last_bar_mid3 = (self.lineBar[-1].close + self.lineBar[-1].high + self.lineBar[-1].low) / 3
         list_mid3.append(last_bar_mid3)
         bar_mid3_ema10 = ta.EMA(np.array(list_mid3, dtype=float), emaLen)[-1]
@@ -3953,10 +4534,7 @@ class CtaLineBar(object):
         获取未完结的bar计算出来的YB值
         :return: None，空值；float,计算值
         """
-        if self.rt_countYb not in self.rt_funcs:
-            self.writeCtaLog(u'{}添加rt_countYb到实时函数中'.format(self.name))
-            self.rt_funcs.add(self.rt_countYb)
-            self.rt_countYb()
+        self.check_rt_funcs(self.rt_countYb)
         return self._rt_YB
 
     @property
@@ -4082,9 +4660,9 @@ class CtaLineBar(object):
 
                 # 不包含当前最新的Bar
                 if self.mode == self.TICK_MODE:
-                    listClose = [x.close for x in self.lineBar[-BiasLen-1:-1]]
+                    listClose = get_bar_values(self.lineBar, 'close', -BiasLen-1, -1)
                 else:
-                    listClose = [x.close for x in self.lineBar[-BiasLen:]]
+                    listClose = get_bar_values(self.lineBar, 'close', -BiasLen)
 
                 if len(self.lineBias) > self.inputBiasLen * 8:
                     del self.lineBias[0]
@@ -4108,9 +4686,9 @@ class CtaLineBar(object):
 
                 # 不包含当前最新的Bar
                 if self.mode == self.TICK_MODE:
-                    listClose = [x.close for x in self.lineBar[-Bias2Len-1:-1]]
+                    listClose = get_bar_values(self.lineBar, 'close', -Bias2Len-1, -1)
                 else:
-                    listClose = [x.close for x in self.lineBar[-Bias2Len:]]
+                    listClose = get_bar_values(self.lineBar, 'close', -Bias2Len)
 
                 if len(self.lineBias2) > self.inputBias2Len * 8:
                     del self.lineBias2[0]
@@ -4134,9 +4712,9 @@ class CtaLineBar(object):
 
                 # 不包含当前最新的Bar
                 if self.mode == self.TICK_MODE:
-                    listClose = [x.close for x in self.lineBar[-Bias3Len-1:-1]]
+                    listClose = get_bar_values(self.lineBar, 'close', -Bias3Len-1, -1)
                 else:
-                    listClose = [x.close for x in self.lineBar[-Bias3Len:]]
+                    listClose = get_bar_values(self.lineBar, 'close', -Bias3Len)
 
                 if len(self.lineBias3) > self.inputBias3Len * 8:
                     del self.lineBias3[0]
@@ -4163,7 +4741,7 @@ class CtaLineBar(object):
                 else:
                     biasLen = self.inputBiasLen
 
-            listClose = [x.close for x in self.lineBar[-biasLen:]]
+            listClose = get_bar_values(self.lineBar, 'close', -biasLen)
 
             # 计算BIAS
             m = np.mean(listClose)
@@ -4178,7 +4756,7 @@ class CtaLineBar(object):
                 else:
                     biasLen = self.inputBias2Len
 
-            listClose = [x.close for x in self.lineBar[-biasLen:]]
+            listClose = get_bar_values(self.lineBar, 'close', -biasLen)
 
             # 计算BIAS
             m = np.mean(listClose)
@@ -4193,7 +4771,7 @@ class CtaLineBar(object):
                 else:
                     biasLen = self.inputBias3Len
 
-            listClose = [x.close for x in self.lineBar[-biasLen:]]
+            listClose = get_bar_values(self.lineBar, 'close', -biasLen)
 
             # 计算BIAS
             m = np.mean(listClose)
@@ -4201,13 +4779,8 @@ class CtaLineBar(object):
 
     def getRuntimeBias(self):
         """获取实时BIAS计算值"""
-        if self.rt_countBias in self.rt_funcs:
-            return self._rt_Bias, self._rt_Bias2, self._rt_Bias3
-        else:
-            self.writeCtaLog(u'getRuntimeBias(),添加rt_countBias到实时函数中')
-            self.rt_funcs.add(self.rt_countBias)
-            self.rt_countBias()
-            return self._rt_Bias, self._rt_Bias2, self._rt_Bias3
+        self.check_rt_funcs(self.rt_countBias)
+        return self._rt_Bias, self._rt_Bias2, self._rt_Bias3
 
     @property
     def rt_Bias(self):
@@ -4240,22 +4813,7 @@ class CtaLineBar(object):
         :param dt:
         :return:
         """
-        tradingDay = ''
-        if dt is None:
-            dt = datetime.now()
-
-        if dt.hour >= 21:
-            if dt.isoweekday() == 5:
-                # 星期五=》星期一
-                return (dt + timedelta(days=3)).strftime('%Y-%m-%d')
-            else:
-                # 第二天
-                return (dt + timedelta(days=1)).strftime('%Y-%m-%d')
-        elif dt.hour < 8 and dt.isoweekday() == 6:
-            # 星期六=>星期一
-            return (dt + timedelta(days=2)).strftime('%Y-%m-%d')
-        else:
-            return dt.strftime('%Y-%m-%d')
+        return get_calendar().get_trading_date(dt)
 
     def append_data(self, file_name, dict_data, field_names=None):
         """
@@ -4467,6 +5025,10 @@ class CtaMinuteBar(CtaLineBar):
         self.paramList.append('inputSarAfLimit')
         self.paramList.append('inputGoldenN')
         self.paramList.append('activate_boll_ma_area')
+        self.paramList.append('activate_incremental')
+        self.paramList.append('activate_ring_buffer')
+        self.paramList.append('activate_bar_store')
+        self.paramList.append('activate_lazy_rt')
         self.paramList.append('is_7x24')
 
         self.paramList.append('minDiff')
@@ -4505,15 +5067,14 @@ class CtaMinuteBar(CtaLineBar):
         l1 = len(self.lineBar)
 
         if l1 == 0:
-            self.lineBar.append(bar)
+            bar = self.append_bar(bar, copy_bar=False)
             self.curTradingDay = bar.tradingDay
             # self.m1_bars_count += bar_freq
             if bar_is_completed:
                 # self.m1_bars_count = 0
                 self.onBar(bar)
             # 计算当前加入的 bar的1分钟，属于当日的第几个1分钟
-            minutes_passed = (bar.datetime - datetime.strptime(bar.datetime.strftime('%Y-%m-%d'),
-                                                               '%Y-%m-%d')).total_seconds() / 60
+            minutes_passed = get_minutes_of_day(bar.datetime)
             # 计算，当前的bar，属于当日的第几个bar
             self.bars_count = int(minutes_passed / self.barTimeInterval)
             return
@@ -4525,16 +5086,16 @@ class CtaMinuteBar(CtaLineBar):
         if bar_is_completed:
             is_new_bar = True
 
-        minutes_passed = (bar.datetime - datetime.strptime(bar.datetime.strftime('%Y-%m-%d'), '%Y-%m-%d')).total_seconds()/ 60
+        minutes_passed = get_minutes_of_day(bar.datetime)
         if self.shortSymbol in MARKET_ZJ:
-            if int(bar.datetime.strftime('%H%M')) > 1130 and int(bar.datetime.strftime('%H%M')) < 1600:
+            if (bar.datetime.hour * 100 + bar.datetime.minute) > 1130 and (bar.datetime.hour * 100 + bar.datetime.minute) < 1600:
                 # 扣除11:30到13:00的中场休息的90分钟
                 minutes_passed = minutes_passed - 90
         else:
-            if int(bar.datetime.strftime('%H%M')) > 1015 and int(bar.datetime.strftime('%H%M')) <= 1130:
+            if (bar.datetime.hour * 100 + bar.datetime.minute) > 1015 and (bar.datetime.hour * 100 + bar.datetime.minute) <= 1130:
                 # 扣除10:15到10:30的中场休息的15分钟
                 minutes_passed = minutes_passed - 15
-            elif int(bar.datetime.strftime('%H%M')) > 1130 and int(bar.datetime.strftime('%H%M')) < 1600:
+            elif (bar.datetime.hour * 100 + bar.datetime.minute) > 1130 and (bar.datetime.hour * 100 + bar.datetime.minute) < 1600:
                 # 扣除(10:15到10:30的中场休息的15分钟)&(11:30到13:30的中场休息的120分钟)
                 minutes_passed = minutes_passed - 135
         bars_passed = int(minutes_passed / self.barTimeInterval)
@@ -4559,9 +5120,8 @@ class CtaMinuteBar(CtaLineBar):
             is_new_bar = True
 
         if is_new_bar:
-            new_bar = copy.deepcopy(bar)
             # 添加新的bar
-            self.lineBar.append(new_bar)
+            self.append_bar(bar)
             # 将上一个Bar推送至OnBar事件
             self.onBar(lastBar)
         else:
@@ -4590,16 +5150,16 @@ class CtaMinuteBar(CtaLineBar):
 
         l1 = len(self.lineBar)
 
-        minutes_passed = (tick.datetime - datetime.strptime(tick.datetime.strftime('%Y-%m-%d'),'%Y-%m-%d')).total_seconds() / 60
+        minutes_passed = get_minutes_of_day(tick.datetime)
         if self.shortSymbol in MARKET_ZJ:
-            if int(tick.datetime.strftime('%H%M')) > 1130 and int(tick.datetime.strftime('%H%M')) < 1600:
+            if (tick.datetime.hour * 100 + tick.datetime.minute) > 1130 and (tick.datetime.hour * 100 + tick.datetime.minute) < 1600:
                 # 扣除11:30到13:00的中场休息的90分钟
                 minutes_passed = minutes_passed - 90
         else:
-            if int(tick.datetime.strftime('%H%M')) > 1015 and int(tick.datetime.strftime('%H%M')) <= 1130:
+            if (tick.datetime.hour * 100 + tick.datetime.minute) > 1015 and (tick.datetime.hour * 100 + tick.datetime.minute) <= 1130:
                 # 扣除10:15到10:30的中场休息的15分钟
                 minutes_passed = minutes_passed - 15
-            elif int(tick.datetime.strftime('%H%M')) > 1130 and int(tick.datetime.strftime('%H%M')) < 1600:
+            elif (tick.datetime.hour * 100 + tick.datetime.minute) > 1130 and (tick.datetime.hour * 100 + tick.datetime.minute) < 1600:
                 # 扣除(10:15到10:30的中场休息的15分钟)&(11:30到13:30的中场休息的120分钟)
                 minutes_passed = minutes_passed - 135
         bars_passed = int(minutes_passed / self.barTimeInterval)
@@ -4773,6 +5333,10 @@ class CtaHourBar(CtaLineBar):
         self.paramList.append('inputYbRef')
         self.paramList.append('inputGoldenN')
         self.paramList.append('activate_boll_ma_area')
+        self.paramList.append('activate_incremental')
+        self.paramList.append('activate_ring_buffer')
+        self.paramList.append('activate_bar_store')
+        self.paramList.append('activate_lazy_rt')
         self.paramList.append('is_7x24')
 
         self.paramList.append('minDiff')
@@ -4807,7 +5371,7 @@ class CtaHourBar(CtaLineBar):
         l1 = len(self.lineBar)
 
         if l1 == 0:
-            self.lineBar.append(bar)
+            bar = self.append_bar(bar, copy_bar=False)
             self.curTradingDay = bar.tradingDay
             self.m1_bars_count += bar_freq
             if bar_is_completed:
@@ -4839,7 +5403,7 @@ class CtaHourBar(CtaLineBar):
 
         if is_new_bar:
             # 添加新的bar
-            self.lineBar.append(bar)
+            self.append_bar(bar, copy_bar=False)
             self.m1_bars_count = bar_freq
             # 将上一个Bar推送至OnBar事件
             self.onBar(lastBar)
@@ -4916,7 +5480,7 @@ class CtaHourBar(CtaLineBar):
         if self.curTradingDay != tick.tradingDay:
             is_new_bar = True
             # 去除分钟和秒数
-            tick.datetime = datetime.strptime(tick.datetime.strftime('%Y-%m-%d %H:00:00'), '%Y-%m-%d %H:%M:%S')
+            tick.datetime = tick.datetime.replace(minute=0, second=0, microsecond=0)
             tick.time = tick.datetime.strftime('%H:%M:%S')
             self.last_minute = tick.datetime.minute
             self.curTradingDay = tick.tradingDay
@@ -4939,7 +5503,7 @@ class CtaHourBar(CtaLineBar):
                 #                         self.barTimeInterval))
                 is_new_bar = True
                 # 去除分钟和秒数
-                tick.datetime = datetime.strptime(tick.datetime.strftime('%Y-%m-%d %H:00:00'), '%Y-%m-%d %H:%M:%S')
+                tick.datetime = tick.datetime.replace(minute=0, second=0, microsecond=0)
                 tick.time = tick.datetime.strftime('%H:%M:%S')
                 if len(tick.tradingDay) > 0:
                     self.curTradingDay = tick.tradingDay
@@ -4954,7 +5518,7 @@ class CtaHourBar(CtaLineBar):
                 #                         self.barTimeInterval))
                 is_new_bar = True
                 # 去除秒数
-                tick.datetime = datetime.strptime(tick.datetime.strftime('%Y-%m-%d %H:%M:00'), '%Y-%m-%d %H:%M:%S')
+                tick.datetime = tick.datetime.replace(second=0, microsecond=0)
                 tick.time = tick.datetime.strftime('%H:%M:%S')
 
         if is_new_bar:
@@ -5062,6 +5626,10 @@ class CtaDayBar(CtaLineBar):
         self.paramList.append('inputYbRef')
         self.paramList.append('inputGoldenN')
         self.paramList.append('activate_boll_ma_area')
+        self.paramList.append('activate_incremental')
+        self.paramList.append('activate_ring_buffer')
+        self.paramList.append('activate_bar_store')
+        self.paramList.append('activate_lazy_rt')
         self.paramList.append('is_7x24')
 
         self.paramList.append('minDiff')
@@ -5091,8 +5659,7 @@ class CtaDayBar(CtaLineBar):
         l1 = len(self.lineBar)
 
         if l1 == 0:
-            new_bar = copy.deepcopy(bar)
-            self.lineBar.append(new_bar)
+            self.append_bar(bar)
             self.curTradingDay = bar.tradingDay if bar.tradingDay is not None else bar.date
             if bar_is_completed:
                 self.onBar(bar)
@@ -5118,8 +5685,7 @@ class CtaDayBar(CtaLineBar):
 
         if is_new_bar:
             # 添加新的bar
-            new_bar = copy.deepcopy(bar)
-            self.lineBar.append(new_bar)
+            self.append_bar(bar)
             # 将上一个Bar推送至OnBar事件
             self.onBar(lastBar)
         else:
@@ -5308,6 +5874,10 @@ class CtaWeekBar(CtaLineBar):
         self.paramList.append('inputYbRef')
         self.paramList.append('inputGoldenN')
         self.paramList.append('activate_boll_ma_area')
+        self.paramList.append('activate_incremental')
+        self.paramList.append('activate_ring_buffer')
+        self.paramList.append('activate_bar_store')
+        self.paramList.append('activate_lazy_rt')
         self.paramList.append('is_7x24')
 
         self.paramList.append('minDiff')
@@ -5342,10 +5912,9 @@ class CtaWeekBar(CtaLineBar):
         l1 = len(self.lineBar)
 
         if l1 == 0:
-            new_bar = copy.deepcopy(bar)
+            new_bar = self.append_bar(bar)
             new_bar.datetime = self.get_bar_start_dt(bar.datetime)
             self.writeCtaLog(u'周线开始时间:{}=>{}'.format(bar.datetime,new_bar.datetime))
-            self.lineBar.append(new_bar)
             self.curTradingDay = bar.tradingDay if bar.tradingDay is not None else bar.date
             if bar_is_completed:
                 self.onBar(bar)
@@ -5366,10 +5935,9 @@ class CtaWeekBar(CtaLineBar):
 
         if is_new_bar:
             # 添加新的bar
-            new_bar = copy.deepcopy(bar)
+            new_bar = self.append_bar(bar)
             new_bar.datetime = self.get_bar_start_dt(bar.datetime)
             self.writeCtaLog(u'新周线开始时间:{}=>{}'.format(bar.datetime, new_bar.datetime))
-            self.lineBar.append(new_bar)
             # 将上一个Bar推送至OnBar事件
             self.onBar(lastBar)
         else:
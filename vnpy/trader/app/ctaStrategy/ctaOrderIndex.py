@@ -0,0 +1,142 @@
+# encoding: UTF-8
+
+"""
+委托的价格索引
+按合约分别保存多头、空头委托，价格有序，每个tick/bar只需二分查找出会触发（成交）的部分，不再遍历全部委托。
+- 本地停止单（StopOrderIndex）：多头 价格 >= 停止价 时触发，按停止价升序；空头 价格 <= 停止价 时触发，按停止价降序
+- 限价单（LimitOrderIndex）：多头 买入撮合价 <= 委托价 时成交，按委托价降序；空头 卖出撮合价 >= 委托价 时成交，按委托价升序
+降序的一方保存为负价格的升序。触发条件与原遍历方式一致，多个委托同时触发时，按发出的先后顺序返回。
+"""
+
+from bisect import bisect_left, bisect_right, insort
+
+from vnpy.trader.vtConstant import DIRECTION_LONG, DIRECTION_SHORT
+
+# 比任何序号都大，用于二分查找价格的右边界
+_MAX_SEQ = float('inf')
+
+
+class StopOrderIndex(object):
+    """本地停止单的价格索引"""
+
+    # 索引中保存的价格 = 方向符号 * 委托价，索引价格 <= 方向符号 * 撮合价 时触发
+    LONG_SIGN = 1
+    SHORT_SIGN = -1
+
+    def __init__(self, ignore_case=False):
+        """
+        :param ignore_case: 合约代码是否不区分大小写（回测引擎按小写匹配）
+        """
+        self.ignore_case = ignore_case
+        self._books = {}    # 合约: (多头[(索引价格, 序号, 委托编号, 委托)], 空头[...])
+        self._entries = {}  # 委托编号: (合约, 所在列表, 索引项)
+        self._seq = 0       # 发出的顺序
+
+    def _key(self, vtSymbol):
+        return vtSymbol.lower() if self.ignore_case else vtSymbol
+
+    def add(self, order, orderID=None):
+        """
+        添加委托（需已设置vtSymbol、direction、price）
+        :param orderID: 委托编号，缺省为停止单的stopOrderID
+        """
+        if orderID is None:
+            orderID = order.stopOrderID
+        if orderID in self._entries:
+            self.remove(orderID)
+        if order.direction not in (DIRECTION_LONG, DIRECTION_SHORT):
+            return
+
+        symbol = self._key(order.vtSymbol)
+        book = self._books.get(symbol, None)
+        if book is None:
+            book = ([], [])
+            self._books[symbol] = book
+
+        self._seq += 1
+        if order.direction == DIRECTION_LONG:
+            orders, entry = book[0], (self.LONG_SIGN * order.price, self._seq, orderID, order)
+        else:
+            orders, entry = book[1], (self.SHORT_SIGN * order.price, self._seq, orderID, order)
+        insort(orders, entry)
+        self._entries[orderID] = (symbol, orders, entry)
+
+    def remove(self, orderID):
+        """移除委托（撤单），不存在时返回False"""
+        item = self._entries.pop(orderID, None)
+        if item is None:
+            return False
+        symbol, orders, entry = item
+        i = bisect_left(orders, entry[:2])
+        if i < len(orders) and orders[i][1] == entry[1]:
+            del orders[i]
+        book = self._books.get(symbol, None)
+        if book is not None and not book[0] and not book[1]:
+            del self._books[symbol]
+        return True
+
+    def pop_triggered(self, vtSymbol, buyPrice, sellPrice):
+        """
+        取出并移除会触发（成交）的委托
+        :param vtSymbol: 合约，或多个合约的tuple/list
+        :param buyPrice: 多头委托的撮合价格
+        :param sellPrice: 空头委托的撮合价格
+        :return: [(委托编号, 委托)]，按发出的先后顺序
+        """
+        symbols = vtSymbol if isinstance(vtSymbol, (tuple, list)) else (vtSymbol,)
+        triggered = []
+        for symbol in set(self._key(s) for s in symbols if s):
+            book = self._books.get(symbol, None)
+            if book is None:
+                continue
+            longs, shorts = book
+            if longs and buyPrice is not None:
+                limit = self.LONG_SIGN * buyPrice
+                if longs[0][0] <= limit:
+                    n = bisect_right(longs, (limit, _MAX_SEQ))
+                    triggered.extend(longs[:n])
+                    del longs[:n]
+            if shorts and sellPrice is not None:
+                limit = self.SHORT_SIGN * sellPrice
+                if shorts[0][0] <= limit:
+                    n = bisect_right(shorts, (limit, _MAX_SEQ))
+                    triggered.extend(shorts[:n])
+                    del shorts[:n]
+            if not longs and not shorts:
+                del self._books[symbol]
+
+        if not triggered:
+            return []
+        if len(triggered) > 1:
+            triggered.sort(key=lambda entry: entry[1])
+        result = []
+        for entry in triggered:
+            self._entries.pop(entry[2], None)
+            result.append((entry[2], entry[3]))
+        return result
+
+    def clear(self):
+        self._books.clear()
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, orderID):
+        return orderID in self._entries
+
+
+class LimitOrderIndex(StopOrderIndex):
+    """限价单的价格索引（回测撮合用）"""
+
+    LONG_SIGN = -1
+    SHORT_SIGN = 1
+
+    def add(self, order, orderID=None):
+        """
+        添加限价单
+        :param orderID: 委托编号，缺省为order.vtOrderID
+        """
+        if orderID is None:
+            orderID = order.vtOrderID
+        super(LimitOrderIndex, self).add(order, orderID)
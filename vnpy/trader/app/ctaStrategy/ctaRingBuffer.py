@@ -0,0 +1,210 @@
+# encoding: UTF-8
+
+"""
+NumPy环形缓冲区
+用于CtaLineBar的lineOpen/lineClose/各指标序列，替代list + del [0]的裁剪方式：
+- 预分配float64数组，append/del [0] 均为O(1)，不产生大量Python float对象
+- 兼容list的常用用法：[-1]、[-n:]、len()、for循环、append、del [0]、赋值[-1]
+- 每个数据写两份（i 与 i+capacity），任意最近n个数据都是连续内存，
+  可通过view(n)或np.asarray()零拷贝传入TA-Lib
+"""
+
+import numpy as np
+
+
+class RingBuffer(object):
+    """float64 环形缓冲区"""
+
+    def __init__(self, capacity=64, maxlen=None, data=None):
+        """
+        :param capacity: 预分配容量，数据超出容量时自动扩容（maxlen为None时）
+        :param maxlen: 最大长度，达到后append会自动丢弃最早的数据；None为不限制，由调用方del [0]裁剪
+        :param data: 初始数据
+        """
+        self.maxlen = int(maxlen) if maxlen else None
+        capacity = max(int(capacity), 1)
+        if self.maxlen:
+            capacity = min(capacity, self.maxlen)
+        self._capacity = capacity
+        self._data = np.zeros(capacity * 2, dtype=np.float64)
+        self._mv = memoryview(self._data)   # 标量读写使用memoryview，直接得到Python float，避免numpy标量开销
+        self._start = 0     # 第一个数据在数组中的位置，[0, capacity)
+        self._len = 0
+
+        if data is not None:
+            for v in data:
+                self.append(v)
+
+    # ----------------------------------------------------------------------
+    def _grow(self):
+        """扩容一倍"""
+        values = self.view()
+        capacity = self._capacity * 2
+        if self.maxlen:
+            capacity = min(capacity, self.maxlen)
+        data = np.zeros(capacity * 2, dtype=np.float64)
+        n = self._len
+        data[:n] = values
+        data[capacity:capacity + n] = values
+        self._data = data
+        self._mv = memoryview(data)
+        self._capacity = capacity
+        self._start = 0
+
+    def append(self, value):
+        """添加数据"""
+        value = float(value)
+        cap = self._capacity
+        if self._len == cap:
+            if self.maxlen is None or cap < self.maxlen:
+                self._grow()
+                cap = self._capacity
+            else:
+                # 已满，覆盖最早的数据
+                pos = self._start
+                mv = self._mv
+                mv[pos] = value
+                mv[pos + cap] = value
+                self._start = (pos + 1) % cap
+                return
+
+        pos = (self._start + self._len) % cap
+        mv = self._mv
+        mv[pos] = value
+        mv[pos + cap] = value
+        self._len += 1
+
+    def extend(self, values):
+        for v in values:
+            self.append(v)
+
+    def popleft(self):
+        """移除并返回最早的数据"""
+        if self._len == 0:
+            raise IndexError('pop from empty RingBuffer')
+        value = self._mv[self._start]
+        self._start = (self._start + 1) % self._capacity
+        self._len -= 1
+        return value
+
+    def pop(self):
+        """移除并返回最新的数据"""
+        if self._len == 0:
+            raise IndexError('pop from empty RingBuffer')
+        value = self._mv[self._start + self._len - 1]
+        self._len -= 1
+        return value
+
+    def clear(self):
+        self._start = 0
+        self._len = 0
+
+    # ----------------------------------------------------------------------
+    def view(self, n=None):
+        """
+        最近n个数据的只读连续视图（零拷贝），可直接传入TA-Lib
+        :param n: None 为全部数据
+        :return: np.ndarray
+        """
+        end = self._start + self._len
+        if n is None or n >= self._len:
+            begin = self._start
+        else:
+            begin = end - max(int(n), 0)
+        v = self._data[begin:end]
+        v.flags.writeable = False
+        return v
+
+    def tolist(self):
+        return self.view().tolist()
+
+    def __array__(self, dtype=None, copy=None):
+        v = self.view()
+        if dtype is not None and np.dtype(dtype) != v.dtype:
+            return v.astype(dtype)
+        if copy:
+            return v.copy()
+        return v
+
+    # ----------------------------------------------------------------------
+    def __len__(self):
+        return self._len
+
+    def _index(self, i):
+        n = self._len
+        if i < 0:
+            i += n
+        if i < 0 or i >= n:
+            raise IndexError('RingBuffer index out of range')
+        return self._start + i
+
+    def __getitem__(self, item):
+        if item.__class__ is slice:
+            # 与list一致，切片返回list
+            return self.view()[item].tolist()
+        n = self._len
+        if item < 0:
+            item += n
+        if item < 0 or item >= n:
+            raise IndexError('RingBuffer index out of range')
+        return self._mv[self._start + item]
+
+    def __setitem__(self, item, value):
+        if isinstance(item, slice):
+            raise TypeError('RingBuffer does not support slice assignment')
+        pos = self._index(item) % self._capacity
+        value = float(value)
+        self._mv[pos] = value
+        self._mv[pos + self._capacity] = value
+
+    def __delitem__(self, item):
+        if isinstance(item, slice):
+            values = self.view().tolist()
+            del values[item]
+        elif item == 0 or item == -self._len:
+            self.popleft()
+            return
+        elif item == -1 or item == self._len - 1:
+            self.pop()
+            return
+        else:
+            values = self.view().tolist()
+            del values[item]
+        self.clear()
+        self.extend(values)
+
+    def __iter__(self):
+        return iter(self.view().tolist())
+
+    def __reversed__(self):
+        return reversed(self.view().tolist())
+
+    def __contains__(self, value):
+        return value in self.view().tolist()
+
+    def __add__(self, other):
+        return self.tolist() + list(other)
+
+    def __radd__(self, other):
+        return list(other) + self.tolist()
+
+    def __eq__(self, other):
+        if isinstance(other, RingBuffer):
+            other = other.tolist()
+        return self.tolist() == other
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    __hash__ = None
+
+    def __repr__(self):
+        return 'RingBuffer({})'.format(self.tolist())
+
+    # ----------------------------------------------------------------------
+    def __getstate__(self):
+        """Pickle时只保存有效数据"""
+        return {'capacity': self._capacity, 'maxlen': self.maxlen, 'data': self.tolist()}
+
+    def __setstate__(self, state):
+        self.__init__(capacity=state['capacity'], maxlen=state['maxlen'], data=state['data'])
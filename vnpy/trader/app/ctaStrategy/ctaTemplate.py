@@ -8,6 +8,7 @@ from datetime import datetime,timedelta
 import os,csv
 from .ctaBase import *
 from vnpy.trader.vtConstant import *
+from vnpy.trader.vtSession import get_calendar
 
 
 ########################################################################
@@ -365,22 +366,7 @@ class CtaTemplate(object):
         :param dt:
         :return:
         """
-        tradingDay = ''
-        if dt is None:
-            dt = datetime.now()
-
-        if dt.hour >= 20:
-            if dt.isoweekday() == 5:
-                # 星期五=》星期一
-                return (dt + timedelta(days=3)).strftime('%Y-%m-%d')
-            else:
-                # 第二天
-                return (dt + timedelta(days=1)).strftime('%Y-%m-%d')
-        elif dt.hour < 8 and dt.isoweekday() == 6:
-            # 星期六=>星期一
-            return (dt + timedelta(days=2)).strftime('%Y-%m-%d')
-        else:
-            return dt.strftime('%Y-%m-%d')
+        return get_calendar(night_hour=20).get_trading_date(dt)
 
     def append_data(self, file_name, dict_data, field_names=None):
         """
@@ -0,0 +1,138 @@
+# encoding: UTF-8
+
+"""
+DrEngine批量写入的压力测试
+使用本地的模拟Mongo（每次写入调用固定往返延时 + 每条数据的写入时间），
+比较逐条insert_one与按表批量insert_many的持续写入速度（条/秒）。
+
+    python drBenchmark.py [tick数量] [合约数量]
+"""
+
+import sys
+import time
+from datetime import datetime, timedelta
+from threading import Lock
+
+from vnpy.event import Event
+from vnpy.trader.vtEvent import EVENT_TICK
+from vnpy.trader.vtObject import VtTickData
+from vnpy.trader.app.dataRecorder.drBase import TICK_DB_NAME
+from vnpy.trader.app.dataRecorder.drEngine import DrEngine
+
+
+########################################################################
+class FakeMongoEngine(object):
+    """模拟的主引擎数据库接口"""
+
+    #----------------------------------------------------------------------
+    def __init__(self, latency=0.0003, perDoc=0.000005):
+        """
+        :param latency: 每次写入调用的往返延时（秒）
+        :param perDoc: 每条数据的写入时间（秒）
+        """
+        self.latency = latency
+        self.perDoc = perDoc
+        self.count = 0
+        self.calls = 0
+        self.lock = Lock()
+
+    #----------------------------------------------------------------------
+    def subscribe(self, req, gatewayName):
+        pass
+
+    #----------------------------------------------------------------------
+    def dbInsert(self, dbName, collectionName, d):
+        time.sleep(self.latency + self.perDoc)
+        with self.lock:
+            self.count += 1
+            self.calls += 1
+
+    #----------------------------------------------------------------------
+    def dbInsertMany(self, dbName, collectionName, data_list, ordered=True):
+        time.sleep(self.latency + self.perDoc * len(data_list))
+        with self.lock:
+            self.count += len(data_list)
+            self.calls += 1
+        return True
+
+
+########################################################################
+class FakeEventEngine(object):
+    """不处理事件的事件引擎"""
+
+    #----------------------------------------------------------------------
+    def put(self, event):
+        pass
+
+    #----------------------------------------------------------------------
+    def register(self, type_, handler):
+        pass
+
+
+#----------------------------------------------------------------------
+def makeTicks(n, symbols):
+    """生成n个tick事件，轮流分配到各合约"""
+    start = datetime(2019, 1, 2, 9, 0, 0)
+    events = []
+    for i in range(n):
+        tick = VtTickData()
+        tick.vtSymbol = tick.symbol = symbols[i % len(symbols)]
+        tick.lastPrice = tick.bidPrice1 = tick.askPrice1 = 3500.0 + i % 10
+        tick.datetime = start + timedelta(milliseconds=500 * i)
+        tick.date = tick.datetime.strftime('%Y-%m-%d')
+        tick.time = tick.datetime.strftime('%H:%M:%S.%f')
+        events.append(Event(EVENT_TICK, tick))
+    return events
+
+
+#----------------------------------------------------------------------
+def runLegacy(events, mainEngine):
+    """原方式：逐条insert_one（主力合约映射时每个tick写两次）"""
+    t0 = time.perf_counter()
+    for event in events:
+        tick = event.dict_['data']
+        mainEngine.dbInsert(TICK_DB_NAME, tick.vtSymbol, tick.__dict__)
+        mainEngine.dbInsert(TICK_DB_NAME, tick.vtSymbol[:2] + '99', tick.__dict__)
+    return time.perf_counter() - t0
+
+
+#----------------------------------------------------------------------
+def runBatch(events, mainEngine, symbols):
+    """批量方式：DrEngine写入线程按表insert_many，停止时写完"""
+    engine = DrEngine(mainEngine, FakeEventEngine())
+    engine.logger = None
+    for symbol in symbols:
+        engine.tickDict[symbol] = None
+        engine.activeSymbolDict[symbol] = symbol[:2] + '99'
+    engine.start()
+
+    t0 = time.perf_counter()
+    for event in events:
+        engine.procecssTickEvent(event)
+    putTime = time.perf_counter() - t0
+    engine.stop()
+    return time.perf_counter() - t0, putTime, engine.getStats()
+
+
+#----------------------------------------------------------------------
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    symbolCount = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    symbols = ['{0}{1:02d}01'.format(chr(ord('a') + i % 26) * 2, i) for i in range(symbolCount)]
+    events = makeTicks(n, symbols)
+
+    legacyCount = min(n, 2000)
+    mongo = FakeMongoEngine()
+    seconds = runLegacy(events[:legacyCount], mongo)
+    print(u'逐条写入: {0}个tick, {1}次写入调用, {2:.2f}秒, {3:.0f} tick/秒'.format(
+        legacyCount, mongo.calls, seconds, legacyCount / seconds))
+
+    mongo = FakeMongoEngine()
+    seconds, putTime, stats = runBatch(events, mongo, symbols)
+    print(u'批量写入: {0}个tick, {1}次写入调用, {2:.2f}秒（行情线程{3:.2f}秒）, {4:.0f} tick/秒'.format(
+        n, mongo.calls, seconds, putTime, n / seconds))
+    print(u'写入统计: {0}'.format(stats))
+
+
+if __name__ == '__main__':
+    main()
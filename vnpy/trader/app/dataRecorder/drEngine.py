@@ -4,6 +4,13 @@
 本文件中实现了行情数据记录引擎，用于汇总TICK数据，并生成K线插入数据库。
 
 使用DR_setting.json来配置需要收集的合约，以及主力合约代码。
+
+数据库写入：行情线程只把数据放入有界队列，写入线程按(数据库, 表)分批，
+达到批量条数或等待超过时间窗口后用insert_many（unordered）写入；
+队列满时丢弃（或等待），停止时写完队列中剩余的数据；数据库连接断开时，重连后重试该批数据。
+可在DR_setting.json中用"batch"设置：
+{"size": 500, "interval": 1.0, "max_queue": 200000, "block": false, "retry": 3, "retry_interval": 1.0}
+存储方式（drStorage）：缺省写入MongoDB；"storage": "journal"时，tick和分钟bar写入本地日志文件（"journal_path"目录）
 '''
 
 import json
@@ -11,16 +18,21 @@ import os
 import copy
 from collections import OrderedDict
 from datetime import datetime, timedelta
-from queue import Queue
-from threading import Thread
+from queue import Queue, Empty, Full
+from threading import Thread, Lock
+from time import monotonic, sleep
+
+from pymongo.errors import ConnectionFailure
 
 
 from vnpy.trader.vtEvent import *
 from vnpy.trader.vtObject import VtTickData
 from vnpy.trader.vtGateway import VtSubscribeReq, VtLogData
 from vnpy.trader.vtFunction import todayDate,getJsonPath,getShortSymbol
+from vnpy.trader.vtSession import get_calendar
 from vnpy.trader.app.ctaStrategy.ctaRenkoBar import CtaRenkoBar
 from .drBase import *
+from .drStorage import DrMongoStorage, DrJournalStorage
 from vnpy.trader.setup_logger import setup_logger
 from vnpy.trader.data_source import DataSource
 ########################################################################
@@ -30,6 +42,14 @@ class DrEngine(object):
     settingFileName = 'DR_setting.json'
     settingFilePath = getJsonPath(settingFileName,__file__)
 
+    # 批量写入的缺省设置
+    batchSize = 500             # 每批最多条数
+    batchInterval = 1.0         # 最长等待秒数
+    maxQueueSize = 200000       # 队列最大条数
+    blockOnFull = False         # 队列满时，True：等待；False：丢弃，计入dropped
+    retryTimes = 3              # 连接断开时，每批数据的重试次数
+    retryInterval = 1.0         # 重试前等待的秒数
+
     #----------------------------------------------------------------------
     def __init__(self, mainEngine, eventEngine):
         """Constructor"""
@@ -53,9 +73,22 @@ class DrEngine(object):
 
         # 负责执行数据库插入的单独线程相关
         self.active = False                     # 工作状态
-        self.queue = Queue()                    # 队列
+        self.queue = Queue(maxsize=self.maxQueueSize)   # 队列
         self.thread = Thread(target=self.run)   # 线程
 
+        # 数据存储（缺省为MongoDB）
+        self.storage = DrMongoStorage(self.mainEngine)
+
+        # 写入统计
+        self.statsLock = Lock()
+        self.stats = {'queued': 0,          # 放入队列
+                      'dropped': 0,         # 队列满丢弃
+                      'inserted': 0,        # 已写入
+                      'failed': 0,          # 写入失败
+                      'batches': 0,         # 写入批次
+                      'retries': 0,         # 连接断开后的重试次数
+                      'maxQueued': 0}       # 队列中的最大条数
+
         self.logger = None
         self.createLogger()
         # 载入设置，订阅行情
@@ -90,6 +123,22 @@ class DrEngine(object):
             working = drSetting['working']
             if not working:
                 return
+
+            # 批量写入设置
+            batchSetting = drSetting.get('batch', {})
+            self.batchSize = max(int(batchSetting.get('size', self.batchSize)), 1)
+            self.batchInterval = batchSetting.get('interval', self.batchInterval)
+            self.maxQueueSize = batchSetting.get('max_queue', self.maxQueueSize)
+            self.blockOnFull = batchSetting.get('block', self.blockOnFull)
+            self.retryTimes = max(int(batchSetting.get('retry', self.retryTimes)), 0)
+            self.retryInterval = batchSetting.get('retry_interval', self.retryInterval)
+            self.queue = Queue(maxsize=self.maxQueueSize)
+
+            # 存储方式
+            if drSetting.get('storage', 'mongo') == 'journal':
+                journalPath = drSetting.get('journal_path', None) or os.path.join(os.getcwd(), 'journal')
+                self.storage = DrJournalStorage(journalPath, fallback=DrMongoStorage(self.mainEngine))
+                self.writeDrLog(u'tick和分钟bar写入本地日志:{}'.format(journalPath))
             
             if 'tick' in drSetting:
                 l = drSetting['tick']
@@ -200,15 +249,17 @@ class DrEngine(object):
         for key in d.keys():
             if key != 'datetime':
                 d[key] = tick.__getattribute__(key)
-        drTick.datetime = datetime.strptime(' '.join([tick.date, tick.time]), '%Y-%m-%d %H:%M:%S.%f')
+        # 优先使用gateway生成的datetime，没有时才解析字符串
+        drTick.datetime = getattr(tick, 'datetime', None) or \
+            datetime.strptime(' '.join([tick.date, tick.time]), '%Y-%m-%d %H:%M:%S.%f')
         
         # 更新Tick数据
         if vtSymbol in self.tickDict:
-            self.insertData(TICK_DB_NAME, vtSymbol, drTick)
-            
+            # 有主力合约映射时，一次放入队列，写入两个表
             if vtSymbol in self.activeSymbolDict:
-                activeSymbol = self.activeSymbolDict[vtSymbol]
-                self.insertData(TICK_DB_NAME, activeSymbol, drTick)
+                self.insertData(TICK_DB_NAME, (vtSymbol, self.activeSymbolDict[vtSymbol]), drTick)
+            else:
+                self.insertData(TICK_DB_NAME, vtSymbol, drTick)
             
             # 发出日志
             self.writeDrLog(u'记录Tick数据%s，时间:%s, last:%s, bid:%s, ask:%s' 
@@ -222,11 +273,10 @@ class DrEngine(object):
             if not bar.datetime or bar.datetime.minute != drTick.datetime.minute:    
                 if bar.vtSymbol:
                     newBar = copy.copy(bar)
-                    self.insertData(MINUTE_DB_NAME, vtSymbol, newBar)
-                    
                     if vtSymbol in self.activeSymbolDict:
-                        activeSymbol = self.activeSymbolDict[vtSymbol]
-                        self.insertData(MINUTE_DB_NAME, activeSymbol, newBar)                    
+                        self.insertData(MINUTE_DB_NAME, (vtSymbol, self.activeSymbolDict[vtSymbol]), newBar)
+                    else:
+                        self.insertData(MINUTE_DB_NAME, vtSymbol, newBar)
                     
                     self.writeDrLog(u'记录分钟线数据%s，时间:%s, O:%s, H:%s, L:%s, C:%s' 
                                     %(bar.vtSymbol, bar.time, bar.open, bar.high, 
@@ -304,18 +354,7 @@ class DrEngine(object):
                         tick.date = tick.datetime.strftime('%Y-%m-%d')
                         tick.time = tick.datetime.strftime('%H:%M:00')
 
-                        if tick.datetime.hour >= 21:
-                            if tick.datetime.isoweekday() == 5:
-                                # 星期五=》星期一
-                                tick.tradingDay = (tick.datetime + timedelta(days=3)).strftime('%Y-%m-%d')
-                            else:
-                                # 第二天
-                                tick.tradingDay = (tick.datetime + timedelta(days=1)).strftime('%Y-%m-%d')
-                        elif tick.datetime.hour < 8 and tick.datetime.isoweekday() == 6:
-                            # 星期六=>星期一
-                            tick.tradingDay = (tick.datetime + timedelta(days=2)).strftime('%Y-%m-%d')
-                        else:
-                            tick.tradingDay = tick.date
+                        tick.tradingDay = get_calendar().get_trading_date(tick.datetime)
                         tick.upperLimit = float(row['limit_up'])
                         tick.lowerLimit = float(row['limit_down'])
                         tick.lastPrice = float(row['close'])
@@ -364,18 +403,120 @@ class DrEngine(object):
  
     #----------------------------------------------------------------------
     def insertData(self, dbName, collectionName, data):
-        """插入数据到数据库（这里的data可以是CtaTickData或者CtaBarData）"""
-        self.queue.put((dbName, collectionName, data.__dict__))
+        """
+        插入数据到数据库（这里的data可以是CtaTickData或者CtaBarData）
+        :param collectionName: 表名，或表名的元组（同一数据写入多个表）
+        :return: 是否放入队列
+        """
+        if isinstance(collectionName, str):
+            collectionName = (collectionName,)
+        try:
+            if self.blockOnFull:
+                self.queue.put((dbName, collectionName, data.__dict__), timeout=self.batchInterval)
+            else:
+                self.queue.put_nowait((dbName, collectionName, data.__dict__))
+        except Full:
+            with self.statsLock:
+                self.stats['dropped'] += 1
+            return False
+
+        n = self.queue.qsize()
+        with self.statsLock:
+            self.stats['queued'] += 1
+            if n > self.stats['maxQueued']:
+                self.stats['maxQueued'] = n
+        return True
 
     #----------------------------------------------------------------------
     def run(self):
-        """运行插入线程"""
-        while self.active:
+        """运行插入线程：按(数据库, 表)分批写入，停止后写完队列中剩余的数据"""
+        batches = {}        # (数据库, 表): [数据]
+        deadlines = {}      # (数据库, 表): 最迟写入时间
+        lastStorageFlush = monotonic()
+
+        while self.active or not self.queue.empty():
+            timeout = min(deadlines.values()) - monotonic() if deadlines else 1
             try:
-                dbName, collectionName, d = self.queue.get(block=True, timeout=1)
-                self.mainEngine.dbInsert(dbName, collectionName, d)
-            except Exception as ex:
+                dbName, collectionNames, d = self.queue.get(block=True, timeout=min(max(timeout, 0), 1))
+                for collectionName in collectionNames:
+                    key = (dbName, collectionName)
+                    batch = batches.get(key, None)
+                    if batch is None:
+                        batch = batches[key] = []
+                        deadlines[key] = monotonic() + self.batchInterval
+                    # 写入多个表时，各表使用独立的副本（insert_many会添加_id）
+                    batch.append(d if len(collectionNames) == 1 else dict(d))
+                    if len(batch) >= self.batchSize:
+                        del deadlines[key]
+                        self.flushBatch(key, batches.pop(key))
+            except Empty:
                 pass
+
+            # 写入超过时间窗口的批次
+            now = monotonic()
+            for key in [k for k, t in deadlines.items() if t <= now]:
+                del deadlines[key]
+                self.flushBatch(key, batches.pop(key))
+
+            # 定期写入存储的缓冲（本地日志的文件缓冲、索引）
+            if now - lastStorageFlush >= self.batchInterval:
+                try:
+                    self.storage.flush()
+                except Exception as ex:
+                    self.writeDrLog(u'写入存储缓冲异常:{}'.format(str(ex)))
+                lastStorageFlush = now
+
+        # 停止时写入所有剩余的批次
+        for key, batch in batches.items():
+            self.flushBatch(key, batch)
+        try:
+            self.storage.close()
+        except Exception as ex:
+            self.writeDrLog(u'关闭存储异常:{}'.format(str(ex)))
+
+    #----------------------------------------------------------------------
+    def flushBatch(self, key, batch):
+        """
+        写入一批数据
+        连接断开时，重连后重试该批数据（最多retryTimes次，每次等待retryInterval秒），其间新数据在队列中积压；
+        部分记录写入出错时（如重复键），按实际写入的条数统计
+        """
+        dbName, collectionName = key
+        inserted = 0
+        retries = 0
+        while True:
+            try:
+                inserted = self.storage.insertMany(dbName, collectionName, batch, retry=retries > 0)
+                break
+            except ConnectionFailure as ex:
+                self.writeDrLog(u'写入{}.{}连接异常:{}'.format(dbName, collectionName, str(ex)))
+                if retries >= self.retryTimes:
+                    break
+                retries += 1
+                sleep(self.retryInterval)
+                try:
+                    self.storage.reconnect()
+                except Exception as ex:
+                    self.writeDrLog(u'重新连接异常:{}'.format(str(ex)))
+                self.writeDrLog(u'第{}次重试写入{}.{}，{}条'.format(retries, dbName, collectionName, len(batch)))
+            except Exception as ex:
+                self.writeDrLog(u'写入{}.{}异常:{}'.format(dbName, collectionName, str(ex)))
+                break
+
+        with self.statsLock:
+            self.stats['batches'] += 1
+            self.stats['retries'] += retries
+            self.stats['inserted'] += inserted
+            self.stats['failed'] += len(batch) - inserted
+
+    #----------------------------------------------------------------------
+    def getStats(self):
+        """写入统计（背压指标）"""
+        with self.statsLock:
+            d = dict(self.stats)
+        d['queueSize'] = self.queue.qsize()
+        return d
+
     #----------------------------------------------------------------------
     def start(self):
         """启动"""
@@ -384,10 +525,11 @@ class DrEngine(object):
 
     #----------------------------------------------------------------------
     def stop(self):
-        """退出"""
+        """退出（等待写入线程写完队列中的数据）"""
         if self.active:
             self.active = False
             self.thread.join()
+            self.writeDrLog(u'数据记录停止，写入统计:{}'.format(self.getStats()))
         
     #----------------------------------------------------------------------
     def writeDrLog(self, content):
@@ -0,0 +1,111 @@
+# encoding: UTF-8
+
+'''
+DrEngine的数据存储
+写入线程把同一(数据库, 表)的一批数据交给存储写入，insertMany返回写入的条数，
+连接异常（pymongo.errors.ConnectionFailure）时抛出，由写入线程reconnect后重试：
+- DrMongoStorage：使用主引擎的数据库连接，insert_many写入MongoDB
+- DrJournalStorage：tick和分钟bar写入本地日志文件（vnpy/data/journal），其他数据（如Renko）交给备用存储
+在DR_setting.json中设置："storage": "journal", "journal_path": "日志根目录"
+'''
+
+from pymongo.errors import ConnectionFailure, BulkWriteError
+
+from vnpy.data.journal.tick_journal import JournalWriter, KIND_TICK, KIND_BAR
+from .drBase import TICK_DB_NAME, MINUTE_DB_NAME
+
+
+########################################################################
+class DrMongoStorage(object):
+    """MongoDB存储"""
+
+    #----------------------------------------------------------------------
+    def __init__(self, mainEngine):
+        """Constructor"""
+        self.mainEngine = mainEngine
+
+    #----------------------------------------------------------------------
+    def insertMany(self, dbName, collectionName, docs, retry=False):
+        """
+        写入一批数据（unordered，出错的记录跳过，其余照常写入）
+        :param retry: 是否为连接断开后的重试。insert_many已为每条数据设置_id，
+                      上次已写入的记录本次报重复键错误，计为已写入
+        :return: 写入的条数；未连接、连接断开时抛出ConnectionFailure
+        """
+        dbClient = self.mainEngine.dbClient
+        if not dbClient:
+            raise ConnectionFailure(u'数据库未连接')
+
+        try:
+            dbClient[dbName][collectionName].insert_many(docs, ordered=False)
+        except BulkWriteError as ex:
+            inserted = ex.details.get('nInserted', 0)
+            if retry:
+                inserted += len([e for e in ex.details.get('writeErrors', []) if e.get('code') == 11000])
+            return inserted
+        return len(docs)
+
+    #----------------------------------------------------------------------
+    def reconnect(self):
+        """重新连接数据库（主引擎已断开时）"""
+        self.mainEngine.dbConnect()
+
+    #----------------------------------------------------------------------
+    def flush(self):
+        """写入缓冲"""
+        pass
+
+    #----------------------------------------------------------------------
+    def close(self):
+        """关闭"""
+        pass
+
+
+########################################################################
+class DrJournalStorage(object):
+    """本地日志文件存储，表名（合约）作为日志的目录名"""
+
+    # 数据库 => 日志类型
+    kindMap = {TICK_DB_NAME: KIND_TICK,
+               MINUTE_DB_NAME: KIND_BAR}
+
+    #----------------------------------------------------------------------
+    def __init__(self, root, fallback=None):
+        """
+        :param root: 日志根目录
+        :param fallback: 其他数据库的备用存储，None时丢弃
+        """
+        self.writer = JournalWriter(root)
+        self.fallback = fallback
+
+    #----------------------------------------------------------------------
+    def insertMany(self, dbName, collectionName, docs, retry=False):
+        """写入一批数据，返回写入的条数"""
+        kind = self.kindMap.get(dbName, None)
+        if kind is None:
+            if self.fallback is None:
+                return 0
+            return self.fallback.insertMany(dbName, collectionName, docs, retry=retry)
+
+        self.writer.append(kind, collectionName, docs)
+        return len(docs)
+
+    #----------------------------------------------------------------------
+    def reconnect(self):
+        """重新连接备用存储"""
+        if self.fallback is not None:
+            self.fallback.reconnect()
+
+    #----------------------------------------------------------------------
+    def flush(self):
+        """写入文件缓冲，更新索引"""
+        self.writer.flush()
+        if self.fallback is not None:
+            self.fallback.flush()
+
+    #----------------------------------------------------------------------
+    def close(self):
+        """关闭所有文件"""
+        self.writer.close()
+        if self.fallback is not None:
+            self.fallback.close()
@@ -21,6 +21,7 @@ from vnpy.trader.vtGateway import *
 from vnpy.trader.gateway.ctpGateway.language import text
 from vnpy.trader.gateway.ctpGateway.ctpDataType import *
 from vnpy.trader.vtFunction import getJsonPath,getShortSymbol,roundToPriceTick
+from vnpy.trader.vtSession import get_calendar, get_tick_datetime
 from vnpy.trader.app.ctaStrategy.ctaBase import MARKET_DAY_ONLY,NIGHT_MARKET_SQ1,NIGHT_MARKET_SQ2,NIGHT_MARKET_SQ3,NIGHT_MARKET_ZZ,NIGHT_MARKET_DL
 from vnpy.amqp.consumer import subscriber
 from vnpy.trader.vtUtility import BarGenerator
@@ -499,6 +500,8 @@ class CtpMdApi(MdApi):
         self.brokerID = EMPTY_STRING        # 经纪商代码
         self.address = EMPTY_STRING         # 服务器地址
 
+        self.calendar = get_calendar(night_hour=20)     # 交易日历（计算tick的交易日）
+
     #----------------------------------------------------------------------
     def onFrontConnected(self):
         """服务器连接"""
@@ -632,30 +635,11 @@ class CtpMdApi(MdApi):
             if tick.exchange is EXCHANGE_CFFEX and dt.hour == 9 and dt.minute < 14:
                 return
 
-            # 日期，取系统时间的日期
-            tick.date = dt.strftime('%Y-%m-%d')
-            # 生成dateteime
-            tick.datetime = datetime.strptime(tick.date + ' ' + tick.time, '%Y-%m-%d %H:%M:%S.%f')
-            # 生成TradingDay
-
-            # 正常日盘时间
-            tick.tradingDay = tick.date
-
-            # 修正夜盘的tradingDay
-            if tick.datetime.hour >= 20:
-                # 周一~周四晚上20点之后的tick，交易日属于第二天
-                if tick.datetime.isoweekday() in [1,2,3,4]:
-                    trading_day = tick.datetime + timedelta(days=1)
-                    tick.tradingDay = trading_day.strftime('%Y-%m-%d')
-                # 周五晚上20点之后的tick，交易日属于下周一
-                elif tick.datetime.isoweekday() == 5:
-                    trading_day = tick.datetime + timedelta(days=3)
-                    tick.tradingDay = trading_day.strftime('%Y-%m-%d')
-            elif tick.datetime.hour < 3:
-                # 周六凌晨的tick，交易日属于下周一
-                if tick.datetime.isoweekday() == 6:
-                    trading_day = tick.datetime + timedelta(days=2)
-                    tick.tradingDay = trading_day.strftime('%Y-%m-%d')
+            # 日期，取系统时间的日期；datetime直接由整数生成，日期、交易日字符串按日缓存，不再strptime/strftime
+            tick.datetime = get_tick_datetime(dt, data['UpdateTime'], data['UpdateMillisec'])
+            tick.date = self.calendar.format_ordinal(dt.toordinal())
+            # 交易日：20点之后的夜盘属于下一个交易日（周五夜盘属于下周一），周六凌晨属于下周一
+            tick.tradingDay = self.calendar.get_trading_date(tick.datetime)
 
             tick.openPrice = data['OpenPrice']
             tick.highPrice = data['HighestPrice']
@@ -2738,7 +2722,8 @@ class SubMdApi():
                 password=self.setting.get('password', 'admin'),
                 exchange=self.setting.get('exchange', 'x_fanout_md_tick'))
 
-            self.sub.set_callback(self.on_message)
+            # 按消息的content_type解码json/msgpack，一条消息可包含多个tick
+            self.sub.set_tick_callback(self.on_ticks)
             self.thread = Thread(target=self.sub.start)
             self.thread.start()
             self.connect_status = True
@@ -2751,31 +2736,27 @@ class SubMdApi():
     def reconnect(self):
         pass
 
-    def on_message(self, chan, method_frame, _header_frame, body, userdata=None):
-        # print(" [x] %r" % body)
-        try:
-            str_tick = body.decode('utf-8')
-            d = json.loads(str_tick)
-            symbol = d.get('vtSymbol', None)
-            str_datetime = d.get('datetime', None)
-            if symbol not in self.registed_symbol_set or str_datetime is None:
-                return
-            if '.' in str_datetime:
-                dt = datetime.strptime(str_datetime,'%Y-%m-%d %H:%M:%S.%f')
-            else:
-                dt = datetime.strptime(str_datetime,'%Y-%m-%d %H:%M:%S')
-            d.update({'datetime': dt})
-            d.pop('rawData',None)
-            tick = VtTickData()
-            tick.__dict__.update(d)
+    def on_ticks(self, tick_list):
+        """
+        接收tick（已由subscriber解码为dict，datetime已转换）
+        :param tick_list: [dict]
+        """
+        for d in tick_list:
+            try:
+                symbol = d.get('vtSymbol', None)
+                if symbol not in self.registed_symbol_set or d.get('datetime', None) is None:
+                    continue
+                d.pop('rawData', None)
+                tick = VtTickData()
+                tick.__dict__.update(d)
 
-            self.symbol_tick_dict[symbol] = tick
-            self.gateway.onTick(tick)
-            self.gateway.onCustomerTick(tick)
+                self.symbol_tick_dict[symbol] = tick
+                self.gateway.onTick(tick)
+                self.gateway.onCustomerTick(tick)
 
-        except Exception as ex:
-            self.gateway.writeError(u'RabbitMQ on_message 异常:{}'.format(str(ex)))
-            self.gateway.writeError(traceback.format_exc())
+            except Exception as ex:
+                self.gateway.writeError(u'RabbitMQ on_ticks 异常:{}'.format(str(ex)))
+                self.gateway.writeError(traceback.format_exc())
 
     def close(self):
         """退出API"""
@@ -35,6 +35,9 @@ from vnpy.trader.app.ctaStrategy.uiCtaWidget import  CtaValueMonitor
 if str(platform.system()) == 'Windows':
     import winsound
 
+# 远程调用的超时秒数
+RPC_TIMEOUT = 10
+
 
 ########################################################################
 class QGridSpinBox(QtWidgets.QSpinBox):
@@ -424,7 +427,8 @@ class RpcServerMonitor(QtWidgets.QWidget):
 
         try:
             self.eventEngine.start(timer=False)
-            self.rpc_client = VtClient(self.reqAddress, self.pubAddress, self.eventEngine)
+            # 监控多个服务端，单个服务端无响应时，调用超时返回，不阻塞界面
+            self.rpc_client = VtClient(self.reqAddress, self.pubAddress, self.eventEngine, timeout=RPC_TIMEOUT)
             # 这里是订阅所有的publish event，也可以指定。
             self.rpc_client.subscribeTopic(self.subscribeTopics)
             self.rpc_client.start()
@@ -6,6 +6,7 @@ import platform
 import sys
 
 from vnpy.rpc import RpcClient
+from vnpy.trader.vtEventCodec import decodeEvent
 from vnpy.trader.app.ctaStrategy.ctaEngine import CtaEngine
 from vnpy.trader.app.dataRecorder.drEngine import DrEngine
 from vnpy.trader.app.riskManager.rmEngine import RmEngine
@@ -21,9 +22,9 @@ class VtClient(RpcClient):
     """vn.trader客户端"""
 
     #----------------------------------------------------------------------
-    def __init__(self, reqAddress, subAddress, eventEngine):
+    def __init__(self, reqAddress, subAddress, eventEngine, timeout=30):
         """Constructor"""
-        super(VtClient, self).__init__(reqAddress, subAddress)
+        super(VtClient, self).__init__(reqAddress, subAddress, timeout=timeout)
 
         self.eventEngine = eventEngine
 
@@ -33,7 +34,8 @@ class VtClient(RpcClient):
     def callback(self, topic, data):
         """subscribe 回调函数"""
 
-        self.eventEngine.put(data)
+        # tick/委托/成交为紧凑格式，还原为Event
+        self.eventEngine.put(decodeEvent(data))
 
 
 ########################################################################
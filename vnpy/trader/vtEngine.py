@@ -17,12 +17,14 @@ from vnpy.trader.vtEvent import Event as vn_event
 from vnpy.trader.language import text
 
 from vnpy.trader.vtFunction import loadMongoSetting, getTempPath,getFullSymbol,getShortSymbol,getJsonPath
+from vnpy.data.mongo.mongo_pool import get_client, iter_query, db_query_iter, db_query_columns, DEFAULT_BATCH_SIZE
 from vnpy.trader.vtGateway import *
 from vnpy.trader.app import (ctaStrategy, riskManager)
 from vnpy.trader.setup_logger import setup_logger
 from vnpy.trader.vtGlobal import globalSetting
 import traceback
 from datetime import datetime, timedelta, time, date
+from time import sleep
 
 from vnpy.trader.vtConstant import (DIRECTION_LONG, DIRECTION_SHORT,
                                     OFFSET_OPEN, OFFSET_CLOSE, OFFSET_CLOSETODAY,
@@ -469,8 +471,9 @@ class MainEngine(object):
             self.algoEngine.stop()
 
         if self.dbClient:
-            self.writeLog(u'关闭数据库连接')
-            self.dbClient.close()
+            # 共享的MongoClient由mongo_pool管理（其他引擎仍在使用），只释放引用，不关闭
+            self.writeLog(u'释放数据库连接')
+            self.dbClient = None
 
     def disconnect(self, gateway_name=EMPTY_STRING):
         """断开底层gateway的连接"""
@@ -674,8 +677,8 @@ class MainEngine(object):
             host, port, logging = loadMongoSetting()
 
             try:
-                # 设置MongoDB操作的超时时间为0.5秒
-                self.dbClient = MongoClient(host, port, connectTimeoutMS=500)
+                # 使用进程内共享的MongoClient（连接池、超时设置见mongo_pool）
+                self.dbClient = get_client(host, port)
 
                 # 调用server_info查询服务器状态，防止服务器异常并未连接成功
                 self.dbClient.server_info()
@@ -708,7 +711,7 @@ class MainEngine(object):
 
         except AutoReconnect as ex:
             self.writeError(u'数据库连接断开重连:{}'.format(str(ex)))
-            time.sleep(1)
+            sleep(1)
         except ConnectionFailure:
             self.dbClient = None
             self.writeError(u'数据库连接断开')
@@ -725,16 +728,17 @@ class MainEngine(object):
         :param collectionName:
         :param data_list:
         :param ordered: 是否忽略insert error
-        :return:
+        :return: 是否写入成功
         """
         if not isinstance(data_list,list):
             self.writeLog(text.DATA_INSERT_FAILED)
-            return
+            return False
         try:
             if self.dbClient:
                 db = self.dbClient[dbName]
                 collection = db[collectionName]
                 collection.insert_many(data_list, ordered = ordered)
+                return True
             else:
                 self.writeLog(text.DATA_INSERT_FAILED)
                 if self.db_has_connected:
@@ -743,7 +747,7 @@ class MainEngine(object):
 
         except AutoReconnect as ex:
             self.writeError(u'数据库连接断开重连:{}'.format(str(ex)))
-            time.sleep(1)
+            sleep(1)
         except ConnectionFailure:
             self.dbClient = None
             self.writeError(u'数据库连接断开')
@@ -753,6 +757,8 @@ class MainEngine(object):
         except Exception as ex:
             self.writeError(u'dbInsertMany exception:{}'.format(str(ex)))
 
+        return False
+
     # ----------------------------------------------------------------------
     def dbQuery(self, dbName, collectionName, d, sortKey='', sortDirection=ASCENDING):
         """从MongoDB中读取数据，d是查询要求，返回的是数据库查询的指针"""
@@ -761,15 +767,8 @@ class MainEngine(object):
                 db = self.dbClient[dbName]
                 collection = db[collectionName]
 
-                if sortKey:
-                    cursor = collection.find(d).sort(sortKey, sortDirection)  # 对查询出来的数据进行排序
-                else:
-                    cursor = collection.find(d)
-
-                if cursor:
-                    return list(cursor)
-                else:
-                    return []
+                # 返回列表（可通过RPC传送），大量数据请使用dbQueryIter
+                return list(iter_query(collection, d, sortKey, sortDirection))
             else:
                 self.writeLog(text.DATA_QUERY_FAILED)
                 if self.db_has_connected:
@@ -778,7 +777,7 @@ class MainEngine(object):
 
         except AutoReconnect as ex:
             self.writeError(u'数据库连接断开重连:{}'.format(str(ex)))
-            time.sleep(1)
+            sleep(1)
         except ConnectionFailure:
             self.dbClient = None
             self.writeError(u'数据库连接断开')
@@ -790,6 +789,29 @@ class MainEngine(object):
 
         return []
 
+    def dbQueryIter(self, dbName, collectionName, d, sortKey='', sortDirection=ASCENDING, projection=None,
+                    batchSize=DEFAULT_BATCH_SIZE):
+        """
+        从MongoDB中流式读取数据，按批读取游标，逐条返回，不把结果全部放入内存
+        :param projection: 读取的字段，如{'_id': 0}
+        :return: generator，异常时写日志后重新抛出，避免调用者把读取到一半的数据当作完整数据使用
+        """
+        return db_query_iter(self, dbName, collectionName, d, sortKey, sortDirection, projection, batchSize,
+                             fail_msg=text.DATA_QUERY_FAILED)
+
+    # ----------------------------------------------------------------------
+    def dbQueryColumns(self, dbName, collectionName, d, fields, sortKey='', sortDirection=ASCENDING,
+                       batchSize=DEFAULT_BATCH_SIZE, dtypes=None):
+        """
+        从MongoDB中读取指定字段，返回numpy数组
+        :param fields: 字段列表
+        :param dtypes: {字段: dtype}，缺省由数据推断，datetime为datetime64[us]
+        :return: {字段: np.ndarray}，失败时返回None
+        """
+        return db_query_columns(self, dbName, collectionName, d, fields, sortKey, sortDirection, batchSize,
+                                dtypes=dtypes, fail_msg=text.DATA_QUERY_FAILED)
+
+    # ----------------------------------------------------------------------
     def dbQueryBySort(self, dbName, collectionName, d, sortName, sortType, limitNum=0):
         """从MongoDB中读取数据，d是查询要求，sortName是排序的字段,sortType是排序类型
           返回的是数据库查询的指针"""
@@ -813,7 +835,7 @@ class MainEngine(object):
 
         except AutoReconnect as ex:
             self.writeError(u'数据库连接断开重连:{}'.format(str(ex)))
-            time.sleep(1)
+            sleep(1)
         except ConnectionFailure:
             self.dbClient = None
             self.writeError(u'数据库连接断开')
@@ -846,7 +868,7 @@ class MainEngine(object):
 
         except AutoReconnect as ex:
             self.writeError(u'数据库连接断开重连:{}'.format(str(ex)))
-            time.sleep(1)
+            sleep(1)
         except ConnectionFailure:
             self.dbClient = None
             self.writeError(u'数据库连接断开')
@@ -18,6 +18,7 @@ from vnpy.event import *
 # 系统相关
 EVENT_TIMER = 'eTimer'                  # 计时器事件，每隔1秒发送一次
 EVENT_LOG = 'eLog'                      # 日志事件，全局通用
+EVENT_PROFILE = 'eProfile'              # 事件引擎延时统计事件，开启统计后定期发送
 
 # Gateway相关
 EVENT_TICK = 'eTick.'                   # TICK行情事件，可后接具体的vtSymbol
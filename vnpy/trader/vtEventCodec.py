@@ -0,0 +1,65 @@
+# encoding: UTF-8
+
+"""
+VtServer推送事件的紧凑格式
+tick/委托/成交事件不再推送pickle的Event对象（每条消息都带有类路径和全部字段名），
+而是推送只含基本类型的元组：(格式标记, 事件类型, 类名, [字段值...], {额外字段})，
+字段名按类的缺省字段顺序由服务端和客户端各自生成，不随消息发送。
+其他事件仍推送原Event对象，客户端用decodeEvent统一还原。
+"""
+
+from vnpy.event import Event
+from vnpy.trader.vtObject import VtTickData, VtOrderData, VtTradeData
+
+COMPACT_TAG = 'vtc1'
+
+# 不推送的字段（原始数据，可能无法序列化）
+EXCLUDE_FIELDS = ('rawData',)
+
+# 使用紧凑格式的数据类
+COMPACT_CLASSES = {cls.__name__: cls for cls in (VtTickData, VtOrderData, VtTradeData)}
+
+# 各数据类的字段顺序
+COMPACT_FIELDS = {name: tuple(cls().__dict__.keys()) for name, cls in COMPACT_CLASSES.items()}
+COMPACT_FIELD_SETS = {name: set(fields) for name, fields in COMPACT_FIELDS.items()}
+
+
+#----------------------------------------------------------------------
+def encodeEvent(event):
+    """
+    Event => 紧凑格式的元组
+    :return: 不支持的事件返回None，由调用方推送原Event
+    """
+    dict_ = event.dict_
+    if len(dict_) != 1:
+        return None
+    data = dict_.get('data', None)
+    name = data.__class__.__name__
+    if COMPACT_CLASSES.get(name, None) is not data.__class__:
+        return None
+
+    d = data.__dict__
+    values = [None if k in EXCLUDE_FIELDS else d.get(k, None) for k in COMPACT_FIELDS[name]]
+
+    # 运行中添加的字段
+    extra = None
+    if d.keys() != COMPACT_FIELD_SETS[name]:
+        extra = {k: v for k, v in d.items()
+                 if k not in COMPACT_FIELD_SETS[name] and k not in EXCLUDE_FIELDS}
+
+    return (COMPACT_TAG, event.type_, name, values, extra)
+
+
+#----------------------------------------------------------------------
+def decodeEvent(data):
+    """紧凑格式的元组 => Event，其他数据（原Event对象）原样返回"""
+    if type(data) is not tuple or len(data) != 5 or data[0] != COMPACT_TAG:
+        return data
+
+    tag, type_, name, values, extra = data
+    cls = COMPACT_CLASSES[name]
+    obj = cls.__new__(cls)
+    obj.__dict__.update(zip(COMPACT_FIELDS[name], values))
+    if extra:
+        obj.__dict__.update(extra)
+    return Event(type_, obj)
@@ -12,6 +12,8 @@ import importlib
 import re
 from functools import lru_cache
 
+from vnpy.trader.vtSession import get_calendar
+
 MAX_NUMBER = 10000000000000
 MAX_DECIMAL = 8
 
@@ -246,22 +248,7 @@ def getTradingDate(dt=None):
     :param dt:
     :return:
     """
-    tradingDay = ''
-    if dt is None:
-        dt = datetime.now()
-
-    if dt.hour >= 21:
-        if dt.isoweekday() == 5:
-            # 星期五=》星期一
-            return (dt + timedelta(days=3)).strftime('%Y-%m-%d')
-        else:
-            # 第二天
-            return (dt + timedelta(days=1)).strftime('%Y-%m-%d')
-    elif dt.hour < 8 and dt.isoweekday() == 6:
-        # 星期六=>星期一
-        return (dt + timedelta(days=2)).strftime('%Y-%m-%d')
-    else:
-        return dt.strftime('%Y-%m-%d')
+    return get_calendar().get_trading_date(dt)
 
 
 # 图标路径
@@ -32,26 +32,38 @@ class VtGateway(object):
     # ----------------------------------------------------------------------
     def onTick(self, tick):
         """市场行情推送"""
-        # 通用事件
-        event1 = Event(type_=EVENT_TICK)
-        event1.dict_['data'] = copy.copy(tick)
-        self.eventEngine.put(event1)
-
         if tick.lastPrice is not None and tick.lastPrice != 0:
             self.symbol_price_dict.update({tick.vtSymbol: tick.lastPrice})
         elif tick.askPrice1 is not None and tick.bidPrice1 is not None:
             self.symbol_price_dict.update({tick.vtSymbol: (tick.askPrice1 + tick.bidPrice1)/2})
 
-        # 特定合约代码的事件
-        event2 = Event(type_=EVENT_TICK+tick.vtSymbol)
-        event2.dict_['data'] = copy.copy(tick)
-        self.eventEngine.put(event2)
+        # 通用事件、特定合约代码的事件
+        self.putEventData(EVENT_TICK, copy.copy(tick), tick.vtSymbol)
 
         # 推送Bar
         kline = self.klines.get(tick.vtSymbol,None)
         if kline:
             kline.updateTick(tick)
 
+    def putEventData(self, type_, data, key):
+        """
+        推送通用事件（type_）及特定事件（type_+key）
+        事件引擎支持putData时，数据只入队一次，由引擎按主题分发
+        """
+        putData = getattr(self.eventEngine, 'putData', None)
+        if putData is not None:
+            putData(type_, data, key)
+            return
+
+        event1 = Event(type_=type_)
+        event1.dict_['data'] = data
+        self.eventEngine.put(event1)
+
+        event2 = Event(type_=type_+key)
+        event2.dict_['data'] = data
+        self.eventEngine.put(event2)
+
+    # ----------------------------------------------------------------------
     def onBar(self,bar,type=EVENT_BAR):
         """市场行情推送"""
         # bar, 或者 barDict
@@ -64,54 +76,26 @@ class VtGateway(object):
     # ----------------------------------------------------------------------
     def onTrade(self, trade):
         """成交信息推送"""
-        # 通用事件
-        event1 = Event(type_=EVENT_TRADE)
-        event1.dict_['data'] = trade
-        self.eventEngine.put(event1)
-
-        # 特定合约的成交事件
-        event2 = Event(type_=EVENT_TRADE+trade.vtSymbol)
-        event2.dict_['data'] = trade
-        self.eventEngine.put(event2)
+        # 通用事件、特定合约的成交事件
+        self.putEventData(EVENT_TRADE, trade, trade.vtSymbol)
 
     # ----------------------------------------------------------------------
     def onOrder(self, order):
         """订单变化推送"""
-        # 通用事件
-        event1 = Event(type_=EVENT_ORDER)
-        event1.dict_['data'] = order
-        self.eventEngine.put(event1)
-
-        # 特定订单编号的事件
-        event2 = Event(type_=EVENT_ORDER+order.vtOrderID)
-        event2.dict_['data'] = order
-        self.eventEngine.put(event2)
+        # 通用事件、特定订单编号的事件
+        self.putEventData(EVENT_ORDER, order, order.vtOrderID)
 
     # ----------------------------------------------------------------------
     def onPosition(self, position):
         """持仓信息推送"""
-        # 通用事件
-        event1 = Event(type_=EVENT_POSITION)
-        event1.dict_['data'] = position
-        self.eventEngine.put(event1)
-
-        # 特定合约代码的事件
-        event2 = Event(type_=EVENT_POSITION+position.vtSymbol)
-        event2.dict_['data'] = position
-        self.eventEngine.put(event2)
+        # 通用事件、特定合约代码的事件
+        self.putEventData(EVENT_POSITION, position, position.vtSymbol)
 
     # ----------------------------------------------------------------------
     def onAccount(self, account):
         """账户信息推送"""
-        # 通用事件
-        event1 = Event(type_=EVENT_ACCOUNT)
-        event1.dict_['data'] = account
-        self.eventEngine.put(event1)
-
-        # 特定合约代码的事件
-        event2 = Event(type_=EVENT_ACCOUNT+account.vtAccountID)
-        event2.dict_['data'] = account
-        self.eventEngine.put(event2)
+        # 通用事件、特定合约代码的事件
+        self.putEventData(EVENT_ACCOUNT, account, account.vtAccountID)
 
         # 更新账号ID
         self.accountID = account.accountID  # account.vtAccountID
@@ -45,6 +45,7 @@ class VtTickData(VtBaseData):
         self.time = EMPTY_STRING  # 时间 11:20:56.5
         self.date = EMPTY_STRING  # 日期 2015-10-09
         self.tradingDay = EMPTY_STRING  # 交易日期
+        self.datetime = None  # python的datetime时间对象，由gateway生成
 
         # 常规行情
         self.openPrice = EMPTY_FLOAT  # 今日开盘价
@@ -13,12 +13,13 @@ ROOT_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '..','..'))
 sys.path.append(ROOT_PATH)
 
 from datetime import datetime
-from time import sleep
+from time import sleep, monotonic
 from threading import Thread
 
 import vtEvent
 from vnpy.rpc import RpcServer
 from vnpy.trader.vtEngine import MainEngine
+from vnpy.trader.vtEventCodec import encodeEvent
 
 from vnpy.trader.gateway import ctpGateway
 init_gateway_names = {'CTP': ['CTP', 'CTP_Prod', 'CTP_Post', 'CTP_EBF', 'CTP_JR', 'CTP_JR2']}
@@ -28,10 +29,22 @@ class VtServer(RpcServer):
     """vn.trader服务器"""
 
     #----------------------------------------------------------------------
-    def __init__(self, repAddress, pubAddress):
-        """Constructor"""
+    def __init__(self, repAddress, pubAddress, compact=True, rateLimits=None):
+        """
+        Constructor
+        :param compact: tick/委托/成交事件是否使用紧凑格式推送（客户端用vtEventCodec.decodeEvent还原）
+        :param rateLimits: {主题前缀: 最小推送间隔（秒）}，同一主题、同一合约在间隔内的事件不推送
+        """
         super(VtServer, self).__init__(repAddress, pubAddress)
         self.usePickle()
+
+        # 推送相关
+        self.compact = compact
+        self.rateLimits = {}                # 主题前缀: 最小推送间隔（秒）
+        self.topicIntervals = {}            # 主题: 最小推送间隔（秒），0为不限制
+        self.lastPublishTime = {}           # (主题, 合约): 上次推送的时间
+        for prefix, interval in (rateLimits or {}).items():
+            self.setRateLimit(prefix, interval)
         
         # 创建主引擎对象
         self.engine = MainEngine()
@@ -41,6 +54,8 @@ class VtServer(RpcServer):
             self.engine.addGateway(ctpGateway, gw_name)
 
         # 注册主引擎的方法到服务器的RPC函数
+        # 交易相关的函数在服务器线程中依次执行（如CtpTdApi.sendOrder的reqID/orderRef递增不是线程安全的），
+        # 只读查询（数据库查询、合约查询）可在工作线程池中并发执行
         self.register(self.engine.connect)
         self.register(self.engine.disconnect)
         self.register(self.engine.subscribe)
@@ -54,13 +69,13 @@ class VtServer(RpcServer):
         self.register(self.engine.writeLog)
         self.register(self.engine.dbConnect)
         self.register(self.engine.dbInsert)
-        self.register(self.engine.dbQuery)
+        self.register(self.engine.dbQuery, concurrent=True)
         self.register(self.engine.dbUpdate)
-        self.register(self.engine.getContract)
-        self.register(self.engine.getAllContracts)
+        self.register(self.engine.getContract, concurrent=True)
+        self.register(self.engine.getAllContracts, concurrent=True)
         self.register(self.engine.getOrder)
         self.register(self.engine.getAllWorkingOrders)
-        self.register(self.engine.getAllGatewayNames)
+        self.register(self.engine.getAllGatewayNames, concurrent=True)
         self.register(self.engine.saveData)
         
         # 注册事件引擎发送的事件处理监听
@@ -69,7 +84,50 @@ class VtServer(RpcServer):
     #----------------------------------------------------------------------
     def eventHandler(self, event):
         """事件处理"""
-        self.publish(event.type_, event)
+        type_ = event.type_
+
+        # 没有客户端订阅的主题，不打包
+        if not self.hasSubscriber(type_):
+            return
+
+        # 限速
+        if self.rateLimits and self.isRateLimited(event):
+            return
+
+        data = encodeEvent(event) if self.compact else None
+        self.publish(type_, event if data is None else data)
+
+    #----------------------------------------------------------------------
+    def setRateLimit(self, prefix, interval):
+        """
+        设置主题的推送限速
+        :param prefix: 主题前缀，如EVENT_TICK，多个前缀匹配时使用最长的
+        :param interval: 最小推送间隔（秒），0或None为取消限速
+        """
+        if interval:
+            self.rateLimits[prefix] = interval
+        else:
+            self.rateLimits.pop(prefix, None)
+        self.topicIntervals.clear()
+
+    #----------------------------------------------------------------------
+    def isRateLimited(self, event):
+        """事件是否因限速而不推送（同一主题下，按合约分别计算间隔）"""
+        type_ = event.type_
+        interval = self.topicIntervals.get(type_, None)
+        if interval is None:
+            prefixes = [p for p in self.rateLimits if type_.startswith(p)]
+            interval = self.rateLimits[max(prefixes, key=len)] if prefixes else 0
+            self.topicIntervals[type_] = interval
+        if not interval:
+            return False
+
+        key = (type_, getattr(event.dict_.get('data', None), 'vtSymbol', None))
+        now = monotonic()
+        if now - self.lastPublishTime.get(key, -interval) < interval:
+            return True
+        self.lastPublishTime[key] = now
+        return False
         
     #----------------------------------------------------------------------
     def stopServer(self):
@@ -0,0 +1,174 @@
+# encoding: UTF-8
+
+"""
+交易日历
+根据时间计算所属交易日、当日分钟数、当日第几根bar等。
+交易日按（自然日, 时段）缓存为整数序号（date.toordinal()），字符串也只格式化一次，
+避免每个bar/tick都做datetime加减和strftime。
+交易日规则（与原getTradingDate一致）：
+- 夜盘（night_hour点及之后）属于下一个交易日，周五夜盘属于下周一
+- 周六凌晨（8点之前）属于下周一
+- 计算出的交易日为节假日时，顺延至下一个非周末、非节假日
+"""
+
+from datetime import datetime, date
+
+DAY_SESSION = 0         # 日盘（及其他时间）
+NIGHT_SESSION = 1       # 夜盘，night_hour点及之后
+EARLY_SESSION = 2       # 凌晨，8点之前
+
+EARLY_HOUR = 8
+
+
+def _to_ordinal(d):
+    """日期/datetime/'YYYY-mm-dd'/'YYYYmmdd' => 日期序号"""
+    if isinstance(d, int):
+        return d
+    if isinstance(d, (datetime, date)):
+        return d.toordinal()
+    d = str(d).replace('-', '')
+    return date(int(d[0:4]), int(d[4:6]), int(d[6:8])).toordinal()
+
+
+class TradingCalendar(object):
+    """交易日历（按交易所区分，各自维护节假日与缓存）"""
+
+    def __init__(self, exchange=None, night_hour=21, holidays=None):
+        """
+        :param exchange: 交易所，None为通用
+        :param night_hour: 夜盘开始的小时，该小时及之后属于下一个交易日
+        :param holidays: 节假日列表
+        """
+        self.exchange = exchange
+        self.night_hour = night_hour
+        self.holidays = set()       # 节假日的日期序号
+        self._day_cache = {}        # (日期序号, 时段): 交易日序号
+        self._str_cache = {}        # 日期序号: 'YYYY-mm-dd'
+        if holidays:
+            self.add_holidays(holidays)
+
+    def add_holidays(self, holidays):
+        """添加节假日，清除已缓存的交易日"""
+        for d in holidays:
+            self.holidays.add(_to_ordinal(d))
+        self._day_cache.clear()
+
+    def is_trading_day(self, d):
+        """是否交易日（非周末、非节假日）"""
+        ordinal = _to_ordinal(d)
+        return ordinal not in self.holidays and date.fromordinal(ordinal).isoweekday() <= 5
+
+    def _calc_trading_day(self, ordinal, session):
+        """计算交易日序号"""
+        weekday = date.fromordinal(ordinal).isoweekday()
+        if session == NIGHT_SESSION:
+            # 星期五=》星期一，其他=》第二天
+            ordinal += 3 if weekday == 5 else 1
+        elif session == EARLY_SESSION and weekday == 6:
+            # 星期六=>星期一
+            ordinal += 2
+        else:
+            return ordinal
+
+        if ordinal in self.holidays:
+            while not self.is_trading_day(ordinal):
+                ordinal += 1
+        return ordinal
+
+    def get_trading_day_index(self, dt=None):
+        """
+        获取交易日的整数序号（date.toordinal()），可直接比较、相减
+        :param dt: datetime，缺省为当前时间
+        :return: int
+        """
+        if dt is None:
+            dt = datetime.now()
+        hour = dt.hour
+        if hour >= self.night_hour:
+            session = NIGHT_SESSION
+        elif hour < EARLY_HOUR:
+            session = EARLY_SESSION
+        else:
+            session = DAY_SESSION
+
+        key = (dt.toordinal(), session)
+        ordinal = self._day_cache.get(key, None)
+        if ordinal is None:
+            ordinal = self._calc_trading_day(key[0], session)
+            self._day_cache[key] = ordinal
+        return ordinal
+
+    def get_trading_date(self, dt=None):
+        """
+        根据输入的时间，返回交易日的日期
+        :param dt: datetime，缺省为当前时间
+        :return: 'YYYY-mm-dd'
+        """
+        return self.format_ordinal(self.get_trading_day_index(dt))
+
+    def format_ordinal(self, ordinal):
+        """日期序号 => 'YYYY-mm-dd'（缓存）"""
+        s = self._str_cache.get(ordinal, None)
+        if s is None:
+            s = date.fromordinal(ordinal).strftime('%Y-%m-%d')
+            self._str_cache[ordinal] = s
+        return s
+
+
+# 已创建的交易日历，(交易所, 夜盘开始小时): TradingCalendar
+_calendars = {}
+
+
+def get_calendar(exchange=None, night_hour=21):
+    """获取（共享的）交易日历"""
+    key = (exchange, night_hour)
+    calendar = _calendars.get(key, None)
+    if calendar is None:
+        calendar = TradingCalendar(exchange=exchange, night_hour=night_hour)
+        _calendars[key] = calendar
+    return calendar
+
+
+def set_holidays(holidays, exchange=None):
+    """设置节假日，作用于该交易所（None为通用）的所有交易日历"""
+    get_calendar(exchange)
+    for (cal_exchange, night_hour), calendar in _calendars.items():
+        if cal_exchange == exchange:
+            calendar.add_holidays(holidays)
+
+
+def get_trading_date(dt=None, exchange=None, night_hour=21):
+    """根据输入的时间，返回交易日的日期'YYYY-mm-dd'"""
+    return get_calendar(exchange, night_hour).get_trading_date(dt)
+
+
+def get_minutes_of_day(dt):
+    """
+    当日0点起经过的分钟数（float）
+    与 (dt - datetime.strptime(dt.strftime('%Y-%m-%d'), '%Y-%m-%d')).total_seconds() / 60 结果一致
+    """
+    return ((dt.hour * 3600 + dt.minute * 60 + dt.second) * 1000000 + dt.microsecond) / 1000000 / 60
+
+
+def get_tick_datetime(dt, update_time, millisec=0):
+    """
+    dt所在日期 + 'HH:MM:SS' + 毫秒 => datetime
+    替代 datetime.strptime(date + ' ' + time, '%Y-%m-%d %H:%M:%S.%f')，只做整数运算
+    :param dt: datetime/date，取其日期
+    :param update_time: 'HH:MM:SS'
+    :param millisec: 毫秒
+    """
+    return datetime(dt.year, dt.month, dt.day,
+                    int(update_time[0:2]), int(update_time[3:5]), int(update_time[6:8]),
+                    int(millisec) * 1000)
+
+
+def get_bar_index(dt, interval):
+    """
+    当日第几根interval分钟的bar（从0开始）
+    与 int(get_minutes_of_day(dt) / interval) 结果一致
+    """
+    if isinstance(interval, int) and interval > 0:
+        # 整数周期，直接用整数分钟计算
+        return (dt.hour * 60 + dt.minute) // interval
+    return int(get_minutes_of_day(dt) / interval)